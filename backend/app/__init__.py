@@ -3,12 +3,14 @@ from flask_cors import CORS
 from flask_pymongo import PyMongo
 from app.config import config
 import os
+import time
 
 mongo = PyMongo()
 
 
 def create_app(config_name='default'):
     """Application factory pattern"""
+    created_at = time.perf_counter()
     app = Flask(__name__)
 
     # Load configuration
@@ -32,4 +34,23 @@ def create_app(config_name='default'):
     def health_check():
         return {'status': 'healthy', 'service': 'Security Anomaly Detection API'}, 200
 
+    # Readiness: 503 until the model is loaded and warm, so the load
+    # balancer only routes to warm workers
+    from app.warmup import WarmupState, start_warmup
+    app.extensions['warmup'] = warmup = WarmupState(created_at)
+
+    @app.route('/api/ready', methods=['GET'])
+    def readiness_check():
+        from app.api import login_analysis
+
+        body = warmup.to_dict()
+        manager = login_analysis._model_manager
+        if warmup.status == 'ready' and not (manager and manager.detector and manager.detector.is_ready):
+            body['status'] = 'no_model'
+        if body['status'] in ('ready', 'disabled'):
+            return body, 200
+        return body, 503
+
+    start_warmup(app, warmup, app.config.get('WARMUP_MODE', 'background'))
+
     return app
\ No newline at end of file
@@ -0,0 +1,298 @@
+import json
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from app.models.alert import Alert, AlertSeverity
+from app.models.login_event import LoginEvent
+from app.ml.online_profiles import OnlineProfileUpdater
+from app.utils.geolocation import geolocation_service
+from app.utils.validators import validate_login_event
+
+
+def prepare_event(data: Dict) -> Dict:
+    """Fill in what /analyze defaults: timestamp (now), location (from the IP) and success"""
+    # Add timestamp if not provided
+    if 'timestamp' not in data:
+        data['timestamp'] = datetime.utcnow().isoformat()
+
+    # Get location from IP if not provided
+    if 'location' not in data:
+        data['location'] = geolocation_service.get_location_from_ip(data['ip_address'])
+
+    # Set success to True if not provided
+    if 'success' not in data:
+        data['success'] = True
+    return data
+
+
+def parse_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def risk_thresholds(config, detector=None) -> Tuple[float, float]:
+    """
+    (medium, high) risk thresholds for a detector's scores
+
+    Legacy models without a calibration table report clipped linear scores
+    rather than percentiles, so they keep the LEGACY_* thresholds.
+    """
+    if detector is not None and detector.is_ready and detector.calibration is None:
+        return (config.get('LEGACY_MEDIUM_RISK_THRESHOLD', 0.6),
+                config.get('LEGACY_HIGH_RISK_THRESHOLD', 0.8))
+    return config.get('MEDIUM_RISK_THRESHOLD', 0.95), config.get('HIGH_RISK_THRESHOLD', 0.99)
+
+
+def severity_for(risk_score: float, config, detector=None) -> AlertSeverity:
+    """Alert severity of a risk score under the configured thresholds (see risk_thresholds)"""
+    medium, high = risk_thresholds(config, detector)
+    if risk_score >= high:
+        return AlertSeverity.HIGH
+    if risk_score >= medium:
+        return AlertSeverity.MEDIUM
+    return AlertSeverity.LOW
+
+
+def learn_from(engineer, data: Dict, is_anomaly: bool, severity: AlertSeverity):
+    """
+    Update the online profile with a scored login
+
+    Failed and high-risk logins are left out so an attacker cannot train
+    the profile toward their own behavior.
+    """
+    if isinstance(engineer.user_profiles, OnlineProfileUpdater) and data['success'] \
+            and not (is_anomaly and severity == AlertSeverity.HIGH):
+        engineer.user_profiles.observe(data)
+
+
+def build_login_event(data: Dict, is_anomaly: bool, risk_score: float, reasons: List[str]) -> LoginEvent:
+    return LoginEvent(
+        user_id=data['user_id'],
+        username=data['username'],
+        timestamp=parse_timestamp(data['timestamp']),
+        ip_address=data['ip_address'],
+        location=data['location'],
+        device_info=data['device_info'],
+        success=data['success'],
+        risk_score=risk_score,
+        is_anomaly=is_anomaly,
+        anomaly_reasons=reasons
+    )
+
+
+def build_alert(data: Dict, risk_score: float, reasons: List[str], severity: AlertSeverity,
+                login_event_id: str) -> Alert:
+    return Alert(
+        alert_type='suspicious_login',
+        severity=severity,
+        user_id=data['user_id'],
+        username=data['username'],
+        description=f"Suspicious login detected with risk score {risk_score:.2f}",
+        timestamp=datetime.utcnow(),
+        login_event_id=login_event_id,
+        details={
+            'risk_score': risk_score,
+            'reasons': reasons,
+            'ip_address': data['ip_address'],
+            'location': data['location']
+        }
+    )
+
+
+def score_events(events: List, engineer, detector, extractor, config) -> List[Dict]:
+    """
+    Validate, engineer and score a batch of raw login events
+
+    Events are validated and given /analyze's defaults one by one. Feature
+    rows are extracted in order into one matrix, recording each login in the
+    login history and failure counters right after its own extraction, so
+    stateful features are what sequential /analyze calls would compute. The
+    matrix is scored with one predict_batch call. Online profiles learn from
+    the batch after scoring (logins within a batch do not see each other's
+    profile updates).
+
+    A malformed event is reported as invalid before anything is recorded
+    for it. Any other error (e.g. from the model) propagates, so callers
+    never rescore events whose logins were already recorded.
+
+    Returns:
+        One result per event, in order: {'index', 'status': 'invalid',
+        'errors'} or {'index', 'status': 'ok', 'event', 'is_anomaly',
+        'risk_score', 'severity' (AlertSeverity), 'reasons'}
+    """
+    results = [None] * len(events)
+    X = np.empty((len(events), len(detector.feature_columns)), dtype=np.float64)
+    scored = []
+
+    for index, data in enumerate(events):
+        if not isinstance(data, dict):
+            results[index] = {'index': index, 'status': 'invalid', 'errors': ['Event must be a JSON object']}
+            continue
+        try:
+            is_valid, errors = validate_login_event(data)
+            if is_valid:
+                prepare_event(data)
+                parse_timestamp(data['timestamp'])
+                extractor.extract(data, out=X[len(scored):len(scored) + 1])
+        except (TypeError, ValueError, AttributeError, KeyError) as e:
+            errors = [f"Invalid event: {e}"]
+        if errors:
+            results[index] = {'index': index, 'status': 'invalid', 'errors': errors}
+            continue
+
+        # Remember the login for velocity and failure features of later ones
+        if engineer.login_history is not None:
+            engineer.login_history.record_event(data)
+        if engineer.failure_counters is not None:
+            engineer.failure_counters.record_event(data)
+        scored.append(index)
+
+    if not scored:
+        return results
+
+    explain = config.get('ANOMALY_ATTRIBUTION', True) and detector.engine is not None
+    predictions = detector.predict_batch(X[:len(scored)], explain)
+    risk_scores = predictions['risk_score']
+    medium_risk, high_risk = risk_thresholds(config, detector)
+    high = risk_scores >= high_risk
+    medium = risk_scores >= medium_risk
+
+    for row, index in enumerate(scored):
+        severity = AlertSeverity.HIGH if high[row] else AlertSeverity.MEDIUM if medium[row] else AlertSeverity.LOW
+        result = {
+            'index': index,
+            'status': 'ok',
+            'event': events[index],
+            'is_anomaly': bool(predictions['is_anomaly'][row]),
+            'risk_score': float(risk_scores[row]),
+            'severity': severity,
+            'reasons': predictions['reasons'][row]
+        }
+        learn_from(engineer, events[index], result['is_anomaly'], severity)
+        results[index] = result
+    return results
+
+
+def _insert_many(collection, documents: List[Dict]) -> Dict[int, str]:
+    """Unordered bulk insert; positions of documents that were not stored, with the error"""
+    if not documents:
+        return {}
+    try:
+        collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        return {error['index']: error.get('errmsg', 'write error') for error in e.details.get('writeErrors', [])}
+    except Exception as e:
+        return {position: str(e) for position in range(len(documents))}
+    return {}
+
+
+def persist_results(db, results: List[Dict]) -> List[Dict]:
+    """
+    Store scored logins and their alerts with one bulk insert each
+
+    Ids are generated client-side so every result knows its login_event_id
+    whatever the outcome of the unordered insert_many. Alerts are only
+    written for logins that were stored. A result whose login or alert
+    could not be stored gets status 'failed' and an error.
+
+    Returns:
+        The results, with login_event_id and alert_id set
+    """
+    stored = [result for result in results if result['status'] == 'ok']
+    documents = []
+    for result in stored:
+        data = result['event']
+        document = build_login_event(data, result['is_anomaly'], result['risk_score'], result['reasons']).to_dict()
+        document['_id'] = ObjectId()
+        documents.append(document)
+        result['login_event_id'] = str(document['_id'])
+        result['alert_id'] = None
+
+    for position, error in _insert_many(db.login_events, documents).items():
+        stored[position].update(status='failed', login_event_id=None, error=f"Login event not stored: {error}")
+
+    flagged = [result for result in stored if result['status'] == 'ok' and result['is_anomaly']]
+    alerts = []
+    for result in flagged:
+        alert = build_alert(result['event'], result['risk_score'], result['reasons'], result['severity'],
+                            result['login_event_id']).to_dict()
+        alert['_id'] = ObjectId()
+        alerts.append(alert)
+        result['alert_id'] = str(alert['_id'])
+
+    for position, error in _insert_many(db.alerts, alerts).items():
+        flagged[position].update(status='failed', alert_id=None, error=f"Alert not stored: {error}")
+    return results
+
+
+def result_to_json(result: Dict) -> Dict:
+    """API representation of one batch result"""
+    if result['status'] == 'invalid':
+        return {'index': result['index'], 'status': 'invalid', 'errors': result['errors']}
+
+    body = {
+        'index': result['index'],
+        'status': result['status'],
+        'login_event_id': result.get('login_event_id'),
+        'is_anomaly': result['is_anomaly'],
+        'risk_score': round(result['risk_score'], 3),
+        'severity': result['severity'].value if result['is_anomaly'] else 'normal',
+        'reasons': result['reasons'],
+        'alert_id': result.get('alert_id')
+    }
+    if 'error' in result:
+        body['error'] = result['error']
+    return body
+
+
+def summarize(results: List[Dict]) -> Dict:
+    statuses = [result['status'] for result in results]
+    return {
+        'received': len(results),
+        'stored': statuses.count('ok'),
+        'invalid': statuses.count('invalid'),
+        'failed': statuses.count('failed'),
+        'anomalies': sum(1 for result in results if result.get('is_anomaly'))
+    }
+
+
+def read_ndjson(stream, chunk_size: int, max_line_bytes: int) -> Iterator[List[Tuple[int, object, Optional[str]]]]:
+    """
+    Parse an NDJSON byte stream lazily, chunk_size events at a time
+
+    Only one chunk of parsed lines is held at a time, and a line longer than
+    max_line_bytes is skipped without being buffered, so memory does not
+    grow with the size of the upload. Blank lines are ignored.
+
+    Yields:
+        Lists of (line number, event, error); event is None when the line
+        could not be parsed and error says why
+    """
+    chunk = []
+    line_no = 0
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            break
+        line_no += 1
+        if len(line) > max_line_bytes and not line.endswith(b'\n'):
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_line_bytes + 1)
+            chunk.append((line_no, None, f"Line longer than {max_line_bytes} bytes"))
+        else:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                chunk.append((line_no, json.loads(line), None))
+            except ValueError as e:
+                chunk.append((line_no, None, f"Invalid JSON: {e}"))
+
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
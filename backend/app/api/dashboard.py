@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime, timedelta
 from app import mongo
 from app.middleware.auth_middleware import token_required
@@ -32,10 +32,10 @@ def get_dashboard_stats(current_user):
             'resolved': False
         })
 
-        # High-risk logins (risk_score > 0.7)
+        # High-risk logins (risk_score >= MEDIUM_RISK_THRESHOLD)
         high_risk_logins = mongo.db.login_events.count_documents({
             'timestamp': {'$gte': time_threshold},
-            'risk_score': {'$gte': 0.7}
+            'risk_score': {'$gte': current_app.config.get('MEDIUM_RISK_THRESHOLD', 0.95)}
         })
 
         # Average risk score
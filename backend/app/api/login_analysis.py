@@ -1,49 +1,263 @@
-from flask import Blueprint, request, jsonify, current_app
-from datetime import datetime
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from datetime import datetime, timedelta
 from app import mongo
-from app.middleware.auth_middleware import token_required
-from app.models.login_event import LoginEvent
-from app.models.alert import Alert, AlertSeverity
+from app.middleware.auth_middleware import token_required, admin_required
+from app.analysis import (prepare_event, severity_for, learn_from, build_login_event, build_alert,
+                          score_events, persist_results, result_to_json, summarize, read_ndjson)
 from app.ml.feature_engineering import LoginFeatureEngineer
-from app.ml.anomaly_detector import LoginAnomalyDetector
-from app.utils.geolocation import geolocation_service
+from app.ml.model_manager import ModelManager
+from app.ml.feature_extractor import CompiledFeatureExtractor
+from app.ml.profile_store import ProfileStore
+from app.ml.online_profiles import OnlineProfileUpdater
+from app.ml.login_history import LoginHistory, HISTORY_FEATURE_COLUMNS
+from app.ml.failure_counters import FailureCounters, FAILURE_FEATURE_COLUMNS
+from app.ml.scoring_dispatcher import MicroBatchScorer
+from app.ml.scoring_pool import ProcessScoringBackend
 from app.utils.validators import validate_login_event
+from app.write_behind import WriteBehindQueue
+from bson import ObjectId
+from pymongo import UpdateOne
+import atexit
 import joblib
+import json
 import os
+import threading
 
 login_analysis_bp = Blueprint('login_analysis', __name__)
 
-# Load ML model and feature engineer (lazy loading)
-_detector = None
+# Model manager and feature engineer (created lazily on first use)
+_model_manager = None
 _engineer = None
+_extractor = None
+_write_behind = None
+_scorer = None
+_init_lock = threading.RLock()
+
+
+def get_model_manager():
+    """Lazy create the model manager and load the initial model"""
+    global _model_manager
+    if _model_manager is None:
+        with _init_lock:
+            if _model_manager is None:
+                config = current_app.config
+                manager = ModelManager(
+                    model_path=config.get('MODEL_PATH', './ml_models'),
+                    warmup_rows=config.get('MODEL_WARMUP_ROWS', 32),
+                    on_swap=lambda model: _on_model_swap(model, config),
+                    reload_interval=config.get('MODEL_RELOAD_INTERVAL', 0),
+                    detector_options=_detector_options(config)
+                )
+                manager.load_initial()
+                _model_manager = manager
+    return _model_manager
 
 
 def get_detector():
-    """Lazy load the ML detector"""
-    global _detector
-    if _detector is None:
-        model_path = current_app.config.get('MODEL_PATH', './ml_models')
-        _detector = LoginAnomalyDetector(model_path=model_path)
-        try:
-            _detector.load_model()
-        except FileNotFoundError:
-            print("Warning: ML model not found. Please train the model first.")
-    return _detector
+    """The detector of the active model version"""
+    return get_model_manager().current().detector
 
 
 def get_engineer():
     """Lazy load the feature engineer with user profiles"""
     global _engineer
     if _engineer is None:
-        _engineer = LoginFeatureEngineer()
-        # Load user profiles
-        model_path = current_app.config.get('MODEL_PATH', './ml_models')
-        profiles_path = os.path.join(model_path, 'login_anomaly_detector_user_profiles.pkl')
+        with _init_lock:
+            if _engineer is None:
+                _engineer = _create_engineer(current_app.config)
+    return _engineer
+
+
+def get_write_behind():
+    """Write-behind queue for /analyze, or None when WRITE_BEHIND is off"""
+    global _write_behind
+    config = current_app.config
+    if _write_behind is None and config.get('WRITE_BEHIND', False):
+        with _init_lock:
+            if _write_behind is None:
+                queue = WriteBehindQueue(
+                    mongo.db,
+                    max_size=config.get('WRITE_BEHIND_MAX_QUEUE', 10000),
+                    flush_size=config.get('WRITE_BEHIND_FLUSH_SIZE', 500),
+                    flush_interval=config.get('WRITE_BEHIND_FLUSH_INTERVAL', 0.2),
+                    spill_path=config.get('WRITE_BEHIND_SPILL_PATH') or None
+                )
+                # Write what is still queued on a clean shutdown
+                atexit.register(queue.close)
+                _write_behind = queue
+    return _write_behind
+
+
+def get_scorer():
+    """
+    Scorer shared by this worker's threads (SCORING_BACKEND), or None to
+    score in the request thread
+    """
+    global _scorer
+    config = current_app.config
+    backend = config.get('SCORING_BACKEND', 'thread')
+    if _scorer is None and (backend == 'process' or config.get('SCORING_MICRO_BATCH', False)):
+        with _init_lock:
+            if _scorer is None:
+                if backend == 'process':
+                    scorer = ProcessScoringBackend(
+                        processes=config.get('SCORING_PROCESSES', 2),
+                        slots=config.get('SCORING_RING_SLOTS', 64),
+                        timeout=config.get('SCORING_TIMEOUT', 5.0),
+                        detector_options=_detector_options(config)
+                    )
+                    scorer.start(get_detector())
+                    atexit.register(scorer.close)
+                else:
+                    scorer = MicroBatchScorer(
+                        max_batch=config.get('SCORING_MAX_BATCH', 64),
+                        max_wait_ms=config.get('SCORING_MAX_WAIT_MS', 0.5)
+                    )
+                _scorer = scorer
+    return _scorer
+
+
+def _detector_options(config):
+    """LoginAnomalyDetector arguments taken from the app config"""
+    return {
+        'unusual_risk': config.get('MEDIUM_RISK_THRESHOLD', 0.95),
+        'legacy_unusual_risk': config.get('ANOMALY_THRESHOLD', 0.7)
+    }
+
+
+def _create_engineer(config):
+    engineer = LoginFeatureEngineer()
+    detector = get_detector()
+
+    # Load user profiles, preferring the model bundle's memory-mapped
+    # section, then a standalone store, then the legacy pickle, so
+    # workers share pages instead of private copies
+    model_path = config.get('MODEL_PATH', './ml_models')
+    store_path = os.path.join(model_path, 'login_anomaly_detector_profiles')
+    profiles_path = os.path.join(model_path, 'login_anomaly_detector_user_profiles.pkl')
+    bundle_profiles = detector.load_profiles()
+    if bundle_profiles is not None:
+        engineer.user_profiles = bundle_profiles
+    else:
         try:
-            _engineer.user_profiles = joblib.load(profiles_path)
+            engineer.user_profiles = ProfileStore.load(store_path)
         except FileNotFoundError:
-            print("Warning: User profiles not found. Using default profiles.")
-    return _engineer
+            try:
+                engineer.user_profiles = joblib.load(profiles_path)
+            except FileNotFoundError:
+                print("Warning: User profiles not found. Using default profiles.")
+
+    # Keep profiles fresh between retrains
+    if config.get('PROFILE_ONLINE_UPDATES', False):
+        engineer.user_profiles = OnlineProfileUpdater(
+            base=engineer.user_profiles,
+            half_life=config.get('PROFILE_HALF_LIFE', 50.0),
+            persist=_persist_online_profiles,
+            flush_interval=config.get('PROFILE_FLUSH_INTERVAL', 5.0),
+            flush_batch_size=config.get('PROFILE_FLUSH_BATCH_SIZE', 500),
+            max_users=config.get('PROFILE_ONLINE_MAX_USERS', 100000),
+            base_version=get_model_manager().current().version
+        )
+        atexit.register(engineer.user_profiles.close)
+        threading.Thread(target=_preload_online_profiles, args=(engineer.user_profiles,),
+                         name='online-profile-preload', daemon=True).start()
+
+    _attach_feature_state(engineer, detector.feature_columns or [], config)
+    return engineer
+
+
+def _attach_feature_state(engineer, feature_columns, config):
+    """Attach the in-process state that the model's features need"""
+    # Velocity features need the recent-login ring buffer
+    if engineer.login_history is None and any(column in feature_columns for column in HISTORY_FEATURE_COLUMNS):
+        engineer.login_history = _warm_login_history(config)
+
+    # Brute-force features need the sliding-window failure counters
+    if engineer.failure_counters is None and any(column in feature_columns for column in FAILURE_FEATURE_COLUMNS):
+        engineer.failure_counters = FailureCounters(
+            ip_mode=config.get('FAILURE_COUNTER_IP_MODE', 'approx'),
+            max_keys=config.get('FAILURE_COUNTER_MAX_KEYS', 100000)
+        )
+
+
+def _on_model_swap(model, config):
+    """Point the live feature engineer at the new version's profiles and state"""
+    engineer = _engineer
+    if engineer is None:
+        return
+
+    profiles = model.detector.load_profiles()
+    if profiles is not None:
+        if isinstance(engineer.user_profiles, OnlineProfileUpdater):
+            engineer.user_profiles.rebase(profiles, model.version)
+        else:
+            engineer.user_profiles = profiles
+
+    _attach_feature_state(engineer, model.detector.feature_columns or [], config)
+
+    # Have the scoring processes load the new version before requests ask for it
+    if isinstance(_scorer, ProcessScoringBackend) and model.version is not None:
+        _scorer.load(model.detector)
+
+
+def get_extractor(engineer, detector):
+    """Compiled feature extractor for the current engineer and model columns"""
+    global _extractor
+    if not detector.is_ready:
+        raise ValueError("Model not trained or loaded")
+    if _extractor is None or _extractor.engineer is not engineer \
+            or _extractor.feature_columns != detector.feature_columns:
+        _extractor = CompiledFeatureExtractor(engineer, detector.feature_columns)
+    return _extractor
+
+
+def _warm_login_history(config):
+    """Create the recent-login ring buffer and fill it from login_events"""
+    history = LoginHistory(
+        capacity=config.get('LOGIN_HISTORY_CAPACITY', 10),
+        max_users=config.get('LOGIN_HISTORY_MAX_USERS', 100000)
+    )
+    since = datetime.utcnow() - timedelta(hours=config.get('LOGIN_HISTORY_WARMUP_HOURS', 24))
+    try:
+        cursor = mongo.db.login_events.find(
+            {'timestamp': {'$gte': since}},
+            {'_id': 0, 'user_id': 1, 'timestamp': 1, 'location': 1, 'device_info': 1, 'success': 1}
+        ).sort('timestamp', 1)
+        count = history.warm_up(cursor)
+        print(f"Login history warmed up with {count} events")
+    except Exception as e:
+        print(f"Warning: Could not warm up login history: {e}")
+    return history
+
+
+def _persist_online_profiles(states):
+    """
+    Bulk-upsert online profile states (called from the flusher thread)
+
+    Each worker keeps its own online state per user and writes it whole, so
+    across workers the last flush wins. Decayed counters and streaming
+    medians cannot be merged field by field, and the batch retrain rebuilds
+    profiles from login_events, so a lost concurrent update only delays
+    what the profile has learned. $set leaves other fields of the document
+    alone.
+    """
+    updated_at = datetime.utcnow()
+    mongo.db.user_profiles.bulk_write(
+        [UpdateOne({'_id': state['user_id']}, {'$set': dict(state, updated_at=updated_at)}, upsert=True)
+         for state in states],
+        ordered=False
+    )
+
+
+def _preload_online_profiles(updater):
+    """Restore the most recently persisted online profile states of the current model in one query"""
+    try:
+        cursor = mongo.db.user_profiles.find({'base_version': updater.base_version}, {'_id': 0, 'updated_at': 0}) \
+            .sort('updated_at', -1).limit(updater.max_users)
+        count = updater.preload(cursor)
+        print(f"Preloaded {count} online profiles")
+    except Exception as e:
+        print(f"Warning: Could not preload online profiles: {e}")
 
 
 @login_analysis_bp.route('/analyze', methods=['POST'])
@@ -80,75 +294,56 @@ def analyze_login(current_user):
         if not is_valid:
             return jsonify({'error': 'Invalid input', 'details': errors}), 400
 
-        # Add timestamp if not provided
-        if 'timestamp' not in data:
-            data['timestamp'] = datetime.utcnow().isoformat()
-
-        # Get location from IP if not provided
-        if 'location' not in data:
-            location = geolocation_service.get_location_from_ip(data['ip_address'])
-            data['location'] = location
+        prepare_event(data)
 
-        # Set success to True if not provided
-        if 'success' not in data:
-            data['success'] = True
-
-        # Engineer features
+        # Engineer features straight into the model's row layout. The model
+        # version is read once so a concurrent swap cannot mix two models.
         engineer = get_engineer()
-        features = engineer.engineer_features(data)
+        model = get_model_manager().current()
+        detector = model.detector
+        row = get_extractor(engineer, detector).extract(data)
 
         # Detect anomaly
-        detector = get_detector()
-        is_anomaly, risk_score, reasons = detector.predict(features)
-
-        # Determine alert severity based on risk score
         config = current_app.config
-        if risk_score >= config.get('HIGH_RISK_THRESHOLD', 0.8):
-            severity = AlertSeverity.HIGH
-        elif risk_score >= config.get('MEDIUM_RISK_THRESHOLD', 0.6):
-            severity = AlertSeverity.MEDIUM
+        explain = config.get('ANOMALY_ATTRIBUTION', True) and detector.engine is not None
+        scorer = get_scorer()
+        if scorer is not None:
+            is_anomaly, risk_score, reasons = scorer.score(detector, row, explain)
         else:
-            severity = AlertSeverity.LOW
-
-        # Create login event
-        login_event = LoginEvent(
-            user_id=data['user_id'],
-            username=data['username'],
-            timestamp=datetime.fromisoformat(data['timestamp'].replace('Z', '+00:00')),
-            ip_address=data['ip_address'],
-            location=data['location'],
-            device_info=data['device_info'],
-            success=data['success'],
-            risk_score=risk_score,
-            is_anomaly=is_anomaly,
-            anomaly_reasons=reasons
-        )
-
-        # Store in MongoDB
-        result = mongo.db.login_events.insert_one(login_event.to_dict())
-        login_event_id = str(result.inserted_id)
+            is_anomaly, risk_score, reasons = detector.predict_row(row, explain)
+        severity = severity_for(risk_score, config, detector)
+
+        # Remember the login for velocity and failure features of later ones
+        if engineer.login_history is not None:
+            engineer.login_history.record_event(data)
+        if engineer.failure_counters is not None:
+            engineer.failure_counters.record_event(data)
+
+        # Learn from the login now that it has been scored
+        learn_from(engineer, data, is_anomaly, severity)
+
+        # Store in MongoDB, or queue the write with a client-side id
+        write_behind = get_write_behind()
+        login_event = build_login_event(data, is_anomaly, risk_score, reasons).to_dict()
+        if write_behind is not None:
+            login_event['_id'] = ObjectId()
+            write_behind.submit('login_events', login_event)
+            login_event_id = str(login_event['_id'])
+        else:
+            result = mongo.db.login_events.insert_one(login_event)
+            login_event_id = str(result.inserted_id)
 
         # Create alert if anomaly detected
         alert_id = None
         if is_anomaly:
-            alert = Alert(
-                alert_type='suspicious_login',
-                severity=severity,
-                user_id=data['user_id'],
-                username=data['username'],
-                description=f"Suspicious login detected with risk score {risk_score:.2f}",
-                timestamp=datetime.utcnow(),
-                login_event_id=login_event_id,
-                details={
-                    'risk_score': risk_score,
-                    'reasons': reasons,
-                    'ip_address': data['ip_address'],
-                    'location': data['location']
-                }
-            )
-
-            alert_result = mongo.db.alerts.insert_one(alert.to_dict())
-            alert_id = str(alert_result.inserted_id)
+            alert = build_alert(data, risk_score, reasons, severity, login_event_id).to_dict()
+            if write_behind is not None:
+                alert['_id'] = ObjectId()
+                write_behind.submit('alerts', alert)
+                alert_id = str(alert['_id'])
+            else:
+                alert_result = mongo.db.alerts.insert_one(alert)
+                alert_id = str(alert_result.inserted_id)
 
         # Return analysis result
         return jsonify({
@@ -158,6 +353,7 @@ def analyze_login(current_user):
             'severity': severity.value if is_anomaly else 'normal',
             'reasons': reasons,
             'alert_id': alert_id,
+            'model_version': model.version,
             'message': 'Login analyzed successfully'
         }), 200
 
@@ -165,6 +361,108 @@ def analyze_login(current_user):
         return jsonify({'error': str(e)}), 500
 
 
+@login_analysis_bp.route('/analyze/batch', methods=['POST'])
+@token_required
+def analyze_login_batch(current_user):
+    """
+    Analyze a batch of login attempts
+
+    Expected payload: {"events": [<event as for /analyze>, ...]} (or the
+    bare list), at most ANALYZE_BATCH_MAX_EVENTS events. Every event is
+    validated on its own; valid ones are engineered and scored together
+    and stored with one bulk insert for events and one for alerts.
+
+    Returns one result per event, keyed by its position ("index"), with
+    status "ok", "invalid" (validation errors) or "failed" (not stored).
+    The response is 200 when every event was stored, 207 otherwise.
+    """
+    try:
+        data = request.get_json(silent=True)
+        events = data.get('events') if isinstance(data, dict) else data
+        if not isinstance(events, list) or not events:
+            return jsonify({'error': 'Invalid input', 'details': ['Expected a non-empty list of events']}), 400
+
+        max_events = current_app.config.get('ANALYZE_BATCH_MAX_EVENTS', 5000)
+        if len(events) > max_events:
+            return jsonify({'error': f'Too many events: {len(events)} (at most {max_events} per batch)'}), 413
+
+        engineer = get_engineer()
+        model = get_model_manager().current()
+        detector = model.detector
+        results = score_events(events, engineer, detector, get_extractor(engineer, detector), current_app.config)
+        persist_results(mongo.db, results)
+
+        summary = summarize(results)
+        return jsonify({
+            'results': [result_to_json(result) for result in results],
+            'summary': summary,
+            'model_version': model.version,
+            'message': 'Batch analyzed'
+        }), 200 if summary['stored'] == summary['received'] else 207
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@login_analysis_bp.route('/ingest', methods=['POST'])
+@token_required
+def ingest_logins(current_user):
+    """
+    Stream login events in, stream analysis results out (NDJSON)
+
+    The request body is read incrementally, one login event per line, and
+    processed INGEST_CHUNK_SIZE events at a time: each chunk is scored and
+    stored (as in /analyze/batch) and its results are written to the
+    response before the next chunk is read, so a slow client slows down
+    reading and memory stays flat for any upload size:
+
+        curl -N -H "Authorization: Bearer $TOKEN" -H "Content-Type: application/x-ndjson" \\
+            --data-binary @logins.ndjson http://localhost:5000/api/login/ingest
+
+    Each response line is a result as in /analyze/batch, with "index" (the
+    event's position in the upload) and "line" (line number). The last line
+    is {"summary": ..., "model_version": ...}, or {"error": ...} if
+    processing stopped.
+    """
+    try:
+        config = current_app.config
+        engineer = get_engineer()
+        model = get_model_manager().current()
+        detector = model.detector
+        extractor = get_extractor(engineer, detector)
+        chunks = read_ndjson(request.stream, config.get('INGEST_CHUNK_SIZE', 1000),
+                             config.get('INGEST_MAX_LINE_BYTES', 65536))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    def generate():
+        totals = {'received': 0, 'stored': 0, 'invalid': 0, 'failed': 0, 'anomalies': 0}
+        try:
+            for chunk in chunks:
+                parsed = [event for _, event, error in chunk if error is None]
+                scored = iter(persist_results(mongo.db, score_events(parsed, engineer, detector, extractor, config)))
+
+                lines = []
+                for line_no, event, error in chunk:
+                    if error is None:
+                        body = result_to_json(next(scored))
+                    else:
+                        body = {'status': 'invalid', 'errors': [error]}
+                    body.update(index=totals['received'], line=line_no)
+                    totals['received'] += 1
+                    totals['stored' if body['status'] == 'ok' else body['status']] += 1
+                    totals['anomalies'] += bool(body.get('is_anomaly'))
+                    lines.append(json.dumps(body))
+                yield '\n'.join(lines) + '\n'
+
+            yield json.dumps({'summary': totals, 'model_version': model.version}) + '\n'
+
+        except Exception as e:
+            yield json.dumps({'error': str(e), 'summary': totals}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @login_analysis_bp.route('/events', methods=['GET'])
 @token_required
 def get_login_events(current_user):
@@ -208,8 +506,6 @@ def get_login_events(current_user):
 def get_login_event(current_user, event_id):
     """Get details of a specific login event"""
     try:
-        from bson import ObjectId
-
         event = mongo.db.login_events.find_one({'_id': ObjectId(event_id)})
 
         if not event:
@@ -220,4 +516,120 @@ def get_login_event(current_user, event_id):
         return jsonify(event), 200
 
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+
+@login_analysis_bp.route('/write-behind', methods=['GET'])
+@token_required
+def get_write_behind_status(current_user):
+    """Write-behind queue depth, flush latency and dropped/spilled counts"""
+    try:
+        write_behind = get_write_behind()
+        if write_behind is None:
+            return jsonify({'enabled': False}), 200
+        return jsonify(dict(write_behind.metrics(), enabled=True)), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@login_analysis_bp.route('/model', methods=['GET'])
+@token_required
+def get_model_status(current_user):
+    """Active and previous model versions, pin and reload state"""
+    try:
+        status = get_model_manager().status()
+        scorer = get_scorer()
+        if scorer is not None:
+            status['scoring'] = scorer.metrics()
+        return jsonify(status), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@login_analysis_bp.route('/model/reload', methods=['POST'])
+@admin_required
+def reload_model(current_user):
+    """
+    Load a new model version in the background and swap it in when warm
+
+    Optional payload:
+    {
+        "path": "login_anomaly_detector.bundle",  # relative to MODEL_PATH
+        "wait": false,   # block until the reload has finished
+        "force": false   # reload even while a version is pinned
+    }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        manager = get_model_manager()
+
+        # Only artifacts under MODEL_PATH may be loaded
+        path = data.get('path')
+        if path is not None:
+            model_dir = os.path.realpath(manager.model_path)
+            path = os.path.realpath(os.path.join(model_dir, path))
+            if not path.startswith(model_dir + os.sep):
+                return jsonify({'error': 'Model path must be inside MODEL_PATH'}), 400
+
+        started = manager.reload(path=path, wait=bool(data.get('wait', False)),
+                                 force=bool(data.get('force', False)))
+        if not started:
+            return jsonify({'error': 'Reload refused (version pinned or reload in progress)',
+                            **manager.status()}), 409
+
+        return jsonify({'message': 'Reload started', **manager.status()}), 202
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@login_analysis_bp.route('/model/pin', methods=['POST'])
+@admin_required
+def pin_model(current_user):
+    """
+    Pin the active (or previous) model version; reloads are refused while pinned
+
+    Optional payload: {"version": "20240115143000-1a2b3c4d"}
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        manager = get_model_manager()
+        try:
+            manager.pin(data.get('version'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        return jsonify(manager.status()), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@login_analysis_bp.route('/model/unpin', methods=['POST'])
+@admin_required
+def unpin_model(current_user):
+    """Allow reloads again"""
+    try:
+        manager = get_model_manager()
+        manager.unpin()
+        return jsonify(manager.status()), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@login_analysis_bp.route('/model/rollback', methods=['POST'])
+@admin_required
+def rollback_model(current_user):
+    """Swap the previous model version back in"""
+    try:
+        manager = get_model_manager()
+        if manager.rollback() is None:
+            return jsonify({'error': 'No previous model version'}), 409
+
+        return jsonify(manager.status()), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
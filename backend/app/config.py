@@ -14,12 +14,70 @@ class Config:
 
     # ML Model Configuration
     MODEL_PATH = os.getenv('MODEL_PATH', './ml_models')
+    # "Unusual pattern" cut-off for legacy models (see Risk Score Thresholds)
     ANOMALY_THRESHOLD = float(os.getenv('ANOMALY_THRESHOLD', '0.7'))
+    # Rank reasons by the features the forest's isolation paths split on
+    ANOMALY_ATTRIBUTION = os.getenv('ANOMALY_ATTRIBUTION', 'true').lower() == 'true'
+    # Events accepted by one POST /api/login/analyze/batch request
+    ANALYZE_BATCH_MAX_EVENTS = int(os.getenv('ANALYZE_BATCH_MAX_EVENTS', '5000'))
+    # Streaming NDJSON ingest: events scored and stored per chunk, longest accepted line
+    INGEST_CHUNK_SIZE = int(os.getenv('INGEST_CHUNK_SIZE', '1000'))
+    INGEST_MAX_LINE_BYTES = int(os.getenv('INGEST_MAX_LINE_BYTES', '65536'))
 
-    # Risk Score Thresholds
-    LOW_RISK_THRESHOLD = 0.3
-    MEDIUM_RISK_THRESHOLD = 0.6
-    HIGH_RISK_THRESHOLD = 0.8
+    # Scoring backend for /analyze: 'thread' scores in the request thread,
+    # 'process' in a pool of worker processes fed through shared memory
+    SCORING_BACKEND = os.getenv('SCORING_BACKEND', 'thread')
+    SCORING_PROCESSES = int(os.getenv('SCORING_PROCESSES', str(os.cpu_count() or 1)))
+    SCORING_RING_SLOTS = int(os.getenv('SCORING_RING_SLOTS', '64'))  # rows in flight per process
+    SCORING_TIMEOUT = float(os.getenv('SCORING_TIMEOUT', '5'))  # seconds
+    # Micro-batching for the thread backend: concurrent requests' rows are
+    # scored together, each waiting at most SCORING_MAX_WAIT_MS for company
+    SCORING_MICRO_BATCH = os.getenv('SCORING_MICRO_BATCH', 'false').lower() == 'true'
+    SCORING_MAX_BATCH = int(os.getenv('SCORING_MAX_BATCH', '64'))  # rows
+    SCORING_MAX_WAIT_MS = float(os.getenv('SCORING_MAX_WAIT_MS', '0.5'))
+
+    # Write-behind persistence for /analyze: events and alerts are queued and
+    # bulk-inserted by a background thread, spilling to a file if MongoDB is down
+    WRITE_BEHIND = os.getenv('WRITE_BEHIND', 'false').lower() == 'true'
+    WRITE_BEHIND_MAX_QUEUE = int(os.getenv('WRITE_BEHIND_MAX_QUEUE', '10000'))  # documents
+    WRITE_BEHIND_FLUSH_SIZE = int(os.getenv('WRITE_BEHIND_FLUSH_SIZE', '500'))  # documents per insert_many
+    WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', '0.2'))  # seconds
+    WRITE_BEHIND_SPILL_PATH = os.getenv('WRITE_BEHIND_SPILL_PATH', './data/write_behind_spill.ndjson')
+
+    # Startup warm-up: 'sync', 'background' or 'off' (see /api/ready)
+    WARMUP_MODE = os.getenv('WARMUP_MODE', 'background')
+    GEOLOCATION_PRIME_LIMIT = int(os.getenv('GEOLOCATION_PRIME_LIMIT', '1000'))  # recent IPs resolved at startup
+    GEOLOCATION_PRIME_BUDGET = float(os.getenv('GEOLOCATION_PRIME_BUDGET', '10'))  # seconds before ready
+
+    # Hot model reload
+    MODEL_WARMUP_ROWS = int(os.getenv('MODEL_WARMUP_ROWS', '32'))  # synthetic scores before going live
+    MODEL_RELOAD_INTERVAL = float(os.getenv('MODEL_RELOAD_INTERVAL', '0'))  # seconds, 0 = no watcher
+
+    # Online profile updates (learn from every analyzed login)
+    PROFILE_ONLINE_UPDATES = os.getenv('PROFILE_ONLINE_UPDATES', 'true').lower() == 'true'
+    PROFILE_HALF_LIFE = float(os.getenv('PROFILE_HALF_LIFE', '50'))  # in logins
+    PROFILE_FLUSH_INTERVAL = float(os.getenv('PROFILE_FLUSH_INTERVAL', '5'))  # seconds
+    PROFILE_FLUSH_BATCH_SIZE = int(os.getenv('PROFILE_FLUSH_BATCH_SIZE', '500'))
+    PROFILE_ONLINE_MAX_USERS = int(os.getenv('PROFILE_ONLINE_MAX_USERS', '100000'))
+
+    # Recent-login ring buffer (used when the model has velocity features)
+    LOGIN_HISTORY_CAPACITY = int(os.getenv('LOGIN_HISTORY_CAPACITY', '10'))  # logins per user
+    LOGIN_HISTORY_MAX_USERS = int(os.getenv('LOGIN_HISTORY_MAX_USERS', '100000'))
+    LOGIN_HISTORY_WARMUP_HOURS = int(os.getenv('LOGIN_HISTORY_WARMUP_HOURS', '24'))
+
+    # Sliding-window failure counters (used when the model has failure features)
+    FAILURE_COUNTER_IP_MODE = os.getenv('FAILURE_COUNTER_IP_MODE', 'approx')  # 'approx' or 'exact'
+    FAILURE_COUNTER_MAX_KEYS = int(os.getenv('FAILURE_COUNTER_MAX_KEYS', '100000'))
+
+    # Risk Score Thresholds. Calibrated models report risk as the share of
+    # training logins that scored as more normal, so 0.99 = top 1%. Medium
+    # risk is also the "unusual pattern" and dashboard high-risk cut-off.
+    MEDIUM_RISK_THRESHOLD = float(os.getenv('MEDIUM_RISK_THRESHOLD', '0.95'))
+    HIGH_RISK_THRESHOLD = float(os.getenv('HIGH_RISK_THRESHOLD', '0.99'))
+    # Legacy pickled models have no calibration table (their risk is the
+    # clipped linear score), so they keep the thresholds tuned for that scale
+    LEGACY_MEDIUM_RISK_THRESHOLD = float(os.getenv('LEGACY_MEDIUM_RISK_THRESHOLD', '0.6'))
+    LEGACY_HIGH_RISK_THRESHOLD = float(os.getenv('LEGACY_HIGH_RISK_THRESHOLD', '0.8'))
 
     # Geolocation API (optional - can use offline database)
     IPSTACK_API_KEY = os.getenv('IPSTACK_API_KEY', '')
@@ -38,6 +96,7 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     DEBUG = True
     TESTING = True
+    WARMUP_MODE = 'off'
     MONGO_URI = 'mongodb://localhost:27017/security_detection_test'
 
 
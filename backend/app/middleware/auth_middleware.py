@@ -27,7 +27,8 @@ def token_required(f):
             data = jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=['HS256'])
             current_user = {
                 'user_id': data['user_id'],
-                'username': data['username']
+                'username': data['username'],
+                'role': data.get('role', 'analyst')
             }
         except jwt.ExpiredSignatureError:
             return jsonify({'error': 'Token has expired'}), 401
@@ -36,4 +37,18 @@ def token_required(f):
 
         return f(current_user, *args, **kwargs)
 
-    return decorated
\ No newline at end of file
+    return decorated
+
+
+def admin_required(f):
+    """Decorator to require a JWT token with the admin role"""
+
+    @wraps(f)
+    @token_required
+    def decorated(current_user, *args, **kwargs):
+        if current_user.get('role') != 'admin':
+            return jsonify({'error': 'Admin privileges required'}), 403
+
+        return f(current_user, *args, **kwargs)
+
+    return decorated
@@ -3,31 +3,133 @@ import pandas as pd
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 import joblib
+import copy
+import io
 import os
-from typing import Dict, Tuple, List
+import threading
+from typing import Dict, Tuple, List, Optional
 from datetime import datetime
 
+from app.ml.forest_engine import ForestEngine
+from app.ml.model_bundle import ModelBundle, write_bundle
+from app.ml.profile_store import ProfileStore
+
+# Wording for features named by path attribution
+_FEATURE_LABELS = {
+    'hour': 'login hour',
+    'day_of_week': 'day of week',
+    'is_weekend': 'weekend login',
+    'is_work_hours': 'login outside work hours',
+    'is_night': 'night-time login',
+    'latitude': 'location (latitude)',
+    'longitude': 'location (longitude)',
+    'distance_from_typical': 'distance from typical location',
+    'browser': 'browser',
+    'os': 'operating system',
+    'is_mobile': 'device type',
+    'is_typical_device': 'device',
+    'success': 'login outcome',
+    'seconds_since_last_login': 'time since previous login',
+    'travel_speed_kmh': 'travel speed since previous login',
+    'device_switches': 'number of device switches',
+    'user_failures_5m': 'recent failed logins for this account',
+    'user_failures_1h': 'failed logins for this account in the last hour',
+    'ip_failures_5m': 'recent failed logins from this IP address',
+    'ip_failures_1h': 'failed logins from this IP address in the last hour',
+    'ip_distinct_users_1h': 'accounts seen from this IP address',
+}
+
 
 class LoginAnomalyDetector:
     """Detect anomalous login attempts using Isolation Forest"""
 
-    def __init__(self, model_path='./ml_models', contamination=0.1):
+    # Above this many rows sklearn's compiled per-tree traversal outruns the
+    # vectorized ForestEngine, whose advantage is the per-call overhead
+    ENGINE_MAX_ROWS = 512
+
+    # Training score quantiles summarized by the calibration table
+    # (0, 0.1%, ..., 100%)
+    CALIBRATION_QUANTILES = 1001
+
+    # Path attribution: features weighing at least this many times their
+    # training-average share are named as reasons (at most this many)
+    ATTRIBUTION_MIN_LIFT = 1.5
+    ATTRIBUTION_MAX_REASONS = 3
+
+    # Share of the forest replaced by a warm-start refresh
+    REFRESH_FRACTION = 0.1
+
+    def __init__(self, model_path='./ml_models', contamination=0.1, use_engine=True, fuse_scaler=True,
+                 n_estimators=100, max_samples='auto', max_features=1.0, n_jobs=-1,
+                 unusual_risk=0.95, legacy_unusual_risk=0.7):
         """
         Initialize the anomaly detector
 
         Args:
             model_path: Path to save/load models
             contamination: Expected proportion of outliers in the dataset
+            use_engine: Score small batches with the flattened-array
+                ForestEngine instead of sklearn
+            fuse_scaler: Fold the scaler into the engine's split thresholds
+                so the engine scores raw rows (identical decisions)
+            n_estimators: Trees in the forest
+            max_samples: Rows drawn per tree ('auto' = min(256, n))
+            max_features: Features (count or fraction) drawn per tree
+            n_jobs: Processes used to fit the forest (-1 = all cores)
+            unusual_risk: Risk from which a login no rule explains is
+                reported as an unusual pattern
+            legacy_unusual_risk: The same cut-off for models without a
+                calibration table, whose risks keep the linear scale
         """
         self.model_path = model_path
         self.contamination = contamination
-        self.model = None
+        self.n_estimators = n_estimators
+        self.max_samples = max_samples
+        self.max_features = max_features
+        self.n_jobs = n_jobs
+        self.unusual_risk = unusual_risk
+        self.legacy_unusual_risk = legacy_unusual_risk
+        self.use_engine = use_engine
+        self.fuse_scaler = fuse_scaler
+        self._model = None
+        self._model_loader = None
+        self._model_lock = threading.Lock()
         self.scaler = None
+        self.engine = None
+        self.calibration = None
+        self.attribution_baseline = None
+        # Refresh generation each tree was grown in (0 = initial training)
+        self.tree_generation = None
+        self.refreshed_at = None
         self.feature_columns = None
+        self.bundle = None
+        self.model_version = None
 
         # Create model directory if it doesn't exist
         os.makedirs(model_path, exist_ok=True)
 
+    @property
+    def model(self) -> Optional[IsolationForest]:
+        """The sklearn forest; unpickled from the bundle on first use"""
+        if self._model is None and self._model_loader is not None:
+            with self._model_lock:
+                if self._model is None and self._model_loader is not None:
+                    self._model = self._model_loader()
+                    self._model_loader = None
+        return self._model
+
+    @model.setter
+    def model(self, model: Optional[IsolationForest]):
+        self._model = model
+        self._model_loader = None
+
+    @property
+    def is_ready(self) -> bool:
+        """A model is trained or loaded (without forcing a lazy unpickle)"""
+        return self.scaler is not None and (
+            self.engine is not None or self._model is not None or self._model_loader is not None
+        )
+
     def train(self, features_df: pd.DataFrame):
         """
         Train the Isolation Forest model
@@ -37,80 +139,373 @@ class LoginAnomalyDetector:
         """
         # Select feature columns (exclude metadata columns)
         exclude_cols = ['user_id', 'timestamp']
-        self.feature_columns = [col for col in features_df.columns if col not in exclude_cols]
+        feature_columns = [col for col in features_df.columns if col not in exclude_cols]
 
-        X = features_df[self.feature_columns].values
+        self.train_matrix(features_df[feature_columns].values, feature_columns)
+
+    def train_matrix(self, X: np.ndarray, feature_columns: List[str]):
+        """
+        Train on a feature matrix
+
+        Args:
+            X: Rows of shape (n, n_features) in feature_columns order
+            feature_columns: Feature names of the columns
+        """
+        self.feature_columns = list(feature_columns)
+        X = np.asarray(X, dtype=np.float64)
 
         # Scale features
         self.scaler = StandardScaler()
         X_scaled = self.scaler.fit_transform(X)
 
+        self._fit_forest(X, X_scaled)
+
+    def train_sample(self, sample: np.ndarray, feature_columns: List[str], scaler: StandardScaler):
+        """
+        Train on a sample of rows with a scaler fitted on all of them
+
+        Used by out-of-core training: the scaler is fitted incrementally
+        over every row (partial_fit) and the forest, which only ever looks
+        at max_samples rows per tree, on a uniform sample.
+
+        Args:
+            sample: Rows of shape (n, n_features) in feature_columns order
+            feature_columns: Feature names of the columns
+            scaler: StandardScaler fitted on all training rows
+        """
+        self.feature_columns = list(feature_columns)
+        self.scaler = scaler
+        X = np.asarray(sample, dtype=np.float64)
+        self._fit_forest(X, scaler.transform(X))
+
+    def _fit_forest(self, X: np.ndarray, X_scaled: np.ndarray):
+        """Fit the forest on scaled rows, then derive engine, calibration and attribution baseline"""
         # Train Isolation Forest
         self.model = IsolationForest(
             contamination=self.contamination,
             random_state=42,
-            n_estimators=100,
-            max_samples='auto',
+            n_estimators=self.n_estimators,
+            max_samples=self.max_samples,
+            max_features=self.max_features,
             bootstrap=False,
-            n_jobs=-1,
+            n_jobs=self.n_jobs,
             verbose=0
         )
 
         self.model.fit(X_scaled)
+        self.tree_generation = np.zeros(len(self.model.estimators_), dtype=np.int64)
+        self.refreshed_at = None
+        self._build_engine()
+        self.calibration = self._fit_calibration(self.model.score_samples(X_scaled))
+        self.attribution_baseline = self._fit_attribution_baseline(X)
 
         print(f"Model trained with {len(X)} samples")
         print(f"Features used: {self.feature_columns}")
 
-    def predict(self, features: Dict) -> Tuple[bool, float, List[str]]:
+    def refresh(self, X, n_trees: Optional[int] = None) -> Dict:
+        """
+        Warm-start refresh: replace the oldest trees with trees grown on recent rows
+
+        The scaler statistics are updated with the recent rows (streaming
+        mean and variance, StandardScaler.partial_fit) and the split
+        thresholds of the trees that are kept are moved to the new scaling,
+        so they still split at the same raw values. The n_trees trees of the
+        oldest generations are retired and as many are grown on the recent
+        rows with the forest's subsample size and feature sampling. The
+        decision offset, calibration table and attribution baseline are
+        recomputed from the recent rows' scores. Save the result with
+        save_model to publish it as a new version.
+
+        Args:
+            X: Recent rows; DataFrame with the feature columns, or array of
+                shape (n, n_features) in feature_columns order. At least
+                the forest's max_samples rows.
+            n_trees: Trees to replace (default REFRESH_FRACTION of the forest)
+
+        Returns:
+            Summary: generation, retired (tree generations), grown, rows,
+            offset
+        """
+        if not self.is_ready:
+            raise ValueError("Model not trained or loaded")
+
+        if isinstance(X, pd.DataFrame):
+            X = X[self.feature_columns].to_numpy(dtype=np.float64)
+        X = np.asarray(X, dtype=np.float64)
+
+        # Work on copies so a failed refresh leaves the detector untouched
+        model = copy.deepcopy(self.model)
+        n_estimators = len(model.estimators_)
+        if n_trees is None:
+            n_trees = max(1, int(round(n_estimators * self.REFRESH_FRACTION)))
+        if not 1 <= n_trees <= n_estimators:
+            raise ValueError(f"n_trees must be between 1 and {n_estimators}, got {n_trees}")
+        if len(X) < model.max_samples_:
+            raise ValueError(f"Refresh needs at least {model.max_samples_} rows, got {len(X)}")
+
+        scaler = copy.deepcopy(self.scaler)
+        scaler.partial_fit(X)
+        X_scaled = scaler.transform(X)
+
+        generations = self.tree_generation if self.tree_generation is not None \
+            else np.zeros(n_estimators, dtype=np.int64)
+        generation = int(generations.max()) + 1
+        retire = np.argsort(generations, kind='stable')[:n_trees]
+        keep = np.setdiff1d(np.arange(n_estimators), retire)
+
+        grown = IsolationForest(
+            n_estimators=n_trees,
+            max_samples=model.max_samples_,
+            max_features=model.max_features,
+            bootstrap=model.bootstrap,
+            random_state=42 + generation,
+            n_jobs=self.n_jobs
+        ).fit(X_scaled)
+
+        # Same raw split values under the new scaling
+        for idx in keep:
+            tree = model.estimators_[idx].tree_
+            splits = tree.children_left != -1
+            columns = np.asarray(model.estimators_features_[idx])[tree.feature[splits]]
+            raw = tree.threshold[splits] * self.scaler.scale_[columns] + self.scaler.mean_[columns]
+            tree.threshold[splits] = (raw - scaler.mean_[columns]) / scaler.scale_[columns]
+
+        # Splice the per-tree state sklearn keeps alongside estimators_
+        model.estimators_ = [model.estimators_[i] for i in keep] + grown.estimators_
+        model.estimators_features_ = [model.estimators_features_[i] for i in keep] + grown.estimators_features_
+        model._average_path_length_per_tree = tuple(
+            [model._average_path_length_per_tree[i] for i in keep] + list(grown._average_path_length_per_tree)
+        )
+        model._decision_path_lengths = tuple(
+            [model._decision_path_lengths[i] for i in keep] + list(grown._decision_path_lengths)
+        )
+        seeds = getattr(model, '_seeds', None)
+        if seeds is not None and len(seeds) == n_estimators:
+            model._seeds = np.concatenate([np.asarray(seeds)[keep], grown._seeds])
+
+        scores = model.score_samples(X_scaled)
+        if model.contamination != 'auto':
+            model.offset_ = np.percentile(scores, 100.0 * model.contamination)
+
+        retired = generations[retire]
+        self.model = model
+        self.scaler = scaler
+        self.tree_generation = np.concatenate([generations[keep], np.full(n_trees, generation, dtype=np.int64)])
+        self.refreshed_at = datetime.utcnow().isoformat()
+        self._build_engine()
+        self.calibration = self._fit_calibration(scores)
+        self.attribution_baseline = self._fit_attribution_baseline(X)
+
+        print(f"Refreshed {n_trees} of {n_estimators} trees on {len(X)} rows (generation {generation})")
+        return {
+            'generation': generation,
+            'retired': retired.tolist(),
+            'grown': n_trees,
+            'rows': len(X),
+            'offset': float(model.offset_)
+        }
+
+    def predict(self, features: Dict, explain: bool = False) -> Tuple[bool, float, List[str]]:
         """
         Predict if a login is anomalous
 
         Args:
             features: Dictionary of engineered features
+            explain: Rank reasons by path attribution (see predict_batch)
 
         Returns:
             Tuple of (is_anomaly, risk_score, reasons)
         """
-        if self.model is None or self.scaler is None:
+        if not self.is_ready:
             raise ValueError("Model not trained or loaded")
 
         # Prepare features in correct order
         X = np.array([[features[col] for col in self.feature_columns]])
+        return self.predict_row(X, explain)
 
-        # Scale features
-        X_scaled = self.scaler.transform(X)
+    def predict_row(self, X: np.ndarray, explain: bool = False) -> Tuple[bool, float, List[str]]:
+        """
+        Predict if a login is anomalous from a prepared feature row
+
+        Args:
+            X: Array of shape (1, n_features) in feature_columns order, e.g.
+                filled by CompiledFeatureExtractor
+            explain: Rank reasons by path attribution (see predict_batch)
+
+        Returns:
+            Tuple of (is_anomaly, risk_score, reasons)
+        """
+        results = self.predict_batch(X, explain)
+        return bool(results['is_anomaly'][0]), float(results['risk_score'][0]), results['reasons'][0]
 
-        # Predict (-1 for anomaly, 1 for normal)
-        prediction = self.model.predict(X_scaled)[0]
-        is_anomaly = prediction == -1
+    def predict_batch(self, X, explain: bool = False) -> Dict:
+        """
+        Predict anomalies for a batch of logins
 
-        # Get anomaly score (more negative = more anomalous)
-        anomaly_score = self.model.score_samples(X_scaled)[0]
+        Scales once and walks the forest once: the label is derived from the
+        anomaly score and the model's offset_ (exactly what
+        IsolationForest.predict computes) instead of a second traversal.
 
-        # Convert to risk score (0 to 1, where 1 is highest risk)
-        # Isolation Forest scores are typically between -0.5 and 0.5
-        # We'll normalize to 0-1 range
-        risk_score = self._normalize_score(anomaly_score)
+        With explain, the forest engine also records which features the
+        isolation paths split on (same traversal, any batch size). Each
+        feature's share of that weight relative to its average share on the
+        training data ("lift", 1 = typical) orders the rule-based reasons,
+        and for anomalies names up to ATTRIBUTION_MAX_REASONS further
+        features the rules do not cover.
 
-        # Identify reasons for anomaly
-        reasons = self._identify_anomaly_reasons(features, risk_score)
+        Args:
+            X: DataFrame with the feature columns, or array of shape
+                (n, n_features) in feature_columns order
+            explain: Compute path attribution and rank reasons by it
 
-        return is_anomaly, risk_score, reasons
+        Returns:
+            Dictionary of columns: is_anomaly (bool array), risk_score
+            (float array), anomaly_score (raw score_samples array) and
+            reasons (list of lists); with explain also attribution (lift
+            per feature, array of shape (n, n_features))
+        """
+        if not self.is_ready:
+            raise ValueError("Model not trained or loaded")
+
+        if isinstance(X, pd.DataFrame):
+            X = X[self.feature_columns].to_numpy(dtype=np.float64)
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        attribution = None
+        if explain:
+            anomaly_scores, contributions = self._attribute(X)
+            attribution = self._attribution_lift(contributions)
+        else:
+            anomaly_scores = self._score_samples(X)
+
+        # More negative = more anomalous; below the offset is an outlier
+        offset = self.engine.offset if self.engine is not None else self.model.offset_
+        is_anomaly = anomaly_scores < offset
+
+        risk_scores = self._normalize_scores(anomaly_scores)
+        reasons = self._identify_anomaly_reasons_batch(self._matrix_columns(X), risk_scores,
+                                                       attribution, is_anomaly)
+
+        results = {
+            'is_anomaly': is_anomaly,
+            'risk_score': risk_scores,
+            'anomaly_score': anomaly_scores,
+            'reasons': reasons
+        }
+        if explain:
+            results['attribution'] = attribution
+        return results
+
+    def _build_engine(self):
+        """Export the fitted forest for fast small-batch scoring"""
+        self.engine = None
+        if self.use_engine:
+            self.engine = ForestEngine.from_sklearn(self.model)
+            if self.fuse_scaler:
+                self.engine = self.engine.fuse_scaler(self.scaler)
+
+    def _score_samples(self, X: np.ndarray) -> np.ndarray:
+        """Raw IsolationForest scores of unscaled rows"""
+        if self.engine is not None and len(X) <= self.ENGINE_MAX_ROWS:
+            if self.engine.fused:
+                return self.engine.score_samples(X)
+            return self.engine.score_samples(self.scaler.transform(X))
+        return self.model.score_samples(self.scaler.transform(X))
+
+    def _attribute(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Scores and per-feature path contributions of unscaled rows"""
+        if self.engine is None:
+            raise ValueError("Attribution needs the forest engine (use_engine=True)")
+        if self.engine.fused:
+            return self.engine.score_samples(X, attribute=True)
+        return self.engine.score_samples(self.scaler.transform(X), attribute=True)
+
+    def _fit_attribution_baseline(self, X: np.ndarray) -> Optional[np.ndarray]:
+        """Average share of path contributions per feature on training rows"""
+        if self.engine is None:
+            return None
+        _, contributions = self._attribute(X)
+        totals = contributions.sum(axis=1, keepdims=True)
+        shares = np.divide(contributions, totals, out=np.zeros_like(contributions), where=totals > 0)
+        return shares.mean(axis=0)
+
+    def _attribution_lift(self, contributions: np.ndarray) -> np.ndarray:
+        """Each feature's share of a row's contributions over its baseline share"""
+        totals = contributions.sum(axis=1, keepdims=True)
+        shares = np.divide(contributions, totals, out=np.zeros_like(contributions), where=totals > 0)
+        baseline = self.attribution_baseline
+        if baseline is None:
+            baseline = np.full(contributions.shape[1], 1.0 / contributions.shape[1])
+        return np.divide(shares, baseline, out=np.zeros_like(shares), where=baseline > 0)
+
+    def _matrix_columns(self, X: np.ndarray):
+        """Accessor returning a feature column of X (or a default column)"""
+        index = {col: i for i, col in enumerate(self.feature_columns)}
+
+        def column(name, default):
+            i = index.get(name)
+            return X[:, i] if i is not None else np.full(len(X), default)
+        return column
+
+    def _fit_calibration(self, scores: np.ndarray) -> np.ndarray:
+        """
+        Calibration table of the training scores (a piecewise-linear ECDF)
+
+        Scores are summarized by CALIBRATION_QUANTILES quantiles. Tied
+        quantiles (many identical training rows score identically) collapse
+        into one knot at their mean ECDF position, so the curve is continuous
+        and scores differing in the last bits get practically equal risks.
+
+        Args:
+            scores: score_samples of the training rows
+
+        Returns:
+            Array of shape (2, m): strictly increasing knot scores, and the
+            ECDF (0-1, non-decreasing) at each knot
+        """
+        positions = np.linspace(0, 1, self.CALIBRATION_QUANTILES)
+        quantiles = np.quantile(scores, positions)
+        knots, inverse = np.unique(quantiles, return_inverse=True)
+        cdf = np.bincount(inverse, weights=positions) / np.bincount(inverse)
+        if len(knots) == 1:
+            # Constant scores: any score is as risky as the training data
+            knots = np.array([knots[0], np.nextafter(knots[0], np.inf)])
+            cdf = np.array([0.5, 0.5])
+        return np.ascontiguousarray(np.stack([knots, cdf]), dtype=np.float64)
 
     def _normalize_score(self, score: float) -> float:
         """
         Normalize anomaly score to 0-1 range
 
         More negative scores indicate more anomalous behavior
-        Typical range is approximately -0.5 to 0.5
         """
-        # Clamp score to reasonable range
-        score = np.clip(score, -0.5, 0.5)
+        return float(self._normalize_scores(np.asarray([score]))[0])
+
+    def _normalize_scores(self, scores: np.ndarray) -> np.ndarray:
+        """
+        Vectorized _normalize_score
+
+        With a calibration table the risk is the share of training logins
+        that scored as more normal (1 - ECDF, found by binary search over the
+        knots and interpolated linearly between them), so a risk of 0.99
+        means the top 1% of training traffic wherever a particular forest's
+        scores happen to cluster. Models without a table (legacy pickles)
+        clip to [-0.5, 0.5] and map linearly.
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        if self.calibration is None:
+            # Clamp score to reasonable range
+            scores = np.clip(scores, -0.5, 0.5)
 
-        # Normalize to 0-1 (invert so higher = more risky)
-        normalized = 1 - ((score + 0.5) / 1.0)
+            # Normalize to 0-1 (invert so higher = more risky)
+            return 1 - ((scores + 0.5) / 1.0)
 
-        return float(normalized)
+        knots, cdf = self.calibration
+        lower = np.clip(np.searchsorted(knots, scores, side='right') - 1, 0, len(knots) - 2)
+        fraction = np.clip((scores - knots[lower]) / (knots[lower + 1] - knots[lower]), 0.0, 1.0)
+        return 1 - (cdf[lower] + fraction * (cdf[lower + 1] - cdf[lower]))
 
     def _identify_anomaly_reasons(self, features: Dict, risk_score: float) -> List[str]:
         """
@@ -123,57 +518,196 @@ class LoginAnomalyDetector:
         Returns:
             List of human-readable reasons
         """
-        reasons = []
+        def column(name, default):
+            return np.array([features.get(name, default)])
+        return self._identify_anomaly_reasons_batch(column, np.array([risk_score]))[0]
+
+    def _identify_anomaly_reasons_batch(self, column, risk_scores: np.ndarray,
+                                         attribution: Optional[np.ndarray] = None,
+                                         is_anomaly: Optional[np.ndarray] = None) -> List[List[str]]:
+        """
+        Identify reasons for a batch of logins
+
+        Every rule is evaluated as a mask over the whole batch; reasons are
+        then appended to the rows it matches, in rule order.
+
+        Args:
+            column: column(name, default) -> array of that feature per row
+            risk_scores: Calculated risk scores
+            attribution: Optional path attribution lift, shape (n,
+                n_features) in feature_columns order; reasons are then sorted
+                by the lift of the feature behind them
+            is_anomaly: Rows that get attributed reasons for features no
+                rule covers (with attribution)
+
+        Returns:
+            List of human-readable reasons per row
+        """
+        # (feature, message) per row; the feature ranks it under attribution
+        reasons = [[] for _ in range(len(risk_scores))]
+
+        def add(mask, message, feature=None):
+            for i in np.flatnonzero(mask):
+                reasons[i].append((feature, message if isinstance(message, str) else message(i)))
+
+        is_night = column('is_night', 0)
+        is_weekend = column('is_weekend', 0)
 
         # Check for off-hours login
-        if features.get('is_night', 0) == 1:
-            reasons.append("Login attempt during unusual hours (late night/early morning)")
+        add(is_night == 1, "Login attempt during unusual hours (late night/early morning)", 'is_night')
 
-        if features.get('is_work_hours', 0) == 0 and features.get('is_weekend', 0) == 0:
-            reasons.append("Login outside typical work hours on weekday")
+        add((column('is_work_hours', 0) == 0) & (is_weekend == 0),
+            "Login outside typical work hours on weekday", 'is_work_hours')
 
         # Check for weekend login
-        if features.get('is_weekend', 0) == 1:
-            reasons.append("Login attempt during weekend")
+        add(is_weekend == 1, "Login attempt during weekend", 'is_weekend')
 
         # Check for unusual location
-        distance = features.get('distance_from_typical', 0)
-        if distance > 100:  # More than 100km from typical location
-            reasons.append(f"Login from unusual location (>{int(distance)}km from typical)")
+        distance = column('distance_from_typical', 0)
+        add(distance > 100,  # More than 100km from typical location
+            lambda i: f"Login from unusual location (>{int(distance[i])}km from typical)",
+            'distance_from_typical')
+
+        # Check for impossible travel since the previous login
+        speed = column('travel_speed_kmh', 0)
+        add(speed > 1000,  # Faster than a commercial flight
+            lambda i: f"Impossible travel since previous login ({int(speed[i])} km/h)",
+            'travel_speed_kmh')
 
         # Check for new/unusual device
-        if features.get('is_typical_device', 0) == 0:
-            reasons.append("Login from new or unusual device")
+        add(column('is_typical_device', 0) == 0, "Login from new or unusual device", 'is_typical_device')
 
         # Check for failed login
-        if features.get('success', 1) == 0:
-            reasons.append("Failed login attempt")
+        add(column('success', 1) == 0, "Failed login attempt", 'success')
+
+        # Check for bursts of failures (brute force / credential stuffing)
+        user_failures = column('user_failures_5m', 0)
+        add(user_failures >= 5,
+            lambda i: f"Burst of failed logins for this account ({int(user_failures[i])} in last 5 minutes)",
+            'user_failures_5m')
+
+        ip_failures = column('ip_failures_1h', 0)
+        add(ip_failures >= 20,
+            lambda i: f"Many failed logins from this IP address ({int(ip_failures[i])} in last hour)",
+            'ip_failures_1h')
+
+        ip_users = column('ip_distinct_users_1h', 0)
+        add(ip_users >= 10,
+            lambda i: f"IP address used by many accounts (~{int(ip_users[i])} in last hour)",
+            'ip_distinct_users_1h')
+
+        if attribution is not None:
+            self._add_attributed_reasons(reasons, attribution, is_anomaly)
 
         # If high risk but no specific reasons identified
-        if risk_score > 0.7 and not reasons:
-            reasons.append("Unusual pattern detected in login behavior")
+        unusual_risk = self.unusual_risk if self.calibration is not None else self.legacy_unusual_risk
+        add((risk_scores >= unusual_risk) & np.array([not r for r in reasons], dtype=bool),
+            "Unusual pattern detected in login behavior")
+
+        if attribution is not None:
+            index = {col: i for i, col in enumerate(self.feature_columns)}
+            for i, row in enumerate(reasons):
+                lift = attribution[i]
+                row.sort(key=lambda reason: -lift[index[reason[0]]] if reason[0] in index else 0.0)
+
+        return [[message for _, message in row] for row in reasons]
+
+    def _add_attributed_reasons(self, reasons: List[List[Tuple]], attribution: np.ndarray,
+                                is_anomaly: Optional[np.ndarray]):
+        """Name the most over-weighted features of anomalous rows not covered by a rule"""
+        rows = np.flatnonzero(is_anomaly) if is_anomaly is not None else range(len(reasons))
+        for i in rows:
+            covered = {feature for feature, _ in reasons[i]}
+            added = 0
+            for j in np.argsort(-attribution[i], kind='stable'):
+                lift = attribution[i, j]
+                if lift < self.ATTRIBUTION_MIN_LIFT or added == self.ATTRIBUTION_MAX_REASONS:
+                    break
+                feature = self.feature_columns[j]
+                if feature in covered:
+                    continue
+                label = _FEATURE_LABELS.get(feature, feature.replace('_', ' '))
+                reasons[i].append((feature, f"Unusual {label} ({lift:.1f}x its usual weight in the model)"))
+                added += 1
+
+    def save_model(self, model_name='login_anomaly_detector', profiles=None) -> str:
+        """
+        Save the trained model as a single bundle file
 
-        return reasons
+        The bundle holds the feature schema, scaler statistics, the forest
+        as flat arrays (raw and scaler-fused thresholds), the score
+        calibration table, the attribution baseline, the pickled sklearn
+        model and, optionally, the user profiles. It is written atomically.
 
-    def save_model(self, model_name='login_anomaly_detector'):
-        """Save the trained model and scaler"""
+        Args:
+            model_name: Bundle name (<model_path>/<model_name>.bundle)
+            profiles: user_id -> profile mapping or ProfileStore to include
+
+        Returns:
+            Path of the written bundle
+        """
         if self.model is None or self.scaler is None:
             raise ValueError("No model to save. Train the model first.")
 
-        model_file = os.path.join(self.model_path, f'{model_name}.pkl')
-        scaler_file = os.path.join(self.model_path, f'{model_name}_scaler.pkl')
-        features_file = os.path.join(self.model_path, f'{model_name}_features.pkl')
+        engine = ForestEngine.from_sklearn(self.model)
+        fused = engine.fuse_scaler(self.scaler)
 
-        joblib.dump(self.model, model_file)
-        joblib.dump(self.scaler, scaler_file)
-        joblib.dump(self.feature_columns, features_file)
+        model_bytes = io.BytesIO()
+        joblib.dump(self.model, model_bytes)
 
-        print(f"Model saved to {model_file}")
-        print(f"Scaler saved to {scaler_file}")
-        print(f"Features saved to {features_file}")
+        sections = {
+            'scaler/mean': self.scaler.mean_,
+            'scaler/scale': self.scaler.scale_,
+            'scaler/var': self.scaler.var_,
+        }
+        sections.update({f'forest/{name}': array for name, array in engine.to_arrays().items()})
+        sections['forest/fused_threshold'] = fused.threshold
+        sections['model/sklearn'] = np.frombuffer(model_bytes.getvalue(), dtype=np.uint8)
+        if self.calibration is not None:
+            sections['calibration/table'] = self.calibration
+        if self.attribution_baseline is not None:
+            sections['attribution/baseline'] = self.attribution_baseline
+        if self.tree_generation is not None:
+            sections['refresh/tree_generation'] = self.tree_generation
+
+        manifest = {
+            'model_name': model_name,
+            'feature_schema': {'columns': list(self.feature_columns), 'dtype': 'float64'},
+            'scaler': {'n_samples_seen': int(self.scaler.n_samples_seen_)},
+            'forest': dict(engine.to_params(), n_estimators=len(self.model.estimators_),
+                           max_samples=int(self.model.max_samples_), max_features=self.model.max_features),
+            'contamination': self.contamination,
+            'calibration': {'knots': self.calibration.shape[1]} if self.calibration is not None else None,
+            'refresh': {
+                'generation': int(self.tree_generation.max()) if self.tree_generation is not None else 0,
+                'refreshed_at': self.refreshed_at,
+            },
+        }
+
+        if profiles is not None:
+            store = profiles if isinstance(profiles, ProfileStore) else ProfileStore.from_profiles(profiles)
+            sections.update({f'profiles/{name}': array for name, array in store.to_arrays().items()})
+            manifest['profiles'] = {'device_vocab': store.device_vocab, 'n_users': len(store)}
+
+        bundle_file = os.path.join(self.model_path, f'{model_name}.bundle')
+        manifest = write_bundle(bundle_file, sections, manifest)
+        self.model_version = manifest['version']
+
+        print(f"Model bundle saved to {bundle_file} (version {self.model_version})")
+        return bundle_file
 
     def load_model(self, model_name='login_anomaly_detector'):
-        """Load a trained model and scaler"""
+        """
+        Load a trained model
+
+        Prefers <model_name>.bundle and falls back to the legacy layout of
+        separate joblib pickles for model, scaler and features.
+        """
+        bundle_file = os.path.join(self.model_path, f'{model_name}.bundle')
+        if os.path.exists(bundle_file):
+            self.load_bundle(bundle_file)
+            return
+
         model_file = os.path.join(self.model_path, f'{model_name}.pkl')
         scaler_file = os.path.join(self.model_path, f'{model_name}_scaler.pkl')
         features_file = os.path.join(self.model_path, f'{model_name}_features.pkl')
@@ -184,10 +718,69 @@ class LoginAnomalyDetector:
         self.model = joblib.load(model_file)
         self.scaler = joblib.load(scaler_file)
         self.feature_columns = joblib.load(features_file)
+        self.calibration = None
+        self.attribution_baseline = None
+        self.tree_generation = np.zeros(len(self.model.estimators_), dtype=np.int64)
+        self.refreshed_at = None
+        self.bundle = None
+        self.model_version = None
+        self._build_engine()
 
         print(f"Model loaded from {model_file}")
         print(f"Features: {self.feature_columns}")
 
+    def load_bundle(self, bundle_file: str):
+        """
+        Load a model bundle written by save_model
+
+        The forest arrays are used in place from the memory-mapped file. The
+        sklearn model is only unpickled if something needs it (batches above
+        ENGINE_MAX_ROWS, evaluate, or use_engine=False).
+        """
+        bundle = ModelBundle(bundle_file)
+        manifest = bundle.manifest
+        feature_columns = manifest['feature_schema']['columns']
+
+        scaler = StandardScaler()
+        scaler.mean_ = np.array(bundle.array('scaler/mean'))
+        scaler.scale_ = np.array(bundle.array('scaler/scale'))
+        scaler.var_ = np.array(bundle.array('scaler/var'))
+        scaler.n_features_in_ = len(scaler.mean_)
+        scaler.n_samples_seen_ = manifest['scaler']['n_samples_seen']
+        if scaler.n_features_in_ != len(feature_columns):
+            raise ValueError(f"Bundle feature schema does not match its scaler: {bundle_file}")
+
+        self.bundle = bundle
+        self.scaler = scaler
+        self.feature_columns = feature_columns
+        self.calibration = np.array(bundle.array('calibration/table')) \
+            if 'calibration/table' in bundle else None
+        self.attribution_baseline = np.array(bundle.array('attribution/baseline')) \
+            if 'attribution/baseline' in bundle else None
+        self.tree_generation = np.array(bundle.array('refresh/tree_generation')) \
+            if 'refresh/tree_generation' in bundle else np.zeros(manifest['forest']['n_estimators'], dtype=np.int64)
+        self.refreshed_at = (manifest.get('refresh') or {}).get('refreshed_at')
+        self._model = None
+        self._model_loader = lambda: joblib.load(io.BytesIO(bundle.array('model/sklearn')))
+        self.engine = None
+        if self.use_engine:
+            arrays = bundle.arrays('forest')
+            if self.fuse_scaler:
+                arrays['threshold'] = arrays['fused_threshold']
+            params = {name: manifest['forest'][name] for name in ('max_depth', 'denominator', 'offset')}
+            self.engine = ForestEngine.from_arrays(arrays, params, fused=self.fuse_scaler)
+        self.model_version = manifest['version']
+
+        print(f"Model bundle loaded from {bundle_file} (version {self.model_version})")
+        print(f"Features: {self.feature_columns}")
+
+    def load_profiles(self) -> Optional[ProfileStore]:
+        """User profiles stored in the loaded bundle (memory-mapped), if any"""
+        if self.bundle is None or 'profiles' not in self.bundle.manifest:
+            return None
+        return ProfileStore.from_arrays(self.bundle.arrays('profiles'),
+                                        self.bundle.manifest['profiles']['device_vocab'])
+
     def evaluate(self, features_df: pd.DataFrame, true_labels: pd.Series) -> Dict:
         """
         Evaluate model performance
@@ -202,32 +795,44 @@ class LoginAnomalyDetector:
         if self.model is None:
             raise ValueError("Model not trained or loaded")
 
-        X = features_df[self.feature_columns].values
-        X_scaled = self.scaler.transform(X)
+        return self.evaluate_matrix(features_df[self.feature_columns].values, true_labels)
+
+    def evaluate_matrix(self, X: np.ndarray, true_labels) -> Dict:
+        """
+        Evaluate model performance on a feature matrix
+
+        Args:
+            X: Rows of shape (n, n_features) in feature_columns order
+            true_labels: True anomaly labels (True/False or 1/0)
+
+        Returns:
+            Dictionary with evaluation metrics
+        """
+        if self.model is None:
+            raise ValueError("Model not trained or loaded")
 
-        predictions = self.model.predict(X_scaled)
-        # Convert -1/1 to True/False
-        predictions = (predictions == -1)
+        # Same rule as IsolationForest.predict, from a single scoring pass
+        predictions = self._score_samples(X) < self.model.offset_
 
         # Calculate metrics
         from sklearn.metrics import precision_score, recall_score, f1_score, confusion_matrix
 
-        true_labels = true_labels.astype(bool)
+        true_labels = np.asarray(true_labels).astype(bool)
 
         metrics = {
-            'precision': precision_score(true_labels, predictions),
-            'recall': recall_score(true_labels, predictions),
-            'f1_score': f1_score(true_labels, predictions),
-            'confusion_matrix': confusion_matrix(true_labels, predictions).tolist()
+            'precision': precision_score(true_labels, predictions, zero_division=0),
+            'recall': recall_score(true_labels, predictions, zero_division=0),
+            'f1_score': f1_score(true_labels, predictions, zero_division=0),
+            'confusion_matrix': confusion_matrix(true_labels, predictions, labels=[False, True]).tolist()
         }
 
         return metrics
 
 
 if __name__ == '__main__':
-    # Test the anomaly detector
-    from data_generator import SyntheticLoginDataGenerator
-    from feature_engineering import LoginFeatureEngineer
+    # Test the anomaly detector (run with python -m app.ml.anomaly_detector)
+    from app.ml.data_generator import SyntheticLoginDataGenerator
+    from app.ml.feature_engineering import LoginFeatureEngineer
 
     # Generate data
     print("Generating synthetic data...")
@@ -5,12 +5,24 @@ import random
 import json
 
 
+# Bump when generated data changes for the same parameters and seed
+GENERATOR_VERSION = 1
+
+
 class SyntheticLoginDataGenerator:
     """Generate synthetic login data with normal patterns and anomalies"""
 
-    def __init__(self, num_users=50, days=30):
+    def __init__(self, num_users=50, days=30, seed=None):
+        """
+        Args:
+            num_users: Number of users to simulate
+            days: Days of logins, ending now
+            seed: Seed for reproducible datasets (None: different every time)
+        """
         self.num_users = num_users
         self.days = days
+        self.seed = seed
+        self._random = random.Random(seed)
         self.users = self._generate_users()
         self.locations = self._get_locations()
 
@@ -22,9 +34,9 @@ class SyntheticLoginDataGenerator:
                 'user_id': f'user_{i:03d}',
                 'username': f'employee_{i:03d}',
                 'typical_work_hours': (9, 17),  # 9 AM to 5 PM
-                'typical_location': random.choice(['US-CA', 'US-NY', 'US-TX', 'US-FL', 'US-WA']),
-                'login_frequency': random.randint(1, 5),  # logins per day
-                'devices': random.choice([
+                'typical_location': self._random.choice(['US-CA', 'US-NY', 'US-TX', 'US-FL', 'US-WA']),
+                'login_frequency': self._random.randint(1, 5),  # logins per day
+                'devices': self._random.choice([
                     ['Chrome/Windows', 'Safari/iPhone'],
                     ['Firefox/macOS', 'Chrome/Android'],
                     ['Edge/Windows']
@@ -50,8 +62,8 @@ class SyntheticLoginDataGenerator:
         """Generate a normal login event for a user"""
         # Login during typical work hours
         start_hour, end_hour = user['typical_work_hours']
-        hour = random.randint(start_hour, end_hour)
-        minute = random.randint(0, 59)
+        hour = self._random.randint(start_hour, end_hour)
+        minute = self._random.randint(0, 59)
         timestamp = datetime.combine(date, datetime.min.time()) + timedelta(hours=hour, minutes=minute)
 
         # Typical location
@@ -60,14 +72,14 @@ class SyntheticLoginDataGenerator:
 
         # Add small random variation to coordinates
         location = {
-            'latitude': location['lat'] + random.uniform(-0.1, 0.1),
-            'longitude': location['lon'] + random.uniform(-0.1, 0.1),
+            'latitude': location['lat'] + self._random.uniform(-0.1, 0.1),
+            'longitude': location['lon'] + self._random.uniform(-0.1, 0.1),
             'city': location['city'],
             'country': location['country']
         }
 
         # Typical device
-        device = random.choice(user['devices'])
+        device = self._random.choice(user['devices'])
         browser, os = device.split('/')
 
         return {
@@ -91,26 +103,33 @@ class SyntheticLoginDataGenerator:
 
         if anomaly_type == 'off_hours':
             # Login at unusual time (late night or early morning)
-            hour = random.choice([2, 3, 4, 22, 23])
-            minute = random.randint(0, 59)
+            hour = self._random.choice([2, 3, 4, 22, 23])
+            minute = self._random.randint(0, 59)
             timestamp = datetime.combine(date, datetime.min.time()) + timedelta(hours=hour, minutes=minute)
             normal_login['timestamp'] = timestamp.isoformat()
 
         elif anomaly_type == 'unusual_location':
             # Login from foreign country
-            foreign_location_key = random.choice(['CN', 'RU', 'BR'])
+            foreign_location_key = self._random.choice(['CN', 'RU', 'BR'])
             location = self.locations[foreign_location_key]
             normal_login['location'] = {
-                'latitude': location['lat'] + random.uniform(-0.1, 0.1),
-                'longitude': location['lon'] + random.uniform(-0.1, 0.1),
+                'latitude': location['lat'] + self._random.uniform(-0.1, 0.1),
+                'longitude': location['lon'] + self._random.uniform(-0.1, 0.1),
                 'city': location['city'],
                 'country': location['country']
             }
 
         elif anomaly_type == 'impossible_travel':
-            # Two logins from distant locations within short time
-            # This will be handled by generating two events
-            pass
+            # Login from a distant location; generate_dataset pairs it with a
+            # normal login shortly before
+            foreign_location_key = self._random.choice(['CN', 'RU', 'BR'])
+            location = self.locations[foreign_location_key]
+            normal_login['location'] = {
+                'latitude': location['lat'] + self._random.uniform(-0.1, 0.1),
+                'longitude': location['lon'] + self._random.uniform(-0.1, 0.1),
+                'city': location['city'],
+                'country': location['country']
+            }
 
         elif anomaly_type == 'new_device':
             # Login from completely new device
@@ -129,7 +148,8 @@ class SyntheticLoginDataGenerator:
 
     def _generate_ip(self):
         """Generate random IP address"""
-        return f"{random.randint(1, 255)}.{random.randint(0, 255)}.{random.randint(0, 255)}.{random.randint(1, 255)}"
+        randint = self._random.randint
+        return f"{randint(1, 255)}.{randint(0, 255)}.{randint(0, 255)}.{randint(1, 255)}"
 
     def generate_dataset(self, anomaly_percentage=0.1):
         """
@@ -149,16 +169,25 @@ class SyntheticLoginDataGenerator:
 
             for user in self.users:
                 # Determine number of logins for this user today
-                num_logins = random.randint(user['login_frequency'] - 1, user['login_frequency'] + 1)
+                num_logins = self._random.randint(user['login_frequency'] - 1, user['login_frequency'] + 1)
                 num_logins = max(1, num_logins)
 
                 for _ in range(num_logins):
                     # Decide if this should be anomalous
-                    if random.random() < anomaly_percentage:
-                        anomaly_type = random.choice([
-                            'off_hours', 'unusual_location', 'new_device', 'failed_attempts'
+                    if self._random.random() < anomaly_percentage:
+                        anomaly_type = self._random.choice([
+                            'off_hours', 'unusual_location', 'impossible_travel',
+                            'new_device', 'failed_attempts'
                         ])
                         event = self.generate_anomalous_login(user, current_date, anomaly_type)
+
+                        if anomaly_type == 'impossible_travel':
+                            # Two logins from distant locations within a short time
+                            previous = self.generate_normal_login(user, current_date)
+                            events.append(previous)
+                            travel_time = timedelta(minutes=self._random.randint(10, 90))
+                            event['timestamp'] = (datetime.fromisoformat(previous['timestamp'])
+                                                  + travel_time).isoformat()
                     else:
                         event = self.generate_normal_login(user, current_date)
 
@@ -0,0 +1,129 @@
+"""
+Great-circle distance kernels for location features
+
+Two methods are available, each with a scalar fast path (plain ``math``,
+arguments already in radians) and a NumPy array kernel:
+
+``haversine``
+    Spherical distance on a sphere of mean Earth radius. Max error against
+    the WGS-84 geodesic (geopy.distance.geodesic) is 0.55% of the distance,
+    typically 0.1-0.3%.
+
+``lambert``
+    Lambert's ellipsoidal correction applied to the haversine central
+    angle. Max error against the geodesic is about 15 m up to 10,000 km
+    (relative error below 3e-5 everywhere), at roughly three times the cost
+    of haversine.
+
+Both are one to two orders of magnitude faster than geodesic, which runs
+an iterative solver per call.
+"""
+import math
+from typing import Tuple
+
+import numpy as np
+
+# WGS-84 ellipsoid
+WGS84_A_KM = 6378.137
+WGS84_F = 1 / 298.257223563
+
+# Mean Earth radius (IUGG), used by the spherical model
+EARTH_RADIUS_KM = 6371.0088
+
+DISTANCE_METHODS = ('haversine', 'lambert')
+
+
+def to_radians(latitude: float, longitude: float) -> Tuple[float, float]:
+    """Convert a (lat, lon) pair in degrees to radians"""
+    return math.radians(latitude), math.radians(longitude)
+
+
+def _check_method(method: str):
+    if method not in DISTANCE_METHODS:
+        raise ValueError(f"Unknown distance method: {method}. Must be one of: {DISTANCE_METHODS}")
+
+
+def _central_angle(lat1, lon1, lat2, lon2):
+    """Haversine central angle, scalar version (radians in, radians out)"""
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * math.asin(math.sqrt(min(h, 1.0)))
+
+
+def _reduced_latitude(lat):
+    return math.atan((1 - WGS84_F) * math.tan(lat))
+
+
+def distance_km_rad(lat1: float, lon1: float, lat2: float, lon2: float,
+                    method: str = 'haversine') -> float:
+    """
+    Distance in kilometers between two points given in radians
+
+    This is the scalar fast path; callers that compare against the same
+    reference point repeatedly should convert it to radians once.
+    """
+    if method == 'haversine':
+        return EARTH_RADIUS_KM * _central_angle(lat1, lon1, lat2, lon2)
+
+    _check_method(method)
+    beta1 = _reduced_latitude(lat1)
+    beta2 = _reduced_latitude(lat2)
+    sigma = _central_angle(beta1, lon1, beta2, lon2)
+    if sigma == 0.0:
+        return 0.0
+
+    p = (beta1 + beta2) / 2
+    q = (beta2 - beta1) / 2
+    sin_sigma = math.sin(sigma)
+    cos_half = math.cos(sigma / 2) ** 2
+    sin_half = math.sin(sigma / 2) ** 2
+    x = (sigma - sin_sigma) * math.sin(p) ** 2 * math.cos(q) ** 2 / cos_half if cos_half else 0.0
+    y = (sigma + sin_sigma) * math.cos(p) ** 2 * math.sin(q) ** 2 / sin_half
+    return WGS84_A_KM * (sigma - WGS84_F / 2 * (x + y))
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float,
+                method: str = 'haversine') -> float:
+    """Distance in kilometers between two points given in degrees"""
+    return distance_km_rad(
+        math.radians(lat1), math.radians(lon1),
+        math.radians(lat2), math.radians(lon2),
+        method
+    )
+
+
+def distance_km_array(lat1, lon1, lat2, lon2, method: str = 'haversine') -> np.ndarray:
+    """
+    Vectorized distance in kilometers between arrays of points in degrees
+
+    Inputs broadcast against each other, so a single reference point can be
+    compared against a whole column.
+    """
+    _check_method(method)
+    lat1 = np.radians(np.asarray(lat1, dtype=np.float64))
+    lon1 = np.radians(np.asarray(lon1, dtype=np.float64))
+    lat2 = np.radians(np.asarray(lat2, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lon2, dtype=np.float64))
+
+    if method == 'lambert':
+        lat1 = np.arctan((1 - WGS84_F) * np.tan(lat1))
+        lat2 = np.arctan((1 - WGS84_F) * np.tan(lat2))
+
+    h = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    sigma = 2 * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+    if method == 'haversine':
+        return EARTH_RADIUS_KM * sigma
+
+    p = (lat1 + lat2) / 2
+    q = (lat2 - lat1) / 2
+    sin_sigma = np.sin(sigma)
+    cos_half = np.cos(sigma / 2) ** 2
+    sin_half = np.sin(sigma / 2) ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = np.where(cos_half > 0,
+                     (sigma - sin_sigma) * np.sin(p) ** 2 * np.cos(q) ** 2 / cos_half, 0.0)
+        y = np.where(sin_half > 0,
+                     (sigma + sin_sigma) * np.cos(p) ** 2 * np.sin(q) ** 2 / sin_half, 0.0)
+    return WGS84_A_KM * (sigma - WGS84_F / 2 * (x + y))
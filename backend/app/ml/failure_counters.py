@@ -0,0 +1,395 @@
+import math
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+# Features derived from recent failed logins
+FAILURE_FEATURE_COLUMNS = [
+    'user_failures_5m', 'user_failures_1h',
+    'ip_failures_5m', 'ip_failures_1h',
+    'ip_distinct_users_1h'
+]
+
+FIVE_MINUTES = 5 * 60
+ONE_HOUR = 60 * 60
+
+
+def _epoch_seconds(timestamp) -> float:
+    return pd.Timestamp(timestamp).timestamp()
+
+
+def _stable_hash(*parts) -> int:
+    """Process-independent hash (Python's str hash is salted per process)"""
+    return zlib.crc32('\x1f'.join(str(part) for part in parts).encode('utf-8'))
+
+
+class _TimeWheel:
+    """Ring of per-bucket counts for one key, with a running total"""
+
+    __slots__ = ('counts', 'last_bucket', 'total')
+
+    def __init__(self, num_buckets: int):
+        self.counts = [0] * num_buckets
+        self.last_bucket = None
+        self.total = 0
+
+    def advance(self, bucket: int):
+        if self.last_bucket is None:
+            self.last_bucket = bucket
+            return
+        steps = bucket - self.last_bucket
+        if steps <= 0:
+            return
+        num_buckets = len(self.counts)
+        if steps >= num_buckets:
+            self.counts = [0] * num_buckets
+            self.total = 0
+        else:
+            for b in range(self.last_bucket + 1, bucket + 1):
+                slot = b % num_buckets
+                self.total -= self.counts[slot]
+                self.counts[slot] = 0
+        self.last_bucket = bucket
+
+    def add(self, bucket: int, amount: int = 1):
+        self.advance(bucket)
+        if bucket <= self.last_bucket - len(self.counts):
+            return  # older than the window
+        self.counts[bucket % len(self.counts)] += amount
+        self.total += amount
+
+
+class SlidingWindowCounter:
+    """
+    Exact per-key event counts over a sliding time window
+
+    Each key owns a time wheel of `window / bucket` buckets, so adds and
+    queries are O(1) amortized and the window edge is accurate to one
+    bucket. At most `max_keys` keys are kept; the least recently updated
+    key is evicted beyond that, which bounds memory.
+    """
+
+    def __init__(self, window_seconds: float, bucket_seconds: float, max_keys: int = 100000):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = max(1, int(math.ceil(window_seconds / bucket_seconds)))
+        self.max_keys = max_keys
+        self._wheels = OrderedDict()
+
+    def _bucket(self, seconds: float) -> int:
+        return int(seconds // self.bucket_seconds)
+
+    def add(self, key, seconds: float, amount: int = 1):
+        wheel = self._wheels.get(key)
+        if wheel is None:
+            wheel = self._wheels[key] = _TimeWheel(self.num_buckets)
+            if len(self._wheels) > self.max_keys:
+                self._wheels.popitem(last=False)
+        else:
+            self._wheels.move_to_end(key)
+        wheel.add(self._bucket(seconds), amount)
+
+    def count(self, key, seconds: float) -> int:
+        wheel = self._wheels.get(key)
+        if wheel is None:
+            return 0
+        wheel.advance(self._bucket(seconds))
+        return wheel.total
+
+    def memory_bytes(self) -> int:
+        """Rough upper bound of the memory held by the wheels"""
+        return len(self._wheels) * (8 * self.num_buckets + 120)
+
+
+class CountMinWindowCounter:
+    """
+    Approximate per-key counts over a sliding window in fixed memory
+
+    A count-min sketch (depth x width counters) per time bucket, plus a
+    running sum over the live buckets. Memory does not grow with the number
+    of keys; counts are never underestimated and overestimate by at most
+    e/width of the window's total events with probability 1 - exp(-depth).
+    """
+
+    def __init__(self, window_seconds: float, bucket_seconds: float,
+                 width: int = 2048, depth: int = 4):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = max(1, int(math.ceil(window_seconds / bucket_seconds)))
+        self.width = width
+        self.depth = depth
+        self._buckets = np.zeros((self.num_buckets, depth, width), dtype=np.uint32)
+        self._total = np.zeros((depth, width), dtype=np.int64)
+        self._rows = np.arange(depth)
+        self._last_bucket = None
+
+    def _columns(self, key) -> np.ndarray:
+        return np.array([_stable_hash(row, key) % self.width for row in range(self.depth)])
+
+    def _advance(self, bucket: int):
+        if self._last_bucket is None:
+            self._last_bucket = bucket
+            return
+        steps = bucket - self._last_bucket
+        if steps <= 0:
+            return
+        if steps >= self.num_buckets:
+            self._buckets[:] = 0
+            self._total[:] = 0
+        else:
+            for b in range(self._last_bucket + 1, bucket + 1):
+                slot = b % self.num_buckets
+                self._total -= self._buckets[slot]
+                self._buckets[slot] = 0
+        self._last_bucket = bucket
+
+    def add(self, key, seconds: float, amount: int = 1):
+        bucket = int(seconds // self.bucket_seconds)
+        self._advance(bucket)
+        if bucket <= self._last_bucket - self.num_buckets:
+            return
+        columns = self._columns(key)
+        self._buckets[bucket % self.num_buckets, self._rows, columns] += amount
+        self._total[self._rows, columns] += amount
+
+    def count(self, key, seconds: float) -> int:
+        self._advance(int(seconds // self.bucket_seconds))
+        return int(self._total[self._rows, self._columns(key)].min())
+
+    def memory_bytes(self) -> int:
+        return self._buckets.nbytes + self._total.nbytes
+
+
+class DistinctWindowCounter:
+    """
+    Approximate number of distinct values per key over a sliding window
+
+    Each key keeps one small bitmap per time bucket; values are hashed into
+    `bits` positions and the live bitmaps are OR-ed and read with linear
+    counting (n = -m ln(zero_fraction)). Accurate to a few percent up to
+    roughly `bits` distinct values, after which it saturates.
+    """
+
+    def __init__(self, window_seconds: float, bucket_seconds: float,
+                 bits: int = 128, max_keys: int = 100000):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = max(1, int(math.ceil(window_seconds / bucket_seconds)))
+        self.bits = bits
+        self.max_keys = max_keys
+        self._bitmaps = OrderedDict()  # key -> [last_bucket, [bitmap per bucket]]
+
+    def _expire(self, entry, bucket: int):
+        last_bucket, bitmaps = entry
+        steps = bucket - last_bucket
+        if steps <= 0:
+            return
+        if steps >= self.num_buckets:
+            entry[1] = [0] * self.num_buckets
+        else:
+            for b in range(last_bucket + 1, bucket + 1):
+                bitmaps[b % self.num_buckets] = 0
+        entry[0] = bucket
+
+    def add(self, key, value, seconds: float):
+        bucket = int(seconds // self.bucket_seconds)
+        entry = self._bitmaps.get(key)
+        if entry is None:
+            entry = self._bitmaps[key] = [bucket, [0] * self.num_buckets]
+            if len(self._bitmaps) > self.max_keys:
+                self._bitmaps.popitem(last=False)
+        else:
+            self._bitmaps.move_to_end(key)
+            self._expire(entry, bucket)
+        if bucket <= entry[0] - self.num_buckets:
+            return
+        entry[1][bucket % self.num_buckets] |= 1 << (_stable_hash(value) % self.bits)
+
+    def count(self, key, seconds: float) -> float:
+        entry = self._bitmaps.get(key)
+        if entry is None:
+            return 0.0
+        self._expire(entry, int(seconds // self.bucket_seconds))
+        combined = 0
+        for bitmap in entry[1]:
+            combined |= bitmap
+        zeros = self.bits - bin(combined).count('1')
+        if zeros == 0:
+            return self.bits * math.log(self.bits)
+        return -self.bits * math.log(zeros / self.bits)
+
+    def memory_bytes(self) -> int:
+        return len(self._bitmaps) * (self.num_buckets * (self.bits // 8 + 28) + 120)
+
+
+class FailureCounters:
+    """
+    In-memory failed-login counters for brute-force and credential-stuffing
+    features
+
+    Tracks failures per user_id (exact time wheels) and per ip_address
+    (count-min sketches in 'approx' mode, exact wheels in 'exact' mode) over
+    5-minute and 1-hour windows, plus the approximate number of distinct
+    users seen per IP in the last hour. Replaces a count_documents query on
+    login_events per request.
+    """
+
+    def __init__(self, ip_mode: str = 'approx', max_keys: int = 100000,
+                 sketch_width: int = 2048, sketch_depth: int = 4):
+        """
+        Args:
+            ip_mode: 'approx' (count-min, fixed memory) or 'exact' for the IP
+                failure counters
+            max_keys: Keys kept per exact counter before LRU eviction
+            sketch_width: Count-min width (error ~ e/width of window total)
+            sketch_depth: Count-min depth (failure probability exp(-depth))
+        """
+        if ip_mode not in ('approx', 'exact'):
+            raise ValueError("ip_mode must be 'approx' or 'exact'")
+        self.ip_mode = ip_mode
+
+        self.user_5m = SlidingWindowCounter(FIVE_MINUTES, 10, max_keys)
+        self.user_1h = SlidingWindowCounter(ONE_HOUR, 60, max_keys)
+        if ip_mode == 'approx':
+            self.ip_5m = CountMinWindowCounter(FIVE_MINUTES, 10, sketch_width, sketch_depth)
+            self.ip_1h = CountMinWindowCounter(ONE_HOUR, 60, sketch_width, sketch_depth)
+        else:
+            self.ip_5m = SlidingWindowCounter(FIVE_MINUTES, 10, max_keys)
+            self.ip_1h = SlidingWindowCounter(ONE_HOUR, 60, max_keys)
+        self.ip_users_1h = DistinctWindowCounter(ONE_HOUR, 60, max_keys=max_keys)
+        self._lock = threading.Lock()
+
+    def record(self, user_id: str, ip_address: str, timestamp, success: bool):
+        """Count a login (only failures feed the failure counters)"""
+        seconds = _epoch_seconds(timestamp)
+        with self._lock:
+            self.ip_users_1h.add(ip_address, user_id, seconds)
+            if not success:
+                self.user_5m.add(user_id, seconds)
+                self.user_1h.add(user_id, seconds)
+                self.ip_5m.add(ip_address, seconds)
+                self.ip_1h.add(ip_address, seconds)
+
+    def record_event(self, login_event: Dict):
+        """Count a raw login event (as accepted by /analyze)"""
+        self.record(login_event['user_id'], login_event['ip_address'],
+                    login_event['timestamp'], login_event.get('success', True))
+
+    def extract_features(self, user_id: str, ip_address: str, timestamp) -> Dict:
+        """
+        Failure features for a new login, from logins recorded before it
+
+        The login itself is not counted; call record() once it is scored.
+        """
+        seconds = _epoch_seconds(timestamp)
+        with self._lock:
+            return {
+                'user_failures_5m': self.user_5m.count(user_id, seconds),
+                'user_failures_1h': self.user_1h.count(user_id, seconds),
+                'ip_failures_5m': self.ip_5m.count(ip_address, seconds),
+                'ip_failures_1h': self.ip_1h.count(ip_address, seconds),
+                'ip_distinct_users_1h': self.ip_users_1h.count(ip_address, seconds)
+            }
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by all counters"""
+        return sum(counter.memory_bytes() for counter in (
+            self.user_5m, self.user_1h, self.ip_5m, self.ip_1h, self.ip_users_1h
+        ))
+
+
+def _windowed_prior_counts(keys: np.ndarray, seconds: np.ndarray, weights: np.ndarray,
+                           window: float) -> np.ndarray:
+    """
+    Per event, the sum of `weights` over earlier events with the same key
+    in the last `window` seconds
+    """
+    key_codes = pd.factorize(keys)[0].astype(np.float64)
+    order = np.lexsort((seconds, key_codes))
+    t = seconds[order] - seconds.min()
+    span = t.max() + window + 1
+    composite = key_codes[order] * span + t
+
+    exclusive = np.concatenate([[0], np.cumsum(weights[order])[:-1]])
+    group_start = np.searchsorted(composite, key_codes[order] * span, side='left')
+    window_start = np.maximum(np.searchsorted(composite, composite - window, side='left'), group_start)
+
+    counts = np.empty(len(keys), dtype=np.int64)
+    counts[order] = exclusive - exclusive[window_start]
+    return counts
+
+
+def _windowed_prior_distinct(keys: np.ndarray, values: np.ndarray, seconds: np.ndarray,
+                             window: float) -> np.ndarray:
+    """
+    Per event, the number of distinct values among earlier same-key events in the window
+
+    With events sorted by (key, time), the window of event i is the sorted
+    range [s_i, i). A value is counted once, at its first occurrence in the
+    range: at positions j whose previous occurrence of the same (key, value)
+    prev_j is before s_i. Positions before s_i always satisfy prev_j < s_i, so
+
+        distinct_i = #{j < i : prev_j < s_i} - s_i
+
+    Both i and s_i grow along the sorted order, so event j is counted by
+    every i from max(j + 1, first i with s_i > prev_j) on, and the first
+    term is a cumulative count of those start positions.
+    """
+    n = len(keys)
+    key_codes = pd.factorize(keys)[0]
+    order = np.lexsort((seconds, key_codes))
+    sorted_keys = key_codes[order].astype(np.float64)
+    t = seconds[order] - seconds.min()
+    span = t.max() + window + 1
+    composite = sorted_keys * span + t
+
+    group_start = np.searchsorted(composite, sorted_keys * span, side='left')
+    window_start = np.maximum(np.searchsorted(composite, composite - window, side='left'), group_start)
+
+    # Previous sorted position holding the same (key, value), -1 if none
+    pair_codes = pd.factorize(pd.MultiIndex.from_arrays([key_codes[order], pd.factorize(values)[0][order]]))[0]
+    by_pair = np.argsort(pair_codes, kind='stable')
+    previous = np.full(n, -1, dtype=np.int64)
+    same_pair = pair_codes[by_pair[1:]] == pair_codes[by_pair[:-1]]
+    previous[by_pair[1:][same_pair]] = by_pair[:-1][same_pair]
+
+    counted_from = np.maximum(np.arange(1, n + 1), np.searchsorted(window_start, previous, side='right'))
+    counted = np.cumsum(np.bincount(counted_from, minlength=n + 1))[:n]
+
+    result = np.empty(n, dtype=np.float64)
+    result[order] = counted - window_start
+    result[key_codes < 0] = 0
+    return result
+
+
+def failure_features_batch(user_ids: np.ndarray, ip_addresses: np.ndarray, timestamps: pd.Series,
+                           success: np.ndarray) -> pd.DataFrame:
+    """
+    Column-wise equivalent of replaying events through FailureCounters
+
+    Counts are exact (no bucketing or sketching), over events strictly
+    before each one in time.
+
+    Returns:
+        DataFrame with FAILURE_FEATURE_COLUMNS, aligned with the input order
+    """
+    n = len(user_ids)
+    if n == 0:
+        return pd.DataFrame({column: pd.Series(dtype=np.float64) for column in FAILURE_FEATURE_COLUMNS})
+
+    stamps = pd.to_datetime(pd.Series(timestamps).reset_index(drop=True))
+    epoch = pd.Timestamp('1970-01-01', tz=stamps.dt.tz)
+    seconds = ((stamps - epoch) / pd.Timedelta(seconds=1)).to_numpy(dtype=np.float64)
+    failures = (~np.asarray(success, dtype=bool)).astype(np.int64)
+
+    return pd.DataFrame({
+        'user_failures_5m': _windowed_prior_counts(user_ids, seconds, failures, FIVE_MINUTES),
+        'user_failures_1h': _windowed_prior_counts(user_ids, seconds, failures, ONE_HOUR),
+        'ip_failures_5m': _windowed_prior_counts(ip_addresses, seconds, failures, FIVE_MINUTES),
+        'ip_failures_1h': _windowed_prior_counts(ip_addresses, seconds, failures, ONE_HOUR),
+        'ip_distinct_users_1h': _windowed_prior_distinct(ip_addresses, user_ids, seconds, ONE_HOUR),
+    }, columns=FAILURE_FEATURE_COLUMNS)
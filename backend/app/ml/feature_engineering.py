@@ -1,15 +1,222 @@
 import pandas as pd
 import numpy as np
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List
-from geopy.distance import geodesic
+from app.ml.distance import distance_km_rad, distance_km_array, to_radians
+from app.ml.profile_store import ProfileStore, locate_profile
+from app.ml.login_history import LoginHistory, HISTORY_FEATURE_COLUMNS, history_features_batch
+from app.ml.failure_counters import FailureCounters, FAILURE_FEATURE_COLUMNS, failure_features_batch
+
+
+# Categorical encodings shared by the single-event and batch paths
+BROWSER_ENCODING = {
+    'Chrome': 1, 'Firefox': 2, 'Safari': 3, 'Edge': 4, 'TOR Browser': 5
+}
+
+OS_ENCODING = {
+    'Windows': 1, 'macOS': 2, 'Linux': 3, 'iOS': 4, 'Android': 5, 'iPhone': 4
+}
+
+# Bump when engineered values change for the same input (invalidates cached
+# pipeline features)
+FEATURE_ENGINEER_VERSION = 1
+
+# Column order produced by engineer_features / engineer_features_batch
+FEATURE_COLUMNS = [
+    'hour', 'day_of_week', 'is_weekend', 'is_work_hours', 'is_night',
+    'latitude', 'longitude', 'distance_from_typical',
+    'browser', 'os', 'is_mobile', 'is_typical_device', 'success'
+]
+
+
+def _nested_column(series: pd.Series, key: str) -> list:
+    """Pull one field out of a column of dicts (e.g. location.latitude)"""
+    return [item[key] for item in series]
+
+
+def _mapping_profile_lookup(profiles: Mapping, user_ids: np.ndarray, device_strings: np.ndarray):
+    """
+    Join events against a user_id -> profile mapping
+
+    Only the users present in the batch are looked up, so this works for
+    any Mapping (plain dict or an online overlay) without scanning it.
+
+    Returns per-event arrays: profile position (-1 if none), typical
+    latitude/longitude (NaN if none) and whether the device is known.
+    """
+    batch_users = pd.unique(user_ids)
+    batch_profiles = [profiles.get(uid) for uid in batch_users]
+    row_pos = pd.Index(batch_users).get_indexer(user_ids)
+    has_profile = np.array([profile is not None for profile in batch_profiles] + [False])[row_pos]
+    row_pos = np.where(has_profile, row_pos, -1)
+
+    typical = [profile.get('typical_location') if profile else None for profile in batch_profiles]
+    profile_lat = np.array([t['latitude'] if t else np.nan for t in typical] + [np.nan], dtype=np.float64)
+    profile_lon = np.array([t['longitude'] if t else np.nan for t in typical] + [np.nan], dtype=np.float64)
+
+    known_devices = [
+        (uid, device)
+        for uid, profile in zip(batch_users, batch_profiles) if profile
+        for device in profile.get('devices', [])
+    ]
+    if known_devices:
+        seen = pd.MultiIndex.from_arrays([user_ids, device_strings]).isin(known_devices)
+    else:
+        seen = np.zeros(len(user_ids), dtype=bool)
+
+    # Position -1 picks the trailing NaN
+    return row_pos, profile_lat[row_pos], profile_lon[row_pos], seen
+
+
+def _store_profile_lookup(store: ProfileStore, user_ids: np.ndarray, device_strings: np.ndarray):
+    """Same as _mapping_profile_lookup, against a ProfileStore"""
+    row_pos = store.lookup(user_ids)
+    has_profile = row_pos >= 0
+
+    typical_lat = np.full(len(row_pos), np.nan)
+    typical_lon = np.full(len(row_pos), np.nan)
+    typical_lat[has_profile], typical_lon[has_profile] = store.typical_locations(row_pos[has_profile])
+
+    seen = np.zeros(len(row_pos), dtype=bool)
+    seen[has_profile] = store.has_devices(row_pos[has_profile], device_strings[has_profile])
+
+    return row_pos, typical_lat, typical_lon, seen
+
+
+def _modes_per_user(flat: pd.DataFrame, column: str) -> pd.Series:
+    """All most-frequent values of a column per user, sorted ascending (like Series.mode)"""
+    counts = flat.groupby(['user_id', column], sort=True).size().rename('count').reset_index()
+    top = counts[counts['count'] == counts.groupby('user_id')['count'].transform('max')]
+    return top.groupby('user_id', sort=False)[column].agg(list)
+
+
+def _build_profiles_flat(flat: pd.DataFrame) -> Dict:
+    """
+    Build profiles from pre-flattened login events in one groupby pass
+
+    Args:
+        flat: DataFrame with user_id, hour, weekday, date, latitude,
+            longitude and device columns
+
+    Returns:
+        Dictionary of user_id -> profile, in order of first appearance
+    """
+    grouped = flat.groupby('user_id', sort=False)
+    medians = grouped[['latitude', 'longitude']].median()
+    logins = grouped.size()
+    active_days = grouped['date'].nunique()
+    typical_hours = _modes_per_user(flat, 'hour')
+    typical_days = _modes_per_user(flat, 'weekday')
+    devices = flat[['user_id', 'device']].drop_duplicates().groupby('user_id', sort=False)['device'].agg(list)
+
+    profiles = {}
+    for user_id in logins.index:
+        profiles[user_id] = {
+            'user_id': user_id,
+            'typical_hours': typical_hours[user_id],
+            'typical_location': {
+                'latitude': medians.at[user_id, 'latitude'],
+                'longitude': medians.at[user_id, 'longitude']
+            },
+            'devices': devices[user_id],
+            'avg_logins_per_day': int(logins[user_id]) / int(active_days[user_id]),
+            'typical_days': typical_days[user_id]
+        }
+    return profiles
+
+
+def build_profiles(historical_data: pd.DataFrame, n_jobs: int = 1) -> Dict:
+    """
+    Build behavioral profiles for every user in a single pass
+
+    The nested location/device_info columns are flattened once and every
+    profile field is computed with one groupby over user_id. Output matches
+    calling LoginFeatureEngineer.build_user_profile for each user.
+
+    Args:
+        historical_data: DataFrame of raw login events
+        n_jobs: Number of worker processes. With more than one, users are
+            sharded by a stable hash of user_id and each shard is built in
+            its own process.
+
+    Returns:
+        Dictionary of user_id -> profile, in order of first appearance
+    """
+    timestamps = pd.to_datetime(historical_data['timestamp'])
+    browsers = _nested_column(historical_data['device_info'], 'browser')
+    oses = _nested_column(historical_data['device_info'], 'os')
+
+    flat = pd.DataFrame({
+        'user_id': historical_data['user_id'].to_numpy(),
+        'hour': timestamps.dt.hour.to_numpy(),
+        'weekday': timestamps.dt.weekday.to_numpy(),
+        'date': timestamps.dt.normalize().to_numpy(),
+        'latitude': np.asarray(_nested_column(historical_data['location'], 'latitude'), dtype=np.float64),
+        'longitude': np.asarray(_nested_column(historical_data['location'], 'longitude'), dtype=np.float64),
+        'device': [f"{browser}/{os_name}" for browser, os_name in zip(browsers, oses)],
+    })
+
+    if n_jobs <= 1 or flat.empty:
+        return _build_profiles_flat(flat)
+
+    shard_ids = pd.util.hash_array(flat['user_id'].to_numpy()) % n_jobs
+    shards = [flat[shard_ids == shard] for shard in range(n_jobs)]
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        results = list(executor.map(_build_profiles_flat, [s for s in shards if not s.empty]))
+
+    merged = {}
+    for result in results:
+        merged.update(result)
+    return {user_id: merged[user_id] for user_id in flat['user_id'].unique()}
 
 
 class LoginFeatureEngineer:
     """Extract features from login events for anomaly detection"""
 
-    def __init__(self):
+    def __init__(self, distance_method: str = 'haversine', login_history: LoginHistory = None,
+                 failure_counters: FailureCounters = None):
+        """
+        Args:
+            distance_method: Kernel for distance_from_typical, 'haversine' or
+                'lambert' (see app.ml.distance for error bounds)
+            login_history: Recent-login ring buffer. When set, the velocity
+                features in HISTORY_FEATURE_COLUMNS are added after 'success'
+            failure_counters: Sliding-window failure counters. When set, the
+                features in FAILURE_FEATURE_COLUMNS are added last
+        """
         self.user_profiles = {}
+        self.distance_method = distance_method
+        self.login_history = login_history
+        self.failure_counters = failure_counters
+        # user_id -> (typical_location dict, lat_rad, lon_rad), for plain dict profiles
+        self._typical_location_rad = {}
+
+    def _located_typical_location_rad(self, store, found, user_id: str):
+        """
+        Typical location in radians of a profile found with locate_profile
+
+        Store positions read the store's precomputed radians. Plain dict
+        profiles are converted once and cached per user; online profile
+        dicts change with every login, so they are converted on each call.
+
+        Returns:
+            (lat_rad, lon_rad), or None if the user has no typical location
+        """
+        if store is not None:
+            return store.typical_location_rad(found) if found >= 0 else None
+        typical_loc = found.get('typical_location') if found else None
+        if not typical_loc:
+            return None
+        if not isinstance(self.user_profiles, dict):
+            return to_radians(typical_loc['latitude'], typical_loc['longitude'])
+
+        cached = self._typical_location_rad.get(user_id)
+        if cached is None or cached[0] is not typical_loc:
+            cached = (typical_loc, *to_radians(typical_loc['latitude'], typical_loc['longitude']))
+            self._typical_location_rad[user_id] = cached
+        return cached[1], cached[2]
 
     def extract_temporal_features(self, timestamp: datetime) -> Dict:
         """Extract time-based features"""
@@ -29,16 +236,14 @@ class LoginFeatureEngineer:
         }
 
         # Calculate distance from user's typical location if available
-        if user_id and user_id in self.user_profiles:
-            typical_loc = self.user_profiles[user_id].get('typical_location')
-            if typical_loc:
-                distance = geodesic(
-                    (location['latitude'], location['longitude']),
-                    (typical_loc['latitude'], typical_loc['longitude'])
-                ).kilometers
-                features['distance_from_typical'] = distance
-            else:
-                features['distance_from_typical'] = 0
+        typical = None
+        if user_id:
+            typical = self._located_typical_location_rad(*locate_profile(self.user_profiles, user_id), user_id)
+        if typical:
+            lat, lon = to_radians(location['latitude'], location['longitude'])
+            features['distance_from_typical'] = distance_km_rad(
+                lat, lon, typical[0], typical[1], self.distance_method
+            )
         else:
             features['distance_from_typical'] = 0
 
@@ -46,27 +251,19 @@ class LoginFeatureEngineer:
 
     def extract_device_features(self, device_info: Dict, user_id: str = None) -> Dict:
         """Extract device-based features"""
-        # Encode browser
-        browser_encoding = {
-            'Chrome': 1, 'Firefox': 2, 'Safari': 3, 'Edge': 4, 'TOR Browser': 5
-        }
-
-        # Encode OS
-        os_encoding = {
-            'Windows': 1, 'macOS': 2, 'Linux': 3, 'iOS': 4, 'Android': 5, 'iPhone': 4
-        }
-
         features = {
-            'browser': browser_encoding.get(device_info['browser'], 0),
-            'os': os_encoding.get(device_info['os'], 0),
+            'browser': BROWSER_ENCODING.get(device_info['browser'], 0),
+            'os': OS_ENCODING.get(device_info['os'], 0),
             'is_mobile': 1 if device_info['device_type'] == 'mobile' else 0
         }
 
         # Check if device is typical for user
-        if user_id and user_id in self.user_profiles:
-            typical_devices = self.user_profiles[user_id].get('devices', [])
-            device_string = f"{device_info['browser']}/{device_info['os']}"
-            features['is_typical_device'] = 1 if device_string in typical_devices else 0
+        store, found = locate_profile(self.user_profiles, user_id) if user_id else (None, None)
+        device_string = f"{device_info['browser']}/{device_info['os']}"
+        if store is not None and found >= 0:
+            features['is_typical_device'] = 1 if store.has_device(found, device_string) else 0
+        elif store is None and found is not None:
+            features['is_typical_device'] = 1 if device_string in found.get('devices', []) else 0
         else:
             features['is_typical_device'] = 1
 
@@ -96,13 +293,15 @@ class LoginFeatureEngineer:
 
         return profile
 
-    def build_all_profiles(self, historical_data: pd.DataFrame):
-        """Build profiles for all users"""
-        user_ids = historical_data['user_id'].unique()
-        for user_id in user_ids:
-            profile = self.build_user_profile(historical_data, user_id)
-            if profile:
-                self.user_profiles[user_id] = profile
+    def build_all_profiles(self, historical_data: pd.DataFrame, n_jobs: int = 1):
+        """
+        Build profiles for all users
+
+        Args:
+            historical_data: DataFrame of raw login events
+            n_jobs: Number of worker processes (see build_profiles)
+        """
+        self.user_profiles.update(build_profiles(historical_data, n_jobs=n_jobs))
 
         print(f"Built profiles for {len(self.user_profiles)} users")
 
@@ -137,25 +336,133 @@ class LoginFeatureEngineer:
         # Additional features
         features['success'] = 1 if login_event['success'] else 0
 
+        # Velocity features from the user's recent logins
+        if self.login_history is not None:
+            device_info = login_event['device_info']
+            features.update(self.login_history.extract_features(
+                user_id, timestamp,
+                login_event['location']['latitude'], login_event['location']['longitude'],
+                f"{device_info['browser']}/{device_info['os']}"
+            ))
+
+        # Brute-force / credential-stuffing features
+        if self.failure_counters is not None:
+            features.update(self.failure_counters.extract_features(
+                user_id, login_event['ip_address'], timestamp
+            ))
+
         return features
 
     def engineer_features_batch(self, login_events: pd.DataFrame) -> pd.DataFrame:
-        """Engineer features for a batch of login events"""
-        feature_list = []
+        """
+        Engineer features for a batch of login events
+
+        Works column-wise instead of row by row: timestamps are parsed once,
+        temporal flags come from the datetime64 column, device codes from a
+        categorical mapping and profile fields from a join on user_id.
+        Produces the same columns as calling engineer_features per event,
+        plus user_id and timestamp. With a login history attached, velocity
+        features are computed against each user's previous event in the
+        batch, as if the events had been replayed through the ring buffer;
+        failure counts are likewise exact windowed counts over the batch.
+
+        Args:
+            login_events: DataFrame of raw login events
 
-        for _, event in login_events.iterrows():
-            event_dict = event.to_dict()
-            features = self.engineer_features(event_dict)
-            features['user_id'] = event['user_id']
-            features['timestamp'] = event['timestamp']
-            feature_list.append(features)
+        Returns:
+            DataFrame of engineered features
+        """
+        n = len(login_events)
+        timestamps = pd.to_datetime(login_events['timestamp'])
+        user_ids = login_events['user_id'].to_numpy()
+
+        # Temporal features
+        hour = timestamps.dt.hour.to_numpy(dtype=np.int64)
+        day_of_week = timestamps.dt.weekday.to_numpy(dtype=np.int64)
+        is_weekend = (day_of_week >= 5).astype(np.int64)
+        is_work_hours = ((hour >= 9) & (hour <= 17)).astype(np.int64)
+        is_night = ((hour >= 22) | (hour <= 5)).astype(np.int64)
 
-        return pd.DataFrame(feature_list)
+        # Location features
+        latitude = np.asarray(_nested_column(login_events['location'], 'latitude'), dtype=np.float64)
+        longitude = np.asarray(_nested_column(login_events['location'], 'longitude'), dtype=np.float64)
+
+        # Device features
+        browsers = pd.Series(_nested_column(login_events['device_info'], 'browser'), dtype=object)
+        oses = pd.Series(_nested_column(login_events['device_info'], 'os'), dtype=object)
+        device_types = np.asarray(_nested_column(login_events['device_info'], 'device_type'), dtype=object)
+
+        browser = browsers.map(BROWSER_ENCODING).fillna(0).to_numpy(dtype=np.int64)
+        os_code = oses.map(OS_ENCODING).fillna(0).to_numpy(dtype=np.int64)
+        is_mobile = (device_types == 'mobile').astype(np.int64)
+
+        # Profile lookups (join on user_id)
+        distance_from_typical = np.zeros(n, dtype=np.float64)
+        is_typical_device = np.ones(n, dtype=np.int64)
+
+        if self.user_profiles and n > 0:
+            device_strings = (browsers.astype(str) + '/' + oses.astype(str)).to_numpy()
+            if isinstance(self.user_profiles, ProfileStore):
+                row_pos, typical_lat, typical_lon, seen = _store_profile_lookup(
+                    self.user_profiles, user_ids, device_strings
+                )
+            else:
+                row_pos, typical_lat, typical_lon, seen = _mapping_profile_lookup(
+                    self.user_profiles, user_ids, device_strings
+                )
+            has_profile = row_pos >= 0
+
+            idx = np.flatnonzero(has_profile & ~np.isnan(typical_lat))
+            distance_from_typical[idx] = distance_km_array(
+                latitude[idx], longitude[idx], typical_lat[idx], typical_lon[idx],
+                self.distance_method
+            )
+            is_typical_device[has_profile] = seen[has_profile].astype(np.int64)
+
+        success = login_events['success'].astype(bool).to_numpy(dtype=np.int64)
+
+        features_df = pd.DataFrame({
+            'hour': hour,
+            'day_of_week': day_of_week,
+            'is_weekend': is_weekend,
+            'is_work_hours': is_work_hours,
+            'is_night': is_night,
+            'latitude': latitude,
+            'longitude': longitude,
+            'distance_from_typical': distance_from_typical,
+            'browser': browser,
+            'os': os_code,
+            'is_mobile': is_mobile,
+            'is_typical_device': is_typical_device,
+            'success': success,
+        }, columns=FEATURE_COLUMNS)
+
+        if self.login_history is not None:
+            history_df = history_features_batch(
+                user_ids, timestamps, latitude, longitude,
+                (browsers.astype(str) + '/' + oses.astype(str)).to_numpy(),
+                capacity=self.login_history.capacity
+            )
+            for column in HISTORY_FEATURE_COLUMNS:
+                features_df[column] = history_df[column].to_numpy()
+
+        if self.failure_counters is not None:
+            failure_df = failure_features_batch(
+                user_ids, login_events['ip_address'].to_numpy(), timestamps,
+                login_events['success'].astype(bool).to_numpy()
+            )
+            for column in FAILURE_FEATURE_COLUMNS:
+                features_df[column] = failure_df[column].to_numpy()
+
+        features_df['user_id'] = user_ids
+        features_df['timestamp'] = login_events['timestamp'].to_numpy()
+
+        return features_df
 
 
 if __name__ == '__main__':
-    # Test feature engineering
-    from data_generator import SyntheticLoginDataGenerator
+    # Test feature engineering (run with python -m app.ml.feature_engineering)
+    from app.ml.data_generator import SyntheticLoginDataGenerator
 
     # Generate sample data
     generator = SyntheticLoginDataGenerator(num_users=10, days=30)
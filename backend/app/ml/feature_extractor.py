@@ -0,0 +1,191 @@
+import threading
+from datetime import datetime
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from app.ml.distance import distance_km_rad, to_radians
+from app.ml.feature_engineering import BROWSER_ENCODING, OS_ENCODING
+from app.ml.login_history import HISTORY_FEATURE_COLUMNS
+from app.ml.profile_store import locate_profile
+from app.ml.failure_counters import FAILURE_FEATURE_COLUMNS
+
+# Lookup tables for the temporal flags, indexed by hour / weekday
+_WORK_HOURS = tuple(1.0 if 9 <= hour <= 17 else 0.0 for hour in range(24))
+_NIGHT = tuple(1.0 if hour >= 22 or hour <= 5 else 0.0 for hour in range(24))
+_WEEKEND = tuple(1.0 if day >= 5 else 0.0 for day in range(7))
+
+_TEMPORAL = {'hour', 'day_of_week', 'is_weekend', 'is_work_hours', 'is_night'}
+_DEVICE = {'browser', 'os', 'is_mobile', 'is_typical_device'}
+
+# Statement writing each column into row[i]
+_COLUMN_STATEMENTS = {
+    'hour': 'row[{i}] = hour',
+    'day_of_week': 'row[{i}] = weekday',
+    'is_weekend': 'row[{i}] = _WEEKEND[weekday]',
+    'is_work_hours': 'row[{i}] = _WORK_HOURS[hour]',
+    'is_night': 'row[{i}] = _NIGHT[hour]',
+    'latitude': 'row[{i}] = lat',
+    'longitude': 'row[{i}] = lon',
+    'distance_from_typical': 'row[{i}] = _distance_from_typical(store, found, user_id, lat, lon)',
+    'browser': 'row[{i}] = device[0]',
+    'os': 'row[{i}] = device[1]',
+    'is_mobile': 'row[{i}] = device[2]',
+    'is_typical_device': 'row[{i}] = _is_typical_device(store, found, device[3])',
+    'success': "row[{i}] = 1.0 if event['success'] else 0.0",
+}
+_COLUMN_STATEMENTS.update({
+    column: f"row[{{i}}] = history['{column}']" for column in HISTORY_FEATURE_COLUMNS
+})
+_COLUMN_STATEMENTS.update({
+    column: f"row[{{i}}] = failures['{column}']" for column in FAILURE_FEATURE_COLUMNS
+})
+
+
+def _parse_timestamp(value) -> datetime:
+    """datetime (incl. pd.Timestamp) as-is, ISO strings via fromisoformat"""
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return pd.to_datetime(value)
+
+
+class CompiledFeatureExtractor:
+    """
+    Feature extractor specialized for one model's feature_columns
+
+    Generates and compiles a function that reads a raw login event and
+    writes each feature straight into its slot of a preallocated row
+    (shape (1, n_features)), in the order the detector expects. Temporal
+    flags come from lookup tables, device codes from an interned
+    (browser, os, device_type) table and profile fields straight from the
+    ProfileStore arrays (see locate_profile), so the default features are
+    computed without building intermediate dicts. Values match
+    LoginFeatureEngineer.engineer_features.
+
+    Each thread gets its own row buffer; the returned row is overwritten by
+    that thread's next call.
+    """
+
+    def __init__(self, engineer, feature_columns: List[str], dtype=np.float64):
+        """
+        Args:
+            engineer: LoginFeatureEngineer providing profiles, distance
+                method and optional login history / failure counters
+            feature_columns: Column order of the target model
+            dtype: Row buffer dtype (float64 or float32)
+        """
+        unknown = [column for column in feature_columns if column not in _COLUMN_STATEMENTS]
+        if unknown:
+            raise KeyError(f"Cannot extract features: {unknown}")
+
+        self.engineer = engineer
+        self.feature_columns = list(feature_columns)
+        self.dtype = dtype
+        self._device_table = {}
+        self._local = threading.local()
+        self.source = self._generate_source()
+        namespace = {
+            '_WEEKEND': _WEEKEND,
+            '_WORK_HOURS': _WORK_HOURS,
+            '_NIGHT': _NIGHT,
+            '_parse_timestamp': _parse_timestamp,
+            '_engineer': engineer,
+            '_locate_profile': locate_profile,
+            '_intern_device': self._intern_device,
+            '_distance_from_typical': self._distance_from_typical,
+            '_is_typical_device': self._is_typical_device,
+        }
+        exec(compile(self.source, f'<feature extractor {id(self):x}>', 'exec'), namespace)
+        self._extract = namespace['extract']
+
+    def _generate_source(self) -> str:
+        columns = set(self.feature_columns)
+        needs_location = bool(columns & {'latitude', 'longitude', 'distance_from_typical'}) \
+            or bool(columns & set(HISTORY_FEATURE_COLUMNS))
+        needs_device = bool(columns & _DEVICE) or bool(columns & set(HISTORY_FEATURE_COLUMNS))
+        needs_timestamp = bool(columns & _TEMPORAL) or bool(
+            columns & (set(HISTORY_FEATURE_COLUMNS) | set(FAILURE_FEATURE_COLUMNS)))
+        needs_profile = bool(columns & {'distance_from_typical', 'is_typical_device'})
+
+        lines = ['def extract(event, row):', "    user_id = event['user_id']"]
+        if needs_timestamp:
+            lines += ["    ts = _parse_timestamp(event['timestamp'])",
+                      '    hour = ts.hour',
+                      '    weekday = ts.weekday()']
+        if needs_location:
+            lines += ["    location = event['location']",
+                      "    lat = location['latitude']",
+                      "    lon = location['longitude']"]
+        if needs_device:
+            lines += ["    device = _intern_device(event['device_info'])"]
+        if needs_profile:
+            lines += ['    store, found = _locate_profile(_engineer.user_profiles, user_id)']
+        if columns & set(HISTORY_FEATURE_COLUMNS):
+            lines += ['    history = _engineer.login_history.extract_features(user_id, ts, lat, lon, device[3])']
+        if columns & set(FAILURE_FEATURE_COLUMNS):
+            lines += ["    failures = _engineer.failure_counters.extract_features(user_id, event['ip_address'], ts)"]
+
+        lines += ['    row = row[0]']
+        for i, column in enumerate(self.feature_columns):
+            lines.append('    ' + _COLUMN_STATEMENTS[column].format(i=i))
+        lines.append('')
+        return '\n'.join(lines)
+
+    def _intern_device(self, device_info):
+        """(browser code, os code, is_mobile, "browser/os") for a device, cached"""
+        key = (device_info['browser'], device_info['os'], device_info['device_type'])
+        codes = self._device_table.get(key)
+        if codes is None:
+            codes = (
+                float(BROWSER_ENCODING.get(key[0], 0)),
+                float(OS_ENCODING.get(key[1], 0)),
+                1.0 if key[2] == 'mobile' else 0.0,
+                f"{key[0]}/{key[1]}"
+            )
+            self._device_table[key] = codes
+        return codes
+
+    def _distance_from_typical(self, store, found, user_id, lat, lon) -> float:
+        typical = self.engineer._located_typical_location_rad(store, found, user_id)
+        if typical is None:
+            return 0.0
+        lat_rad, lon_rad = to_radians(lat, lon)
+        return distance_km_rad(lat_rad, lon_rad, typical[0], typical[1], self.engineer.distance_method)
+
+    @staticmethod
+    def _is_typical_device(store, found, device_string) -> float:
+        if store is not None:
+            if found < 0:
+                return 1.0
+            return 1.0 if store.has_device(found, device_string) else 0.0
+        if found is None:
+            return 1.0
+        return 1.0 if device_string in found.get('devices', []) else 0.0
+
+    def row_buffer(self) -> np.ndarray:
+        """This thread's reusable (1, n_features) row"""
+        row = getattr(self._local, 'row', None)
+        if row is None:
+            row = self._local.row = np.zeros((1, len(self.feature_columns)), dtype=self.dtype)
+        return row
+
+    def extract(self, login_event, out: np.ndarray = None) -> np.ndarray:
+        """
+        Extract features of a raw login event into a row
+
+        Args:
+            login_event: Raw login event (as accepted by /analyze)
+            out: Row to fill, shape (1, n_features). Defaults to this
+                thread's reusable buffer.
+
+        Returns:
+            The filled row
+        """
+        if out is None:
+            out = self.row_buffer()
+        self._extract(login_event, out)
+        return out
@@ -0,0 +1,282 @@
+from typing import Dict
+
+import numpy as np
+from sklearn.ensemble._iforest import _average_path_length
+
+_SIGN_MASK = np.int64(0x7FFFFFFFFFFFFFFF)
+
+
+def _ordered_key(x: np.ndarray) -> np.ndarray:
+    """Map float64 to int64 so that integer order equals float order"""
+    bits = x.view(np.int64)
+    return bits ^ ((bits >> 63) & _SIGN_MASK)
+
+
+def _from_ordered_key(key: np.ndarray) -> np.ndarray:
+    return (key ^ ((key >> 63) & _SIGN_MASK)).view(np.float64)
+
+
+def _raw_thresholds(threshold: np.ndarray, mean: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """
+    Largest raw float64 value that still goes left at each split
+
+    A scaled split sends x left iff float32((x - mean) / scale) <= threshold.
+    That predicate is monotone in x, so it is equivalent to x <= T for one
+    float64 T per node; T is found exactly by bisecting over the ordered
+    float64 bit patterns (64 vectorized steps over all nodes at once).
+    """
+    def goes_right(x):
+        with np.errstate(over='ignore', invalid='ignore'):
+            return ((x - mean) / scale).astype(np.float32) > threshold
+
+    finite_max = np.full(len(threshold), np.finfo(np.float64).max)
+    raw = np.empty(len(threshold), dtype=np.float64)
+    never_right = ~goes_right(finite_max)
+    always_right = goes_right(-finite_max)
+    raw[never_right] = np.inf
+    raw[always_right & ~never_right] = -np.inf
+
+    search = ~(never_right | always_right)
+    lo = _ordered_key(-finite_max[search])
+    hi = _ordered_key(finite_max[search])
+    mean, scale, threshold = mean[search], scale[search], threshold[search]
+    for _ in range(64):
+        mid = (lo >> 1) + (hi >> 1) + (lo & hi & 1)
+        right = goes_right(_from_ordered_key(mid))
+        hi = np.where(right, mid, hi)
+        lo = np.where(right, lo, mid)
+    raw[search] = _from_ordered_key(lo)
+    return raw
+
+
+class ForestEngine:
+    """
+    Flattened-array inference for a fitted IsolationForest
+
+    Every tree is exported into shared contiguous arrays indexed by a global
+    node id: split feature (already mapped through estimators_features_),
+    split threshold, children, and for leaves the path length sklearn would
+    add (node depth plus the average-path-length correction for the samples
+    left in the leaf). Leaves point to themselves with an infinite threshold,
+    so all trees are walked together one level at a time with a handful of
+    vectorized gathers per level and no per-tree Python loop.
+
+    Scores equal IsolationForest.score_samples; like sklearn, rows are cast
+    to float32 before being compared with the split thresholds. A fused
+    engine (see fuse_scaler) instead compares raw float64 rows.
+
+    With attribute=True the leaves reached by the same walk also give
+    per-feature contributions. A tree credits a row with 1 / (its path
+    length), so short (isolating) paths count most, and spreads that credit
+    over the path's splits in proportion to depth: the splits just above the
+    leaf, which cut the row off, weigh the most. Credits are averaged over
+    trees.
+    """
+
+    BLOCK_ROWS = 256
+
+    def __init__(self, feature, threshold, children, path_length, roots, max_depth, denominator, offset,
+                 input_dtype=np.float32):
+        """
+        Args:
+            feature: (n_nodes,) int split feature per node (0 for leaves)
+            threshold: (n_nodes,) float64 split threshold (+inf for leaves)
+            children: (n_nodes, 2) int global ids of left/right child
+                (the node itself for leaves)
+            path_length: (n_nodes,) float64 path length credited at a leaf
+            roots: (n_trees,) int global id of each tree's root
+            max_depth: Deepest leaf over all trees
+            denominator: n_trees * c(max_samples) score normalizer
+            offset: The model's offset_ (decision threshold on scores)
+            input_dtype: dtype rows are cast to before comparison
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.path_length = path_length
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.denominator = float(denominator)
+        self.offset = float(offset)
+        self.input_dtype = input_dtype
+        self._leaf_attribution = None
+
+    @classmethod
+    def from_sklearn(cls, model) -> 'ForestEngine':
+        """Export a fitted sklearn IsolationForest"""
+        n_features = model.n_features_in_
+        features, thresholds, children, path_lengths, roots = [], [], [], [], []
+        max_depth = 0
+        start = 0
+
+        for tree_idx, (estimator, tree_features) in enumerate(
+            zip(model.estimators_, model.estimators_features_)
+        ):
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            is_leaf = tree.children_left == -1
+            node_ids = np.arange(n_nodes)
+
+            feature = np.asarray(tree_features)[np.where(is_leaf, 0, tree.feature)] \
+                if len(tree_features) != n_features else np.where(is_leaf, 0, tree.feature)
+            threshold = np.where(is_leaf, np.inf, tree.threshold)
+            left = np.where(is_leaf, node_ids, tree.children_left) + start
+            right = np.where(is_leaf, node_ids, tree.children_right) + start
+            path_length = (model._decision_path_lengths[tree_idx]
+                           + model._average_path_length_per_tree[tree_idx] - 1.0)
+
+            features.append(feature)
+            thresholds.append(threshold)
+            children.append(np.column_stack([left, right]))
+            path_lengths.append(path_length)
+            roots.append(start)
+            max_depth = max(max_depth, tree.max_depth)
+            start += n_nodes
+
+        denominator = len(model.estimators_) * _average_path_length([model._max_samples])[0]
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            children=np.ascontiguousarray(np.concatenate(children), dtype=np.intp),
+            path_length=np.ascontiguousarray(np.concatenate(path_lengths), dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            denominator=denominator,
+            offset=model.offset_
+        )
+
+    def fuse_scaler(self, scaler) -> 'ForestEngine':
+        """
+        Fold a fitted StandardScaler into the split thresholds
+
+        Returns an engine that scores raw (unscaled) rows and makes exactly
+        the same left/right decision at every node as this engine on
+        scaler.transform(rows), so scores are bit-for-bit identical.
+        """
+        n_features = len(scaler.mean_ if scaler.mean_ is not None else scaler.scale_)
+        mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(n_features)
+        scale = scaler.scale_ if scaler.scale_ is not None else np.ones(n_features)
+
+        is_leaf = np.isinf(self.threshold)
+        threshold = self.threshold.copy()
+        feature = self.feature[~is_leaf]
+        threshold[~is_leaf] = _raw_thresholds(self.threshold[~is_leaf], mean[feature], scale[feature])
+
+        return ForestEngine(
+            feature=self.feature,
+            threshold=threshold,
+            children=self.children,
+            path_length=self.path_length,
+            roots=self.roots,
+            max_depth=self.max_depth,
+            denominator=self.denominator,
+            offset=self.offset,
+            input_dtype=np.float64
+        )
+
+    # Arrays and scalars that fully describe an engine (for model bundles)
+    ARRAYS = ('feature', 'threshold', 'children', 'path_length', 'roots')
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    def to_params(self) -> Dict:
+        return {'max_depth': self.max_depth, 'denominator': self.denominator, 'offset': self.offset}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], params: Dict, fused: bool = False) -> 'ForestEngine':
+        """Rebuild an engine from to_arrays()/to_params() (arrays are used in place)"""
+        return cls(input_dtype=np.float64 if fused else np.float32,
+                   **{name: arrays[name] for name in cls.ARRAYS}, **params)
+
+    @property
+    def fused(self) -> bool:
+        return self.input_dtype == np.float64
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def leaves(self, X: np.ndarray) -> np.ndarray:
+        """Global leaf id reached by each row in each tree, shape (n, n_trees)"""
+        X = np.ascontiguousarray(X, dtype=self.input_dtype)
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        row_offset = (np.arange(n_rows, dtype=np.intp) * n_features)[:, None]
+        children = self.children.ravel()
+
+        nodes = np.broadcast_to(self.roots, (n_rows, self.n_trees))
+        for _ in range(self.max_depth):
+            values = flat[row_offset + self.feature[nodes]]
+            nodes = children[2 * nodes + (values > self.threshold[nodes])]
+        return nodes
+
+    def score_samples(self, X: np.ndarray, attribute: bool = False):
+        """
+        Same as IsolationForest.score_samples (lower = more abnormal)
+
+        Args:
+            X: Rows to score
+            attribute: Also return per-feature path contributions
+
+        Returns:
+            Scores, or a tuple of (scores, contributions of shape
+            (n, n_features)) when attribute is set
+        """
+        leaf_attribution = self.leaf_attribution(np.shape(X)[1]) if attribute else None
+
+        # Walk rows in blocks so the (rows, trees) node matrix stays in cache
+        depths = np.empty(len(X), dtype=np.float64)
+        contributions = np.empty(np.shape(X)) if attribute else None
+        for start in range(0, len(X), self.BLOCK_ROWS):
+            block = slice(start, start + self.BLOCK_ROWS)
+            leaves = self.leaves(X[block])
+            depths[block] = self.path_length[leaves].sum(axis=1)
+            if attribute:
+                contributions[block] = leaf_attribution[leaves].sum(axis=1)
+
+        if self.denominator == 0:
+            scores = -np.ones(len(depths))
+        else:
+            scores = -(2 ** (-depths / self.denominator))
+        return (scores, contributions) if attribute else scores
+
+    def leaf_attribution(self, n_features: int) -> np.ndarray:
+        """
+        Contribution vector of the path ending at each node
+
+        A path is fixed by its leaf, so its credits are computed once per
+        node (top-down, one level at a time) and attribution at scoring time
+        is a gather over the leaves the walk already produced.
+
+        Returns:
+            Array of shape (n_nodes, n_features); rows of internal nodes
+            hold their partial (uncredited) depth weights
+        """
+        cached = self._leaf_attribution
+        if cached is not None and cached.shape[1] == n_features:
+            return cached
+
+        n_nodes = len(self.feature)
+        weights = np.zeros((n_nodes, n_features))
+        depth = np.zeros(n_nodes, dtype=np.intp)
+        level = self.roots
+        while len(level):
+            internal = level[self.children[level, 0] != level]
+            for side in (0, 1):
+                child = self.children[internal, side]
+                depth[child] = depth[internal] + 1
+                weights[child] = weights[internal]
+                weights[child, self.feature[internal]] += depth[child]
+            level = self.children[internal].ravel()
+
+        is_leaf = self.children[:, 0] == np.arange(n_nodes)
+        splits = depth[is_leaf]
+        weights[is_leaf] /= (np.maximum(self.path_length[is_leaf], 1.0)
+                             * np.maximum(splits * (splits + 1) / 2, 1.0) * self.n_trees)[:, None]
+        self._leaf_attribution = weights
+        return weights
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        """Same as IsolationForest.decision_function (negative = outlier)"""
+        return self.score_samples(X) - self.offset
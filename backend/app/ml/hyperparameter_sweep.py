@@ -0,0 +1,163 @@
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.ml.anomaly_detector import LoginAnomalyDetector
+
+# Default grid: forest size, subsample size and decision threshold
+SWEEP_GRID = {
+    'n_estimators': [50, 100, 200],
+    'max_samples': ['auto', 1024],
+    'contamination': [0.05, 0.10, 0.15],
+}
+
+# Objectives of the Pareto front: higher F1, faster training and scoring
+PARETO_OBJECTIVES = {'f1_score': 1, 'train_seconds': -1, 'latency_us': -1}
+
+
+def expand_grid(grid: Dict[str, List]) -> List[Dict]:
+    """Every combination of the grid's values, as detector keyword arguments"""
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def pareto_front(results: List[Dict], objectives: Dict[str, int] = PARETO_OBJECTIVES) -> List[int]:
+    """
+    Indices of the results no other result dominates
+
+    A result dominates another if it is at least as good in every objective
+    and better in one (sign 1 = higher is better, -1 = lower).
+    """
+    values = np.array([[sign * result[name] for name, sign in objectives.items()] for result in results])
+    front = []
+    for i, row in enumerate(values):
+        dominated = np.any(np.all(values >= row, axis=1) & np.any(values > row, axis=1))
+        if not dominated:
+            front.append(i)
+    return front
+
+
+def _evaluate_config(matrix_path: str, labels_path: str, feature_columns: List[str], config: Dict,
+                     latency_rows: int) -> Dict:
+    """Train and evaluate one configuration on the shared matrix (runs in a worker)"""
+    X = np.load(matrix_path, mmap_mode='r')
+    labels = np.load(labels_path, mmap_mode='r')
+
+    # Parallelism is across configurations; each forest is fitted on one core
+    detector = LoginAnomalyDetector(model_path=os.path.dirname(matrix_path), n_jobs=1, **config)
+    start = time.perf_counter()
+    detector.train_matrix(X, feature_columns)
+    train_seconds = time.perf_counter() - start
+
+    metrics = detector.evaluate_matrix(X, labels)
+
+    # Single-event path used by /analyze, one row at a time
+    rows = np.asarray(X[:latency_rows], dtype=np.float64)
+    timings = np.empty(len(rows))
+    for i in range(len(rows)):
+        start = time.perf_counter()
+        detector.predict_row(rows[i:i + 1])
+        timings[i] = time.perf_counter() - start
+
+    return dict(config,
+                precision=float(metrics['precision']),
+                recall=float(metrics['recall']),
+                f1_score=float(metrics['f1_score']),
+                train_seconds=round(train_seconds, 4),
+                latency_us=round(float(np.median(timings)) * 1e6, 1))
+
+
+class HyperparameterSweep:
+    """
+    Parallel grid search over IsolationForest configurations
+
+    The feature matrix and labels are written once as .npy files in
+    work_dir (and removed afterwards); worker processes memory-map them read-only, so every
+    configuration sees the same rows without copying them per worker. Each
+    configuration is trained, evaluated (precision, recall, F1 against the
+    labels) and timed (training wall time and median single-event scoring
+    latency). Timings are taken while other configurations train in
+    parallel, so compare them with each other rather than with production.
+    """
+
+    def __init__(self, work_dir: str, grid: Optional[Dict[str, List]] = None, workers: Optional[int] = None,
+                 latency_rows: int = 200):
+        """
+        Args:
+            work_dir: Directory for the shared matrix
+            grid: Parameter name -> values (detector keyword arguments);
+                default SWEEP_GRID
+            workers: Worker processes (default: CPU count)
+            latency_rows: Rows scored one at a time to measure latency
+        """
+        self.work_dir = work_dir
+        self.grid = grid or SWEEP_GRID
+        self.workers = workers or os.cpu_count() or 1
+        self.latency_rows = latency_rows
+        self.results = []
+        self.front = []
+        os.makedirs(work_dir, exist_ok=True)
+
+    def run(self, X: np.ndarray, labels, feature_columns: List[str]) -> List[Dict]:
+        """
+        Evaluate every configuration of the grid
+
+        Args:
+            X: Feature matrix of shape (n, n_features)
+            labels: True anomaly labels per row
+            feature_columns: Feature names of the columns
+
+        Returns:
+            One result dict per configuration (parameters, metrics, timings
+            and whether it is on the Pareto front), in grid order
+        """
+        matrix_path = os.path.join(self.work_dir, 'features.npy')
+        labels_path = os.path.join(self.work_dir, 'labels.npy')
+        np.save(matrix_path, np.ascontiguousarray(X, dtype=np.float64))
+        np.save(labels_path, np.asarray(labels, dtype=bool))
+
+        configs = expand_grid(self.grid)
+        args = [(matrix_path, labels_path, list(feature_columns), config, self.latency_rows)
+                for config in configs]
+        try:
+            if self.workers <= 1:
+                results = [_evaluate_config(*arg) for arg in args]
+            else:
+                with ProcessPoolExecutor(max_workers=min(self.workers, len(configs))) as executor:
+                    results = list(executor.map(_evaluate_config, *zip(*args)))
+        finally:
+            os.remove(matrix_path)
+            os.remove(labels_path)
+
+        self.front = pareto_front(results)
+        for i, result in enumerate(results):
+            result['pareto'] = i in self.front
+        self.results = results
+        return results
+
+    def best(self) -> Dict:
+        """The Pareto-optimal configuration with the highest F1 (ties: lowest latency, then training time)"""
+        if not self.results:
+            raise ValueError("No sweep results. Run the sweep first.")
+        candidates = [self.results[i] for i in self.front]
+        return max(candidates, key=lambda r: (r['f1_score'], -r['latency_us'], -r['train_seconds']))
+
+    def best_params(self) -> Dict:
+        best = self.best()
+        return {name: best[name] for name in self.grid}
+
+    def report(self) -> str:
+        """Table of configurations, one line each (* = Pareto front)"""
+        names = sorted(self.grid)
+        header = ' '.join(f'{name:>14}' for name in names)
+        lines = [f"  {header} {'precision':>9} {'recall':>7} {'F1':>6} {'train s':>8} {'latency us':>10}"]
+        for result in self.results:
+            params = ' '.join(f'{str(result[name]):>14}' for name in names)
+            lines.append(f"{'*' if result['pareto'] else ' '} {params} {result['precision']:9.3f} "
+                         f"{result['recall']:7.3f} {result['f1_score']:6.3f} {result['train_seconds']:8.2f} "
+                         f"{result['latency_us']:10.1f}")
+        return '\n'.join(lines)
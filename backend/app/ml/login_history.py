@@ -0,0 +1,189 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+
+from app.ml.distance import distance_km, distance_km_array
+
+# Features derived from a user's recent logins
+HISTORY_FEATURE_COLUMNS = ['seconds_since_last_login', 'travel_speed_kmh', 'device_switches']
+
+# Gaps are capped so "no previous login" and "last login a month ago" look alike
+MAX_GAP_SECONDS = 30 * 24 * 3600
+# Floor on elapsed time for travel speed, so back-to-back logins a few
+# seconds apart on slightly different coordinates don't produce huge speeds
+MIN_TRAVEL_SECONDS = 60
+
+
+def _epoch_seconds(timestamp) -> float:
+    return pd.Timestamp(timestamp).timestamp()
+
+
+class LoginHistory:
+    """
+    In-process ring buffer of each user's most recent logins
+
+    Keeps the last `capacity` logins per user (timestamp, latitude,
+    longitude, device code, success) in a bounded deque, for at most
+    `max_users` users with least-recently-used eviction. Velocity and
+    impossible-travel features are then derived in constant time per event
+    without querying login_events.
+    """
+
+    def __init__(self, capacity: int = 10, max_users: int = 100000):
+        """
+        Args:
+            capacity: Logins kept per user
+            max_users: Users kept before the least recently seen is evicted
+        """
+        self.capacity = capacity
+        self.max_users = max_users
+        self._buffers = OrderedDict()
+        self._device_codes = {}
+        self._lock = threading.Lock()
+
+    def _device_code(self, device: str) -> int:
+        code = self._device_codes.get(device)
+        if code is None:
+            code = self._device_codes.setdefault(device, len(self._device_codes))
+        return code
+
+    def record(self, user_id: str, timestamp, latitude: float, longitude: float,
+               device: str, success: bool = True):
+        """Append a login to the user's buffer"""
+        entry = (_epoch_seconds(timestamp), latitude, longitude, self._device_code(device), bool(success))
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is None:
+                buffer = self._buffers[user_id] = deque(maxlen=self.capacity)
+                if len(self._buffers) > self.max_users:
+                    self._buffers.popitem(last=False)
+            else:
+                self._buffers.move_to_end(user_id)
+            buffer.append(entry)
+
+    def record_event(self, login_event: Dict):
+        """Append a raw login event (as accepted by /analyze)"""
+        device_info = login_event['device_info']
+        self.record(
+            login_event['user_id'],
+            login_event['timestamp'],
+            login_event['location']['latitude'],
+            login_event['location']['longitude'],
+            f"{device_info['browser']}/{device_info['os']}",
+            login_event.get('success', True)
+        )
+
+    def warm_up(self, login_events: Iterable[Dict]) -> int:
+        """
+        Fill buffers from past events, e.g. a login_events cursor sorted by
+        timestamp ascending
+
+        Returns:
+            Number of events recorded
+        """
+        count = 0
+        for event in login_events:
+            self.record_event(event)
+            count += 1
+        return count
+
+    def extract_features(self, user_id: str, timestamp, latitude: float, longitude: float,
+                         device: str) -> Dict:
+        """
+        Features of a new login relative to the user's recent logins
+
+        The login itself is not recorded; call record() once it is scored.
+        """
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            recent = list(buffer) if buffer else []
+
+        if not recent:
+            return {
+                'seconds_since_last_login': float(MAX_GAP_SECONDS),
+                'travel_speed_kmh': 0.0,
+                'device_switches': 0
+            }
+
+        prev_time, prev_lat, prev_lon, _, _ = recent[-1]
+        elapsed = _epoch_seconds(timestamp) - prev_time
+        distance = distance_km(prev_lat, prev_lon, latitude, longitude)
+
+        device_code = self._device_codes.get(device, -1)
+        codes = [entry[3] for entry in recent] + [device_code]
+        switches = sum(1 for a, b in zip(codes, codes[1:]) if a != b)
+
+        return {
+            'seconds_since_last_login': float(min(max(elapsed, 0.0), MAX_GAP_SECONDS)),
+            'travel_speed_kmh': distance / max(elapsed, MIN_TRAVEL_SECONDS) * 3600,
+            'device_switches': switches
+        }
+
+    def __len__(self) -> int:
+        return len(self._buffers)
+
+    def __contains__(self, user_id) -> bool:
+        return user_id in self._buffers
+
+
+def history_features_batch(user_ids: np.ndarray, timestamps: pd.Series, latitude: np.ndarray,
+                           longitude: np.ndarray, devices: np.ndarray, capacity: int = 10) -> pd.DataFrame:
+    """
+    Column-wise equivalent of replaying events through a LoginHistory
+
+    Events are ordered by (user, time) and every feature is computed against
+    the previous event of the same user with groupby shifts, so a historical
+    batch matches what the ring buffer would have produced online (without
+    eviction).
+
+    Returns:
+        DataFrame with HISTORY_FEATURE_COLUMNS, aligned with the input order
+    """
+    n = len(user_ids)
+    if n == 0:
+        return pd.DataFrame({column: pd.Series(dtype=np.float64) for column in HISTORY_FEATURE_COLUMNS})
+
+    stamps = pd.to_datetime(pd.Series(timestamps).reset_index(drop=True))
+    epoch = pd.Timestamp('1970-01-01', tz=stamps.dt.tz)
+    frame = pd.DataFrame({
+        'user_id': user_ids,
+        'seconds': ((stamps - epoch) / pd.Timedelta(seconds=1)).to_numpy(dtype=np.float64),
+        'latitude': latitude,
+        'longitude': longitude,
+        'device': pd.factorize(devices)[0],
+    })
+    order = np.lexsort((frame['seconds'].to_numpy(), pd.factorize(frame['user_id'])[0]))
+    ordered = frame.iloc[order].reset_index(drop=True)
+    grouped = ordered.groupby('user_id', sort=False)
+
+    prev = grouped[['seconds', 'latitude', 'longitude', 'device']].shift(1)
+    has_prev = prev['seconds'].notna().to_numpy()
+
+    elapsed = (ordered['seconds'] - prev['seconds']).to_numpy()
+    seconds_since = np.where(has_prev, np.clip(elapsed, 0.0, MAX_GAP_SECONDS), float(MAX_GAP_SECONDS))
+
+    speed = np.zeros(n, dtype=np.float64)
+    idx = np.flatnonzero(has_prev)
+    distance = distance_km_array(
+        prev['latitude'].to_numpy()[idx], prev['longitude'].to_numpy()[idx],
+        ordered['latitude'].to_numpy()[idx], ordered['longitude'].to_numpy()[idx]
+    )
+    speed[idx] = distance / np.maximum(elapsed[idx], MIN_TRAVEL_SECONDS) * 3600
+
+    # Device changes among the last `capacity` logins plus this one
+    changed = (has_prev & (prev['device'].to_numpy() != ordered['device'].to_numpy())).astype(np.int64)
+    cumulative = pd.Series(changed).groupby(ordered['user_id']).cumsum()
+    lagged = cumulative.groupby(ordered['user_id']).shift(capacity).fillna(0)
+    switches = (cumulative - lagged).to_numpy(dtype=np.int64)
+
+    result = np.empty((n, 3), dtype=np.float64)
+    result[order, 0] = seconds_since
+    result[order, 1] = speed
+    result[order, 2] = switches
+
+    features = pd.DataFrame(result, columns=HISTORY_FEATURE_COLUMNS)
+    features['device_switches'] = features['device_switches'].astype(np.int64)
+    return features
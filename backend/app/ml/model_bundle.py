@@ -0,0 +1,189 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+
+# File layout:
+#   magic (8 bytes) | manifest length (uint64 LE) | manifest JSON | padding
+#   | section | padding | section ...
+# Every section starts on an ALIGNMENT boundary so it can be viewed in place
+# from a read-only mmap as a NumPy array.
+BUNDLE_MAGIC = b'LADBNDL\x01'
+BUNDLE_FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+_HEADER = struct.Struct('<8sQ')
+
+
+def _padding(offset: int) -> int:
+    return -offset % ALIGNMENT
+
+
+def _section_bytes(array: np.ndarray) -> memoryview:
+    return memoryview(np.ascontiguousarray(array)).cast('B')
+
+
+def write_bundle(path: str, sections: Dict[str, np.ndarray], manifest: Dict) -> Dict:
+    """
+    Write a bundle file atomically
+
+    Args:
+        path: Target file; written next to it and renamed into place, so
+            readers see either the previous bundle or the complete new one
+        sections: Named arrays (C-contiguous copies are written)
+        manifest: JSON-serializable metadata; section layout and checksums
+            are added under 'sections', plus an overall 'checksum' and a
+            'version' (creation time and checksum prefix) unless given
+
+    Returns:
+        The manifest as written
+    """
+    manifest = dict(manifest)
+    manifest['format_version'] = BUNDLE_FORMAT_VERSION
+    manifest.setdefault('created_at', datetime.utcnow().isoformat())
+
+    # Lay sections out after a manifest whose size is not known yet: compute
+    # relative offsets first, then shift them past the encoded manifest
+    layout = {}
+    relative = 0
+    for name, array in sections.items():
+        data = _section_bytes(array)
+        layout[name] = {
+            'offset': relative,
+            'nbytes': data.nbytes,
+            'dtype': np.asarray(array).dtype.str,
+            'shape': list(np.shape(array)),
+            'sha256': hashlib.sha256(data).hexdigest()
+        }
+        relative += data.nbytes + _padding(data.nbytes)
+
+    # Bundle checksum over all section checksums; also names the version
+    manifest['checksum'] = hashlib.sha256(
+        ''.join(f"{name}:{section['sha256']}" for name, section in layout.items()).encode('utf-8')
+    ).hexdigest()
+    created = datetime.fromisoformat(manifest['created_at'])
+    manifest.setdefault('version', f"{created:%Y%m%d%H%M%S}-{manifest['checksum'][:8]}")
+
+    # The manifest's own length depends on the absolute offsets it contains,
+    # so iterate until the data start is stable (in practice twice)
+    manifest['sections'] = layout
+    data_start = 0
+    for _ in range(4):
+        for section in layout.values():
+            section['file_offset'] = data_start + section['offset']
+        encoded = json.dumps(manifest, sort_keys=True).encode('utf-8')
+        header_end = _HEADER.size + len(encoded)
+        needed = header_end + _padding(header_end)
+        if needed == data_start:
+            break
+        data_start = needed
+    else:
+        raise RuntimeError("Could not lay out bundle manifest")
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(BUNDLE_MAGIC, len(encoded)))
+            f.write(encoded)
+            f.write(b'\0' * (data_start - header_end))
+            for name, array in sections.items():
+                data = _section_bytes(array)
+                f.write(data)
+                f.write(b'\0' * _padding(data.nbytes))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return manifest
+
+
+class ModelBundle:
+    """
+    Read-only view of a bundle file
+
+    The file is memory-mapped once; sections are returned as NumPy arrays
+    backed by the mapping, so processes loading the same bundle share its
+    pages through the OS page cache and nothing is read until it is touched.
+    Section checksums are verified on first access of each section.
+    """
+
+    def __init__(self, path: str, verify: bool = True):
+        """
+        Args:
+            path: Bundle file
+            verify: Check each section's SHA-256 on first access
+        """
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Model bundle not found: {path}")
+
+        self.path = path
+        self.verify = verify
+        self._verified = set()
+        self._lock = threading.Lock()
+
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < _HEADER.size:
+            raise ValueError(f"Not a model bundle: {path}")
+        magic, manifest_length = _HEADER.unpack_from(self._mmap, 0)
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f"Not a model bundle: {path}")
+
+        manifest_bytes = self._mmap[_HEADER.size:_HEADER.size + manifest_length]
+        self.manifest = json.loads(manifest_bytes.decode('utf-8'))
+        if self.manifest.get('format_version') != BUNDLE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported bundle format version: {self.manifest.get('format_version')}")
+
+    @property
+    def sections(self) -> Dict:
+        return self.manifest['sections']
+
+    def __contains__(self, name) -> bool:
+        return name in self.sections
+
+    def array(self, name: str) -> np.ndarray:
+        """Section as a read-only array backed by the mapping"""
+        section = self.sections[name]
+        data = memoryview(self._mmap)[section['file_offset']:section['file_offset'] + section['nbytes']]
+
+        if self.verify and name not in self._verified:
+            if hashlib.sha256(data).hexdigest() != section['sha256']:
+                raise ValueError(f"Checksum mismatch in bundle section '{name}': {self.path}")
+            with self._lock:
+                self._verified.add(name)
+
+        dtype = np.dtype(section['dtype'])
+        return np.frombuffer(data, dtype=dtype).reshape(section['shape'])
+
+    def arrays(self, prefix: str) -> Dict[str, np.ndarray]:
+        """All sections named '<prefix>/<name>', keyed by name"""
+        start = f'{prefix}/'
+        return {
+            name[len(start):]: self.array(name)
+            for name in self.sections if name.startswith(start)
+        }
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._mmap)
+
+
+def read_manifest(path: str) -> Optional[Dict]:
+    """Manifest of a bundle without mapping its sections, or None if missing"""
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        magic, manifest_length = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f"Not a model bundle: {path}")
+        return json.loads(f.read(manifest_length).decode('utf-8'))
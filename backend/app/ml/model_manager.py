@@ -0,0 +1,264 @@
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from app.ml.anomaly_detector import LoginAnomalyDetector
+from app.ml.model_bundle import read_manifest
+
+
+class ModelVersion:
+    """An immutable, warmed-up detector and the version it was loaded from"""
+
+    __slots__ = ('detector', 'version', 'source', 'loaded_at')
+
+    def __init__(self, detector: LoginAnomalyDetector, version: Optional[str], source: Optional[str]):
+        self.detector = detector
+        self.version = version
+        self.source = source
+        self.loaded_at = datetime.utcnow()
+
+    def to_dict(self) -> Dict:
+        return {
+            'version': self.version,
+            'source': self.source,
+            'loaded_at': self.loaded_at.isoformat()
+        }
+
+
+class ModelManager:
+    """
+    Owns the detector served by the API and swaps it without restarts
+
+    New artifacts are loaded and warmed up (a few synthetic scores, so lazy
+    imports and caches are paid before traffic sees the model) off the
+    request path, then published by replacing a single reference. Request
+    handlers read that reference once per request without taking a lock and
+    keep using the version they got, so a swap never mixes two models in one
+    request. The previous version is kept for instant rollback, and pinning
+    a version makes reloads a no-op until it is unpinned. The watcher only
+    reacts to new bundles on disk, so it never undoes a rollback.
+    """
+
+    def __init__(self, model_path: str, model_name: str = 'login_anomaly_detector',
+                 warmup_rows: int = 32, on_swap: Optional[Callable[[ModelVersion], None]] = None,
+                 reload_interval: float = 0.0, detector_options: Optional[Dict] = None):
+        """
+        Args:
+            model_path: Directory holding the model artifacts
+            model_name: Artifact name (<model_name>.bundle or legacy pickles)
+            warmup_rows: Synthetic rows scored before a version goes live
+            on_swap: Called with the new ModelVersion after every swap
+            reload_interval: Seconds between checks of the bundle on disk
+                for a new version (0 disables the watcher)
+            detector_options: Extra LoginAnomalyDetector arguments for every
+                loaded version (e.g. unusual_risk)
+        """
+        self.model_path = model_path
+        self.model_name = model_name
+        self.warmup_rows = warmup_rows
+        self.on_swap = on_swap
+        self.reload_interval = reload_interval
+        self.detector_options = dict(detector_options or {})
+
+        self._active = None
+        self._previous = None
+        self.pinned_version = None
+        # Version last loaded from the model directory; the watcher reloads
+        # only when the bundle on disk moves past it, so a rollback sticks
+        self.disk_version = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._reloading = None
+        self._stopped = threading.Event()
+        self._watcher = None
+
+    @property
+    def bundle_path(self) -> str:
+        return os.path.join(self.model_path, f'{self.model_name}.bundle')
+
+    def current(self) -> Optional[ModelVersion]:
+        """The active version (a plain reference read, no locking)"""
+        return self._active
+
+    @property
+    def detector(self) -> Optional[LoginAnomalyDetector]:
+        active = self._active
+        return active.detector if active is not None else None
+
+    def load_initial(self) -> ModelVersion:
+        """
+        Load the model synchronously at startup
+
+        A missing model leaves an untrained detector active, so requests fail
+        with "Model not trained or loaded" until a model is reloaded.
+        """
+        try:
+            model = self._load()
+        except FileNotFoundError:
+            print("Warning: ML model not found. Please train the model first.")
+            model = ModelVersion(LoginAnomalyDetector(model_path=self.model_path, **self.detector_options), None, None)
+        self._swap(model)
+        if self.reload_interval > 0:
+            self._start_watcher()
+        return model
+
+    def _load(self, path: Optional[str] = None) -> ModelVersion:
+        """Load and warm a detector from a bundle path or the model directory"""
+        detector = LoginAnomalyDetector(model_path=self.model_path, **self.detector_options)
+        if path is not None:
+            detector.load_bundle(path)
+            source = path
+        else:
+            detector.load_model(self.model_name)
+            source = self.bundle_path if detector.bundle is not None \
+                else os.path.join(self.model_path, f'{self.model_name}.pkl')
+
+        version = detector.model_version
+        if version is None:
+            version = f"legacy-{int(os.path.getmtime(source))}"
+
+        self._warm(detector)
+        if path is None:
+            self.disk_version = version
+        return ModelVersion(detector, version, source)
+
+    def _warm(self, detector: LoginAnomalyDetector):
+        """Score synthetic rows drawn around the training distribution"""
+        rng = np.random.default_rng(0)
+        scaler = detector.scaler
+        rows = rng.normal(scaler.mean_, scaler.scale_, size=(max(1, self.warmup_rows), len(scaler.mean_)))
+        detector.predict_row(rows[:1])
+        # Explaining also precomputes the engine's per-leaf attribution
+        detector.predict_batch(rows, explain=detector.engine is not None)
+
+    def _swap(self, model: ModelVersion):
+        with self._lock:
+            if self._active is not None:
+                self._previous = self._active
+            self._active = model
+        print(f"Model version {model.version} is now active")
+        if self.on_swap is not None:
+            try:
+                self.on_swap(model)
+            except Exception as e:
+                print(f"Warning: model swap hook failed: {e}")
+
+    def reload(self, path: Optional[str] = None, wait: bool = False, force: bool = False) -> bool:
+        """
+        Load a new version in the background and swap it in when warm
+
+        Args:
+            path: Bundle file to load (default: the model directory)
+            wait: Block until the reload has finished
+            force: Reload even while a version is pinned
+
+        Returns:
+            False if the reload was refused (pinned, or one already running)
+        """
+        with self._lock:
+            if self.pinned_version is not None and not force:
+                return False
+            if self._reloading is not None and self._reloading.is_alive():
+                return False
+            self._reloading = threading.Thread(
+                target=self._reload_worker, args=(path,), name='model-reloader', daemon=True
+            )
+            self._reloading.start()
+            thread = self._reloading
+
+        if wait:
+            thread.join()
+        return True
+
+    def _reload_worker(self, path: Optional[str]):
+        start = time.perf_counter()
+        try:
+            model = self._load(path)
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"Warning: model reload failed, keeping version "
+                  f"{self._active.version if self._active else None}: {e}")
+            return
+
+        active = self._active
+        if active is not None and active.version == model.version:
+            print(f"Model version {model.version} already active")
+            return
+
+        self.last_error = None
+        self._swap(model)
+        print(f"Model reload took {time.perf_counter() - start:.2f}s")
+
+    def rollback(self) -> Optional[ModelVersion]:
+        """Swap the previous version back in; returns it (None if there is none)"""
+        with self._lock:
+            if self._previous is None:
+                return None
+            self._active, self._previous = self._previous, self._active
+            model = self._active
+        print(f"Rolled back to model version {model.version}")
+        if self.on_swap is not None:
+            try:
+                self.on_swap(model)
+            except Exception as e:
+                print(f"Warning: model swap hook failed: {e}")
+        return model
+
+    def pin(self, version: Optional[str] = None) -> str:
+        """
+        Pin a version so reloads leave it in place
+
+        Args:
+            version: Active or previous version (default: the active one);
+                pinning the previous version rolls back to it
+
+        Returns:
+            The pinned version
+        """
+        active, previous = self._active, self._previous
+        if version is None or (active is not None and version == active.version):
+            if active is None:
+                raise ValueError("No active model version to pin")
+            version = active.version
+        elif previous is not None and version == previous.version:
+            self.rollback()
+        else:
+            raise ValueError(f"Unknown model version: {version}")
+
+        self.pinned_version = version
+        return version
+
+    def unpin(self):
+        self.pinned_version = None
+
+    def _start_watcher(self):
+        self._watcher = threading.Thread(target=self._watch_loop, name='model-watcher', daemon=True)
+        self._watcher.start()
+
+    def _watch_loop(self):
+        while not self._stopped.wait(self.reload_interval):
+            try:
+                manifest = read_manifest(self.bundle_path)
+            except Exception as e:
+                print(f"Warning: could not read model manifest: {e}")
+                continue
+            if manifest is not None and manifest['version'] != self.disk_version:
+                self.reload()
+
+    def close(self):
+        """Stop the watcher thread"""
+        self._stopped.set()
+
+    def status(self) -> Dict:
+        active, previous = self._active, self._previous
+        return {
+            'active': active.to_dict() if active is not None else None,
+            'previous': previous.to_dict() if previous is not None else None,
+            'pinned_version': self.pinned_version,
+            'reloading': self._reloading is not None and self._reloading.is_alive(),
+            'last_error': self.last_error
+        }
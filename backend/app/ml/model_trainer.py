@@ -1,72 +1,179 @@
-import pandas as pd
+import argparse
+import json
 import os
-from app.ml.data_generator import SyntheticLoginDataGenerator
-from app.ml.feature_engineering import LoginFeatureEngineer
+import shutil
+import pandas as pd
+from app.ml.data_generator import SyntheticLoginDataGenerator, GENERATOR_VERSION
+from app.ml.feature_engineering import LoginFeatureEngineer, FEATURE_ENGINEER_VERSION
 from app.ml.anomaly_detector import LoginAnomalyDetector
+from app.ml.login_history import LoginHistory, HISTORY_FEATURE_COLUMNS
+from app.ml.failure_counters import FailureCounters, FAILURE_FEATURE_COLUMNS
+from app.ml.hyperparameter_sweep import HyperparameterSweep
+from app.ml.pipeline_cache import StageCache, frame_to_sections, sections_to_frame
+from app.ml.profile_store import ProfileStore
+from app.ml.stage_metrics import StageMetrics
+from app.ml.streaming_training import MongoTrainingSource, StreamingTrainer
 
 
-class ModelTrainingPipeline:
-    """Complete pipeline for training the anomaly detection model"""
+def _login_events():
+    """The login_events collection in the database of MONGO_URI"""
+    from pymongo import MongoClient
+    from app.config import Config
+    return MongoClient(Config.MONGO_URI).get_default_database()['login_events']
 
-    def __init__(self, data_path='./data', model_path='./ml_models'):
+
+class ModelTrainingPipeline:
+    """
+    Complete pipeline for training the anomaly detection model
+
+    Stage results are cached under <data_path>/cache, keyed by a hash of
+    each stage's parameters and the checksums of its inputs (see
+    StageCache): generated data by generator parameters, seed and version;
+    features and profiles by feature options, engineer version and the data
+    fingerprint; the trained model bundle by contamination and the feature
+    fingerprint. A rerun with only contamination changed goes straight to
+    training.
+    """
+
+    def __init__(self, data_path='./data', model_path='./ml_models', force=False,
+                 cache_max_bytes=2 * 1024 ** 3):
+        """
+        Args:
+            data_path: Directory for training data and the stage cache
+            model_path: Directory the model bundle is saved to
+            force: Recompute every stage, replacing cached artifacts
+            cache_max_bytes: Size budget of the stage cache (LRU eviction)
+        """
         self.data_path = data_path
         self.model_path = model_path
         self.generator = None
         self.engineer = None
         self.detector = None
-
-    def generate_training_data(self, num_users=50, days=30, anomaly_percentage=0.10):
+        self.cache = StageCache(os.path.join(data_path, 'cache'), max_bytes=cache_max_bytes, force=force)
+        self.metrics = StageMetrics(track_memory=False)
+        # Checksums of this run's stage outputs, chaining the stage keys
+        self.fingerprints = {}
+        self._train_key = None
+        self._cached_model = None
+
+    def generate_training_data(self, num_users=50, days=30, anomaly_percentage=0.10, seed=42):
         """Generate synthetic training data"""
         print("=" * 60)
         print("STEP 1: Generating Training Data")
         print("=" * 60)
 
-        self.generator = SyntheticLoginDataGenerator(num_users=num_users, days=days)
-
-        # Create data directory if it doesn't exist
-        os.makedirs(os.path.join(self.data_path, 'training'), exist_ok=True)
-
-        filepath = os.path.join(self.data_path, 'training', 'login_events.csv')
-        df = self.generator.save_dataset(filepath, anomaly_percentage=anomaly_percentage)
-
+        params = {'num_users': num_users, 'days': days, 'anomaly_percentage': anomaly_percentage,
+                  'seed': seed, 'version': GENERATOR_VERSION}
+        key = StageCache.key('data', params)
+
+        with self.metrics.stage('data') as stage:
+            artifact = self.cache.load('data', key) if seed is not None else None
+            stage['cache'] = 'hit' if artifact is not None else 'miss'
+            if artifact is not None:
+                df = sections_to_frame(artifact, artifact.manifest['layout'])
+                print(f"Loaded {len(df)} cached events ({key})")
+            else:
+                self.generator = SyntheticLoginDataGenerator(num_users=num_users, days=days, seed=seed)
+                df = self.generator.generate_dataset(anomaly_percentage=anomaly_percentage)
+                sections, layout = frame_to_sections(df)
+                artifact = self.cache.store('data', key, sections, {'params': params, 'layout': layout})
+                print(f"Generated {len(df)} events "
+                      f"({df['is_anomaly'].sum()} anomalous, {df['is_anomaly'].mean() * 100:.2f}%)")
+
+        self.fingerprints['data'] = artifact.manifest['checksum']
         return df
 
-    def engineer_features(self, df):
-        """Engineer features from raw login data"""
+    def engineer_features(self, df, use_login_history=False, use_failure_counters=False):
+        """
+        Engineer features from raw login data
+
+        Args:
+            df: Raw login events
+            use_login_history: Add velocity features (time since last login,
+                travel speed, device switches)
+            use_failure_counters: Add failed-login window features (per user,
+                per IP, distinct users per IP)
+        """
         print("\n" + "=" * 60)
         print("STEP 2: Engineering Features")
         print("=" * 60)
 
-        self.engineer = LoginFeatureEngineer()
-
-        # Build user profiles from historical data
-        self.engineer.build_all_profiles(df)
+        self.engineer = LoginFeatureEngineer(
+            login_history=LoginHistory() if use_login_history else None,
+            failure_counters=FailureCounters() if use_failure_counters else None
+        )
 
-        # Engineer features
-        features_df = self.engineer.engineer_features_batch(df)
+        params = {'use_login_history': use_login_history, 'use_failure_counters': use_failure_counters,
+                  'distance_method': self.engineer.distance_method, 'version': FEATURE_ENGINEER_VERSION}
+        data = self.fingerprints.get('data')
+        key = StageCache.key('features', params, [data]) if data is not None else None
+
+        with self.metrics.stage('features') as stage:
+            artifact = self.cache.load('features', key) if key is not None else None
+            stage['cache'] = 'hit' if artifact is not None else 'miss'
+            if artifact is not None:
+                features_df = sections_to_frame(artifact, artifact.manifest['layout'])
+                self.engineer.user_profiles = ProfileStore.from_arrays(
+                    artifact.arrays('profiles'), artifact.manifest['profiles']['device_vocab']
+                )
+                print(f"Loaded cached features and {len(self.engineer.user_profiles)} profiles ({key})")
+            else:
+                # Build user profiles from historical data
+                self.engineer.build_all_profiles(df)
+
+                # Engineer features
+                features_df = self.engineer.engineer_features_batch(df)
+
+                if key is not None:
+                    sections, layout = frame_to_sections(features_df)
+                    store = ProfileStore.from_profiles(self.engineer.user_profiles)
+                    sections.update({f'profiles/{name}': array for name, array in store.to_arrays().items()})
+                    artifact = self.cache.store('features', key, sections, {
+                        'params': params, 'layout': layout,
+                        'profiles': {'device_vocab': store.device_vocab, 'n_users': len(store)}
+                    })
 
         print(f"\nEngineered {len(features_df.columns)} features")
         print(f"Feature columns: {features_df.columns.tolist()}")
 
-        # Save features
-        features_path = os.path.join(self.data_path, 'training', 'login_features.csv')
-        features_df.to_csv(features_path, index=False)
-        print(f"Features saved to {features_path}")
-
+        if artifact is not None:
+            self.fingerprints['features'] = artifact.manifest['checksum']
         return features_df
 
-    def train_model(self, features_df, contamination=0.10):
-        """Train the anomaly detection model"""
+    def train_model(self, features_df, contamination=0.10, forest_params=None):
+        """
+        Train the anomaly detection model
+
+        Args:
+            features_df: Engineered features
+            contamination: Expected proportion of anomalies
+            forest_params: Extra IsolationForest settings (n_estimators,
+                max_samples, max_features), e.g. from a sweep
+        """
         print("\n" + "=" * 60)
         print("STEP 3: Training Model")
         print("=" * 60)
 
-        self.detector = LoginAnomalyDetector(
-            model_path=self.model_path,
-            contamination=contamination
-        )
-
-        self.detector.train(features_df)
+        forest_params = forest_params or {}
+        params = dict(forest_params, contamination=contamination)
+        features = self.fingerprints.get('features')
+        self._train_key = StageCache.key('train', params, [features]) if features is not None else None
+        self._cached_model = None
+
+        with self.metrics.stage('train') as stage:
+            self.detector = LoginAnomalyDetector(
+                model_path=self.model_path,
+                contamination=contamination,
+                **forest_params
+            )
+
+            artifact = self.cache.load('train', self._train_key) if self._train_key is not None else None
+            stage['cache'] = 'hit' if artifact is not None else 'miss'
+            if artifact is not None:
+                self.detector.load_bundle(artifact.path)
+                self._cached_model = artifact.path
+            else:
+                self.detector.train(features_df)
 
         return self.detector
 
@@ -76,7 +183,8 @@ class ModelTrainingPipeline:
         print("STEP 4: Evaluating Model")
         print("=" * 60)
 
-        metrics = self.detector.evaluate(features_df, df['is_anomaly'])
+        with self.metrics.stage('evaluate'):
+            metrics = self.detector.evaluate(features_df, df['is_anomaly'])
 
         print(f"\nModel Performance Metrics:")
         print(f"  Precision: {metrics['precision']:.3f}")
@@ -93,25 +201,182 @@ class ModelTrainingPipeline:
         print("STEP 5: Saving Model")
         print("=" * 60)
 
-        self.detector.save_model(model_name)
+        with self.metrics.stage('save'):
+            bundle_file = os.path.join(self.model_path, f'{model_name}.bundle')
+            if self._cached_model is not None:
+                # Same bytes (and version) as when this model was first saved
+                tmp_path = f"{bundle_file}.tmp-{os.getpid()}"
+                os.makedirs(self.model_path, exist_ok=True)
+                shutil.copyfile(self._cached_model, tmp_path)
+                os.replace(tmp_path, bundle_file)
+                print(f"Model bundle restored from cache to {bundle_file} (version {self.detector.model_version})")
+            else:
+                # Model, scaler, features and user profiles go into one bundle
+                bundle_file = self.detector.save_model(model_name, profiles=self.engineer.user_profiles)
+                if self._train_key is not None:
+                    self.cache.store_file('train', self._train_key, bundle_file)
+
+        return bundle_file
+
+    def run_sweep(self, num_users=50, days=30, anomaly_percentage=0.10, use_login_history=False,
+                  use_failure_counters=False, seed=42, grid=None, workers=None,
+                  model_name='login_anomaly_detector'):
+        """
+        Sweep IsolationForest configurations and keep the best model
+
+        Data and features are produced (or loaded from the cache) once; the
+        grid is then trained and evaluated in parallel worker processes
+        sharing the feature matrix (see HyperparameterSweep). The Pareto
+        optimal configuration with the highest F1 is retrained here and
+        saved like a regular pipeline run. Results are also written to
+        <data_path>/sweep/results.json.
+
+        Args:
+            grid: Parameter name -> values (default SWEEP_GRID)
+            workers: Worker processes (default: CPU count)
+
+        Returns:
+            One result dict per configuration
+        """
+        print("\n" + "=" * 60)
+        print("STARTING HYPERPARAMETER SWEEP")
+        print("=" * 60)
+
+        df = self.generate_training_data(num_users, days, anomaly_percentage, seed)
+        features_df = self.engineer_features(df, use_login_history, use_failure_counters)
+
+        sweep_dir = os.path.join(self.data_path, 'sweep')
+        sweep = HyperparameterSweep(sweep_dir, grid=grid, workers=workers)
+        feature_columns = [col for col in features_df.columns if col not in ('user_id', 'timestamp')]
+        with self.metrics.stage('sweep'):
+            results = sweep.run(features_df[feature_columns].values, df['is_anomaly'].values, feature_columns)
+
+        print(f"\nEvaluated {len(results)} configurations with {sweep.workers} workers (* = Pareto front):")
+        print(sweep.report())
+        with open(os.path.join(sweep_dir, 'results.json'), 'w') as f:
+            json.dump(results, f, indent=2)
+
+        best = sweep.best_params()
+        print(f"\nSelected: {best}")
+        contamination = best.pop('contamination', 0.10)
+        self.train_model(features_df, contamination, forest_params=best)
+        self.evaluate_model(df, features_df)
+        self.save_model(model_name)
+
+        print(self.metrics.report())
+        return results
+
+    def run_streaming_pipeline(self, collection=None, days=90, batch_size=10000, contamination=0.10,
+                               use_failure_counters=False, sample_size=StreamingTrainer.SAMPLE_SIZE,
+                               model_name='login_anomaly_detector', work_dir=None):
+        """
+        Train on real login events streamed from MongoDB
+
+        Features are written to `work_dir` as memmapped .npy files instead
+        of being held in memory (see StreamingTrainer). There are no labels,
+        so the model is not evaluated.
+
+        Args:
+            collection: pymongo collection of login events (default:
+                login_events in the database of MONGO_URI)
+            days: Training window ending now
+            batch_size: Events fetched from MongoDB per batch
+            work_dir: Directory for the feature files (default:
+                <data_path>/training/stream)
+
+        Returns:
+            Wall time and peak memory per stage
+        """
+        print("\n" + "=" * 60)
+        print("STARTING STREAMING TRAINING PIPELINE")
+        print("=" * 60)
+
+        source = MongoTrainingSource(collection or _login_events(), days=days, batch_size=batch_size)
+        trainer = StreamingTrainer(
+            source,
+            work_dir=work_dir or os.path.join(self.data_path, 'training', 'stream'),
+            sample_size=sample_size,
+            use_failure_counters=use_failure_counters
+        )
+
+        self.detector = trainer.train(contamination, model_path=self.model_path)
+        self.engineer = trainer.engineer
+
+        with trainer.metrics.stage('save'):
+            self.save_model(model_name)
 
-        # Also save the feature engineer profiles
-        import joblib
-        profiles_path = os.path.join(self.model_path, f'{model_name}_user_profiles.pkl')
-        joblib.dump(self.engineer.user_profiles, profiles_path)
-        print(f"User profiles saved to {profiles_path}")
+        print("\n" + trainer.metrics.report())
+        return trainer.metrics.to_dict()
 
-    def run_full_pipeline(self, num_users=50, days=30, anomaly_percentage=0.10, contamination=0.10):
-        """Run the complete training pipeline"""
+    def run_refresh(self, collection=None, days=1, n_trees=None, model_name='login_anomaly_detector'):
+        """
+        Refresh the saved model on recent login events instead of retraining
+
+        Loads <model_name>, engineers features for the last `days` of
+        login_events with the bundle's user profiles (and the same feature
+        options the model was trained with), replaces the oldest trees with
+        trees grown on them (LoginAnomalyDetector.refresh) and saves the
+        result as a new version. User profiles are carried over unchanged.
+
+        Args:
+            collection: pymongo collection of login events (default:
+                login_events in the database of MONGO_URI)
+            days: Recent window the new trees are grown on
+            n_trees: Trees to replace (default: the detector's
+                REFRESH_FRACTION of the forest)
+
+        Returns:
+            Refresh summary (see LoginAnomalyDetector.refresh)
+        """
+        print("\n" + "=" * 60)
+        print("STARTING INCREMENTAL MODEL REFRESH")
+        print("=" * 60)
+
+        with self.metrics.stage('load'):
+            self.detector = LoginAnomalyDetector(model_path=self.model_path)
+            self.detector.load_model(model_name)
+            columns = set(self.detector.feature_columns)
+            self.engineer = LoginFeatureEngineer(
+                login_history=LoginHistory() if columns & set(HISTORY_FEATURE_COLUMNS) else None,
+                failure_counters=FailureCounters() if columns & set(FAILURE_FEATURE_COLUMNS) else None
+            )
+            self.engineer.user_profiles = self.detector.load_profiles() or {}
+
+        with self.metrics.stage('features'):
+            # The recent window is small by design, so it is engineered in one frame
+            source = MongoTrainingSource(collection or _login_events(), days=days)
+            batches = list(source.batches())
+            if not batches:
+                raise ValueError(f"No login events in the last {days} days")
+            features_df = self.engineer.engineer_features_batch(pd.concat(batches, ignore_index=True))
+
+        with self.metrics.stage('refresh'):
+            summary = self.detector.refresh(features_df, n_trees=n_trees)
+
+        with self.metrics.stage('save'):
+            self.save_model(model_name)
+
+        print(self.metrics.report())
+        return summary
+
+    def run_full_pipeline(self, num_users=50, days=30, anomaly_percentage=0.10, contamination=0.10,
+                          use_login_history=False, use_failure_counters=False, seed=42):
+        """
+        Run the complete training pipeline
+
+        Stages whose cached artifacts are still valid are loaded instead of
+        recomputed; evaluation always runs. Per-stage timings are printed at
+        the end and kept in self.metrics.
+        """
         print("\n" + "=" * 60)
         print("STARTING MODEL TRAINING PIPELINE")
         print("=" * 60)
 
         # Generate data
-        df = self.generate_training_data(num_users, days, anomaly_percentage)
+        df = self.generate_training_data(num_users, days, anomaly_percentage, seed)
 
         # Engineer features
-        features_df = self.engineer_features(df)
+        features_df = self.engineer_features(df, use_login_history, use_failure_counters)
 
         # Train model
         self.train_model(features_df, contamination)
@@ -125,20 +390,61 @@ class ModelTrainingPipeline:
         print("\n" + "=" * 60)
         print("PIPELINE COMPLETED SUCCESSFULLY")
         print("=" * 60)
+        print(self.metrics.report())
 
         return metrics
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the login anomaly detector')
+    parser.add_argument('--data-path', default='./data')
+    parser.add_argument('--model-path', default='./ml_models')
+    parser.add_argument('--num-users', type=int, default=100)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--anomaly-percentage', type=float, default=0.10)
+    parser.add_argument('--contamination', type=float, default=0.10)
+    parser.add_argument('--seed', type=int, default=42, help='Synthetic data seed (cache key)')
+    parser.add_argument('--login-history', action='store_true', help='Add velocity features')
+    parser.add_argument('--failure-counters', action='store_true', help='Add failed-login window features')
+    parser.add_argument('--force', action='store_true', help='Recompute every stage, ignoring the cache')
+    parser.add_argument('--cache-max-mb', type=int, default=2048, help='Stage cache size budget')
+    parser.add_argument('--sweep', action='store_true', help='Grid-search forest settings and keep the best')
+    parser.add_argument('--workers', type=int, default=None, help='Sweep worker processes')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Refresh the saved model on recent login_events instead of retraining')
+    parser.add_argument('--refresh-days', type=int, default=1, help='Recent window for --refresh')
+    parser.add_argument('--refresh-trees', type=int, default=None, help='Trees replaced by --refresh')
+    parser.add_argument('--stream', action='store_true',
+                        help='Train on the last --days of login_events, streamed from MongoDB')
+    parser.add_argument('--work-dir', default=None,
+                        help='Feature files for --stream (default: <data-path>/training/stream)')
+    parser.add_argument('--batch-size', type=int, default=10000, help='Events fetched per batch by --stream')
+    args = parser.parse_args()
+
     # Run the training pipeline
     pipeline = ModelTrainingPipeline(
-        data_path='./data',
-        model_path='./ml_models'
+        data_path=args.data_path,
+        model_path=args.model_path,
+        force=args.force,
+        cache_max_bytes=args.cache_max_mb * 1024 * 1024
     )
 
-    metrics = pipeline.run_full_pipeline(
-        num_users=100,
-        days=30,
-        anomaly_percentage=0.10,
-        contamination=0.10
-    )
\ No newline at end of file
+    options = dict(
+        num_users=args.num_users,
+        days=args.days,
+        anomaly_percentage=args.anomaly_percentage,
+        use_login_history=args.login_history,
+        use_failure_counters=args.failure_counters,
+        seed=args.seed
+    )
+    if args.refresh:
+        pipeline.run_refresh(days=args.refresh_days, n_trees=args.refresh_trees)
+    elif args.stream:
+        pipeline.run_streaming_pipeline(days=args.days, batch_size=args.batch_size,
+                                        contamination=args.contamination,
+                                        use_failure_counters=args.failure_counters,
+                                        work_dir=args.work_dir)
+    elif args.sweep:
+        pipeline.run_sweep(workers=args.workers, **options)
+    else:
+        metrics = pipeline.run_full_pipeline(contamination=args.contamination, **options)
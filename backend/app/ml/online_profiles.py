@@ -0,0 +1,447 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from app.ml.profile_store import locate_profile
+
+
+class StreamingMedian:
+    """
+    O(1) streaming median estimate
+
+    Sign-gradient quantile tracker with an adaptive step: the estimate moves
+    toward each new value by at most `step`; the step grows while values keep
+    landing on the same side (so a real move, e.g. a relocation, is tracked
+    in a handful of events) and shrinks when they alternate (so the estimate
+    settles on the median of a stable distribution).
+    """
+
+    GROWTH = 1.5
+    SHRINK = 0.5
+
+    def __init__(self, value: Optional[float] = None, step: float = 0.05,
+                 min_step: float = 1e-4, max_step: float = 90.0):
+        self.value = value
+        self.step = step
+        self.min_step = min_step
+        self.max_step = max_step
+        self._last_direction = 0
+
+    def update(self, x: float):
+        if self.value is None:
+            self.value = x
+            return
+
+        delta = x - self.value
+        if delta == 0:
+            return
+
+        direction = 1 if delta > 0 else -1
+        if direction == self._last_direction:
+            self.step = min(self.step * self.GROWTH, self.max_step)
+        else:
+            self.step = max(self.step * self.SHRINK, self.min_step)
+        self._last_direction = direction
+
+        self.value += direction * min(self.step, abs(delta))
+
+
+class OnlineProfile:
+    """
+    Incrementally updated behavioral profile for one user
+
+    Keeps a streaming median of the login location, exponentially decayed
+    counters for hours, weekdays and devices, and an EWMA of logins per
+    active day. Every update is O(1) in the number of past logins.
+    """
+
+    # A value is "typical" when its decayed weight is at least this share of
+    # the top weight (decayed counters are almost never exactly tied)
+    MODE_RATIO = 0.9
+    # Devices whose decayed weight fell below this are forgotten
+    MIN_DEVICE_WEIGHT = 0.05
+    # Weight given to each value of a seeding profile (about one week of logins)
+    SEED_WEIGHT = 5.0
+
+    def __init__(self, user_id: str, half_life: float = 50.0):
+        """
+        Args:
+            user_id: User this profile belongs to
+            half_life: Number of logins after which an observation's weight
+                in the hour/weekday/device counters has halved
+        """
+        self.user_id = user_id
+        self.decay = 0.5 ** (1.0 / half_life)
+        self.rate_alpha = 1.0 - self.decay
+        self.latitude = StreamingMedian()
+        self.longitude = StreamingMedian()
+        self.hours = [0.0] * 24
+        self.days = [0.0] * 7
+        self.devices = {}
+        self.avg_logins_per_day = None
+        self.current_day = None
+        self.logins_today = 0
+
+    @classmethod
+    def from_profile(cls, profile: Dict, half_life: float = 50.0) -> 'OnlineProfile':
+        """Seed online state from a batch-built profile"""
+        state = cls(profile['user_id'], half_life=half_life)
+        typical_loc = profile.get('typical_location')
+        if typical_loc:
+            state.latitude.value = typical_loc['latitude']
+            state.longitude.value = typical_loc['longitude']
+        for hour in profile.get('typical_hours', []):
+            state.hours[int(hour)] = cls.SEED_WEIGHT
+        for day in profile.get('typical_days', []):
+            state.days[int(day)] = cls.SEED_WEIGHT
+        for device in profile.get('devices', []):
+            state.devices[device] = cls.SEED_WEIGHT
+        state.avg_logins_per_day = profile.get('avg_logins_per_day')
+        return state
+
+    def update(self, timestamp: datetime, latitude: float, longitude: float, device: str):
+        """Fold one login into the profile"""
+        self.latitude.update(latitude)
+        self.longitude.update(longitude)
+
+        for i in range(24):
+            self.hours[i] *= self.decay
+        self.hours[timestamp.hour] += 1.0
+
+        for i in range(7):
+            self.days[i] *= self.decay
+        self.days[timestamp.weekday()] += 1.0
+
+        for known in list(self.devices):
+            weight = self.devices[known] * self.decay
+            if weight < self.MIN_DEVICE_WEIGHT:
+                del self.devices[known]
+            else:
+                self.devices[known] = weight
+        self.devices[device] = self.devices.get(device, 0.0) + 1.0
+
+        # Logins-per-active-day EWMA, folded in when the day rolls over
+        day = timestamp.date()
+        if self.current_day is None or day == self.current_day:
+            self.logins_today += 1
+        else:
+            if self.avg_logins_per_day is None:
+                self.avg_logins_per_day = float(self.logins_today)
+            else:
+                self.avg_logins_per_day += self.rate_alpha * (self.logins_today - self.avg_logins_per_day)
+            self.logins_today = 1
+        self.current_day = day
+
+    @classmethod
+    def _modes(cls, weights: List[float]) -> List[int]:
+        top = max(weights)
+        if top <= 0:
+            return []
+        return [i for i, weight in enumerate(weights) if weight >= top * cls.MODE_RATIO]
+
+    def to_profile(self) -> Dict:
+        """Materialize in the same shape as LoginFeatureEngineer.build_user_profile"""
+        typical_location = None
+        if self.latitude.value is not None:
+            typical_location = {'latitude': self.latitude.value, 'longitude': self.longitude.value}
+
+        avg_logins = self.avg_logins_per_day
+        if avg_logins is None:
+            avg_logins = float(self.logins_today)
+
+        return {
+            'user_id': self.user_id,
+            'typical_hours': self._modes(self.hours),
+            'typical_location': typical_location,
+            'devices': list(self.devices),
+            'avg_logins_per_day': avg_logins,
+            'typical_days': self._modes(self.days)
+        }
+
+    def to_dict(self) -> Dict:
+        """Serialize the full online state (for persistence)"""
+        return {
+            'user_id': self.user_id,
+            'decay': self.decay,
+            'latitude': [self.latitude.value, self.latitude.step],
+            'longitude': [self.longitude.value, self.longitude.step],
+            'hours': self.hours,
+            'days': self.days,
+            'devices': [[device, weight] for device, weight in self.devices.items()],
+            'avg_logins_per_day': self.avg_logins_per_day,
+            'current_day': self.current_day.isoformat() if self.current_day else None,
+            'logins_today': self.logins_today
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'OnlineProfile':
+        """Restore state saved with to_dict"""
+        state = cls(data['user_id'])
+        state.decay = data['decay']
+        state.rate_alpha = 1.0 - state.decay
+        state.latitude.value, state.latitude.step = data['latitude']
+        state.longitude.value, state.longitude.step = data['longitude']
+        state.hours = list(data['hours'])
+        state.days = list(data['days'])
+        state.devices = dict(data['devices'])
+        state.avg_logins_per_day = data['avg_logins_per_day']
+        if data.get('current_day'):
+            state.current_day = datetime.fromisoformat(data['current_day']).date()
+        state.logins_today = data.get('logins_today', 0)
+        return state
+
+
+class OnlineProfileUpdater(Mapping):
+    """
+    Live overlay of online profiles on top of the batch-built profiles
+
+    Acts as the user_id -> profile Mapping for LoginFeatureEngineer: users
+    that have been observed since startup are served from their online
+    state, everyone else from the base profiles (dict or ProfileStore).
+
+    At most `max_users` online states are kept, with least-recently-seen
+    eviction; an evicted user falls back to the base profile. A user seen
+    for the first time is seeded from the base profile, so the request path
+    never reads storage; persisted states are restored in bulk with
+    preload() instead of per user.
+
+    Updated users are marked dirty and handed to `persist` in batches by a
+    background thread, either every `flush_interval` seconds or as soon as
+    `flush_batch_size` users are dirty, so the request path never waits on
+    storage. Dirty users evicted before a flush are persisted with the next
+    batch.
+
+    Persisted states are tagged with `base_version`, the model version the
+    base profiles belong to. rebase() installs retrained base profiles and
+    drops the online states learned on top of the old ones (the retrain
+    already saw those logins), and preload() skips states of other versions.
+    """
+
+    def __init__(self, base: Optional[Mapping] = None, half_life: float = 50.0,
+                 persist: Optional[Callable[[List[Dict]], None]] = None,
+                 flush_interval: float = 5.0, flush_batch_size: int = 500,
+                 max_users: int = 100000, base_version: Optional[str] = None):
+        """
+        Args:
+            base: Batch-built profiles to seed online state from
+            half_life: Decay half-life in logins (see OnlineProfile)
+            persist: Called from the flusher thread with a list of serialized
+                states (OnlineProfile.to_dict)
+            flush_interval: Max seconds between flushes
+            flush_batch_size: Number of dirty users that triggers a flush
+            max_users: Online states kept before the least recently seen
+                user is evicted
+            base_version: Model version of the base profiles, stored with
+                every persisted state
+        """
+        self.base = base if base is not None else {}
+        self.half_life = half_life
+        self.persist = persist
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.max_users = max_users
+        self.base_version = base_version
+
+        self.states = OrderedDict()
+        self._profiles = {}
+        self._dirty = set()
+        # user_id -> serialized state of dirty users evicted before a flush
+        self._evicted = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher = None
+
+    def _new_state(self, user_id: str) -> OnlineProfile:
+        """Seed state for a user without one (called with the lock held)"""
+        saved = self._evicted.pop(user_id, None)
+        if saved is not None:
+            return OnlineProfile.from_dict(saved)
+        profile = self.base.get(user_id)
+        if profile is not None:
+            return OnlineProfile.from_profile(profile, half_life=self.half_life)
+        return OnlineProfile(user_id, half_life=self.half_life)
+
+    def _snapshot(self, state: OnlineProfile) -> Dict:
+        """Serialized state tagged with the base version (lock held)"""
+        return dict(state.to_dict(), base_version=self.base_version)
+
+    def _add(self, user_id: str, state: OnlineProfile):
+        """Insert a state as most recently seen, evicting the least recent (lock held)"""
+        self.states[user_id] = state
+        self.states.move_to_end(user_id)
+        self._profiles[user_id] = state.to_profile()
+        while len(self.states) > self.max_users:
+            old_id, old_state = self.states.popitem(last=False)
+            del self._profiles[old_id]
+            if old_id in self._dirty:
+                self._dirty.discard(old_id)
+                self._evicted[old_id] = self._snapshot(old_state)
+
+    def preload(self, saved_states: Iterable[Dict]) -> int:
+        """
+        Restore persisted states in bulk (e.g. from a thread at startup)
+
+        Restored states rank as least recently seen and never evict live
+        ones; users this process has already observed keep their state.
+        States persisted on top of another base_version are skipped.
+
+        Args:
+            saved_states: Serialized states (as handed to `persist`), most
+                recently updated first; stops once max_users are held
+
+        Returns:
+            Number of states restored
+        """
+        count = 0
+        for saved in saved_states:
+            state = OnlineProfile.from_dict(saved)
+            user_id = state.user_id
+            with self._lock:
+                if len(self.states) >= self.max_users:
+                    break
+                if saved.get('base_version') != self.base_version:
+                    continue
+                if user_id in self.states or user_id in self._evicted:
+                    continue
+                self.states[user_id] = state
+                self.states.move_to_end(user_id, last=False)
+                self._profiles[user_id] = state.to_profile()
+                count += 1
+        return count
+
+    def observe(self, login_event: Dict):
+        """
+        Update the user's profile from an analyzed login event
+
+        Args:
+            login_event: Raw login event (user_id, timestamp, location,
+                device_info)
+        """
+        user_id = login_event['user_id']
+        timestamp = pd.to_datetime(login_event['timestamp'])
+        location = login_event['location']
+        device_info = login_event['device_info']
+        device = f"{device_info['browser']}/{device_info['os']}"
+
+        with self._lock:
+            state = self.states.get(user_id)
+            if state is None:
+                state = self._new_state(user_id)
+            state.update(timestamp, location['latitude'], location['longitude'], device)
+            self._add(user_id, state)
+            if self.persist is not None:
+                self._dirty.add(user_id)
+            dirty_count = len(self._dirty) + len(self._evicted)
+
+        if self.persist is not None:
+            self._ensure_flusher()
+            if dirty_count >= self.flush_batch_size:
+                self._wakeup.set()
+
+    def _ensure_flusher(self):
+        if self._flusher is None:
+            with self._lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(
+                        target=self._flush_loop, name='profile-flusher', daemon=True
+                    )
+                    self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Persist all dirty profiles now
+
+        Returns:
+            Number of profiles handed to `persist`
+        """
+        if self.persist is None:
+            return 0
+
+        with self._lock:
+            pending = {user_id: self._snapshot(self.states[user_id]) for user_id in self._dirty}
+            pending.update(self._evicted)
+            self._dirty = set()
+            self._evicted = {}
+
+        if not pending:
+            return 0
+
+        try:
+            self.persist(list(pending.values()))
+        except Exception as e:
+            print(f"Warning: could not persist {len(pending)} online profiles: {e}")
+            with self._lock:
+                for user_id, saved in pending.items():
+                    if saved['base_version'] != self.base_version:
+                        continue  # rebased meanwhile
+                    if user_id in self.states:
+                        self._dirty.add(user_id)
+                    else:
+                        self._evicted.setdefault(user_id, saved)
+            return 0
+        return len(pending)
+
+    def rebase(self, base: Mapping, base_version: Optional[str] = None):
+        """
+        Serve new base profiles (e.g. after a retrain) and drop the online
+        states learned on top of the old ones, pending writes included
+
+        Args:
+            base: Batch-built profiles of the new model
+            base_version: Model version of the new profiles
+        """
+        with self._lock:
+            self.base = base
+            self.base_version = base_version
+            self.states = OrderedDict()
+            self._profiles = {}
+            self._dirty = set()
+            self._evicted = {}
+
+    def close(self):
+        """Stop the flusher thread after a final flush"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval + 1)
+        self.flush()
+
+    @property
+    def dirty_count(self) -> int:
+        return len(self._dirty) + len(self._evicted)
+
+    def locate(self, user_id):
+        """The user's online profile if observed, else wherever the base serves it (see locate_profile)"""
+        profile = self._profiles.get(user_id)
+        if profile is not None:
+            return None, profile
+        return locate_profile(self.base, user_id)
+
+    def __getitem__(self, user_id) -> Dict:
+        profile = self._profiles.get(user_id)
+        if profile is not None:
+            return profile
+        return self.base[user_id]
+
+    def __contains__(self, user_id) -> bool:
+        return user_id in self._profiles or user_id in self.base
+
+    def __iter__(self):
+        yield from list(self._profiles)
+        for user_id in self.base:
+            if user_id not in self._profiles:
+                yield user_id
+
+    def __len__(self) -> int:
+        return len(self.base) + sum(1 for user_id in list(self._profiles) if user_id not in self.base)
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import shutil
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.ml.model_bundle import ModelBundle, write_bundle
+
+
+def frame_to_sections(df: pd.DataFrame) -> Tuple[Dict[str, np.ndarray], List[Dict]]:
+    """
+    Split a DataFrame into one array per column
+
+    Columns of dicts (location, device_info) are split into one array per
+    key, and object columns of strings become fixed-width unicode arrays,
+    so every section is plain binary (no pickles). Datetime columns are
+    stored as their int64 representation.
+
+    Returns:
+        Tuple of (sections named 'columns/<name>' or 'columns/<name>.<key>',
+        column layout for sections_to_frame)
+    """
+    sections = {}
+    layout = []
+    for name in df.columns:
+        values = df[name]
+        if values.dtype == object and len(values) and isinstance(values.iloc[0], dict):
+            keys = list(values.iloc[0])
+            for key in keys:
+                sections[f'columns/{name}.{key}'] = _to_array(pd.Series([item[key] for item in values]))
+            layout.append({'name': name, 'keys': keys})
+        elif values.dtype.kind == 'M':
+            array = values.to_numpy()
+            sections[f'columns/{name}'] = array.view(np.int64)
+            layout.append({'name': name, 'keys': None, 'dtype': str(array.dtype)})
+        else:
+            sections[f'columns/{name}'] = _to_array(values)
+            layout.append({'name': name, 'keys': None})
+    return sections, layout
+
+
+def _to_array(values: pd.Series) -> np.ndarray:
+    if values.dtype == object:
+        return np.asarray(values.tolist(), dtype=str if isinstance(values.iloc[0], str) else None)
+    return values.to_numpy()
+
+
+def sections_to_frame(bundle: ModelBundle, layout: List[Dict]) -> pd.DataFrame:
+    """Rebuild the DataFrame written by frame_to_sections (copies out of the mapping)"""
+    data = {}
+    for column in layout:
+        name = column['name']
+        if column['keys'] is None:
+            array = bundle.array(f'columns/{name}')
+            if 'dtype' in column:
+                data[name] = np.array(array).view(column['dtype'])
+            else:
+                data[name] = array.astype(object) if array.dtype.kind == 'U' else np.array(array)
+        else:
+            keys = column['keys']
+            parts = [bundle.array(f'columns/{name}.{key}').tolist() for key in keys]
+            data[name] = [dict(zip(keys, values)) for values in zip(*parts)]
+    return pd.DataFrame(data, columns=[column['name'] for column in layout])
+
+
+class StageCache:
+    """
+    Content-addressed store for pipeline stage artifacts
+
+    A stage's key is a hash of its name, parameters and the fingerprints of
+    its inputs (the checksums of upstream artifacts), so a rerun finds the
+    artifacts of every stage whose inputs did not change and recomputes
+    from the first one that did. Artifacts are model bundle files (aligned,
+    checksummed binary sections plus a JSON manifest). The least recently
+    used artifacts are evicted once the cache exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 2 * 1024 ** 3, force: bool = False):
+        """
+        Args:
+            cache_dir: Directory holding the artifacts
+            max_bytes: Size budget for all artifacts
+            force: Ignore existing artifacts (they are recomputed and replaced)
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.force = force
+        # Artifacts used by this run are never evicted by it
+        self._in_use = set()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(stage: str, params: Dict, inputs: Optional[List[str]] = None) -> str:
+        payload = json.dumps({'stage': stage, 'params': params, 'inputs': inputs or []},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def path(self, stage: str, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{stage}-{key}.bundle')
+
+    def load(self, stage: str, key: str) -> Optional[ModelBundle]:
+        """The stage's artifact for this key, or None on a miss (or with force)"""
+        path = self.path(stage, key)
+        if self.force or not os.path.isfile(path):
+            return None
+        try:
+            bundle = ModelBundle(path)
+        except ValueError as e:
+            print(f"Warning: ignoring unreadable cache artifact {path}: {e}")
+            return None
+        os.utime(path)  # recently used
+        self._in_use.add(path)
+        return bundle
+
+    def store(self, stage: str, key: str, sections: Dict[str, np.ndarray], manifest: Dict) -> ModelBundle:
+        """Write an artifact and return it opened"""
+        path = self.path(stage, key)
+        write_bundle(path, sections, dict(manifest, stage=stage, key=key))
+        self._in_use.add(path)
+        self.evict()
+        return ModelBundle(path)
+
+    def store_file(self, stage: str, key: str, source: str) -> str:
+        """Copy an existing bundle file (e.g. a saved model) in as the artifact"""
+        path = self.path(stage, key)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, path)
+        self._in_use.add(path)
+        self.evict()
+        return path
+
+    def size(self) -> int:
+        return sum(os.path.getsize(path) for path in self._artifacts())
+
+    def _artifacts(self) -> List[str]:
+        return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                if name.endswith('.bundle')]
+
+    def evict(self) -> List[str]:
+        """Delete least recently used artifacts until the cache fits max_bytes"""
+        artifacts = sorted(self._artifacts(), key=os.path.getmtime)
+        total = sum(os.path.getsize(path) for path in artifacts)
+        evicted = []
+        for path in artifacts:
+            if total <= self.max_bytes:
+                break
+            if path in self._in_use:
+                continue
+            total -= os.path.getsize(path)
+            os.remove(path)
+            evicted.append(path)
+        if evicted:
+            print(f"Evicted {len(evicted)} cached artifacts ({total / (1024 * 1024):.1f} MB left)")
+        return evicted
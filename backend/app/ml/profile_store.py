@@ -0,0 +1,263 @@
+import json
+import os
+import shutil
+from collections.abc import Mapping
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+_ARRAYS = ('user_ids', 'latitude', 'longitude', 'avg_logins_per_day', 'hours', 'days', 'devices')
+
+
+class ProfileStore(Mapping):
+    """
+    Compact, read-only store of user behavioral profiles
+
+    Profiles are held in fixed-width arrays instead of a dict of dicts:
+    float32 typical latitude/longitude, bitsets for typical hours (24 bits),
+    typical weekdays (7 bits) and known devices (over a global device
+    vocabulary), and a sorted user-id index searched in O(log n).
+
+    The store is saved as a directory of .npy files that workers open with
+    np.load(mmap_mode='r'), so every process shares the same pages through
+    the OS page cache instead of unpickling a private copy.
+
+    It also behaves as a read-only Mapping of user_id -> profile dict, so it
+    can be dropped in for LoginFeatureEngineer.user_profiles. Profile dicts
+    are rebuilt on access; their devices come back in vocabulary order.
+    """
+
+    def __init__(self, user_ids: np.ndarray, latitude: np.ndarray, longitude: np.ndarray,
+                 avg_logins_per_day: np.ndarray, hours: np.ndarray, days: np.ndarray,
+                 devices: np.ndarray, device_vocab: List[str]):
+        self.user_ids = user_ids
+        self.latitude = latitude
+        self.longitude = longitude
+        self.avg_logins_per_day = avg_logins_per_day
+        self.hours = hours
+        self.days = days
+        self.devices = devices
+        self.device_vocab = list(device_vocab)
+        self.device_codes = {device: code for code, device in enumerate(self.device_vocab)}
+        # (n, 2) float64 typical latitude/longitude in radians, built on first use
+        self._location_rad = None
+
+    @classmethod
+    def from_profiles(cls, profiles: Dict) -> 'ProfileStore':
+        """Build a store from a user_id -> profile dict"""
+        user_ids = sorted(profiles.keys(), key=lambda user_id: str(user_id).encode('utf-8'))
+        n = len(user_ids)
+
+        device_vocab = sorted({
+            device for profile in profiles.values() for device in profile.get('devices', [])
+        })
+        device_codes = {device: code for code, device in enumerate(device_vocab)}
+        n_words = max(1, (len(device_vocab) + 63) // 64)
+
+        latitude = np.full(n, np.nan, dtype=np.float32)
+        longitude = np.full(n, np.nan, dtype=np.float32)
+        avg_logins_per_day = np.zeros(n, dtype=np.float32)
+        hours = np.zeros(n, dtype=np.uint32)
+        days = np.zeros(n, dtype=np.uint8)
+        devices = np.zeros((n, n_words), dtype=np.uint64)
+
+        for pos, user_id in enumerate(user_ids):
+            profile = profiles[user_id]
+            typical_loc = profile.get('typical_location')
+            if typical_loc:
+                latitude[pos] = typical_loc['latitude']
+                longitude[pos] = typical_loc['longitude']
+            avg_logins_per_day[pos] = profile.get('avg_logins_per_day', 0)
+            for hour in profile.get('typical_hours', []):
+                hours[pos] |= np.uint32(1 << int(hour))
+            for day in profile.get('typical_days', []):
+                days[pos] |= np.uint8(1 << int(day))
+            for device in profile.get('devices', []):
+                code = device_codes[device]
+                devices[pos, code // 64] |= np.uint64(1 << (code % 64))
+
+        encoded_ids = np.array([str(user_id).encode('utf-8') for user_id in user_ids], dtype=bytes)
+        if n == 0:
+            encoded_ids = np.array([], dtype='S1')
+
+        return cls(encoded_ids, latitude, longitude, avg_logins_per_day,
+                   hours, days, devices, device_vocab)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Backing arrays by name (device_vocab is kept separately)"""
+        return {name: getattr(self, name) for name in _ARRAYS}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], device_vocab: List[str]) -> 'ProfileStore':
+        """Store over existing arrays, e.g. views into a model bundle"""
+        return cls(device_vocab=device_vocab, **{name: arrays[name] for name in _ARRAYS})
+
+    def save(self, path: str):
+        """
+        Save the store as a directory of .npy files
+
+        The directory is written next to the target and renamed into place,
+        so readers never see a partially written store.
+        """
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        for name in _ARRAYS:
+            np.save(os.path.join(tmp_path, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(tmp_path, 'device_vocab.json'), 'w') as f:
+            json.dump(self.device_vocab, f)
+
+        old_path = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'ProfileStore':
+        """
+        Load a store saved with save()
+
+        Args:
+            path: Store directory
+            mmap: Memory-map the arrays read-only instead of reading them
+        """
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"Profile store not found: {path}")
+
+        mmap_mode = 'r' if mmap else None
+        arrays = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in _ARRAYS
+        }
+        with open(os.path.join(path, 'device_vocab.json')) as f:
+            device_vocab = json.load(f)
+
+        return cls(device_vocab=device_vocab, **arrays)
+
+    def index_of(self, user_id: str) -> int:
+        """Position of a user in the store, or -1 if unknown (O(log n))"""
+        key = str(user_id).encode('utf-8')
+        pos = int(self.user_ids.searchsorted(key))
+        if pos < len(self.user_ids) and self.user_ids[pos] == key:
+            return pos
+        return -1
+
+    def lookup(self, user_ids) -> np.ndarray:
+        """Vectorized index_of: positions of many users, -1 where unknown"""
+        keys = np.array([str(user_id).encode('utf-8') for user_id in user_ids], dtype=bytes)
+        if len(keys) == 0 or len(self.user_ids) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+
+        pos = np.searchsorted(self.user_ids, keys)
+        clipped = np.minimum(pos, len(self.user_ids) - 1)
+        found = self.user_ids[clipped] == keys
+        return np.where(found, clipped, -1).astype(np.int64)
+
+    def has_devices(self, positions: np.ndarray, devices) -> np.ndarray:
+        """
+        Vectorized device membership test
+
+        Args:
+            positions: Store positions (must be >= 0)
+            devices: Device strings ("browser/os"), one per position
+
+        Returns:
+            Boolean array, True where the device is in the user's profile
+        """
+        codes = np.array([self.device_codes.get(device, -1) for device in devices], dtype=np.int64)
+        known = codes >= 0
+        result = np.zeros(len(codes), dtype=bool)
+        if known.any():
+            words = self.devices[positions[known], codes[known] // 64]
+            bits = (codes[known] % 64).astype(np.uint64)
+            result[known] = ((words >> bits) & np.uint64(1)).astype(bool)
+        return result
+
+    def has_device(self, pos: int, device: str) -> bool:
+        """Scalar has_devices for one store position"""
+        code = self.device_codes.get(device)
+        if code is None:
+            return False
+        return bool(int(self.devices[pos, code // 64]) >> (code % 64) & 1)
+
+    def typical_locations(self, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Typical latitude/longitude (float64) for store positions"""
+        return (self.latitude[positions].astype(np.float64),
+                self.longitude[positions].astype(np.float64))
+
+    def typical_location_rad(self, pos: int) -> Optional[Tuple[float, float]]:
+        """Typical latitude/longitude of a store position in radians, None if it has none"""
+        location_rad = self._location_rad
+        if location_rad is None:
+            location_rad = np.radians(np.column_stack([self.latitude, self.longitude]).astype(np.float64))
+            self._location_rad = location_rad
+        lat, lon = location_rad[pos].tolist()
+        if lat != lat:
+            return None
+        return lat, lon
+
+    def _profile_at(self, pos: int) -> Dict:
+        lat = float(self.latitude[pos])
+        lon = float(self.longitude[pos])
+        hours = int(self.hours[pos])
+        days = int(self.days[pos])
+        words = self.devices[pos]
+
+        return {
+            'user_id': self.user_ids[pos].decode('utf-8'),
+            'typical_hours': [h for h in range(24) if hours >> h & 1],
+            'typical_location': None if np.isnan(lat) else {'latitude': lat, 'longitude': lon},
+            'devices': [
+                device for code, device in enumerate(self.device_vocab)
+                if int(words[code // 64]) >> (code % 64) & 1
+            ],
+            'avg_logins_per_day': float(self.avg_logins_per_day[pos]),
+            'typical_days': [d for d in range(7) if days >> d & 1]
+        }
+
+    def __getitem__(self, user_id) -> Dict:
+        pos = self.index_of(user_id)
+        if pos < 0:
+            raise KeyError(user_id)
+        return self._profile_at(pos)
+
+    def __contains__(self, user_id) -> bool:
+        return self.index_of(user_id) >= 0
+
+    def __iter__(self):
+        for key in self.user_ids:
+            yield key.decode('utf-8')
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def locate(self, user_id) -> Tuple['ProfileStore', int]:
+        """This store and the user's position in it (see locate_profile)"""
+        return self, self.index_of(user_id)
+
+    @property
+    def nbytes(self) -> int:
+        """Total size of the backing arrays in bytes"""
+        return sum(getattr(self, name).nbytes for name in _ARRAYS)
+
+
+def locate_profile(profiles: Mapping, user_id) -> Tuple[Optional[ProfileStore], object]:
+    """
+    Find a user's profile without rebuilding it from a store
+
+    Args:
+        profiles: user_id -> profile Mapping. Mappings backed by a store
+            (ProfileStore, OnlineProfileUpdater) answer through locate().
+
+    Returns:
+        (store, position) when the profile is served by a ProfileStore
+        (position -1 if the user is unknown), otherwise (None, profile dict
+        or None)
+    """
+    locate = getattr(profiles, 'locate', None)
+    if locate is not None:
+        return locate(user_id)
+    return None, profiles.get(user_id)
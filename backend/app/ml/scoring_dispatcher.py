@@ -0,0 +1,138 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+class MicroBatchScorer:
+    """
+    Scores single feature rows from many threads in shared batches
+
+    A request thread submits its row and gets a Future. One scorer thread
+    waits for the first row, keeps collecting until max_batch rows are
+    waiting or max_wait_ms has passed since that first row arrived, then
+    scores everything with one predict_batch call per (detector, explain)
+    pair and resolves the futures with what predict_row would have returned.
+    Rows submitted against different detectors (e.g. across a model swap)
+    are never scored together.
+
+    Under light load a request waits up to max_wait_ms for company; under
+    heavy load batches fill before the deadline and the per-call overhead
+    of predict_batch is shared by up to max_batch requests. Rows also pile
+    up while a batch is being scored, so a short wait is enough: a blocked
+    request thread cannot submit a second row, and waiting much longer than
+    one scoring pass only adds latency.
+    """
+
+    def __init__(self, max_batch: int = 64, max_wait_ms: float = 0.5):
+        """
+        Args:
+            max_batch: Rows scored together at most
+            max_wait_ms: How long the first row of a batch waits for others
+        """
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending = []
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._scorer = None
+        self.counters = {'rows': 0, 'batches': 0, 'full_batches': 0}
+
+    def submit(self, detector, row: np.ndarray, explain: bool = False) -> Future:
+        """
+        Queue a row of shape (1, n_features) for scoring
+
+        The row is copied, so the caller may reuse its buffer right away.
+
+        Returns:
+            Future resolving to (is_anomaly, risk_score, reasons)
+        """
+        future = Future()
+        item = (detector, explain, np.array(row, dtype=np.float64).reshape(-1), future, time.monotonic())
+        self._ensure_scorer()
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Scorer is closed")
+            self._pending.append(item)
+            # Wake the scorer for a new batch, or early when this one is full
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify()
+        return future
+
+    def score(self, detector, row: np.ndarray, explain: bool = False) -> Tuple[bool, float, List[str]]:
+        """Blocking submit: (is_anomaly, risk_score, reasons) like detector.predict_row"""
+        return self.submit(detector, row, explain).result()
+
+    def _ensure_scorer(self):
+        if self._scorer is None:
+            with self._cond:
+                if self._scorer is None:
+                    self._scorer = threading.Thread(target=self._score_loop, name='micro-batch-scorer', daemon=True)
+                    self._scorer.start()
+
+    def _next_batch(self) -> List:
+        """Wait for a batch to fill or time out; empty once closed and drained"""
+        with self._cond:
+            while not self._pending and not self._stopped:
+                self._cond.wait()
+            if self._pending:
+                deadline = self._pending[0][4] + self.max_wait
+                while len(self._pending) < self.max_batch and not self._stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _score_loop(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            self._score(batch)
+
+    def _score(self, batch: List):
+        groups = {}
+        for item in batch:
+            groups.setdefault((id(item[0]), item[1]), []).append(item)
+
+        for items in groups.values():
+            detector, explain = items[0][0], items[0][1]
+            futures = [item[3] for item in items]
+            try:
+                results = detector.predict_batch(np.stack([item[2] for item in items]), explain)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for i, future in enumerate(futures):
+                future.set_result((bool(results['is_anomaly'][i]), float(results['risk_score'][i]),
+                                   results['reasons'][i]))
+
+        with self._cond:
+            self.counters['rows'] += len(batch)
+            self.counters['batches'] += 1
+            self.counters['full_batches'] += len(batch) == self.max_batch
+
+    def metrics(self) -> Dict:
+        """Rows and batches scored, mean batch size and rows waiting"""
+        with self._cond:
+            counters = dict(self.counters)
+            waiting = len(self._pending)
+        batches = counters['batches']
+        mean_batch = round(counters['rows'] / batches, 2) if batches else None
+        return dict(counters, backend='micro_batch', waiting=waiting, mean_batch=mean_batch)
+
+    def close(self):
+        """Score what is queued, then stop the scorer thread"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._scorer is not None:
+            self._scorer.join()
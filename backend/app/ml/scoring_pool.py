@@ -0,0 +1,533 @@
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.ml.model_bundle import read_manifest
+
+# Bytes of reasons returned per row ('\n'-joined UTF-8, cut at a reason boundary)
+REASON_BYTES = 2048
+
+
+def _slot_dtype(width: int) -> np.dtype:
+    """One ring slot: the feature row and the model generation it was extracted for in, the verdict out"""
+    return np.dtype([
+        ('row', np.float64, (width,)),
+        ('generation', np.uint32),
+        ('explain', np.uint8),
+        ('is_anomaly', np.uint8),
+        ('risk_score', np.float64),
+        ('reasons', f'S{REASON_BYTES}'),
+    ])
+
+
+def _encode_reasons(reasons: List[str]) -> bytes:
+    encoded = b''
+    for reason in reasons:
+        part = reason.encode('utf-8') if not encoded else b'\n' + reason.encode('utf-8')
+        if len(encoded) + len(part) > REASON_BYTES:
+            break
+        encoded += part
+    return encoded
+
+
+def _decode_reasons(encoded: bytes) -> List[str]:
+    return encoded.decode('utf-8').split('\n') if encoded else []
+
+
+def _load_detector(bundle_file: str, detector_options: Dict):
+    """Detector for a bundle, warmed with one scored row; (detector, version, error)"""
+    from app.ml.anomaly_detector import LoginAnomalyDetector
+
+    try:
+        detector = LoginAnomalyDetector(**detector_options)
+        detector.load_bundle(bundle_file)
+        detector.predict_batch(np.zeros((1, len(detector.feature_columns))), detector.engine is not None)
+        return detector, detector.model_version, None
+    except Exception as e:
+        return None, None, str(e)
+
+
+def _score_slots(detector, generation: int, ring: np.ndarray, slots: List[int], conn):
+    """
+    Score the rows in `slots` with one predict_batch per explain flag and write the verdicts back
+
+    Rows extracted for another model generation than the loaded one (queued
+    before a reload) are handed back as stale instead of being scored with
+    a model whose feature columns may differ.
+    """
+    slots = np.asarray(slots)
+    current = ring['generation'][slots] == generation
+    if not current.all():
+        conn.send(('stale', slots[~current].tolist()))
+        slots = slots[current]
+        if not len(slots):
+            return
+    if detector is None:
+        conn.send(('failed', slots.tolist(), "No model loaded in scoring worker"))
+        return
+
+    width = len(detector.feature_columns)
+    explain_flags = ring['explain'][slots].astype(bool)
+    for explain in (False, True):
+        group = slots[explain_flags == explain]
+        if not len(group):
+            continue
+        try:
+            results = detector.predict_batch(ring['row'][group, :width], explain)
+        except Exception as e:
+            conn.send(('failed', group.tolist(), str(e)))
+            continue
+        ring['is_anomaly'][group] = results['is_anomaly']
+        ring['risk_score'][group] = results['risk_score']
+        for slot, reasons in zip(group, results['reasons']):
+            ring['reasons'][slot] = _encode_reasons(reasons)
+        conn.send(('done', group.tolist()))
+
+
+def _worker_main(ring_name: str, slots: int, width: int, conn, bundle_file: Optional[str], generation: int,
+                 detector_options: Dict):
+    """
+    Scoring worker process
+
+    Attaches to its ring, loads the model once (the bundle is memory-mapped,
+    so every worker shares its pages), then scores slots as their indices
+    arrive. Indices already waiting in the pipe are scored together.
+    """
+    shm = shared_memory.SharedMemory(name=ring_name)
+    ring = np.ndarray((slots,), dtype=_slot_dtype(width), buffer=shm.buf)
+    detector = None
+    if bundle_file is not None:
+        detector, version, error = _load_detector(bundle_file, detector_options)
+        conn.send(('loaded', version, error))
+    else:
+        conn.send(('loaded', None, None))
+
+    backlog = deque()
+    try:
+        while True:
+            message = backlog.popleft() if backlog else conn.recv()
+            if message is None:
+                break
+            if message[0] == 'load':
+                detector, version, error = _load_detector(message[1], detector_options)
+                generation = message[2]
+                conn.send(('loaded', version, error))
+                continue
+
+            batch = [message[1]]
+            while conn.poll():
+                message = conn.recv()
+                if message is None or message[0] != 'score':
+                    backlog.append(message)
+                    break
+                batch.append(message[1])
+            _score_slots(detector, generation, ring, batch, conn)
+    except (EOFError, OSError, KeyboardInterrupt):
+        pass
+    finally:
+        del ring
+        shm.close()
+
+
+class _InFlight:
+    __slots__ = ('future', 'detector', 'explain', 'attempts', 'submitted_at')
+
+    def __init__(self, future: Future, detector, explain: bool):
+        self.future = future
+        self.detector = detector
+        self.explain = explain
+        self.attempts = 1
+        self.submitted_at = time.monotonic()
+
+
+class _Worker:
+    """Parent-side state of one worker process: its ring, pipe and in-flight slots"""
+
+    def __init__(self, index: int, slots: int, width: int):
+        self.index = index
+        self.slots = slots
+        self.shm = shared_memory.SharedMemory(create=True, size=_slot_dtype(width).itemsize * slots)
+        self.ring = np.ndarray((slots,), dtype=_slot_dtype(width), buffer=self.shm.buf)
+        self.process = None
+        self.conn = None
+        self.inflight = {}
+        self.lock = threading.Lock()  # guards conn sends and inflight
+        self.loaded = queue.Queue()
+        self.supervisor = None
+
+
+class ProcessScoringBackend:
+    """
+    Scores feature rows in a pool of preforked worker processes
+
+    Scoring (forest traversal, attribution and reasons) is pure Python and
+    NumPy work under the GIL, so threads of one Flask worker cannot score in
+    parallel. This backend hands rows to worker processes instead: each
+    worker owns a ring of fixed-size slots in shared memory; a request
+    claims a free slot, writes its feature row into it and sends the slot
+    index down the worker's pipe, and the worker writes the verdict back
+    into the same slot. Only slot indices are pickled. Every worker loads
+    the model once from the memory-mapped bundle file the parent serves.
+
+    Feature extraction stays in the request thread, because login history,
+    failure counters and online profiles are per-process state that must
+    see every login in order.
+
+    A supervisor thread per worker reads its replies and restarts the worker
+    when it dies or holds a slot longer than `timeout`; its in-flight slots
+    are retried once on the replacement. Rows for a detector the pool has
+    not loaded (a legacy pickle, or a version no longer on disk, e.g. after
+    a rollback) are scored in the calling thread.
+
+    Each load bumps a model generation that slots are tagged with, so rows
+    still queued when the workers switch models are handed back and scored
+    in the supervisor thread with the detector they were extracted for.
+    """
+
+    def __init__(self, processes: int = 2, slots: int = 64, max_features: int = 64,
+                 timeout: float = 5.0, start_method: str = 'spawn', detector_options: Optional[Dict] = None):
+        """
+        Args:
+            processes: Worker processes
+            slots: Ring slots per worker (rows in flight per worker)
+            max_features: Widest feature row a slot holds
+            timeout: Seconds a request waits for a slot or a verdict, and a
+                worker may hold a slot before it is restarted
+            start_method: multiprocessing start method for the workers
+            detector_options: Extra LoginAnomalyDetector arguments for the
+                workers' detectors (e.g. unusual_risk)
+        """
+        self.processes = processes
+        self.slots = slots
+        self.max_features = max_features
+        self.timeout = timeout
+        self.detector_options = dict(detector_options or {})
+        self._context = multiprocessing.get_context(start_method)
+        self._workers = []
+        self._free = queue.Queue()
+        self._start_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._stopped = threading.Event()
+        # (version served by every worker or None, model generation), replaced as a whole
+        self._loaded = (None, 0)
+        self.bundle_file = None
+        self._unavailable = set()
+        self._counters_lock = threading.Lock()
+        self.counters = {'scored': 0, 'failed': 0, 'in_thread': 0, 'stale': 0, 'restarts': 0, 'retried': 0}
+
+    @property
+    def version(self) -> Optional[str]:
+        """Model version every worker serves, None if they disagree or have none"""
+        return self._loaded[0]
+
+    def _count(self, name: str, n: int = 1):
+        with self._counters_lock:
+            self.counters[name] += n
+
+    def start(self, detector=None):
+        """Start the workers, loading the detector's bundle if it has one"""
+        with self._start_lock:
+            if self._workers:
+                return
+            if detector is not None and detector.bundle is not None:
+                self._check_width(detector)
+                self.bundle_file = detector.bundle.path
+            workers = [_Worker(i, self.slots, self.max_features) for i in range(self.processes)]
+            versions = set()
+            for worker in workers:
+                version, error = self._spawn(worker)
+                if error:
+                    print(f"Warning: scoring worker {worker.index} could not load the model: {error}")
+                versions.add(version)
+            self._loaded = (versions.pop() if len(versions) == 1 else None, self._loaded[1])
+            # Interleave slots so concurrent requests spread over the workers
+            for slot in range(self.slots):
+                for worker in workers:
+                    self._free.put((worker, slot))
+            for worker in workers:
+                worker.supervisor = threading.Thread(target=self._supervise, args=(worker,),
+                                                     name=f'scoring-supervisor-{worker.index}', daemon=True)
+                worker.supervisor.start()
+            self._workers = workers
+
+    def _check_width(self, detector):
+        if len(detector.feature_columns) > self.max_features:
+            raise ValueError(f"Model has {len(detector.feature_columns)} features, "
+                             f"scoring slots hold {self.max_features}")
+
+    def _spawn(self, worker: _Worker) -> Tuple[Optional[str], Optional[str]]:
+        """Start a process for the worker's ring and wait for its model; (version, error)"""
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main, name=f'scoring-worker-{worker.index}', daemon=True,
+            args=(worker.shm.name, self.slots, self.max_features, child_conn, self.bundle_file, self._loaded[1],
+                  self.detector_options)
+        )
+        process.start()
+        child_conn.close()
+        try:
+            if not parent_conn.poll(max(self.timeout, 60.0)):
+                raise EOFError("timed out")
+            _, version, error = parent_conn.recv()
+        except (EOFError, OSError) as e:
+            process.kill()
+            process.join()
+            raise RuntimeError(f"Scoring worker {worker.index} failed to start: {e}")
+        worker.process = process
+        worker.conn = parent_conn
+        return version, error
+
+    def load(self, detector) -> bool:
+        """
+        Load the detector's bundle into every worker
+
+        A detector whose version is no longer the one in its bundle file
+        (the file was replaced by a newer version) is never reloaded; it is
+        scored in-thread from then on.
+
+        Returns:
+            True if the pool now serves the detector's version
+        """
+        version = detector.model_version
+        if version is not None and version == self.version:
+            return True
+        if detector.bundle is None or version in self._unavailable:
+            return False
+        self._check_width(detector)
+
+        with self._load_lock:
+            if version == self.version:
+                return True
+            if version in self._unavailable:
+                return False
+            bundle_file = detector.bundle.path
+            try:
+                manifest = read_manifest(bundle_file)
+            except (OSError, ValueError):
+                manifest = None
+            if manifest is None or manifest.get('version') != version:
+                print(f"Warning: model version {version} is not on disk, scoring it in-thread")
+                self._unavailable.add(version)
+                return False
+
+            if not self._workers:
+                self.start(detector)
+            else:
+                generation = self._loaded[1] + 1
+                for worker in self._workers:
+                    with worker.lock:
+                        worker.conn.send(('load', bundle_file, generation))
+                replies = []
+                for worker in self._workers:
+                    try:
+                        replies.append(worker.loaded.get(timeout=max(self.timeout, 60.0)))
+                    except queue.Empty:
+                        replies.append((None, f"worker {worker.index} did not answer"))
+                self.bundle_file = bundle_file
+                versions = {loaded for loaded, _ in replies}
+                self._loaded = (versions.pop() if len(versions) == 1 else None, generation)
+                for loaded, error in replies:
+                    if error:
+                        print(f"Warning: scoring worker could not load {bundle_file}: {error}")
+
+            if self.version != version:
+                # The bundle changed on disk while it was being loaded
+                print(f"Warning: model version {version} is not on disk, scoring it in-thread")
+                self._unavailable.add(version)
+            return self.version == version
+
+    def submit(self, detector, row: np.ndarray, explain: bool = False) -> Future:
+        """
+        Queue a row of shape (1, n_features) for scoring in a worker
+
+        Returns:
+            Future resolving to (is_anomaly, risk_score, reasons)
+        """
+        if self._stopped.is_set():
+            raise RuntimeError("Scoring pool is closed")
+        if not self._workers:
+            self.start(detector)
+        generation = self._generation_for(detector)
+        if generation is None:
+            return self._score_in_thread(detector, row, explain)
+
+        try:
+            worker, slot = self._free.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError("No free scoring slot")
+        row = np.asarray(row, dtype=np.float64).reshape(-1)
+        worker.ring['row'][slot, :len(row)] = row
+        worker.ring['generation'][slot] = generation
+        worker.ring['explain'][slot] = explain
+
+        future = Future()
+        with worker.lock:
+            worker.inflight[slot] = _InFlight(future, detector, explain)
+            try:
+                worker.conn.send(('score', slot))
+            except (OSError, ValueError):
+                pass  # The worker died; its supervisor retries the slot
+        return future
+
+    def score(self, detector, row: np.ndarray, explain: bool = False) -> Tuple[bool, float, List[str]]:
+        """Blocking submit: (is_anomaly, risk_score, reasons) like detector.predict_row"""
+        return self.submit(detector, row, explain).result(timeout=self.timeout)
+
+    def _generation_for(self, detector) -> Optional[int]:
+        """Model generation the workers serve the detector's version under, None if they do not"""
+        version = detector.model_version
+        if version is None:
+            return None
+        loaded = self._loaded
+        if loaded[0] != version:
+            if not self.load(detector):
+                return None
+            loaded = self._loaded
+        return loaded[1] if loaded[0] == version else None
+
+    def _score_in_thread(self, detector, row, explain, counter: str = 'in_thread') -> Future:
+        future = Future()
+        try:
+            future.set_result(detector.predict_row(row, explain))
+        except Exception as e:
+            future.set_exception(e)
+        self._count(counter)
+        return future
+
+    def _supervise(self, worker: _Worker):
+        """Resolve the worker's verdicts; restart it when it dies or hangs"""
+        while not self._stopped.is_set():
+            try:
+                if not worker.conn.poll(min(self.timeout / 2, 0.5)):
+                    self._check_hung(worker)
+                    continue
+                message = worker.conn.recv()
+            except (EOFError, OSError):
+                if self._stopped.is_set():
+                    break
+                self._restart(worker)
+                continue
+
+            kind = message[0]
+            if kind == 'done':
+                self._resolve(worker, message[1])
+            elif kind == 'failed':
+                self._resolve(worker, message[1], error=message[2])
+            elif kind == 'stale':
+                self._score_stale(worker, message[1])
+            elif kind == 'loaded':
+                worker.loaded.put((message[1], message[2]))
+
+    def _resolve(self, worker: _Worker, slots: List[int], error: Optional[str] = None):
+        with worker.lock:
+            entries = [(slot, worker.inflight.pop(slot, None)) for slot in slots]
+        for slot, entry in entries:
+            if entry is None:
+                continue
+            if error is not None:
+                result = RuntimeError(error)
+            else:
+                result = (bool(worker.ring['is_anomaly'][slot]), float(worker.ring['risk_score'][slot]),
+                          _decode_reasons(worker.ring['reasons'][slot]))
+            self._free.put((worker, slot))
+            if error is not None:
+                self._count('failed')
+                entry.future.set_exception(result)
+            else:
+                self._count('scored')
+                entry.future.set_result(result)
+
+    def _score_stale(self, worker: _Worker, slots: List[int]):
+        """Score rows the worker's model has moved past with the detector they were submitted for"""
+        with worker.lock:
+            entries = [(slot, worker.inflight.pop(slot, None)) for slot in slots]
+        for slot, entry in entries:
+            if entry is None:
+                continue
+            row = worker.ring['row'][slot, :len(entry.detector.feature_columns)].reshape(1, -1).copy()
+            self._free.put((worker, slot))
+            future = self._score_in_thread(entry.detector, row, entry.explain, counter='stale')
+            if future.exception() is not None:
+                entry.future.set_exception(future.exception())
+            else:
+                entry.future.set_result(future.result())
+
+    def _check_hung(self, worker: _Worker):
+        with worker.lock:
+            oldest = min((entry.submitted_at for entry in worker.inflight.values()), default=None)
+        if oldest is not None and time.monotonic() - oldest > self.timeout:
+            print(f"Warning: scoring worker {worker.index} held a slot for over {self.timeout}s, killing it")
+            worker.process.kill()
+
+    def _restart(self, worker: _Worker):
+        """Replace a dead worker and retry its in-flight slots once"""
+        worker.process.join(timeout=1)
+        print(f"Warning: scoring worker {worker.index} exited with code {worker.process.exitcode}, restarting")
+        self._count('restarts')
+        try:
+            version, error = self._spawn(worker)
+        except RuntimeError as e:
+            print(f"Warning: {e}")
+            time.sleep(1.0)
+            return
+        if version != self.version:
+            print(f"Warning: restarted scoring worker {worker.index} loaded version {version}, "
+                  f"pool serves {self.version}; scoring in-thread until the next load")
+            self._loaded = (None, self._loaded[1])
+
+        failed = []
+        with worker.lock:
+            for slot, entry in list(worker.inflight.items()):
+                entry.submitted_at = time.monotonic()
+                if entry.attempts >= 2:
+                    failed.append(slot)
+                    continue
+                entry.attempts += 1
+                self._count('retried')
+                worker.conn.send(('score', slot))
+        if failed:
+            self._resolve(worker, failed, error="Scoring worker crashed twice on this row")
+
+    def metrics(self) -> Dict:
+        """Workers alive, restarts, rows in flight and rows scored"""
+        with self._counters_lock:
+            counters = dict(self.counters)
+        return dict(
+            counters,
+            backend='process',
+            processes=self.processes,
+            alive=sum(1 for worker in self._workers if worker.process.is_alive()),
+            inflight=sum(len(worker.inflight) for worker in self._workers),
+            version=self.version
+        )
+
+    def close(self):
+        """Stop the workers and release their rings; in-flight requests fail"""
+        self._stopped.set()
+        for worker in self._workers:
+            try:
+                with worker.lock:
+                    worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=self.timeout)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+            worker.supervisor.join()
+            worker.conn.close()
+            for entry in worker.inflight.values():
+                entry.future.set_exception(RuntimeError("Scoring pool closed"))
+            worker.inflight.clear()
+            del worker.ring
+            worker.shm.close()
+            worker.shm.unlink()
+        self._workers = []
@@ -0,0 +1,75 @@
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict
+
+
+def _max_rss_mb() -> float:
+    """Process-wide peak resident set size so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class StageMetrics:
+    """
+    Wall time and peak memory of named pipeline stages
+
+    Peak memory is the high-water mark of heap allocations traced by
+    tracemalloc during the stage (NumPy and pandas buffers included,
+    memory-mapped files not), relative to what was allocated when the stage
+    started. The process-wide peak RSS at the end of the stage is recorded
+    as well.
+    """
+
+    def __init__(self, track_memory: bool = True):
+        """
+        Args:
+            track_memory: Trace allocations (slows allocation-heavy stages)
+        """
+        self.track_memory = track_memory
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Measure the enclosed block as stage `name`
+
+        Yields the stage's metrics dict, so the block can add to it (e.g.
+        'cache': 'hit').
+        """
+        started_tracing = False
+        base = 0
+        if self.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+
+        metrics = {}
+        start = time.perf_counter()
+        try:
+            yield metrics
+        finally:
+            metrics['seconds'] = round(time.perf_counter() - start, 4)
+            if self.track_memory:
+                metrics['peak_mb'] = round((tracemalloc.get_traced_memory()[1] - base) / (1024 * 1024), 2)
+                if started_tracing:
+                    tracemalloc.stop()
+            metrics['max_rss_mb'] = round(_max_rss_mb(), 1)
+            self.stages[name] = metrics
+
+    def to_dict(self) -> Dict:
+        return {name: dict(metrics) for name, metrics in self.stages.items()}
+
+    def report(self) -> str:
+        """Table of stages, one line each"""
+        lines = [f"{'stage':<12} {'seconds':>9} {'peak MB':>9} {'max RSS MB':>11} {'cache':>6}"]
+        for name, metrics in self.stages.items():
+            peak = f"{metrics['peak_mb']:9.2f}" if 'peak_mb' in metrics else f"{'-':>9}"
+            lines.append(f"{name:<12} {metrics['seconds']:9.2f} {peak} {metrics['max_rss_mb']:11.1f} "
+                         f"{metrics.get('cache', '-'):>6}")
+        return '\n'.join(lines)
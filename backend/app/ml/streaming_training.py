@@ -0,0 +1,300 @@
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from app.ml.anomaly_detector import LoginAnomalyDetector
+from app.ml.failure_counters import FailureCounters, FAILURE_FEATURE_COLUMNS, ONE_HOUR
+from app.ml.feature_engineering import LoginFeatureEngineer, FEATURE_COLUMNS, _build_profiles_flat
+from app.ml.stage_metrics import StageMetrics
+
+# Only the fields feature engineering reads are sent over the wire
+TRAINING_PROJECTION = {
+    '_id': 0,
+    'user_id': 1,
+    'timestamp': 1,
+    'ip_address': 1,
+    'location.latitude': 1,
+    'location.longitude': 1,
+    'device_info.browser': 1,
+    'device_info.os': 1,
+    'device_info.device_type': 1,
+    'success': 1,
+}
+
+_EVENT_COLUMNS = ['user_id', 'timestamp', 'ip_address', 'location', 'device_info', 'success']
+
+# Compact per-event columns profiles are built from (pass 1)
+_PROFILE_COLUMNS = {
+    'user': np.int32,
+    'hour': np.int8,
+    'weekday': np.int8,
+    'day': np.int32,
+    'latitude': np.float64,
+    'longitude': np.float64,
+    'device': np.int32,
+}
+
+
+class MongoTrainingSource:
+    """
+    Login events for training, streamed from a MongoDB collection
+
+    Events in [end - days, end) are read in timestamp order with a
+    projection, and handed out as DataFrames of at most batch_size events.
+    The window is fixed when the source is created, so repeated passes see
+    the same events.
+    """
+
+    def __init__(self, collection, days: int = 90, end: Optional[datetime] = None,
+                 batch_size: int = 10000, query: Optional[Dict] = None):
+        """
+        Args:
+            collection: pymongo collection of login events
+            days: Length of the training window
+            end: End of the window (default: now, UTC)
+            batch_size: Events per batch (also the cursor batch size)
+            query: Extra filter merged into the window query
+        """
+        self.collection = collection
+        self.end = end or datetime.utcnow()
+        self.start = self.end - timedelta(days=days)
+        self.batch_size = batch_size
+        self.extra_query = query or {}
+
+    @property
+    def query(self) -> Dict:
+        return dict(self.extra_query, timestamp={'$gte': self.start, '$lt': self.end})
+
+    def count(self) -> int:
+        return self.collection.count_documents(self.query)
+
+    def batches(self) -> Iterator[pd.DataFrame]:
+        """Events in timestamp order, batch_size at a time"""
+        # A timestamp index avoids the sort; without one it may spill to disk
+        cursor = self.collection.find(self.query, TRAINING_PROJECTION, allow_disk_use=True) \
+            .sort('timestamp', 1).batch_size(self.batch_size)
+
+        chunk = []
+        for event in cursor:
+            chunk.append(event)
+            if len(chunk) == self.batch_size:
+                yield pd.DataFrame(chunk, columns=_EVENT_COLUMNS)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=_EVENT_COLUMNS)
+
+
+def _allocate(shape, dtype, work_dir: Optional[str], name: str) -> np.ndarray:
+    """Array of the given shape, as a .npy memmap in work_dir if one is given"""
+    if work_dir is None:
+        return np.empty(shape, dtype=dtype)
+    return np.lib.format.open_memmap(os.path.join(work_dir, f'{name}.npy'), mode='w+',
+                                     dtype=dtype, shape=shape)
+
+
+def _encode(values: np.ndarray, vocab: Dict) -> np.ndarray:
+    """Stable integer codes (order of first appearance) for a batch of values"""
+    codes, uniques = pd.factorize(values)
+    global_codes = np.array([vocab.setdefault(value, len(vocab)) for value in uniques], dtype=np.int32)
+    return global_codes[codes]
+
+
+class _IndexReservoir:
+    """Uniform sample of row indices from a stream (Algorithm R)"""
+
+    def __init__(self, size: int, rng: np.random.Generator):
+        self.size = size
+        self.rng = rng
+        self.seen = 0
+        self._indices = np.empty(size, dtype=np.int64)
+
+    def offer(self, count: int):
+        """Offer the next `count` rows of the stream"""
+        start, stop = self.seen, self.seen + count
+        fill = min(stop, self.size)
+        if start < fill:
+            self._indices[start:fill] = np.arange(start, fill)
+
+        # Row i replaces a random slot with probability size / (i + 1); later
+        # rows overwrite earlier ones, as in the sequential algorithm
+        candidates = np.arange(max(start, self.size), stop)
+        slots = (self.rng.random(len(candidates)) * (candidates + 1)).astype(np.int64)
+        keep = slots < self.size
+        self._indices[slots[keep]] = candidates[keep]
+        self.seen = stop
+
+    @property
+    def indices(self) -> np.ndarray:
+        """Sampled row indices, ascending"""
+        return np.sort(self._indices[:min(self.seen, self.size)])
+
+
+class StreamingTrainer:
+    """
+    Out-of-core training from a MongoTrainingSource
+
+    Stages, each timed and memory-tracked in `metrics`:
+
+    - profiles: pass 1 over the source; every batch is reduced to compact
+      numeric columns (user and device codes, hour, weekday, day, location)
+      and user profiles are built from those instead of from object frames.
+    - features: pass 2; each batch is engineered by LoginFeatureEngineer and
+      written into a preallocated float32 matrix (a .npy memmap when a work
+      directory is given). The scaler is fitted incrementally and a
+      reservoir keeps a uniform sample of row indices.
+    - train: the forest is fitted on the reservoir sample (it only uses
+      max_samples rows per tree anyway), with the streaming scaler.
+    """
+
+    # Default reservoir size: enough for 100 trees of 256 rows without reuse
+    SAMPLE_SIZE = 100000
+
+    def __init__(self, source: MongoTrainingSource, work_dir: Optional[str] = None,
+                 sample_size: int = SAMPLE_SIZE, use_failure_counters: bool = False,
+                 random_state: int = 42, track_memory: bool = True):
+        """
+        Args:
+            source: Where to read events from
+            work_dir: Directory for the memmapped columns and feature matrix
+                (default: in memory)
+            sample_size: Rows the forest is trained on
+            use_failure_counters: Add the failed-login window features;
+                events from the last hour of a batch are carried into the
+                next one so windows spanning batches stay exact
+            random_state: Seed for the reservoir
+            track_memory: Measure peak allocations per stage
+        """
+        self.source = source
+        self.work_dir = work_dir
+        self.sample_size = sample_size
+        self.use_failure_counters = use_failure_counters
+        self.rng = np.random.default_rng(random_state)
+        self.metrics = StageMetrics(track_memory=track_memory)
+
+        self.engineer = None
+        self.features = None
+        self.feature_columns = FEATURE_COLUMNS + (FAILURE_FEATURE_COLUMNS if use_failure_counters else [])
+        self.scaler = None
+        self.sample_indices = None
+        self.n_events = 0
+
+        if work_dir is not None:
+            os.makedirs(work_dir, exist_ok=True)
+
+    def build_profiles(self) -> Dict:
+        """Pass 1: user profiles from compact columns of every event"""
+        with self.metrics.stage('profiles'):
+            capacity = self.source.count()
+            columns = {name: _allocate((capacity,), dtype, self.work_dir, f'profile_{name}')
+                       for name, dtype in _PROFILE_COLUMNS.items()}
+            users, devices = {}, {}
+            rows = 0
+
+            for batch in self.source.batches():
+                batch = batch.iloc[:capacity - rows]
+                timestamps = pd.to_datetime(batch['timestamp'])
+                device_strings = [f"{d['browser']}/{d['os']}" for d in batch['device_info']]
+                block = slice(rows, rows + len(batch))
+
+                columns['user'][block] = _encode(batch['user_id'].to_numpy(), users)
+                columns['hour'][block] = timestamps.dt.hour.to_numpy()
+                columns['weekday'][block] = timestamps.dt.weekday.to_numpy()
+                columns['day'][block] = timestamps.to_numpy().astype('datetime64[D]').astype(np.int64)
+                columns['latitude'][block] = [loc['latitude'] for loc in batch['location']]
+                columns['longitude'][block] = [loc['longitude'] for loc in batch['location']]
+                columns['device'][block] = _encode(np.asarray(device_strings, dtype=object), devices)
+                rows += len(batch)
+                if rows == capacity:
+                    break
+
+            flat = pd.DataFrame({
+                'user_id': columns['user'][:rows],
+                'hour': columns['hour'][:rows].astype(np.int64),
+                'weekday': columns['weekday'][:rows].astype(np.int64),
+                'date': columns['day'][:rows],
+                'latitude': columns['latitude'][:rows],
+                'longitude': columns['longitude'][:rows],
+                'device': columns['device'][:rows],
+            })
+            coded = _build_profiles_flat(flat) if rows else {}
+            del flat
+
+            user_vocab = list(users)
+            device_vocab = list(devices)
+            profiles = {}
+            for code, profile in coded.items():
+                user_id = user_vocab[code]
+                profile['user_id'] = user_id
+                profile['devices'] = [device_vocab[device] for device in profile['devices']]
+                profiles[user_id] = profile
+
+            self.engineer = LoginFeatureEngineer(
+                failure_counters=FailureCounters() if self.use_failure_counters else None
+            )
+            self.engineer.user_profiles = profiles
+            self.n_events = rows
+
+        print(f"Built profiles for {len(profiles)} users from {rows} events")
+        return profiles
+
+    def engineer_features(self) -> np.ndarray:
+        """Pass 2: float32 feature matrix, streaming scaler and reservoir sample"""
+        if self.engineer is None:
+            self.build_profiles()
+
+        with self.metrics.stage('features'):
+            n = self.n_events
+            matrix = _allocate((n, len(self.feature_columns)), np.float32, self.work_dir, 'features')
+            scaler = StandardScaler()
+            reservoir = _IndexReservoir(self.sample_size, self.rng)
+            context = None
+            rows = 0
+
+            for batch in self.source.batches():
+                batch = batch.iloc[:n - rows]
+                if context is not None:
+                    frame = pd.concat([context, batch], ignore_index=True)
+                    skip = len(context)
+                else:
+                    frame, skip = batch.reset_index(drop=True), 0
+
+                X = self.engineer.engineer_features_batch(frame)[self.feature_columns] \
+                    .to_numpy(dtype=np.float64)[skip:]
+                if len(X):
+                    scaler.partial_fit(X)
+                    matrix[rows:rows + len(X)] = X
+                    reservoir.offer(len(X))
+                rows += len(X)
+
+                if self.use_failure_counters:
+                    timestamps = pd.to_datetime(frame['timestamp'])
+                    context = frame[timestamps >= timestamps.iloc[-1] - pd.Timedelta(seconds=ONE_HOUR)]
+                if rows == n:
+                    break
+
+            if isinstance(matrix, np.memmap):
+                matrix.flush()
+            self.features = matrix[:rows]
+            self.scaler = scaler
+            self.sample_indices = reservoir.indices
+
+        print(f"Engineered {rows} x {len(self.feature_columns)} features "
+              f"({self.features.nbytes / (1024 * 1024):.1f} MB float32), "
+              f"sampled {len(self.sample_indices)} rows")
+        return self.features
+
+    def train(self, contamination: float = 0.10, model_path: str = './ml_models') -> LoginAnomalyDetector:
+        """Run both passes if needed and fit the detector on the sample"""
+        if self.features is None:
+            self.engineer_features()
+        if len(self.features) == 0:
+            raise ValueError("No login events in the training window")
+
+        with self.metrics.stage('train'):
+            detector = LoginAnomalyDetector(model_path=model_path, contamination=contamination)
+            detector.train_sample(self.features[self.sample_indices], self.feature_columns, self.scaler)
+        return detector
@@ -1,13 +1,58 @@
-from typing import Dict, Optional
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
 import requests
+import threading
+import time
 import os
 
 
 class GeolocationService:
     """Service for IP geolocation"""
 
-    def __init__(self):
+    def __init__(self, cache_size: int = None):
         self.api_key = os.getenv('IPSTACK_API_KEY', '')
+        # LRU cache of successful lookups (IPs rarely move between cities)
+        self.cache_size = cache_size if cache_size is not None \
+            else int(os.getenv('GEOLOCATION_CACHE_SIZE', '10000'))
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+
+    def _cached(self, ip_address: str) -> Optional[Dict]:
+        with self._lock:
+            location = self._cache.get(ip_address)
+            if location is not None:
+                self._cache.move_to_end(ip_address)
+            return location
+
+    def _remember(self, ip_address: str, location: Dict):
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[ip_address] = location
+            self._cache.move_to_end(ip_address)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def prime(self, ip_addresses: Iterable[str], budget: Optional[float] = None) -> int:
+        """
+        Resolve addresses ahead of traffic (e.g. at startup)
+
+        Args:
+            ip_addresses: Addresses to resolve, most important first
+            budget: Seconds to spend at most; no new lookup starts after
+                that (None = no limit)
+
+        Returns:
+            Number of addresses now cached
+        """
+        deadline = time.monotonic() + budget if budget is not None else None
+        for ip_address in ip_addresses:
+            if deadline is not None and time.monotonic() >= deadline:
+                print(f"Warning: geolocation priming stopped after its {budget}s budget")
+                break
+            self.get_location_from_ip(ip_address)
+        return len(self._cache)
 
     def get_location_from_ip(self, ip_address: str) -> Optional[Dict]:
         """
@@ -19,20 +64,26 @@ class GeolocationService:
         if not self.api_key or ip_address.startswith('192.168') or ip_address.startswith('127.0'):
             return self._mock_location()
 
+        cached = self._cached(ip_address)
+        if cached is not None:
+            return dict(cached)
+
         try:
             url = f'http://api.ipstack.com/{ip_address}?access_key={self.api_key}'
-            response = requests.get(url, timeout=5)
+            response = self._session.get(url, timeout=5)
             data = response.json()
 
             if 'error' in data:
                 return self._mock_location()
 
-            return {
+            location = {
                 'latitude': data.get('latitude'),
                 'longitude': data.get('longitude'),
                 'city': data.get('city', 'Unknown'),
                 'country': data.get('country_name', 'Unknown')
             }
+            self._remember(ip_address, location)
+            return dict(location)
         except Exception as e:
             print(f"Geolocation error: {e}")
             return self._mock_location()
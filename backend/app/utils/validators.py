@@ -2,6 +2,10 @@ from typing import Dict, List
 import re
 
 
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
 def validate_login_event(data: Dict) -> tuple[bool, List[str]]:
     """
     Validate login event data
@@ -20,27 +24,30 @@ def validate_login_event(data: Dict) -> tuple[bool, List[str]]:
     # Validate IP address format
     if 'ip_address' in data:
         ip_pattern = r'^(\d{1,3}\.){3}\d{1,3}$'
-        if not re.match(ip_pattern, data['ip_address']):
+        if not isinstance(data['ip_address'], str) or not re.match(ip_pattern, data['ip_address']):
             errors.append("Invalid IP address format")
 
     # Validate device_info structure
     if 'device_info' in data:
-        device_required = ['browser', 'os', 'device_type']
-        for field in device_required:
-            if field not in data['device_info']:
-                errors.append(f"Missing device_info field: {field}")
+        if not isinstance(data['device_info'], dict):
+            errors.append("device_info must be an object")
+        else:
+            device_required = ['browser', 'os', 'device_type']
+            for field in device_required:
+                if field not in data['device_info']:
+                    errors.append(f"Missing device_info field: {field}")
 
     # Validate location if provided
     if 'location' in data:
         location = data['location']
-        if 'latitude' not in location or 'longitude' not in location:
+        if not isinstance(location, dict) or 'latitude' not in location or 'longitude' not in location:
             errors.append("Location must include latitude and longitude")
         else:
             lat = location['latitude']
             lon = location['longitude']
-            if not (-90 <= lat <= 90):
+            if not _is_number(lat) or not (-90 <= lat <= 90):
                 errors.append("Invalid latitude value")
-            if not (-180 <= lon <= 180):
+            if not _is_number(lon) or not (-180 <= lon <= 180):
                 errors.append("Invalid longitude value")
 
     return len(errors) == 0, errors
@@ -0,0 +1,134 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict
+
+WARMUP_MODES = ('sync', 'background', 'off')
+
+# Synthetic login scored once at startup so the first real request does not
+# pay for compiling the extractor and the first pass through the model
+_WARMUP_EVENT = {
+    'user_id': '__warmup__',
+    'username': '__warmup__',
+    'ip_address': '127.0.0.1',
+    'device_info': {'browser': 'Chrome', 'os': 'Windows', 'device_type': 'desktop'},
+    'location': {'latitude': 37.7749, 'longitude': -122.4194, 'city': 'San Francisco', 'country': 'USA'},
+    'success': True
+}
+
+
+class WarmupState:
+    """
+    Progress of the startup warm-up, shared with the readiness endpoint
+
+    status is 'pending', 'warming', 'ready', 'failed' or 'disabled'. Step
+    durations and the startup time (from create_app to ready) are kept as
+    metrics.
+    """
+
+    def __init__(self, created_at: float):
+        """
+        Args:
+            created_at: time.perf_counter() when create_app started
+        """
+        self.created_at = created_at
+        self.status = 'pending'
+        self.error = None
+        self.steps = {}
+        self.warmup_seconds = None
+        self.startup_seconds = None
+        self.finished = threading.Event()
+
+    def to_dict(self) -> Dict:
+        return {
+            'status': self.status,
+            'error': self.error,
+            'steps': {name: round(seconds, 4) for name, seconds in self.steps.items()},
+            'warmup_seconds': self.warmup_seconds,
+            'startup_seconds': self.startup_seconds
+        }
+
+
+def _timed(state: WarmupState, name: str, fn):
+    start = time.perf_counter()
+    result = fn()
+    state.steps[name] = time.perf_counter() - start
+    return result
+
+
+def _recent_ip_addresses(config):
+    """Distinct IPs seen recently in login_events (best effort)"""
+    from app import mongo
+
+    since = datetime.utcnow() - timedelta(hours=config.get('LOGIN_HISTORY_WARMUP_HOURS', 24))
+    limit = config.get('GEOLOCATION_PRIME_LIMIT', 1000)
+    if limit <= 0:
+        return []
+    try:
+        return mongo.db.login_events.distinct('ip_address', {'timestamp': {'$gte': since}})[:limit]
+    except Exception as e:
+        print(f"Warning: Could not fetch recent IPs for geolocation priming: {e}")
+        return []
+
+
+def run_warmup(app, state: WarmupState):
+    """Load and warm everything the first /analyze request would otherwise pay for"""
+    from app.api.login_analysis import get_model_manager, get_engineer, get_extractor
+    from app.utils.geolocation import geolocation_service
+
+    state.status = 'warming'
+    start = time.perf_counter()
+    try:
+        with app.app_context():
+            config = app.config
+            model = _timed(state, 'model', get_model_manager).current()
+            engineer = _timed(state, 'feature_engineer', get_engineer)
+
+            def first_score():
+                if not model.detector.is_ready:
+                    return
+                event = dict(_WARMUP_EVENT, timestamp=datetime.utcnow().isoformat())
+                row = get_extractor(engineer, model.detector).extract(event)
+                model.detector.predict_row(row)
+            _timed(state, 'first_score', first_score)
+
+            # Only real lookups are worth priming (without a key they are mocked)
+            if geolocation_service.api_key:
+                _timed(state, 'geolocation', lambda: geolocation_service.prime(
+                    _recent_ip_addresses(config), budget=config.get('GEOLOCATION_PRIME_BUDGET', 10.0)))
+
+        state.status = 'ready'
+    except Exception as e:
+        state.status = 'failed'
+        state.error = f"{type(e).__name__}: {e}"
+        print(f"Warning: startup warm-up failed: {e}")
+    finally:
+        now = time.perf_counter()
+        state.warmup_seconds = round(now - start, 4)
+        state.startup_seconds = round(now - state.created_at, 4)
+        state.finished.set()
+
+    print(f"Startup warm-up {state.status} in {state.warmup_seconds:.2f}s "
+          f"(startup {state.startup_seconds:.2f}s): {state.to_dict()['steps']}")
+
+
+def start_warmup(app, state: WarmupState, mode: str = 'background'):
+    """
+    Run the warm-up according to mode
+
+    Args:
+        mode: 'sync' (block create_app until warm), 'background' (daemon
+            thread; /api/ready answers 503 until done) or 'off' (lazy
+            loading on first request, reported ready immediately)
+    """
+    if mode not in WARMUP_MODES:
+        raise ValueError(f"Unknown warm-up mode: {mode}. Expected one of {WARMUP_MODES}")
+
+    if mode == 'off':
+        state.status = 'disabled'
+        state.startup_seconds = round(time.perf_counter() - state.created_at, 4)
+        state.finished.set()
+    elif mode == 'sync':
+        run_warmup(app, state)
+    else:
+        threading.Thread(target=run_warmup, args=(app, state), name='startup-warmup', daemon=True).start()
@@ -0,0 +1,286 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from bson import json_util
+from pymongo.errors import BulkWriteError, PyMongoError
+
+# Duplicate _id: the document was already written (e.g. by an earlier replay)
+_DUPLICATE_KEY = 11000
+
+
+class WriteBehindQueue:
+    """
+    Bounded in-process queue of MongoDB inserts, written by a flusher thread
+
+    Callers give documents their _id (ObjectId) before submitting, so they
+    can report ids before the write happens. The flusher writes the queue
+    with one insert_many(ordered=False) per collection every flush_interval
+    seconds, or as soon as flush_size documents are waiting. Collections are
+    written in the order they first appear in a batch, so a login event is
+    never written after the alert that references it.
+
+    When MongoDB is unavailable, the batch is appended to a local spill file
+    (one JSON document per line, extended JSON) and replayed after the next
+    successful flush; duplicates from partly written batches are ignored.
+    After a failed replay, idle flushes wait an increasing delay (up to
+    REPLAY_MAX_BACKOFF seconds) before trying again, so a down MongoDB is
+    not probed every tick; a successful insert replays right away. A
+    full queue spills directly. Documents are only dropped when the queue is
+    full and they cannot be spilled either. Queued documents live in memory
+    until flushed, so a crash loses at most one queue's worth.
+    """
+
+    # Seconds an idle flush waits before retrying a failed replay, doubling
+    # from REPLAY_MIN_BACKOFF after each failure
+    REPLAY_MIN_BACKOFF = 1.0
+    REPLAY_MAX_BACKOFF = 60.0
+
+    def __init__(self, db, max_size: int = 10000, flush_size: int = 500, flush_interval: float = 0.2,
+                 spill_path: Optional[str] = None, latency_window: int = 1000):
+        """
+        Args:
+            db: pymongo Database (collections looked up by name)
+            max_size: Documents the queue holds before spilling or dropping
+            flush_size: Documents per insert_many; reaching it wakes the flusher
+            flush_interval: Seconds between flushes otherwise
+            spill_path: Append-only file for writes MongoDB did not take
+                (None: drop them)
+            latency_window: Recent flushes kept for latency percentiles
+        """
+        self.db = db
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher = None
+        self._latencies = deque(maxlen=latency_window)
+        self._replay_backoff = 0.0
+        self._next_replay = 0.0
+        self.counters = {
+            'enqueued': 0, 'written': 0, 'flushes': 0, 'spilled': 0, 'replayed': 0,
+            'dropped': 0, 'write_errors': 0,
+        }
+        if spill_path:
+            os.makedirs(os.path.dirname(os.path.abspath(spill_path)), exist_ok=True)
+
+    def submit(self, collection: str, document: Dict) -> bool:
+        """
+        Queue a document for insertion into `collection`
+
+        Returns:
+            False if the document was dropped (queue full, spill failed)
+        """
+        with self._lock:
+            accepted = len(self._pending) < self.max_size
+            if accepted:
+                self._pending.append((collection, document))
+                self.counters['enqueued'] += 1
+                depth = len(self._pending)
+
+        if not accepted:
+            if self._spill([(collection, document)]):
+                return True
+            with self._lock:
+                self.counters['dropped'] += 1
+            print(f"Warning: write-behind queue full, dropped a {collection} document")
+            return False
+
+        self._ensure_flusher()
+        if depth >= self.flush_size:
+            self._wakeup.set()
+        return True
+
+    def _ensure_flusher(self):
+        if self._flusher is None:
+            with self._lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(
+                        target=self._flush_loop, name='write-behind-flusher', daemon=True
+                    )
+                    self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Warning: write-behind flush failed: {e}")
+
+    def flush(self) -> int:
+        """
+        Write everything queued now, then replay the spill file if MongoDB took the writes
+
+        With nothing queued, the replay waits out the backoff of the last
+        failed one.
+
+        Returns:
+            Number of documents written
+        """
+        with self._flush_lock:
+            written = 0
+            healthy = True
+            inserted = False
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        break
+                    batch = [self._pending.popleft() for _ in range(min(self.flush_size, len(self._pending)))]
+                count, ok = self._write(batch)
+                written += count
+                healthy = healthy and ok
+                inserted = inserted or ok
+
+            if healthy and self.spill_pending() and (inserted or time.monotonic() >= self._next_replay):
+                written += self._replay_spill()
+            return written
+
+    def _write(self, batch: List[Tuple[str, Dict]], spill: bool = True) -> Tuple[int, bool]:
+        """Insert a batch; returns (documents written, whether MongoDB was reachable)"""
+        start = time.perf_counter()
+        by_collection = {}
+        for collection, document in batch:
+            by_collection.setdefault(collection, []).append(document)
+
+        written, reachable = 0, True
+        for collection, documents in by_collection.items():
+            try:
+                self.db[collection].insert_many(documents, ordered=False)
+                written += len(documents)
+            except BulkWriteError as e:
+                errors = [error for error in e.details.get('writeErrors', []) if error.get('code') != _DUPLICATE_KEY]
+                written += len(documents) - len(errors)
+                if errors:
+                    with self._lock:
+                        self.counters['write_errors'] += len(errors)
+                    print(f"Warning: {len(errors)} {collection} documents rejected: {errors[0].get('errmsg')}")
+            except PyMongoError as e:
+                reachable = False
+                print(f"Warning: could not write {len(documents)} {collection} documents: {e}")
+                if spill and not self._spill([(collection, document) for document in documents]):
+                    with self._lock:
+                        self.counters['dropped'] += len(documents)
+
+        with self._lock:
+            self.counters['written'] += written
+            self.counters['flushes'] += 1
+            self._latencies.append(time.perf_counter() - start)
+        return written, reachable
+
+    def _spill(self, items: List[Tuple[str, Dict]]) -> bool:
+        """Append documents to the spill file; False if there is none or it failed"""
+        if not self.spill_path:
+            return False
+        lines = ''.join(json_util.dumps({'collection': collection, 'document': document}) + '\n'
+                        for collection, document in items)
+        try:
+            with self._spill_lock, open(self.spill_path, 'a') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            print(f"Warning: could not spill {len(items)} documents to {self.spill_path}: {e}")
+            return False
+        with self._lock:
+            self.counters['spilled'] += len(items)
+        return True
+
+    def spill_pending(self) -> bool:
+        return bool(self.spill_path) and os.path.exists(self.spill_path) and os.path.getsize(self.spill_path) > 0
+
+    def _replay_spill(self) -> int:
+        """
+        Write spilled documents back; stops (keeping the rest spilled) if
+        MongoDB fails again, and backs off the next attempt
+        """
+        replay_path = f"{self.spill_path}.replay"
+        with self._spill_lock:
+            if not os.path.exists(replay_path):
+                os.replace(self.spill_path, replay_path)
+
+        written = 0
+        ok = True
+        with open(replay_path) as f:
+            batch = []
+            for line in f:
+                record = json_util.loads(line)
+                batch.append((record['collection'], record['document']))
+                if len(batch) == self.flush_size:
+                    count, ok = self._write(batch, spill=False)
+                    if not ok:
+                        self._return_to_spill(batch, f)
+                        break
+                    written += count
+                    batch = []
+            else:
+                if batch:
+                    count, ok = self._write(batch, spill=False)
+                    if ok:
+                        written += count
+                    else:
+                        self._return_to_spill(batch, f)
+        os.remove(replay_path)
+
+        if ok:
+            self._replay_backoff = 0.0
+        else:
+            self._replay_backoff = min(max(self._replay_backoff * 2, self.REPLAY_MIN_BACKOFF),
+                                       self.REPLAY_MAX_BACKOFF)
+        self._next_replay = time.monotonic() + self._replay_backoff
+
+        with self._lock:
+            self.counters['replayed'] += written
+        if written:
+            print(f"Replayed {written} spilled documents")
+        return written
+
+    def _return_to_spill(self, batch: List[Tuple[str, Dict]], rest):
+        self._spill(batch)
+        with self._spill_lock, open(self.spill_path, 'a') as f:
+            for line in rest:
+                f.write(line)
+        # Counted as spilled when first spilled
+        with self._lock:
+            self.counters['spilled'] -= len(batch)
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def metrics(self) -> Dict:
+        """Queue depth, flush latency percentiles and counters"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counters = dict(self.counters)
+            depth = len(self._pending)
+
+        def percentile(q):
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * q), len(latencies) - 1)] * 1000, 3)
+
+        return dict(
+            counters,
+            queue_depth=depth,
+            max_size=self.max_size,
+            flush_latency_ms={'p50': percentile(0.5), 'p99': percentile(0.99), 'max': percentile(1.0)},
+            spill_pending=self.spill_pending()
+        )
+
+    def close(self):
+        """Stop the flusher thread after a final flush"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval + 1)
+        self.flush()
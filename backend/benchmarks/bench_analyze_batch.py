@@ -0,0 +1,121 @@
+"""
+Throughput of POST /api/login/analyze/batch against one /analyze call per event
+
+Both endpoints run in-process through Flask's test client with a real JWT,
+a model trained on synthetic data and an in-memory stand-in for MongoDB
+that sleeps --db-latency-ms per call to model the network round trip
+(insert_one per event and alert vs one insert_many per batch). Events
+carry ISO string timestamps and locations, as posted by the identity
+provider.
+
+Usage (from backend/):
+    python -m benchmarks.bench_analyze_batch --events 5000 --batch-size 1000
+"""
+import argparse
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import jwt
+from bson import ObjectId
+
+from app import create_app, mongo
+from app.config import Config
+from app.ml.anomaly_detector import LoginAnomalyDetector
+from app.ml.data_generator import SyntheticLoginDataGenerator
+from app.ml.feature_engineering import LoginFeatureEngineer
+import app.api.login_analysis as login_analysis
+
+
+class _InsertResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class _MemoryCollection:
+    """insert_one / insert_many with a fixed round-trip delay per call"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.documents = []
+
+    def insert_one(self, document):
+        time.sleep(self.latency)
+        document.setdefault('_id', ObjectId())
+        self.documents.append(document)
+        return _InsertResult(document['_id'])
+
+    def insert_many(self, documents, ordered=True):
+        time.sleep(self.latency)
+        self.documents.extend(documents)
+
+
+class _MemoryDatabase:
+    def __init__(self, latency):
+        self.login_events = _MemoryCollection(latency)
+        self.alerts = _MemoryCollection(latency)
+        self.user_profiles = _MemoryCollection(latency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--db-latency-ms', type=float, default=0.5)
+    args = parser.parse_args()
+
+    df = SyntheticLoginDataGenerator(num_users=args.users, days=14, seed=0).generate_dataset()
+    engineer = LoginFeatureEngineer()
+    engineer.build_all_profiles(df)
+    model_dir = tempfile.mkdtemp()
+    detector = LoginAnomalyDetector(model_path=model_dir)
+    detector.train(engineer.engineer_features_batch(df))
+    detector.save_model(profiles=engineer.user_profiles)
+
+    events = []
+    for event in df.head(args.events).to_dict('records'):
+        event.pop('is_anomaly')
+        event['timestamp'] = event['timestamp'].isoformat()
+        events.append(event)
+
+    app = create_app('testing')
+    app.config.update(MODEL_PATH=model_dir, PROFILE_ONLINE_UPDATES=False)
+    mongo.db = _MemoryDatabase(args.db_latency_ms / 1000)
+    token = jwt.encode({'user_id': 'bench', 'username': 'bench', 'role': 'analyst',
+                        'exp': datetime.utcnow() + timedelta(hours=1)}, Config.JWT_SECRET_KEY, algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.test_client()
+
+    def single():
+        for event in events:
+            assert client.post('/api/login/analyze', json=event, headers=headers).status_code == 200
+
+    def batch():
+        for start in range(0, len(events), args.batch_size):
+            chunk = events[start:start + args.batch_size]
+            assert client.post('/api/login/analyze/batch', json={'events': chunk}, headers=headers).status_code == 200
+
+    try:
+        # Load the model and compile the extractor before timing
+        client.post('/api/login/analyze/batch', json={'events': events[:10]}, headers=headers)
+
+        print(f"Events: {len(events)}, batch size {args.batch_size}, db latency {args.db_latency_ms} ms")
+        print(f"{'':8} {'seconds':>9} {'events/s':>10}")
+        rates = {}
+        for name, fn in (('single', single), ('batch', batch)):
+            start = time.perf_counter()
+            fn()
+            seconds = time.perf_counter() - start
+            rates[name] = len(events) / seconds
+            print(f"{name:8} {seconds:9.2f} {rates[name]:10.0f}")
+        print(f"speedup  {rates['batch'] / rates['single']:.1f}x")
+    finally:
+        login_analysis._model_manager = None
+        login_analysis._engineer = None
+        shutil.rmtree(model_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Throughput benchmark for batch feature engineering
+
+Compares the columnar engineer_features_batch against engineer_features
+applied row by row (the previous implementation).
+
+Usage (from backend/):
+    python -m benchmarks.bench_feature_engineering --users 200 --days 30
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from app.ml.data_generator import SyntheticLoginDataGenerator
+from app.ml.feature_engineering import LoginFeatureEngineer
+
+
+def engineer_rowwise(engineer, df):
+    rows = []
+    for _, event in df.iterrows():
+        features = engineer.engineer_features(event.to_dict())
+        features['user_id'] = event['user_id']
+        features['timestamp'] = event['timestamp']
+        rows.append(features)
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--days', type=int, default=30)
+    args = parser.parse_args()
+
+    df = SyntheticLoginDataGenerator(num_users=args.users, days=args.days).generate_dataset()
+    engineer = LoginFeatureEngineer()
+    engineer.build_all_profiles(df)
+    print(f"Events: {len(df)}")
+
+    start = time.perf_counter()
+    engineer_rowwise(engineer, df)
+    rowwise = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engineer.engineer_features_batch(df)
+    columnar = time.perf_counter() - start
+
+    print(f"Row-wise:  {rowwise:8.3f}s  ({len(df) / rowwise:12,.0f} events/s)")
+    print(f"Columnar:  {columnar:8.3f}s  ({len(df) / columnar:12,.0f} events/s)")
+    print(f"Speedup:   {rowwise / columnar:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Per-event latency and allocation benchmark for single-login feature extraction
+
+Compares the dict path used by /analyze before (engineer_features, then
+building the model row from the dict) against CompiledFeatureExtractor
+filling a preallocated row. Events carry ISO string timestamps, as posted
+to the API. Allocation is the tracemalloc peak within one extraction.
+
+Usage (from backend/):
+    python -m benchmarks.bench_feature_extractor --events 20000
+"""
+import argparse
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.ml.data_generator import SyntheticLoginDataGenerator
+from app.ml.feature_engineering import LoginFeatureEngineer, FEATURE_COLUMNS
+from app.ml.feature_extractor import CompiledFeatureExtractor
+
+
+def dict_path(engineer, event):
+    features = engineer.engineer_features(event)
+    return np.array([[features[col] for col in FEATURE_COLUMNS]])
+
+
+def latencies(fn, events):
+    timings = []
+    for event in events:
+        start = time.perf_counter()
+        fn(event)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def peak_allocation(fn, events):
+    tracemalloc.start()
+    peaks = []
+    for event in events:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(event)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return statistics.mean(peaks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--events', type=int, default=20000)
+    args = parser.parse_args()
+
+    df = SyntheticLoginDataGenerator(num_users=args.users, days=14).generate_dataset()
+    engineer = LoginFeatureEngineer()
+    engineer.build_all_profiles(df)
+    events = []
+    for event in df.head(args.events).to_dict('records'):
+        event['timestamp'] = event['timestamp'].isoformat()
+        events.append(event)
+
+    extractor = CompiledFeatureExtractor(engineer, FEATURE_COLUMNS)
+    candidates = {
+        'dict': lambda event: dict_path(engineer, event),
+        'compiled': extractor.extract,
+    }
+
+    print(f"Events: {len(events)}")
+    print(f"{'':10} {'p50 us':>8} {'p99 us':>8} {'mean us':>8} {'peak alloc B':>13}")
+    for name, fn in candidates.items():
+        latencies(fn, events[:1000])  # warm caches
+        timings = sorted(latencies(fn, events))
+        p50 = timings[len(timings) // 2] * 1e6
+        p99 = timings[int(len(timings) * 0.99)] * 1e6
+        mean = statistics.mean(timings) * 1e6
+        alloc = peak_allocation(fn, events[:2000])
+        print(f"{name:10} {p50:8.2f} {p99:8.2f} {mean:8.2f} {alloc:13.0f}")
+
+
+if __name__ == '__main__':
+    main()
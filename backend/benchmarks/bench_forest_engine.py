@@ -0,0 +1,63 @@
+"""
+Scoring latency benchmark for the flattened-array ForestEngine
+
+Compares, on raw feature rows, StandardScaler + IsolationForest.score_samples
+against StandardScaler + ForestEngine and against the fused engine (scaler
+folded into the split thresholds), for single events and for batches. The
+last column adds path attribution to the fused engine's traversal.
+
+Usage (from backend/):
+    python -m benchmarks.bench_forest_engine --estimators 100
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from app.ml.forest_engine import ForestEngine
+
+
+def per_call(fn, X, repeat):
+    fn(X)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(X)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--estimators', type=int, default=100)
+    parser.add_argument('--features', type=int, default=13)
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    scale = rng.uniform(0.1, 100, size=args.features)
+    X_train = rng.normal(size=(20000, args.features)) * scale
+    scaler = StandardScaler().fit(X_train)
+    model = IsolationForest(n_estimators=args.estimators, random_state=0)
+    model.fit(scaler.transform(X_train))
+    engine = ForestEngine.from_sklearn(model)
+    fused = engine.fuse_scaler(scaler)
+
+    candidates = {
+        'scaler+sklearn': lambda X: model.score_samples(scaler.transform(X)),
+        'scaler+engine': lambda X: engine.score_samples(scaler.transform(X)),
+        'fused engine': fused.score_samples,
+        'fused+attribution': lambda X: fused.score_samples(X, attribute=True),
+    }
+
+    print(f"Trees: {args.estimators}, nodes: {len(engine.threshold)}, max depth: {engine.max_depth}")
+    print(f"{'rows':>7} " + ' '.join(f"{name + ' us/row':>21}" for name in candidates))
+    for rows in (1, 8, 64, 512, 4096):
+        X = rng.normal(size=(rows, args.features)) * scale
+        repeat = max(3, args.repeat // rows)
+        timings = [per_call(fn, X, repeat) / rows for fn in candidates.values()]
+        print(f"{rows:7d} " + ' '.join(f"{t * 1e6:21.2f}" for t in timings))
+
+
+if __name__ == '__main__':
+    main()
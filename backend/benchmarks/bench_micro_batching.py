@@ -0,0 +1,96 @@
+"""
+Latency and throughput of /analyze scoring with and without micro-batching
+
+--threads request threads each extract and score --requests logins, one
+at a time, as concurrent /analyze calls in one worker do. The unbatched
+path calls predict_row per login; the batched path hands rows to a shared
+MicroBatchScorer. Reports p50/p99 per-request latency (extract + score)
+and total throughput for each, on a model trained on synthetic data with
+path attribution on.
+
+Usage (from backend/):
+    python -m benchmarks.bench_micro_batching --threads 16 --max-batch 64 --max-wait-ms 0.5
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from app.ml.anomaly_detector import LoginAnomalyDetector
+from app.ml.data_generator import SyntheticLoginDataGenerator
+from app.ml.feature_engineering import LoginFeatureEngineer
+from app.ml.feature_extractor import CompiledFeatureExtractor
+from app.ml.scoring_dispatcher import MicroBatchScorer
+
+
+def run(threads, requests, events, score):
+    """Per-request latencies (seconds) and elapsed wall time"""
+    latencies = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(t):
+        barrier.wait()
+        for i in range(requests):
+            event = events[(t * requests + i) % len(events)]
+            start = time.perf_counter()
+            score(event)
+            latencies[t].append(time.perf_counter() - start)
+
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    return np.concatenate(latencies), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500, help='per thread')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=0.5)
+    args = parser.parse_args()
+
+    df = SyntheticLoginDataGenerator(num_users=args.users, days=14, seed=0).generate_dataset()
+    engineer = LoginFeatureEngineer()
+    engineer.build_all_profiles(df)
+    detector = LoginAnomalyDetector()
+    detector.train(engineer.engineer_features_batch(df))
+    extractor = CompiledFeatureExtractor(engineer, detector.feature_columns)
+    events = df.drop(columns='is_anomaly').to_dict('records')
+    explain = detector.engine is not None
+
+    scorer = MicroBatchScorer(max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+
+    def unbatched(event):
+        detector.predict_row(extractor.extract(event), explain)
+
+    def batched(event):
+        scorer.score(detector, extractor.extract(event), explain)
+
+    # Compile the extractor and start the scorer thread before timing
+    unbatched(events[0])
+    batched(events[0])
+
+    print(f"Threads: {args.threads}, {args.requests} requests each, "
+          f"max batch {args.max_batch}, max wait {args.max_wait_ms} ms")
+    print(f"{'':10} {'p50 ms':>8} {'p99 ms':>8} {'req/s':>9}")
+    rates = {}
+    for name, score in (('unbatched', unbatched), ('batched', batched)):
+        latencies, seconds = run(args.threads, args.requests, events, score)
+        rates[name] = len(latencies) / seconds
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        print(f"{name:10} {p50:8.2f} {p99:8.2f} {rates[name]:9.0f}")
+    scorer.close()
+
+    metrics = scorer.metrics()
+    print(f"mean batch {metrics['mean_batch']}, throughput {rates['batched'] / rates['unbatched']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Load-time and memory benchmark for model artifacts
+
+Compares the legacy layout (separate joblib pickles for model, scaler,
+features and a dict of user profiles) against the single memory-mapped
+model bundle. Each loader runs in a fresh process and reports load time,
+resident-set growth after loading, and after scoring one event and looking
+up one profile.
+
+Usage (from backend/):
+    python -m benchmarks.bench_model_bundle --users 200000
+"""
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from app.ml.anomaly_detector import LoginAnomalyDetector
+from benchmarks.bench_profile_store import make_profiles, rss_bytes
+
+
+def _measure(kind, model_path, user_id, queue):
+    before = rss_bytes()
+    start = time.perf_counter()
+    detector = LoginAnomalyDetector(model_path=model_path)
+    detector.load_model()
+    if kind == 'joblib':
+        profiles = joblib.load(os.path.join(model_path, 'login_anomaly_detector_user_profiles.pkl'))
+    else:
+        profiles = detector.load_profiles()
+    load_time = time.perf_counter() - start
+    after_load = rss_bytes()
+
+    start = time.perf_counter()
+    detector.predict_row(np.zeros((1, len(detector.feature_columns))))
+    _ = profiles[user_id]
+    first_use = time.perf_counter() - start
+
+    queue.put((load_time, after_load - before, rss_bytes() - before, first_use))
+
+
+def measure(kind, model_path, user_id):
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(kind, model_path, user_id, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200000)
+    parser.add_argument('--estimators', type=int, default=100)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    columns = [f'f{i}' for i in range(13)]
+    features_df = pd.DataFrame(rng.normal(size=(20000, len(columns))), columns=columns)
+    profiles = make_profiles(args.users)
+    user_id = next(iter(profiles))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, 'legacy')
+        bundle_path = os.path.join(tmp, 'bundle')
+        detector = LoginAnomalyDetector(model_path=bundle_path)
+        detector.train(features_df)
+        detector.save_model(profiles=profiles)
+
+        os.makedirs(legacy_path)
+        joblib.dump(detector.model, os.path.join(legacy_path, 'login_anomaly_detector.pkl'))
+        joblib.dump(detector.scaler, os.path.join(legacy_path, 'login_anomaly_detector_scaler.pkl'))
+        joblib.dump(detector.feature_columns, os.path.join(legacy_path, 'login_anomaly_detector_features.pkl'))
+        joblib.dump(profiles, os.path.join(legacy_path, 'login_anomaly_detector_user_profiles.pkl'))
+
+        print(f"Users: {args.users}")
+        print(f"{'':8} {'files MB':>9} {'load s':>8} {'RSS after load MB':>18} "
+              f"{'RSS after first use MB':>23} {'first use ms':>13}")
+        for kind, path in (('joblib', legacy_path), ('bundle', bundle_path)):
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            load_time, rss_load, rss_use, first_use = measure(kind, path, user_id)
+            print(f"{kind:8} {size / 1e6:9.1f} {load_time:8.3f} {rss_load / 1e6:18.1f} "
+                  f"{rss_use / 1e6:23.1f} {first_use * 1e3:13.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Benchmark for user profile building
+
+Compares the single-pass groupby builder (serial and process-pool modes)
+against calling build_user_profile once per user (the previous
+implementation of build_all_profiles).
+
+Usage (from backend/):
+    python -m benchmarks.bench_profile_builder --users 1000 --days 30 --jobs 4
+"""
+import argparse
+import time
+
+from app.ml.data_generator import SyntheticLoginDataGenerator
+from app.ml.feature_engineering import LoginFeatureEngineer, build_profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--jobs', type=int, default=4)
+    args = parser.parse_args()
+
+    df = SyntheticLoginDataGenerator(num_users=args.users, days=args.days).generate_dataset()
+    print(f"Events: {len(df)}  Users: {args.users}")
+
+    engineer = LoginFeatureEngineer()
+    start = time.perf_counter()
+    for user_id in df['user_id'].unique():
+        engineer.build_user_profile(df, user_id)
+    per_user = time.perf_counter() - start
+
+    start = time.perf_counter()
+    build_profiles(df)
+    single_pass = time.perf_counter() - start
+
+    start = time.perf_counter()
+    build_profiles(df, n_jobs=args.jobs)
+    sharded = time.perf_counter() - start
+
+    print(f"Per-user filter:       {per_user:8.3f}s")
+    print(f"Single pass:           {single_pass:8.3f}s  ({per_user / single_pass:.1f}x)")
+    print(f"Single pass, {args.jobs} procs: {sharded:8.3f}s  ({per_user / sharded:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Memory and load-time benchmark for user profiles
+
+Compares the legacy pickled dict of profiles (joblib) against the
+memory-mapped ProfileStore. Each loader runs in a fresh process so the
+resident-set growth it reports is not polluted by the parent.
+
+Usage (from backend/):
+    python -m benchmarks.bench_profile_store --users 300000
+"""
+import argparse
+import multiprocessing as mp
+import os
+import random
+import tempfile
+import time
+
+import joblib
+
+from app.ml.profile_store import ProfileStore
+
+DEVICES = ['Chrome/Windows', 'Safari/iPhone', 'Firefox/macOS', 'Chrome/Android',
+           'Edge/Windows', 'Firefox/Linux', 'Safari/macOS', 'Chrome/Linux']
+
+
+def make_profiles(num_users):
+    rng = random.Random(0)
+    profiles = {}
+    for i in range(num_users):
+        user_id = f'user_{i:07d}'
+        profiles[user_id] = {
+            'user_id': user_id,
+            'typical_hours': sorted(rng.sample(range(8, 19), rng.randint(1, 3))),
+            'typical_location': {'latitude': rng.uniform(25, 48), 'longitude': rng.uniform(-123, -70)},
+            'devices': rng.sample(DEVICES, rng.randint(1, 3)),
+            'avg_logins_per_day': rng.uniform(1, 5),
+            'typical_days': sorted(rng.sample(range(7), rng.randint(1, 3))),
+        }
+    return profiles
+
+
+def rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _measure(kind, path, user_ids, queue):
+    before = rss_bytes()
+    start = time.perf_counter()
+    profiles = joblib.load(path) if kind == 'pickle' else ProfileStore.load(path)
+    load_time = time.perf_counter() - start
+    after_load = rss_bytes()
+
+    start = time.perf_counter()
+    for user_id in user_ids:
+        _ = user_id in profiles
+    lookup_time = (time.perf_counter() - start) / len(user_ids)
+
+    queue.put((load_time, after_load - before, rss_bytes() - before, lookup_time))
+
+
+def measure(kind, path, user_ids):
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(kind, path, user_ids, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=300000)
+    parser.add_argument('--lookups', type=int, default=10000)
+    args = parser.parse_args()
+
+    profiles = make_profiles(args.users)
+    user_ids = random.Random(1).sample(list(profiles), min(args.lookups, args.users))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pickle_path = os.path.join(tmp, 'profiles.pkl')
+        store_path = os.path.join(tmp, 'profiles')
+        joblib.dump(profiles, pickle_path)
+        ProfileStore.from_profiles(profiles).save(store_path)
+
+        store_size = sum(os.path.getsize(os.path.join(store_path, f)) for f in os.listdir(store_path))
+        print(f"Users: {args.users}")
+        print(f"{'':8} {'file MB':>9} {'load s':>8} {'RSS after load MB':>18} "
+              f"{'RSS after lookups MB':>21} {'lookup us':>10}")
+        for kind, path, size in (('pickle', pickle_path, os.path.getsize(pickle_path)),
+                                 ('store', store_path, store_size)):
+            load_time, rss_load, rss_lookup, lookup_time = measure(kind, path, user_ids)
+            print(f"{kind:8} {size / 1e6:9.1f} {load_time:8.3f} {rss_load / 1e6:18.1f} "
+                  f"{rss_lookup / 1e6:21.1f} {lookup_time * 1e6:10.2f}")
+
+
+if __name__ == '__main__':
+    main()
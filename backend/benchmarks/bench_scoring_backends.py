@@ -0,0 +1,87 @@
+"""
+Throughput of /analyze scoring in the request thread vs a process pool
+
+--threads request threads each extract and score --requests logins, as
+concurrent /analyze calls in one Flask worker do. The thread backend calls
+predict_row in the request thread (all threads share the GIL); the process
+backend hands rows to a ProcessScoringBackend of --processes workers over
+shared-memory rings. Feature extraction runs in the request thread for
+both. Reports p50/p99 latency and throughput, on a model trained on
+synthetic data with path attribution on. Workers score the slots waiting
+in their pipe together, which pays off even on one CPU; scoring in
+parallel needs a CPU per process besides the request threads'.
+
+Usage (from backend/):
+    python -m benchmarks.bench_scoring_backends --threads 16 --processes 4
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from app.ml.anomaly_detector import LoginAnomalyDetector
+from app.ml.data_generator import SyntheticLoginDataGenerator
+from app.ml.feature_engineering import LoginFeatureEngineer
+from app.ml.feature_extractor import CompiledFeatureExtractor
+from app.ml.scoring_pool import ProcessScoringBackend
+from benchmarks.bench_micro_batching import run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500, help='per thread')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--slots', type=int, default=64)
+    args = parser.parse_args()
+
+    df = SyntheticLoginDataGenerator(num_users=args.users, days=14, seed=0).generate_dataset()
+    engineer = LoginFeatureEngineer()
+    engineer.build_all_profiles(df)
+    model_dir = tempfile.mkdtemp()
+    trainer = LoginAnomalyDetector(model_path=model_dir)
+    trainer.train(engineer.engineer_features_batch(df))
+    trainer.save_model()
+    detector = LoginAnomalyDetector(model_path=model_dir)
+    detector.load_model()
+    extractor = CompiledFeatureExtractor(engineer, detector.feature_columns)
+    events = df.drop(columns='is_anomaly').to_dict('records')
+    explain = detector.engine is not None
+
+    pool = ProcessScoringBackend(processes=args.processes, slots=args.slots)
+    pool.start(detector)
+
+    def thread_backend(event):
+        detector.predict_row(extractor.extract(event), explain)
+
+    def process_backend(event):
+        pool.score(detector, extractor.extract(event), explain)
+
+    try:
+        # Compile the extractor and warm the workers before timing
+        thread_backend(events[0])
+        for event in events[:args.processes * 4]:
+            process_backend(event)
+
+        print(f"Threads: {args.threads}, {args.requests} requests each, {args.processes} processes, "
+              f"{os.cpu_count()} CPUs")
+        print(f"{'':8} {'p50 ms':>8} {'p99 ms':>8} {'req/s':>9}")
+        rates = {}
+        for name, score in (('thread', thread_backend), ('process', process_backend)):
+            latencies, seconds = run(args.threads, args.requests, events, score)
+            rates[name] = len(latencies) / seconds
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            print(f"{name:8} {p50:8.2f} {p99:8.2f} {rates[name]:9.0f}")
+        print(f"throughput {rates['process'] / rates['thread']:.1f}x, "
+              f"restarts {pool.metrics()['restarts']}, in-thread fallbacks {pool.metrics()['in_thread']}")
+    finally:
+        pool.close()
+        shutil.rmtree(model_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -35,9 +35,11 @@ MODEL_PATH=./ml_models
 ANOMALY_THRESHOLD=0.7
 
 # Risk Score Thresholds
-LOW_RISK_THRESHOLD=0.3
-MEDIUM_RISK_THRESHOLD=0.6
-HIGH_RISK_THRESHOLD=0.8
+MEDIUM_RISK_THRESHOLD=0.95
+HIGH_RISK_THRESHOLD=0.99
+# Used instead for legacy models without a calibration table
+LEGACY_MEDIUM_RISK_THRESHOLD=0.6
+LEGACY_HIGH_RISK_THRESHOLD=0.8
 
 # Geolocation API (optional - leave empty for now)
 IPSTACK_API_KEY=
@@ -167,14 +167,23 @@ def reset_ml_globals():
     import app.api.login_analysis as login_analysis_module
 
     # Reset the global variables before test
-    login_analysis_module._detector = None
+    login_analysis_module._model_manager = None
     login_analysis_module._engineer = None
+    login_analysis_module._extractor = None
+    login_analysis_module._write_behind = None
+    login_analysis_module._scorer = None
 
     yield
 
     # Clean up after test
-    login_analysis_module._detector = None
+    for background in (login_analysis_module._write_behind, login_analysis_module._scorer):
+        if background is not None:
+            background.close()
+    login_analysis_module._model_manager = None
     login_analysis_module._engineer = None
+    login_analysis_module._extractor = None
+    login_analysis_module._write_behind = None
+    login_analysis_module._scorer = None
 
 
 # Also update the setup_environment fixture to ensure MODEL_PATH is set
@@ -197,9 +206,8 @@ def setup_environment(setup_ml_model):
         'MONGO_URI': 'mongodb://localhost:27017/security_detection_test',
         'MODEL_PATH': TestingConfig.MODEL_PATH,  # Use the temp directory from setup_ml_model
         'ANOMALY_THRESHOLD': '0.7',
-        'LOW_RISK_THRESHOLD': '0.3',
-        'MEDIUM_RISK_THRESHOLD': '0.6',
-        'HIGH_RISK_THRESHOLD': '0.8',
+        'MEDIUM_RISK_THRESHOLD': '0.95',
+        'HIGH_RISK_THRESHOLD': '0.99',
     }
 
     for key, value in test_env.items():
@@ -0,0 +1,203 @@
+import io
+import json
+import pytest
+from pymongo.errors import BulkWriteError
+from app.analysis import (score_events, persist_results, result_to_json, summarize, severity_for, read_ndjson,
+                          risk_thresholds)
+from app.ml.anomaly_detector import LoginAnomalyDetector
+from app.ml.data_generator import SyntheticLoginDataGenerator
+from app.ml.failure_counters import FailureCounters
+from app.models.alert import AlertSeverity
+from app.ml.feature_engineering import LoginFeatureEngineer
+from app.ml.feature_extractor import CompiledFeatureExtractor
+
+CONFIG = {'HIGH_RISK_THRESHOLD': 0.99, 'MEDIUM_RISK_THRESHOLD': 0.95, 'ANOMALY_ATTRIBUTION': True}
+
+
+class _FakeCollection:
+    """insert_many that records documents and can reject some positions"""
+
+    def __init__(self, reject=()):
+        self.reject = set(reject)
+        self.documents = []
+        self.calls = 0
+
+    def insert_many(self, documents, ordered=True):
+        assert ordered is False
+        self.calls += 1
+        errors = []
+        for position, document in enumerate(documents):
+            if position in self.reject:
+                errors.append({'index': position, 'code': 11000, 'errmsg': 'duplicate key'})
+            else:
+                self.documents.append(document)
+        if errors:
+            raise BulkWriteError({'writeErrors': errors, 'nInserted': len(documents) - len(errors)})
+
+
+class _FakeDatabase:
+    def __init__(self, reject_events=(), reject_alerts=()):
+        self.login_events = _FakeCollection(reject_events)
+        self.alerts = _FakeCollection(reject_alerts)
+
+
+@pytest.fixture(scope='module')
+def model():
+    """Detector with failure-counter features and the events it was trained on"""
+    df = SyntheticLoginDataGenerator(num_users=15, days=5, seed=2).generate_dataset(anomaly_percentage=0.1)
+    engineer = LoginFeatureEngineer(failure_counters=FailureCounters())
+    engineer.build_all_profiles(df)
+    detector = LoginAnomalyDetector(contamination=0.1)
+    detector.train(engineer.engineer_features_batch(df))
+
+    events = [dict(event, timestamp=event['timestamp'].isoformat()) for event in df.to_dict('records')]
+    return detector, engineer.user_profiles, events
+
+
+def _engineer(profiles, detector):
+    engineer = LoginFeatureEngineer(failure_counters=FailureCounters())
+    engineer.user_profiles = profiles
+    return engineer, CompiledFeatureExtractor(engineer, detector.feature_columns)
+
+
+def _score(events, profiles, detector):
+    engineer, extractor = _engineer(profiles, detector)
+    return score_events(events, engineer, detector, extractor, CONFIG)
+
+
+def test_batch_matches_sequential_analyze(model):
+    """One batch gives the results of scoring the events one by one, in order"""
+    detector, profiles, events = model
+    events = events[:300]
+
+    engineer, extractor = _engineer(profiles, detector)
+    expected = []
+    for event in events:
+        row = extractor.extract(dict(event))
+        expected.append(detector.predict_row(row, explain=True))
+        engineer.failure_counters.record_event(event)
+
+    results = _score([dict(event) for event in events], profiles, detector)
+
+    assert [result['index'] for result in results] == list(range(len(events)))
+    for result, (is_anomaly, risk_score, reasons) in zip(results, expected):
+        assert result['is_anomaly'] == is_anomaly
+        assert result['risk_score'] == pytest.approx(risk_score, abs=1e-9)
+        assert result['reasons'] == reasons
+        assert result['severity'] == severity_for(result['risk_score'], CONFIG, detector)
+
+
+def test_legacy_models_keep_legacy_thresholds(model):
+    """Uncalibrated (legacy) models are judged against the LEGACY_* thresholds"""
+    detector, _, _ = model
+    config = dict(CONFIG, LEGACY_MEDIUM_RISK_THRESHOLD=0.6, LEGACY_HIGH_RISK_THRESHOLD=0.8)
+    assert risk_thresholds(config, detector) == (0.95, 0.99)
+    assert severity_for(0.85, config, detector) == AlertSeverity.LOW
+
+    legacy = LoginAnomalyDetector()
+    legacy.scaler, legacy.engine, legacy.calibration = detector.scaler, detector.engine, None
+    assert risk_thresholds(config, legacy) == (0.6, 0.8)
+    assert severity_for(0.85, config, legacy) == AlertSeverity.HIGH
+    assert severity_for(0.7, config, legacy) == AlertSeverity.MEDIUM
+
+
+def test_invalid_events_reported_by_position(model):
+    """Invalid events are reported and skipped; the others are still scored"""
+    detector, profiles, events = model
+    batch = [dict(events[0]), 'not an event', {'user_id': 'u'}, dict(events[1], timestamp='yesterday'),
+             dict(events[2])]
+
+    results = _score(batch, profiles, detector)
+
+    assert [result['status'] for result in results] == ['ok', 'invalid', 'invalid', 'invalid', 'ok']
+    assert any('username' in error for error in results[2]['errors'])
+    assert results[3]['errors'][0].startswith('Invalid event')
+    assert summarize(results) == {'received': 5, 'stored': 2, 'invalid': 3, 'failed': 0,
+                                  'anomalies': sum(r['is_anomaly'] for r in (results[0], results[4]))}
+
+
+def test_badly_typed_events_are_invalid(model):
+    """Wrongly typed fields make only their own event invalid, not the batch"""
+    detector, profiles, events = model
+    location = {'latitude': None, 'longitude': 10.0, 'city': 'X', 'country': 'Y'}
+    batch = [dict(events[0], ip_address=123), dict(events[1], location=location),
+             dict(events[2], device_info='Chrome'), dict(events[3], timestamp=12345), dict(events[4])]
+
+    results = _score(batch, profiles, detector)
+
+    assert [result['status'] for result in results] == ['invalid'] * 4 + ['ok']
+    assert [result['index'] for result in results] == list(range(5))
+    assert results[0]['errors'] == ['Invalid IP address format']
+    assert results[1]['errors'] == ['Invalid latitude value']
+    assert results[3]['errors'][0].startswith('Invalid event')
+
+
+def test_persist_is_one_bulk_insert_with_partial_failure(model):
+    """Events and alerts are written with one insert_many each; rejected positions fail alone"""
+    detector, profiles, events = model
+    results = _score([dict(event) for event in events[:200]], profiles, detector)
+    anomalies = [result['index'] for result in results if result['is_anomaly']]
+    assert len(anomalies) >= 2
+
+    # The first anomaly's event and the second anomaly's alert are rejected
+    db = _FakeDatabase(reject_events=[anomalies[0]], reject_alerts=[0])
+    ok_anomalies = anomalies[1:]
+    persist_results(db, results)
+
+    assert db.login_events.calls == 1 and db.alerts.calls == 1
+    assert len(db.login_events.documents) == 199
+    assert len(db.alerts.documents) == len(ok_anomalies) - 1
+
+    first = result_to_json(results[anomalies[0]])
+    assert first['status'] == 'failed' and first['login_event_id'] is None and first['alert_id'] is None
+    assert 'duplicate key' in first['error']
+
+    second = result_to_json(results[ok_anomalies[0]])
+    assert second['status'] == 'failed' and second['login_event_id'] is not None and second['alert_id'] is None
+
+    stored_ids = {str(document['_id']) for document in db.login_events.documents}
+    for result in results:
+        if result['status'] == 'ok':
+            assert result['login_event_id'] in stored_ids
+    for alert in db.alerts.documents:
+        assert alert['login_event_id'] in stored_ids
+    assert summarize(results)['failed'] == 2
+
+
+class _CountingStream(io.BytesIO):
+    """Byte stream that remembers how far it has been read"""
+
+    def readline(self, size=-1):
+        line = super().readline(size)
+        self.high_water = self.tell()
+        return line
+
+
+def test_read_ndjson_chunks_and_errors():
+    """Lines are parsed in chunks; bad and oversized lines become errors, blank ones are skipped"""
+    lines = [json.dumps({'n': i}) for i in range(5)]
+    lines[1] = '{not json'
+    lines[3] = json.dumps({'padding': 'x' * 500})
+    body = '\n\n'.join(lines).encode() + b'\n'
+
+    chunks = list(read_ndjson(io.BytesIO(body), chunk_size=2, max_line_bytes=100))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    flat = [item for chunk in chunks for item in chunk]
+    assert [line_no for line_no, _, _ in flat] == [1, 3, 5, 7, 9]
+    assert flat[0][1] == {'n': 0} and flat[4][1] == {'n': 4}
+    assert flat[1][1] is None and flat[1][2].startswith('Invalid JSON')
+    assert flat[3][1] is None and 'longer than 100 bytes' in flat[3][2]
+
+
+def test_read_ndjson_reads_lazily():
+    """A chunk is handed out before the rest of the upload is read"""
+    line = json.dumps({'user_id': 'u', 'padding': 'x' * 100}).encode() + b'\n'
+    stream = _CountingStream(line * 10000)
+
+    chunks = read_ndjson(stream, chunk_size=100, max_line_bytes=1000)
+    first = next(chunks)
+
+    assert len(first) == 100
+    assert stream.high_water == 100 * len(line)
+    assert sum(len(chunk) for chunk in chunks) == 9900
@@ -67,4 +67,149 @@ def test_anomaly_detector_evaluation():
     assert 'recall' in metrics
     assert 'f1_score' in metrics
     assert 0 <= metrics['precision'] <= 1
-    assert 0 <= metrics['recall'] <= 1
\ No newline at end of file
+    assert 0 <= metrics['recall'] <= 1
+
+@pytest.fixture(scope='module')
+def trained():
+    """Detector trained on a small generated dataset, with its features"""
+    generator = SyntheticLoginDataGenerator(num_users=20, days=7)
+    df = generator.generate_dataset(anomaly_percentage=0.1)
+
+    engineer = LoginFeatureEngineer()
+    engineer.build_all_profiles(df)
+    features_df = engineer.engineer_features_batch(df)
+
+    detector = LoginAnomalyDetector(contamination=0.1)
+    detector.train(features_df)
+    return detector, features_df
+
+
+def test_predict_batch_matches_sklearn(trained):
+    """Labels from score vs offset_ agree with IsolationForest.predict"""
+    detector, features_df = trained
+    results = detector.predict_batch(features_df)
+
+    X_scaled = detector.scaler.transform(features_df[detector.feature_columns].values)
+    np.testing.assert_array_equal(results['is_anomaly'], detector.model.predict(X_scaled) == -1)
+    np.testing.assert_allclose(results['anomaly_score'], detector.model.score_samples(X_scaled))
+    assert results['is_anomaly'].any()
+    assert len(results['reasons']) == len(features_df)
+
+
+def test_predict_is_batch_of_one(trained):
+    """Single-event predict returns the row's entry of the batch results"""
+    detector, features_df = trained
+    X = features_df[detector.feature_columns].to_numpy()
+    results = detector.predict_batch(X)
+
+    for i in range(0, len(features_df), max(1, len(features_df) // 25)):
+        is_anomaly, risk_score, reasons = detector.predict(features_df.iloc[i].to_dict())
+        assert is_anomaly == results['is_anomaly'][i]
+        assert risk_score == pytest.approx(results['risk_score'][i])
+        assert reasons == results['reasons'][i]
+
+
+def test_batch_reasons():
+    """Vectorized rules attach the same messages as the per-event rules"""
+    detector = LoginAnomalyDetector(contamination=0.1)
+    detector.feature_columns = ['is_night', 'is_work_hours', 'is_weekend',
+                                'distance_from_typical', 'is_typical_device', 'success']
+    X = np.array([
+        [0, 1, 0, 5.0, 1, 1],      # nothing unusual
+        [1, 0, 0, 850.7, 0, 0],    # night, far away, new device, failed
+        [0, 1, 1, 0.0, 1, 1],      # weekend
+    ])
+    reasons = detector._identify_anomaly_reasons_batch(detector._matrix_columns(X), np.array([0.9, 0.9, 0.1]))
+
+    assert reasons[0] == ["Unusual pattern detected in login behavior"]
+    assert reasons[1] == [
+        "Login attempt during unusual hours (late night/early morning)",
+        "Login outside typical work hours on weekday",
+        "Login from unusual location (>850km from typical)",
+        "Login from new or unusual device",
+        "Failed login attempt",
+    ]
+    assert reasons[2] == ["Login attempt during weekend"]
+
+
+def test_unusual_pattern_cutoff_follows_calibration():
+    """Unexplained risk is an unusual pattern from unusual_risk, or legacy_unusual_risk without calibration"""
+    detector = LoginAnomalyDetector(contamination=0.1, unusual_risk=0.95, legacy_unusual_risk=0.7)
+    detector.feature_columns = ['is_night', 'is_work_hours', 'is_weekend', 'is_typical_device', 'success']
+    X = np.array([[0, 1, 0, 1, 1]] * 3)
+    risk_scores = np.array([0.8, 0.95, 0.5])
+    unusual = ["Unusual pattern detected in login behavior"]
+
+    legacy = detector._identify_anomaly_reasons_batch(detector._matrix_columns(X), risk_scores)
+    assert legacy == [unusual, unusual, []]
+
+    detector.calibration = np.array([[-0.5, 0.5], [0.0, 1.0]])
+    calibrated = detector._identify_anomaly_reasons_batch(detector._matrix_columns(X), risk_scores)
+    assert calibrated == [[], unusual, []]
+
+
+def test_calibrated_risk_is_training_percentile(trained):
+    """Risk is the share of training scores above the score (1 - ECDF)"""
+    detector, features_df = trained
+    results = detector.predict_batch(features_df)
+    scores = results['anomaly_score']
+
+    knots, cdf = detector.calibration
+    assert np.all(np.diff(knots) > 0) and np.all(np.diff(cdf) >= 0)
+    # Ties (identical rows) count half: the table's knot sits mid-jump
+    expected = np.array([(scores > s).mean() + 0.5 * (scores == s).mean() for s in scores])
+    np.testing.assert_allclose(results['risk_score'], expected, atol=0.01)
+
+    # Monotone in the score and clamped outside the training range
+    order = np.argsort(scores)
+    assert np.all(np.diff(results['risk_score'][order]) <= 1e-12)
+    extremes = detector._normalize_scores(np.array([-10.0, scores.min(), scores.max(), 10.0]))
+    assert extremes[0] == pytest.approx(extremes[1]) and extremes[2] == pytest.approx(extremes[3])
+    assert extremes[0] > 0.99 and extremes[3] < 0.05
+
+    # Anomalies are the training tail beyond the contamination quantile
+    assert results['risk_score'][results['is_anomaly']].min() >= 1 - detector.contamination - 0.01
+
+
+def test_uncalibrated_risk_falls_back_to_clip():
+    """Models without a calibration table keep the clipped linear mapping"""
+    detector = LoginAnomalyDetector(contamination=0.1)
+    np.testing.assert_allclose(detector._normalize_scores(np.array([-0.9, -0.25, 0.0, 0.7])),
+                               [1.0, 0.75, 0.5, 0.0])
+
+
+def test_explain_ranks_reasons_by_attribution(trained):
+    """Attribution keeps scores and rule reasons, reordered by feature lift"""
+    detector, features_df = trained
+    plain = detector.predict_batch(features_df)
+    explained = detector.predict_batch(features_df, explain=True)
+
+    np.testing.assert_array_equal(explained['is_anomaly'], plain['is_anomaly'])
+    np.testing.assert_allclose(explained['anomaly_score'], plain['anomaly_score'], rtol=1e-12)
+    assert explained['attribution'].shape == (len(features_df), len(detector.feature_columns))
+    assert np.average(explained['attribution'], axis=1,
+                      weights=detector.attribution_baseline) == pytest.approx(1.0)
+
+    for i in range(len(features_df)):
+        rule_reasons = [r for r in plain['reasons'][i] if r != "Unusual pattern detected in login behavior"]
+        assert sorted(r for r in explained['reasons'][i] if r in rule_reasons) == sorted(rule_reasons)
+        if not explained['is_anomaly'][i]:
+            assert not any(r.startswith("Unusual ") and "usual weight" in r for r in explained['reasons'][i])
+
+
+def test_explain_names_uncovered_features():
+    """Anomalies get ranked reasons for features no rule covers"""
+    detector = LoginAnomalyDetector(contamination=0.1)
+    detector.feature_columns = ['hour', 'is_night', 'distance_from_typical', 'is_work_hours', 'is_typical_device']
+    column = detector._matrix_columns(np.array([[3.0, 1, 500.0, 1, 1]] * 2))
+    attribution = np.array([[4.0, 0.5, 2.0, 1.0, 1.0]] * 2)
+
+    reasons = detector._identify_anomaly_reasons_batch(column, np.array([0.99, 0.99]), attribution,
+                                                       np.array([True, False]))
+
+    assert reasons[0] == [
+        "Unusual login hour (4.0x its usual weight in the model)",
+        "Login from unusual location (>500km from typical)",
+        "Login attempt during unusual hours (late night/early morning)",
+    ]
+    assert reasons[1] == reasons[0][1:]
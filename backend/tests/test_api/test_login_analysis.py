@@ -27,6 +27,7 @@ def test_analyze_login_success(client, auth_headers):
     assert 'is_anomaly' in data
     assert 'risk_score' in data
     assert 'severity' in data
+    assert 'model_version' in data
     assert isinstance(data['risk_score'], float)
     assert 0 <= data['risk_score'] <= 1
 
@@ -89,4 +90,155 @@ def test_get_login_events(client, auth_headers):
 
     assert 'events' in data
     assert 'count' in data
-    assert len(data['events']) == 3
\ No newline at end of file
+    assert len(data['events']) == 3
+
+def test_analyze_batch(client, auth_headers, sample_login_event):
+    """A batch is scored and stored with one result per position"""
+    events = [dict(sample_login_event, user_id=f'test_user_{i:03d}') for i in range(5)]
+
+    response = client.post('/api/login/analyze/batch', json={'events': events}, headers=auth_headers)
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [result['index'] for result in data['results']] == list(range(5))
+    assert all(result['status'] == 'ok' and result['login_event_id'] for result in data['results'])
+    assert data['summary']['stored'] == 5
+    assert 'model_version' in data
+
+    events_response = client.get('/api/login/events', headers=auth_headers)
+    assert len(events_response.get_json()['events']) == 5
+
+
+def test_analyze_batch_partial_failure(client, auth_headers, sample_login_event):
+    """Invalid events are reported by position while the rest are stored"""
+    events = [sample_login_event, {'user_id': 'test_user_002'}, sample_login_event]
+
+    response = client.post('/api/login/analyze/batch', json=events, headers=auth_headers)
+
+    assert response.status_code == 207
+    data = response.get_json()
+    assert [result['status'] for result in data['results']] == ['ok', 'invalid', 'ok']
+    assert data['results'][1]['errors']
+    assert data['summary'] == {'received': 3, 'stored': 2, 'invalid': 1, 'failed': 0,
+                               'anomalies': data['summary']['anomalies']}
+
+
+def test_analyze_batch_limits(client, auth_headers, sample_login_event, app):
+    """Empty and oversized batches are rejected"""
+    response = client.post('/api/login/analyze/batch', json={'events': []}, headers=auth_headers)
+    assert response.status_code == 400
+
+    app.config['ANALYZE_BATCH_MAX_EVENTS'] = 2
+    response = client.post('/api/login/analyze/batch', json=[sample_login_event] * 3, headers=auth_headers)
+    assert response.status_code == 413
+
+
+def test_ingest_ndjson(client, auth_headers, sample_login_event, app):
+    """NDJSON in, one NDJSON result per event out, then a summary line"""
+    import json
+
+    app.config['INGEST_CHUNK_SIZE'] = 2
+    lines = [json.dumps(dict(sample_login_event, user_id=f'test_user_{i:03d}')) for i in range(5)]
+    lines.insert(2, '{not json')
+    headers = dict(auth_headers, **{'Content-Type': 'application/x-ndjson'})
+
+    response = client.post('/api/login/ingest', data='\n'.join(lines) + '\n', headers=headers)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    summary = results.pop()['summary']
+    assert [result['index'] for result in results] == list(range(6))
+    assert [result['status'] for result in results] == ['ok', 'ok', 'invalid', 'ok', 'ok', 'ok']
+    assert results[2]['line'] == 3
+    assert summary['stored'] == 5 and summary['invalid'] == 1
+
+
+def test_analyze_write_behind(client, auth_headers, sample_login_event, app, tmp_path):
+    """With write-behind on, /analyze returns the event id before the queued insert lands"""
+    from bson import ObjectId
+    from app import mongo
+
+    app.config.update(WRITE_BEHIND=True, WRITE_BEHIND_FLUSH_INTERVAL=60,
+                      WRITE_BEHIND_SPILL_PATH=str(tmp_path / 'spill.ndjson'))
+
+    response = client.post('/api/login/analyze', json=sample_login_event, headers=auth_headers)
+    assert response.status_code == 200
+    event_id = ObjectId(response.get_json()['login_event_id'])
+
+    status = client.get('/api/login/write-behind', headers=auth_headers).get_json()
+    assert status['enabled'] and status['enqueued'] >= 1
+
+    import app.api.login_analysis as login_analysis
+    login_analysis._write_behind.flush()
+    assert mongo.db.login_events.find_one({'_id': event_id}) is not None
+
+
+def test_analyze_micro_batching(client, auth_headers, sample_login_event, app):
+    """With micro-batching on, /analyze scores through the shared scorer and /model reports it"""
+    app.config.update(SCORING_MICRO_BATCH=True, SCORING_MAX_WAIT_MS=0)
+
+    response = client.post('/api/login/analyze', json=sample_login_event, headers=auth_headers)
+    assert response.status_code == 200
+    assert 0 <= response.get_json()['risk_score'] <= 1
+
+    status = client.get('/api/login/model', headers=auth_headers).get_json()
+    assert status['scoring']['backend'] == 'micro_batch' and status['scoring']['rows'] == 1
+
+
+def test_analyze_process_backend(client, auth_headers, sample_login_event, app):
+    """With the process backend, /analyze is scored by a worker process"""
+    app.config.update(SCORING_BACKEND='process', SCORING_PROCESSES=1)
+
+    response = client.post('/api/login/analyze', json=sample_login_event, headers=auth_headers)
+    assert response.status_code == 200
+
+    scoring = client.get('/api/login/model', headers=auth_headers).get_json()['scoring']
+    assert scoring['backend'] == 'process' and scoring['alive'] == 1
+    assert scoring['scored'] + scoring['in_thread'] == 1
+
+
+def test_ingest_ndjson_bad_lines_do_not_stop_stream(client, auth_headers, sample_login_event, app):
+    """Malformed and badly typed lines get invalid results; the lines after them are still processed"""
+    import json
+
+    app.config['INGEST_CHUNK_SIZE'] = 3
+    bad_location = dict(sample_login_event['location'], latitude=None)
+    lines = [
+        json.dumps(sample_login_event),
+        json.dumps(dict(sample_login_event, ip_address=123)),
+        json.dumps(dict(sample_login_event, location=bad_location)),
+        '[1, 2]',
+        json.dumps(dict(sample_login_event, device_info='Chrome')),
+        json.dumps(sample_login_event),
+    ]
+    headers = dict(auth_headers, **{'Content-Type': 'application/x-ndjson'})
+
+    response = client.post('/api/login/ingest', data='\n'.join(lines) + '\n', headers=headers)
+
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    final = results.pop()
+    assert 'error' not in final
+    assert [result['status'] for result in results] == ['ok', 'invalid', 'invalid', 'invalid', 'invalid', 'ok']
+    assert final['summary']['stored'] == 2 and final['summary']['invalid'] == 4
+
+
+def test_ingest_scoring_failure_ends_stream(client, auth_headers, sample_login_event, app, monkeypatch):
+    """A server-side scoring failure stops the stream with an error line, not invalid results"""
+    import json
+    import app.api.login_analysis as login_analysis
+
+    def broken_predict_batch(X, explain=False):
+        raise RuntimeError('model exploded')
+
+    detector = login_analysis.get_model_manager().current().detector
+    monkeypatch.setattr(detector, 'predict_batch', broken_predict_batch)
+    headers = dict(auth_headers, **{'Content-Type': 'application/x-ndjson'})
+
+    response = client.post('/api/login/ingest', data=json.dumps(sample_login_event) + '\n', headers=headers)
+
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(lines) == 1
+    assert lines[0]['error'] == 'model exploded'
+    assert lines[0]['summary']['invalid'] == 0
@@ -41,7 +41,7 @@ def test_generate_anomalous_login():
     date = datetime.now().date()
 
     # Test different anomaly types
-    anomaly_types = ['off_hours', 'unusual_location', 'new_device', 'failed_attempts']
+    anomaly_types = ['off_hours', 'unusual_location', 'impossible_travel', 'new_device', 'failed_attempts']
 
     for anomaly_type in anomaly_types:
         login = generator.generate_anomalous_login(user, date, anomaly_type)
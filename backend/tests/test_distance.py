@@ -0,0 +1,66 @@
+import pytest
+import numpy as np
+from geopy.distance import geodesic
+from app.ml.distance import (
+    distance_km, distance_km_array, distance_km_rad, to_radians, DISTANCE_METHODS
+)
+
+
+@pytest.fixture
+def point_pairs():
+    """Random point pairs spread over the globe"""
+    rng = np.random.default_rng(42)
+    lat = rng.uniform(-80, 80, size=(500, 2))
+    lon = rng.uniform(-180, 180, size=(500, 2))
+    return lat[:, 0], lon[:, 0], lat[:, 1], lon[:, 1]
+
+
+def _geodesic_km(lat1, lon1, lat2, lon2):
+    return np.array([
+        geodesic((a, b), (c, d)).kilometers for a, b, c, d in zip(lat1, lon1, lat2, lon2)
+    ])
+
+
+def test_haversine_error_bound(point_pairs):
+    """Haversine stays within the documented 0.55% of the geodesic"""
+    expected = _geodesic_km(*point_pairs)
+    actual = distance_km_array(*point_pairs, method='haversine')
+
+    assert np.all(np.abs(actual - expected) / expected < 0.0055)
+
+
+def test_lambert_error_bound(point_pairs):
+    """Lambert's formula stays within the documented 3e-5 relative error"""
+    expected = _geodesic_km(*point_pairs)
+    actual = distance_km_array(*point_pairs, method='lambert')
+
+    assert np.all(np.abs(actual - expected) / expected < 3e-5)
+
+
+@pytest.mark.parametrize('method', DISTANCE_METHODS)
+def test_scalar_matches_array(point_pairs, method):
+    """Scalar fast path and array kernel agree"""
+    array_result = distance_km_array(*point_pairs, method=method)
+    scalar_result = [distance_km(*pair, method=method) for pair in zip(*point_pairs)]
+
+    np.testing.assert_allclose(scalar_result, array_result, rtol=1e-9)
+
+
+@pytest.mark.parametrize('method', DISTANCE_METHODS)
+def test_zero_distance(method):
+    """Identical points are zero kilometers apart"""
+    lat, lon = to_radians(37.7749, -122.4194)
+
+    assert distance_km_rad(lat, lon, lat, lon, method) == 0.0
+    assert distance_km_array(37.7749, -122.4194, 37.7749, -122.4194, method) == 0.0
+
+
+def test_known_distance():
+    """San Francisco to New York is about 4,139 km"""
+    assert distance_km(37.7749, -122.4194, 40.7128, -74.0060, method='lambert') == pytest.approx(4139, abs=5)
+
+
+def test_unknown_method():
+    """Unknown methods are rejected"""
+    with pytest.raises(ValueError):
+        distance_km_array(0, 0, 1, 1, method='vincenty')
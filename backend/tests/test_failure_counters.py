@@ -0,0 +1,143 @@
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from app.ml.data_generator import SyntheticLoginDataGenerator
+from app.ml.feature_engineering import LoginFeatureEngineer
+from app.ml.failure_counters import (
+    SlidingWindowCounter, CountMinWindowCounter, DistinctWindowCounter,
+    FailureCounters, FAILURE_FEATURE_COLUMNS, _windowed_prior_distinct
+)
+
+START = datetime(2024, 1, 15, 10, 0)
+
+
+def _seconds(dt):
+    return pd.Timestamp(dt).timestamp()
+
+
+def test_sliding_window_expires_old_events():
+    """Events leave the window once it slides past them"""
+    counter = SlidingWindowCounter(window_seconds=300, bucket_seconds=10)
+    for i in range(5):
+        counter.add('user_001', _seconds(START + timedelta(seconds=30 * i)))
+
+    assert counter.count('user_001', _seconds(START + timedelta(minutes=2))) == 5
+    assert counter.count('user_001', _seconds(START + timedelta(minutes=6))) == 2
+    assert counter.count('user_001', _seconds(START + timedelta(hours=1))) == 0
+    assert counter.count('user_002', _seconds(START)) == 0
+
+
+def test_sliding_window_bounded_keys():
+    """Keys beyond max_keys are evicted least recently used first"""
+    counter = SlidingWindowCounter(window_seconds=300, bucket_seconds=10, max_keys=2)
+    for key in ('a', 'b', 'a', 'c'):
+        counter.add(key, _seconds(START))
+
+    assert counter.count('a', _seconds(START)) == 2
+    assert counter.count('b', _seconds(START)) == 0
+    assert counter.count('c', _seconds(START)) == 1
+
+
+def test_count_min_never_underestimates():
+    """Count-min estimates are upper bounds within the documented error"""
+    counter = CountMinWindowCounter(window_seconds=3600, bucket_seconds=60, width=256, depth=4)
+    rng = np.random.default_rng(0)
+    keys = [f'10.0.{i // 256}.{i % 256}' for i in rng.integers(0, 2000, size=5000)]
+    now = _seconds(START)
+    for key in keys:
+        counter.add(key, now)
+
+    true_counts = pd.Series(keys).value_counts()
+    for key, true_count in true_counts.head(50).items():
+        estimate = counter.count(key, now)
+        assert true_count <= estimate <= true_count + np.e / 256 * len(keys)
+
+    assert counter.count('10.0.0.1', now + 7200) == 0
+
+
+def test_distinct_counter_estimate():
+    """Linear counting stays close to the true distinct count"""
+    counter = DistinctWindowCounter(window_seconds=3600, bucket_seconds=60, bits=128)
+    now = _seconds(START)
+    for i in range(30):
+        counter.add('10.0.0.1', f'user_{i:03d}', now)
+        counter.add('10.0.0.1', f'user_{i:03d}', now)
+
+    assert counter.count('10.0.0.1', now) == pytest.approx(30, rel=0.25)
+    assert counter.count('10.0.0.1', now + 7200) == 0
+
+
+@pytest.mark.parametrize('ip_mode', ['approx', 'exact'])
+def test_failure_counters_burst(ip_mode):
+    """A burst of failures shows up in user and IP features"""
+    counters = FailureCounters(ip_mode=ip_mode)
+    for i in range(6):
+        counters.record('user_001', '10.0.0.1', START + timedelta(seconds=20 * i), success=False)
+    counters.record('user_002', '10.0.0.1', START + timedelta(seconds=130), success=True)
+
+    features = counters.extract_features('user_001', '10.0.0.1', START + timedelta(minutes=3))
+
+    assert features['user_failures_5m'] == 6
+    assert features['user_failures_1h'] == 6
+    assert features['ip_failures_5m'] >= 6
+    assert features['ip_failures_1h'] >= 6
+    assert features['ip_distinct_users_1h'] == pytest.approx(2, abs=0.1)
+
+    later = counters.extract_features('user_001', '10.0.0.1', START + timedelta(minutes=30))
+    assert later['user_failures_5m'] == 0
+    assert later['user_failures_1h'] == 6
+
+
+def test_invalid_ip_mode():
+    """Unknown IP modes are rejected"""
+    with pytest.raises(ValueError):
+        FailureCounters(ip_mode='fuzzy')
+
+
+def test_batch_matches_online_counters():
+    """Batch failure features agree with replaying events through the counters"""
+    generator = SyntheticLoginDataGenerator(num_users=5, days=1)
+    events = []
+    for i in range(40):
+        event = generator.generate_normal_login(generator.users[i % 3], START.date())
+        event['timestamp'] = (START + timedelta(seconds=45 * i)).isoformat()
+        event['ip_address'] = f'10.0.0.{i % 2}'
+        event['success'] = i % 4 != 0
+        events.append(event)
+    df = pd.DataFrame(events)
+
+    engineer = LoginFeatureEngineer(failure_counters=FailureCounters(ip_mode='exact'))
+    batch_df = engineer.engineer_features_batch(df)
+
+    replay = FailureCounters(ip_mode='exact')
+    for i, event in enumerate(events):
+        online = replay.extract_features(event['user_id'], event['ip_address'], event['timestamp'])
+        replay.record_event(event)
+        for column in ('user_failures_1h', 'ip_failures_1h'):
+            assert batch_df[column].iloc[i] == online[column]
+        # 5-minute windows may differ by the events in one 10s bucket edge
+        assert abs(batch_df['user_failures_5m'].iloc[i] - online['user_failures_5m']) <= 1
+        assert batch_df['ip_distinct_users_1h'].iloc[i] == pytest.approx(online['ip_distinct_users_1h'], abs=0.1)
+
+    assert batch_df.columns.tolist()[-len(FAILURE_FEATURE_COLUMNS) - 2:-2] == FAILURE_FEATURE_COLUMNS
+
+
+def test_windowed_prior_distinct_matches_brute_force():
+    """Vectorized distinct counts equal a scan of each event's window, ties included"""
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        n = int(rng.integers(1, 200))
+        keys = rng.choice(['10.0.0.1', '10.0.0.2', '10.0.0.3'], n)
+        values = rng.choice([f'user_{i}' for i in range(6)], n)
+        seconds = rng.integers(0, 2000, n).astype(np.float64)
+        window = float(rng.choice([10, 300, 3600]))
+
+        expected = np.zeros(n)
+        for i in range(n):
+            # Earlier = before in time, or tied and earlier in the input
+            earlier = (keys == keys[i]) & (seconds >= seconds[i] - window) & \
+                ((seconds < seconds[i]) | ((seconds == seconds[i]) & (np.arange(n) < i)))
+            expected[i] = len(set(values[earlier]))
+
+        np.testing.assert_array_equal(_windowed_prior_distinct(keys, values, seconds, window), expected)
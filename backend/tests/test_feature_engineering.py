@@ -1,7 +1,7 @@
 import pytest
 import pandas as pd
 from datetime import datetime
-from app.ml.feature_engineering import LoginFeatureEngineer
+from app.ml.feature_engineering import LoginFeatureEngineer, build_profiles
 from app.ml.data_generator import SyntheticLoginDataGenerator
 
 
@@ -183,4 +183,72 @@ def test_feature_types(engineer, sample_data):
     # All features should be numeric
     for key, value in features.items():
         if key not in ['user_id', 'timestamp']:
-            assert isinstance(value, (int, float)), f"{key} should be numeric, got {type(value)}"
\ No newline at end of file
+            assert isinstance(value, (int, float)), f"{key} should be numeric, got {type(value)}"
+
+def _engineer_rowwise(engineer, df):
+    """Reference implementation: engineer_features applied event by event"""
+    rows = []
+    for _, event in df.iterrows():
+        features = engineer.engineer_features(event.to_dict())
+        features['user_id'] = event['user_id']
+        features['timestamp'] = event['timestamp']
+        rows.append(features)
+    return pd.DataFrame(rows)
+
+
+def test_engineer_features_batch_matches_single_event(engineer, sample_data):
+    """Columnar batch path must produce the same features as the per-event path"""
+    engineer.build_all_profiles(sample_data)
+
+    # Include a user without a profile and an unseen device
+    extra = sample_data.iloc[:2].copy()
+    extra['user_id'] = ['unknown_user', extra['user_id'].iloc[1]]
+    extra['device_info'] = [extra['device_info'].iloc[0],
+                            {'browser': 'Opera', 'os': 'BeOS', 'device_type': 'mobile'}]
+    data = pd.concat([sample_data, extra], ignore_index=True)
+
+    batch_df = engineer.engineer_features_batch(data)
+    expected_df = _engineer_rowwise(engineer, data)
+
+    assert batch_df.columns.tolist() == expected_df.columns.tolist()
+    pd.testing.assert_frame_equal(batch_df, expected_df, check_dtype=False)
+
+
+def test_engineer_features_batch_without_profiles(engineer, sample_data):
+    """Without profiles every device is typical and distance is zero"""
+    features_df = engineer.engineer_features_batch(sample_data)
+
+    assert (features_df['is_typical_device'] == 1).all()
+    assert (features_df['distance_from_typical'] == 0).all()
+
+
+def test_distance_method_lambert(sample_data):
+    """Both distance kernels give consistent single-event and batch results"""
+    engineer = LoginFeatureEngineer(distance_method='lambert')
+    engineer.build_all_profiles(sample_data)
+
+    features_df = engineer.engineer_features_batch(sample_data)
+    event = sample_data.iloc[0].to_dict()
+    features = engineer.engineer_features(event)
+
+    assert features['distance_from_typical'] == pytest.approx(
+        features_df['distance_from_typical'].iloc[0]
+    )
+
+
+def test_build_all_profiles_matches_per_user(engineer, sample_data):
+    """Single-pass builder matches build_user_profile for every user"""
+    expected = {
+        user_id: engineer.build_user_profile(sample_data, user_id)
+        for user_id in sample_data['user_id'].unique()
+    }
+
+    engineer.build_all_profiles(sample_data)
+
+    assert list(engineer.user_profiles) == list(expected)
+    assert engineer.user_profiles == expected
+
+
+def test_build_profiles_process_pool(sample_data):
+    """Sharded process-pool mode gives the same profiles"""
+    assert build_profiles(sample_data, n_jobs=2) == build_profiles(sample_data)
@@ -0,0 +1,143 @@
+import pytest
+import numpy as np
+from app.ml.data_generator import SyntheticLoginDataGenerator
+from app.ml.feature_engineering import LoginFeatureEngineer, FEATURE_COLUMNS
+from app.ml.feature_extractor import CompiledFeatureExtractor
+from app.ml.anomaly_detector import LoginAnomalyDetector
+from app.ml.profile_store import ProfileStore
+from app.ml.login_history import LoginHistory, HISTORY_FEATURE_COLUMNS
+from app.ml.failure_counters import FailureCounters, FAILURE_FEATURE_COLUMNS
+
+
+@pytest.fixture
+def sample_data():
+    """Generate sample login data"""
+    generator = SyntheticLoginDataGenerator(num_users=10, days=7)
+    return generator.generate_dataset(anomaly_percentage=0.2)
+
+
+def _assert_matches_dict_path(engineer, events, columns):
+    extractor = CompiledFeatureExtractor(engineer, columns)
+    for event in events:
+        row = extractor.extract(event)
+        features = engineer.engineer_features(event)
+        expected = [features[column] for column in columns]
+        np.testing.assert_allclose(row[0], expected, rtol=1e-12)
+
+
+def test_matches_engineer_features(sample_data):
+    """Compiled rows equal the dict features, with and without profiles"""
+    events = [event for _, event in sample_data.head(200).iterrows()]
+    events = [event.to_dict() for event in events]
+
+    _assert_matches_dict_path(LoginFeatureEngineer(), events, FEATURE_COLUMNS)
+
+    engineer = LoginFeatureEngineer()
+    engineer.build_all_profiles(sample_data)
+    _assert_matches_dict_path(engineer, events, FEATURE_COLUMNS)
+
+    engineer.user_profiles = ProfileStore.from_profiles(engineer.user_profiles)
+    _assert_matches_dict_path(engineer, events, FEATURE_COLUMNS)
+
+
+def test_store_profiles_not_rebuilt(sample_data, monkeypatch):
+    """Extraction reads ProfileStore arrays instead of rebuilding profile dicts"""
+    events = sample_data.head(100).to_dict('records')
+    engineer = LoginFeatureEngineer()
+    engineer.build_all_profiles(sample_data)
+    dict_extractor = CompiledFeatureExtractor(engineer, FEATURE_COLUMNS)
+    expected = [dict_extractor.extract(event).copy() for event in events]
+
+    engineer.user_profiles = ProfileStore.from_profiles(engineer.user_profiles)
+
+    def rebuild(pos):
+        raise AssertionError("profile dict rebuilt on the extraction path")
+
+    monkeypatch.setattr(engineer.user_profiles, '_profile_at', rebuild)
+    extractor = CompiledFeatureExtractor(engineer, FEATURE_COLUMNS)
+    for event, row in zip(events, expected):
+        # float32 store coordinates move distances by meters
+        np.testing.assert_allclose(extractor.extract(event), row, atol=0.05)
+
+    unknown = dict(events[0], user_id='unknown-user')
+    row = extractor.extract(unknown)[0]
+    assert row[FEATURE_COLUMNS.index('distance_from_typical')] == 0.0
+    assert row[FEATURE_COLUMNS.index('is_typical_device')] == 1.0
+
+
+def test_iso_string_timestamps(sample_data):
+    """String timestamps (as posted to /analyze) parse like pd.to_datetime"""
+    engineer = LoginFeatureEngineer()
+    engineer.build_all_profiles(sample_data)
+    events = []
+    for _, event in sample_data.head(50).iterrows():
+        event = event.to_dict()
+        event['timestamp'] = event['timestamp'].isoformat() + 'Z'
+        events.append(event)
+
+    _assert_matches_dict_path(engineer, events, FEATURE_COLUMNS)
+
+
+def test_history_and_failure_columns(sample_data):
+    """Optional velocity and failure features are written in model order"""
+    engineer = LoginFeatureEngineer(login_history=LoginHistory(), failure_counters=FailureCounters())
+    columns = FEATURE_COLUMNS + HISTORY_FEATURE_COLUMNS + FAILURE_FEATURE_COLUMNS
+    extractor = CompiledFeatureExtractor(engineer, columns)
+
+    for _, event in sample_data.head(100).iterrows():
+        event = event.to_dict()
+        features = engineer.engineer_features(event)
+        np.testing.assert_allclose(extractor.extract(event)[0], [features[c] for c in columns])
+        engineer.login_history.record_event(event)
+        engineer.failure_counters.record_event(event)
+
+
+def test_column_order_and_subset(sample_data):
+    """Only the requested columns are written, in the requested order"""
+    engineer = LoginFeatureEngineer()
+    columns = ['success', 'hour', 'is_mobile']
+    extractor = CompiledFeatureExtractor(engineer, columns)
+    event = sample_data.iloc[0].to_dict()
+
+    row = extractor.extract(event)
+    features = engineer.engineer_features(event)
+
+    assert row.shape == (1, 3)
+    assert row[0].tolist() == [features['success'], features['hour'], features['is_mobile']]
+    assert 'location' not in extractor.source
+
+
+def test_row_buffer_reused(sample_data):
+    """The same preallocated row is filled on every call"""
+    extractor = CompiledFeatureExtractor(LoginFeatureEngineer(), FEATURE_COLUMNS)
+    first = extractor.extract(sample_data.iloc[0].to_dict())
+    second = extractor.extract(sample_data.iloc[1].to_dict())
+
+    assert first is second
+
+    out = np.zeros((1, len(FEATURE_COLUMNS)), dtype=np.float32)
+    assert extractor.extract(sample_data.iloc[0].to_dict(), out=out) is out
+
+
+def test_unknown_column():
+    """A model column the extractor cannot produce fails at compile time"""
+    with pytest.raises(KeyError):
+        CompiledFeatureExtractor(LoginFeatureEngineer(), ['hour', 'not_a_feature'])
+
+
+def test_predict_row_matches_predict(sample_data):
+    """predict() on dict features is a thin wrapper over predict_row()"""
+    engineer = LoginFeatureEngineer()
+    engineer.build_all_profiles(sample_data)
+    detector = LoginAnomalyDetector(contamination=0.1)
+    detector.train(engineer.engineer_features_batch(sample_data))
+    extractor = CompiledFeatureExtractor(engineer, detector.feature_columns)
+
+    for _, event in sample_data.head(50).iterrows():
+        event = event.to_dict()
+        expected = detector.predict(engineer.engineer_features(event))
+        is_anomaly, risk_score, reasons = detector.predict_row(extractor.extract(event))
+
+        assert is_anomaly == expected[0]
+        assert risk_score == pytest.approx(expected[1])
+        assert reasons == expected[2]
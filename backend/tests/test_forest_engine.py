@@ -0,0 +1,154 @@
+import pytest
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from app.ml.forest_engine import ForestEngine
+from app.ml.anomaly_detector import LoginAnomalyDetector
+from app.ml.feature_engineering import LoginFeatureEngineer
+from app.ml.data_generator import SyntheticLoginDataGenerator
+
+
+@pytest.fixture(scope='module')
+def data():
+    """Training and scoring matrices"""
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(3000, 13)), rng.normal(size=(1500, 13)) * 2
+
+
+@pytest.mark.parametrize('params', [
+    {},
+    {'max_features': 0.5},
+    {'max_samples': 1000},
+    {'n_estimators': 7, 'max_samples': 2},
+])
+def test_scores_match_sklearn(data, params):
+    """Engine scores and decisions equal IsolationForest's"""
+    X_train, X = data
+    model = IsolationForest(random_state=0, **params).fit(X_train)
+    engine = ForestEngine.from_sklearn(model)
+
+    np.testing.assert_allclose(engine.score_samples(X), model.score_samples(X), rtol=1e-12, atol=1e-15)
+    np.testing.assert_array_equal(engine.decision_function(X) < 0, model.predict(X) == -1)
+
+
+def test_leaves_match_sklearn(data):
+    """Each row lands in the same leaf as sklearn's tree.apply"""
+    X_train, X = data
+    model = IsolationForest(n_estimators=20, random_state=0).fit(X_train)
+    engine = ForestEngine.from_sklearn(model)
+
+    leaves = engine.leaves(X) - engine.roots
+    for tree_idx, estimator in enumerate(model.estimators_):
+        np.testing.assert_array_equal(leaves[:, tree_idx], estimator.apply(X.astype(np.float32)))
+
+
+def test_single_row_and_blocks(data):
+    """Scores do not depend on how rows are split into calls or blocks"""
+    X_train, X = data
+    engine = ForestEngine.from_sklearn(IsolationForest(random_state=0).fit(X_train))
+    expected = engine.score_samples(X)
+
+    np.testing.assert_allclose([engine.score_samples(X[i:i + 1])[0] for i in range(20)], expected[:20])
+    assert len(X) > engine.BLOCK_ROWS
+
+
+def test_detector_uses_engine():
+    """Detector decisions are identical with and without the engine"""
+    df = SyntheticLoginDataGenerator(num_users=10, days=7).generate_dataset(anomaly_percentage=0.1)
+    engineer = LoginFeatureEngineer()
+    engineer.build_all_profiles(df)
+    features_df = engineer.engineer_features_batch(df)
+
+    detector = LoginAnomalyDetector(contamination=0.1)
+    detector.train(features_df)
+    assert detector.engine is not None
+
+    with_engine = detector.predict_batch(features_df)
+    detector.engine = None
+    without_engine = detector.predict_batch(features_df)
+
+    np.testing.assert_array_equal(with_engine['is_anomaly'], without_engine['is_anomaly'])
+    # Calibration is steep where training scores are dense, so last-bit score
+    # differences (summation order) show up slightly amplified
+    np.testing.assert_allclose(with_engine['risk_score'], without_engine['risk_score'], atol=1e-9)
+
+
+def test_fused_scaler_decisions_identical():
+    """Folding the scaler into thresholds gives bit-identical leaves and scores"""
+    from sklearn.preprocessing import StandardScaler
+
+    rng = np.random.default_rng(1)
+    scale = np.array([1, 1e3, 1e-3, 50, 2, 3, 4, 5, 6, 7, 8, 9, 1e5])
+    shift = np.array([0, 1e4, 3, -40, 0, 0, 0, 0, 0, 0, 0, 0, 1e6])
+    X_train = rng.normal(size=(3000, 13)) * scale + shift
+    scaler = StandardScaler().fit(X_train)
+    engine = ForestEngine.from_sklearn(IsolationForest(random_state=0).fit(scaler.transform(X_train)))
+    fused = engine.fuse_scaler(scaler)
+    assert fused.fused and not engine.fused
+
+    # Rows sitting exactly on, and one ulp either side of, fused thresholds
+    splits = np.flatnonzero(np.isfinite(fused.threshold))[:500]
+    X = np.repeat(X_train[:1], 3 * len(splits), axis=0)
+    for k, node in enumerate(splits):
+        t = fused.threshold[node]
+        X[3 * k:3 * k + 3, fused.feature[node]] = [np.nextafter(t, -np.inf), t, np.nextafter(t, np.inf)]
+    X = np.vstack([X, X_train[:1000]])
+
+    np.testing.assert_array_equal(fused.leaves(X), engine.leaves(scaler.transform(X)))
+    np.testing.assert_array_equal(fused.score_samples(X), engine.score_samples(scaler.transform(X)))
+
+
+def test_detector_fused_matches_sklearn():
+    """The default fused detector decides exactly like scaler + sklearn"""
+    df = SyntheticLoginDataGenerator(num_users=10, days=7).generate_dataset(anomaly_percentage=0.1)
+    engineer = LoginFeatureEngineer()
+    engineer.build_all_profiles(df)
+    features_df = engineer.engineer_features_batch(df)
+
+    detector = LoginAnomalyDetector(contamination=0.1)
+    detector.train(features_df)
+    assert detector.engine.fused
+
+    X = features_df[detector.feature_columns].to_numpy(dtype=np.float64)
+    X_scaled = detector.scaler.transform(X)
+    np.testing.assert_array_equal(detector._score_samples(X) < detector.model.offset_,
+                                  detector.model.predict(X_scaled) == -1)
+    np.testing.assert_allclose(detector._score_samples(X), detector.model.score_samples(X_scaled), rtol=1e-12)
+
+
+def test_attribution_matches_decision_paths(data):
+    """Contributions equal depth-weighted credits recomputed from sklearn's decision paths"""
+    X_train, X = data
+    model = IsolationForest(n_estimators=15, max_features=0.7, random_state=0).fit(X_train)
+    engine = ForestEngine.from_sklearn(model)
+    X = X[:300]
+
+    scores, contributions = engine.score_samples(X, attribute=True)
+    np.testing.assert_array_equal(scores, engine.score_samples(X))
+    assert contributions.shape == X.shape
+
+    expected = np.zeros_like(contributions)
+    leaves = engine.leaves(X)
+    for tree_idx, (estimator, tree_features) in enumerate(zip(model.estimators_, model.estimators_features_)):
+        tree = estimator.tree_
+        paths = estimator.decision_path(X[:, tree_features].astype(np.float32))
+        for row in range(len(X)):
+            nodes = paths.indices[paths.indptr[row]:paths.indptr[row + 1]]
+            length = max(engine.path_length[leaves[row, tree_idx]], 1.0)
+            splits = nodes[tree.children_left[nodes] != -1]
+            total = len(splits) * (len(splits) + 1) / 2
+            for depth, node in enumerate(splits):
+                expected[row, tree_features[tree.feature[node]]] += \
+                    (depth + 1) / (total * length * engine.n_trees)
+    np.testing.assert_allclose(contributions, expected, rtol=1e-12)
+
+
+def test_attribution_finds_planted_outlier_feature():
+    """The feature a row is extreme in collects the largest contribution"""
+    rng = np.random.default_rng(3)
+    X_train = rng.normal(size=(2000, 6))
+    engine = ForestEngine.from_sklearn(IsolationForest(random_state=0).fit(X_train))
+
+    X = rng.normal(size=(6, 6)) * 0.3
+    X[np.arange(6), np.arange(6)] = 6.0
+    _, contributions = engine.score_samples(X, attribute=True)
+    np.testing.assert_array_equal(contributions.argmax(axis=1), np.arange(6))
@@ -0,0 +1,54 @@
+import time
+from app.utils.geolocation import GeolocationService
+
+
+class _FakeResponse:
+    def json(self):
+        return {'latitude': 48.85, 'longitude': 2.35, 'city': 'Paris', 'country_name': 'France'}
+
+
+class _CountingSession:
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, url, timeout=None):
+        self.calls += 1
+        return _FakeResponse()
+
+
+def test_lookups_are_cached_and_primed():
+    """Resolved IPs are served from the LRU cache"""
+    service = GeolocationService(cache_size=2)
+    service.api_key = 'key'
+    service._session = session = _CountingSession()
+
+    assert service.prime(['8.8.8.8', '1.1.1.1']) == 2
+    assert service.get_location_from_ip('8.8.8.8')['city'] == 'Paris'
+    assert session.calls == 2
+
+    service.get_location_from_ip('9.9.9.9')  # evicts 1.1.1.1
+    service.get_location_from_ip('1.1.1.1')
+    assert session.calls == 4
+
+
+def test_mock_locations_not_cached():
+    """Private addresses and missing keys use the mock without caching"""
+    service = GeolocationService()
+    service.api_key = ''
+    assert service.get_location_from_ip('192.168.1.1')['city'] == 'San Francisco'
+    assert service.prime(['10.0.0.1']) == 0
+
+
+def test_priming_stops_at_budget():
+    """Priming starts no lookup once its time budget is spent"""
+    class SlowSession(_CountingSession):
+        def get(self, url, timeout=None):
+            time.sleep(0.05)
+            return super().get(url, timeout)
+
+    service = GeolocationService()
+    service.api_key = 'key'
+    service._session = session = SlowSession()
+
+    service.prime([f'8.8.8.{i}' for i in range(100)], budget=0.12)
+    assert 1 <= session.calls <= 4
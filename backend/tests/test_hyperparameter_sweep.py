@@ -0,0 +1,75 @@
+import json
+import pytest
+import numpy as np
+from app.ml.anomaly_detector import LoginAnomalyDetector
+from app.ml.hyperparameter_sweep import HyperparameterSweep, expand_grid, pareto_front
+from app.ml.model_bundle import ModelBundle
+from app.ml.model_trainer import ModelTrainingPipeline
+
+GRID = {'n_estimators': [20, 40], 'contamination': [0.05, 0.15]}
+
+
+@pytest.fixture(scope='module')
+def data():
+    """Gaussian inliers with a block of shifted outliers"""
+    rng = np.random.default_rng(0)
+    X = np.vstack([rng.normal(size=(900, 5)), rng.normal(loc=4.0, size=(100, 5))])
+    labels = np.arange(len(X)) >= 900
+    return X, labels, [f'f{i}' for i in range(5)]
+
+
+def test_expand_grid():
+    """Every combination appears once"""
+    configs = expand_grid(GRID)
+    assert len(configs) == 4
+    assert {tuple(sorted(c.items())) for c in configs} == {
+        (('contamination', c), ('n_estimators', n)) for c in (0.05, 0.15) for n in (20, 40)
+    }
+
+
+def test_pareto_front():
+    """Dominated results are excluded, trade-offs kept"""
+    results = [
+        {'f1_score': 0.9, 'train_seconds': 2.0, 'latency_us': 100},
+        {'f1_score': 0.8, 'train_seconds': 1.0, 'latency_us': 100},
+        {'f1_score': 0.8, 'train_seconds': 2.0, 'latency_us': 100},  # dominated by both
+        {'f1_score': 0.9, 'train_seconds': 2.0, 'latency_us': 120},  # dominated by the first
+    ]
+    assert pareto_front(results) == [0, 1]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_sweep_matches_direct_training(tmp_path, data, workers):
+    """Workers on the shared matrix get the same metrics as training here"""
+    X, labels, columns = data
+    sweep = HyperparameterSweep(str(tmp_path), grid=GRID, workers=workers, latency_rows=20)
+    results = sweep.run(X, labels, columns)
+
+    assert len(results) == 4
+    assert not (tmp_path / 'features.npy').exists()
+    for result in results:
+        detector = LoginAnomalyDetector(model_path=str(tmp_path), contamination=result['contamination'],
+                                        n_estimators=result['n_estimators'])
+        detector.train_matrix(X, columns)
+        assert detector.evaluate_matrix(X, labels)['f1_score'] == pytest.approx(result['f1_score'])
+        assert result['train_seconds'] > 0 and result['latency_us'] > 0
+
+    best = sweep.best()
+    assert best['pareto']
+    assert best['f1_score'] == max(results[i]['f1_score'] for i in sweep.front)
+    assert set(sweep.best_params()) == set(GRID)
+
+
+def test_pipeline_sweep_saves_best_model(tmp_path):
+    """run_sweep saves the selected configuration and writes the results"""
+    pipeline = ModelTrainingPipeline(data_path=str(tmp_path / 'data'), model_path=str(tmp_path / 'models'))
+    results = pipeline.run_sweep(num_users=8, days=5, grid=GRID, workers=2)
+
+    best = max((r for r in results if r['pareto']), key=lambda r: (r['f1_score'], -r['latency_us'],
+                                                                    -r['train_seconds']))
+    manifest = ModelBundle(str(tmp_path / 'models' / 'login_anomaly_detector.bundle')).manifest
+    assert manifest['contamination'] == best['contamination']
+    assert manifest['forest']['n_estimators'] == best['n_estimators']
+
+    with open(tmp_path / 'data' / 'sweep' / 'results.json') as f:
+        assert json.load(f) == results
@@ -0,0 +1,124 @@
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from app.ml.data_generator import SyntheticLoginDataGenerator
+from app.ml.feature_engineering import LoginFeatureEngineer
+from app.ml.login_history import (
+    LoginHistory, HISTORY_FEATURE_COLUMNS, MAX_GAP_SECONDS
+)
+
+SAN_FRANCISCO = (37.7749, -122.4194)
+MOSCOW = (55.7558, 37.6173)
+
+
+@pytest.fixture
+def sample_data():
+    """Generate sample login data"""
+    generator = SyntheticLoginDataGenerator(num_users=10, days=7)
+    return generator.generate_dataset(anomaly_percentage=0.2)
+
+
+def test_first_login_has_no_history():
+    """Without previous logins, the gap is capped and speed is zero"""
+    history = LoginHistory()
+
+    features = history.extract_features('user_001', datetime(2024, 1, 15, 10, 0),
+                                        *SAN_FRANCISCO, 'Chrome/Windows')
+
+    assert features == {
+        'seconds_since_last_login': float(MAX_GAP_SECONDS),
+        'travel_speed_kmh': 0.0,
+        'device_switches': 0
+    }
+
+
+def test_impossible_travel_speed():
+    """San Francisco to Moscow in one hour is flagged by travel speed"""
+    history = LoginHistory()
+    start = datetime(2024, 1, 15, 10, 0)
+    history.record('user_001', start, *SAN_FRANCISCO, 'Chrome/Windows')
+
+    features = history.extract_features('user_001', start + timedelta(hours=1),
+                                        *MOSCOW, 'Chrome/Windows')
+
+    assert features['seconds_since_last_login'] == 3600
+    assert features['travel_speed_kmh'] > 9000
+    assert features['device_switches'] == 0
+
+
+def test_device_switches_bounded_by_capacity():
+    """Only the last `capacity` logins count toward device switches"""
+    history = LoginHistory(capacity=3)
+    start = datetime(2024, 1, 15, 10, 0)
+    for i, device in enumerate(['A/x', 'B/x', 'A/x', 'B/x', 'A/x']):
+        history.record('user_001', start + timedelta(hours=i), *SAN_FRANCISCO, device)
+
+    features = history.extract_features('user_001', start + timedelta(hours=6),
+                                        *SAN_FRANCISCO, 'B/x')
+
+    assert features['device_switches'] == 3
+
+
+def test_lru_eviction():
+    """The least recently seen user is evicted beyond max_users"""
+    history = LoginHistory(max_users=2)
+    start = datetime(2024, 1, 15, 10, 0)
+    history.record('user_001', start, *SAN_FRANCISCO, 'Chrome/Windows')
+    history.record('user_002', start, *SAN_FRANCISCO, 'Chrome/Windows')
+    history.record('user_001', start, *SAN_FRANCISCO, 'Chrome/Windows')
+    history.record('user_003', start, *SAN_FRANCISCO, 'Chrome/Windows')
+
+    assert len(history) == 2
+    assert 'user_001' in history
+    assert 'user_002' not in history
+
+
+def test_batch_matches_ring_buffer_replay(sample_data):
+    """Batch velocity features equal replaying events through the ring buffer"""
+    engineer = LoginFeatureEngineer(login_history=LoginHistory(capacity=3))
+    batch_df = engineer.engineer_features_batch(sample_data)
+
+    replay = LoginHistory(capacity=3)
+    ordered = sample_data.assign(_pos=np.arange(len(sample_data))).sort_values(
+        ['user_id', 'timestamp'], kind='mergesort')
+    expected = {}
+    for event in ordered.to_dict('records'):
+        device = f"{event['device_info']['browser']}/{event['device_info']['os']}"
+        expected[event['_pos']] = replay.extract_features(
+            event['user_id'], event['timestamp'],
+            event['location']['latitude'], event['location']['longitude'], device
+        )
+        replay.record_event(event)
+
+    expected_df = pd.DataFrame([expected[i] for i in range(len(sample_data))])
+    pd.testing.assert_frame_equal(batch_df[HISTORY_FEATURE_COLUMNS], expected_df,
+                                  check_dtype=False, rtol=1e-9)
+
+
+def test_engineer_adds_history_features(sample_data):
+    """Velocity features are appended only when a history is attached"""
+    plain = LoginFeatureEngineer().engineer_features_batch(sample_data)
+    with_history = LoginFeatureEngineer(login_history=LoginHistory()).engineer_features_batch(sample_data)
+
+    assert not set(HISTORY_FEATURE_COLUMNS) & set(plain.columns)
+    assert with_history.columns.tolist()[13:16] == HISTORY_FEATURE_COLUMNS
+
+    event = sample_data.iloc[0].to_dict()
+    features = LoginFeatureEngineer(login_history=LoginHistory()).engineer_features(event)
+    assert list(features)[-3:] == HISTORY_FEATURE_COLUMNS
+
+
+def test_generated_impossible_travel(sample_data):
+    """Generated impossible-travel anomalies show up as extreme travel speeds"""
+    generator = SyntheticLoginDataGenerator(num_users=5, days=3)
+    user = generator.users[0]
+    date = datetime(2024, 1, 15).date()
+
+    login = generator.generate_anomalous_login(user, date, 'impossible_travel')
+
+    assert login['is_anomaly'] is True
+    assert login['location']['country'] != 'USA'
+
+    features_df = LoginFeatureEngineer(login_history=LoginHistory()).engineer_features_batch(sample_data)
+    assert features_df['travel_speed_kmh'].max() > 1000
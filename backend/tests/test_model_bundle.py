@@ -0,0 +1,133 @@
+import os
+import pytest
+import numpy as np
+from app.ml.model_bundle import ModelBundle, write_bundle, read_manifest, ALIGNMENT
+from app.ml.anomaly_detector import LoginAnomalyDetector
+from app.ml.feature_engineering import LoginFeatureEngineer
+from app.ml.data_generator import SyntheticLoginDataGenerator
+
+
+@pytest.fixture(scope='module')
+def trained():
+    """Detector and engineer trained on a small generated dataset"""
+    df = SyntheticLoginDataGenerator(num_users=15, days=7).generate_dataset(anomaly_percentage=0.1)
+    engineer = LoginFeatureEngineer()
+    engineer.build_all_profiles(df)
+    features_df = engineer.engineer_features_batch(df)
+
+    detector = LoginAnomalyDetector(contamination=0.1)
+    detector.train(features_df)
+    return detector, engineer, features_df
+
+
+def test_roundtrip_and_alignment(tmp_path):
+    """Sections come back equal, aligned and read-only"""
+    path = str(tmp_path / 'test.bundle')
+    sections = {
+        'a/float': np.linspace(0, 1, 7),
+        'a/int': np.arange(12, dtype=np.int32).reshape(3, 4),
+        'b/bytes': np.array([b'x', b'yy', b'zzz']),
+        'b/empty': np.zeros(0, dtype=np.float32),
+    }
+    written = write_bundle(path, sections, {'name': 'test'})
+
+    bundle = ModelBundle(path)
+    assert bundle.manifest['name'] == 'test'
+    assert bundle.manifest['version'] == written['version']
+    assert bundle.manifest['checksum'] == written['checksum']
+    for name, array in sections.items():
+        loaded = bundle.array(name)
+        np.testing.assert_array_equal(loaded, array)
+        assert loaded.dtype == array.dtype
+        assert bundle.sections[name]['file_offset'] % ALIGNMENT == 0
+        assert not loaded.flags.writeable
+    assert set(bundle.arrays('a')) == {'float', 'int'}
+    assert read_manifest(path) == bundle.manifest
+    assert os.listdir(tmp_path) == ['test.bundle']
+
+
+def test_corrupt_section_detected(tmp_path):
+    """A flipped byte fails the section checksum on access"""
+    path = str(tmp_path / 'test.bundle')
+    write_bundle(path, {'x': np.arange(100.0), 'y': np.arange(5.0)}, {})
+    offset = ModelBundle(path).sections['x']['file_offset']
+    with open(path, 'r+b') as f:
+        f.seek(offset + 3)
+        f.write(b'\xff')
+
+    bundle = ModelBundle(path)
+    np.testing.assert_array_equal(bundle.array('y'), np.arange(5.0))
+    with pytest.raises(ValueError):
+        bundle.array('x')
+
+
+def test_not_a_bundle(tmp_path):
+    """Other files are rejected"""
+    path = tmp_path / 'model.pkl'
+    path.write_bytes(b'not a bundle at all')
+    with pytest.raises(ValueError):
+        ModelBundle(str(path))
+    with pytest.raises(FileNotFoundError):
+        ModelBundle(str(tmp_path / 'missing.bundle'))
+
+
+def test_detector_bundle_roundtrip(tmp_path, trained):
+    """A loaded bundle predicts exactly like the trained detector"""
+    detector, engineer, features_df = trained
+    detector.model_path = str(tmp_path)
+    bundle_file = detector.save_model(profiles=engineer.user_profiles)
+    assert os.listdir(tmp_path) == [os.path.basename(bundle_file)]
+
+    loaded = LoginAnomalyDetector(model_path=str(tmp_path))
+    loaded.load_model()
+    assert loaded.model_version == detector.model_version
+    assert loaded.feature_columns == detector.feature_columns
+    np.testing.assert_array_equal(loaded.calibration, detector.calibration)
+    np.testing.assert_array_equal(loaded.attribution_baseline, detector.attribution_baseline)
+
+    expected = detector.predict_batch(features_df)
+    results = loaded.predict_batch(features_df)
+    np.testing.assert_array_equal(results['is_anomaly'], expected['is_anomaly'])
+    np.testing.assert_array_equal(results['risk_score'], expected['risk_score'])
+    assert results['reasons'] == expected['reasons']
+    assert loaded.predict_batch(features_df, explain=True)['reasons'] == \
+        detector.predict_batch(features_df, explain=True)['reasons']
+
+
+def test_lazy_model_and_profiles(tmp_path, trained):
+    """The sklearn model is only unpickled when a large batch needs it"""
+    detector, engineer, features_df = trained
+    detector.model_path = str(tmp_path)
+    detector.save_model(profiles=engineer.user_profiles)
+
+    loaded = LoginAnomalyDetector(model_path=str(tmp_path))
+    loaded.load_model()
+    X = features_df[loaded.feature_columns].to_numpy()
+    loaded.predict_batch(X[:10])
+    assert loaded._model is None
+
+    loaded.ENGINE_MAX_ROWS = 5
+    loaded.predict_batch(X[:10])
+    assert loaded._model is not None
+
+    profiles = loaded.load_profiles()
+    assert set(profiles) == set(engineer.user_profiles)
+    user_id = next(iter(engineer.user_profiles))
+    assert profiles[user_id]['typical_hours'] == engineer.user_profiles[user_id]['typical_hours']
+
+
+def test_legacy_pickles_still_load(tmp_path, trained):
+    """Model directories without a bundle fall back to the joblib layout"""
+    import joblib
+
+    detector, _, features_df = trained
+    joblib.dump(detector.model, tmp_path / 'login_anomaly_detector.pkl')
+    joblib.dump(detector.scaler, tmp_path / 'login_anomaly_detector_scaler.pkl')
+    joblib.dump(detector.feature_columns, tmp_path / 'login_anomaly_detector_features.pkl')
+
+    loaded = LoginAnomalyDetector(model_path=str(tmp_path))
+    loaded.load_model()
+    assert loaded.model_version is None
+    assert loaded.calibration is None
+    np.testing.assert_array_equal(loaded.predict_batch(features_df)['is_anomaly'],
+                                  detector.predict_batch(features_df)['is_anomaly'])
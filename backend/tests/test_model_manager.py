@@ -0,0 +1,195 @@
+import threading
+import pytest
+import numpy as np
+import pandas as pd
+import jwt
+from datetime import datetime, timedelta
+from app import create_app
+from app.config import Config
+from app.ml.anomaly_detector import LoginAnomalyDetector
+from app.ml.feature_engineering import FEATURE_COLUMNS
+from app.ml.model_manager import ModelManager
+
+
+def _save_bundle(model_path, seed, model_name='login_anomaly_detector'):
+    """Train a detector on random features and save it as a bundle"""
+    rng = np.random.default_rng(seed)
+    features_df = pd.DataFrame(rng.normal(size=(500, len(FEATURE_COLUMNS))), columns=FEATURE_COLUMNS)
+    detector = LoginAnomalyDetector(model_path=str(model_path))
+    detector.train(features_df)
+    detector.save_model(model_name)
+    return detector.model_version
+
+
+def _token(role):
+    return jwt.encode({
+        'user_id': 'u1', 'username': 'ops', 'role': role,
+        'exp': datetime.utcnow() + timedelta(hours=1)
+    }, Config.JWT_SECRET_KEY, algorithm='HS256')
+
+
+def test_initial_load_and_reload(tmp_path):
+    """A reload swaps in the new version and keeps the old one for rollback"""
+    first = _save_bundle(tmp_path, seed=0)
+    swapped = []
+    manager = ModelManager(str(tmp_path), on_swap=swapped.append)
+    manager.load_initial()
+    assert manager.current().version == first
+
+    second = _save_bundle(tmp_path, seed=1)
+    assert second != first
+    old = manager.current()
+    assert manager.reload(wait=True)
+    assert manager.current().version == second
+    assert [model.version for model in swapped] == [first, second]
+
+    # Requests holding the old version keep a working detector
+    assert old.detector.predict_row(np.zeros((1, len(FEATURE_COLUMNS))))[1] >= 0
+
+    assert manager.rollback().version == first
+    assert manager.current() is old
+    assert manager.status()['previous']['version'] == second
+
+
+def test_missing_model_leaves_untrained_detector(tmp_path):
+    """Startup without a model serves 'not trained' errors until a reload"""
+    manager = ModelManager(str(tmp_path))
+    manager.load_initial()
+    assert manager.current().version is None
+    with pytest.raises(ValueError):
+        manager.detector.predict_row(np.zeros((1, len(FEATURE_COLUMNS))))
+
+    version = _save_bundle(tmp_path, seed=0)
+    manager.reload(wait=True)
+    assert manager.current().version == version
+
+
+def test_failed_reload_keeps_active(tmp_path):
+    """A corrupt artifact never replaces the serving model"""
+    version = _save_bundle(tmp_path, seed=0)
+    manager = ModelManager(str(tmp_path))
+    manager.load_initial()
+
+    bad = tmp_path / 'bad.bundle'
+    bad.write_bytes(b'garbage')
+    manager.reload(path=str(bad), wait=True)
+
+    assert manager.current().version == version
+    assert manager.status()['last_error']
+
+
+def test_pin_blocks_reload(tmp_path):
+    """Pinned versions ignore reloads unless forced"""
+    first = _save_bundle(tmp_path, seed=0)
+    manager = ModelManager(str(tmp_path))
+    manager.load_initial()
+    assert manager.pin() == first
+
+    second = _save_bundle(tmp_path, seed=1)
+    assert not manager.reload(wait=True)
+    assert manager.current().version == first
+
+    assert manager.reload(wait=True, force=True)
+    assert manager.current().version == second
+
+    # Pinning the previous version rolls back to it
+    manager.unpin()
+    manager.pin(first)
+    assert manager.current().version == first
+    with pytest.raises(ValueError):
+        manager.pin('no-such-version')
+
+
+def test_reads_during_swaps(tmp_path):
+    """Concurrent readers always see a complete, usable version"""
+    _save_bundle(tmp_path, seed=0)
+    manager = ModelManager(str(tmp_path), warmup_rows=1)
+    manager.load_initial()
+    row = np.zeros((1, len(FEATURE_COLUMNS)))
+    errors = []
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            try:
+                manager.current().detector.predict_row(row)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for seed in (1, 2, 3):
+        _save_bundle(tmp_path, seed=seed)
+        manager.reload(wait=True)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+
+
+@pytest.fixture
+def admin_app(tmp_path):
+    """App whose model directory holds a bundle (no database needed)"""
+    from app.config import TestingConfig
+    import app.api.login_analysis as login_analysis_module
+
+    original = TestingConfig.MODEL_PATH
+    TestingConfig.MODEL_PATH = str(tmp_path)
+    _save_bundle(tmp_path, seed=0)
+    yield create_app('testing')
+    TestingConfig.MODEL_PATH = original
+    login_analysis_module._model_manager = None
+
+
+def test_model_admin_endpoints(admin_app, tmp_path):
+    """Admins can reload, pin and roll back; analysts cannot"""
+    client = admin_app.test_client()
+    admin = {'Authorization': f"Bearer {_token('admin')}"}
+    analyst = {'Authorization': f"Bearer {_token('analyst')}"}
+
+    status = client.get('/api/login/model', headers=analyst).get_json()
+    first = status['active']['version']
+    assert first
+
+    assert client.post('/api/login/model/reload', headers=analyst).status_code == 403
+
+    second = _save_bundle(tmp_path, seed=1)
+    response = client.post('/api/login/model/reload', json={'wait': True}, headers=admin)
+    assert response.status_code == 202
+    assert response.get_json()['active']['version'] == second
+
+    response = client.post('/api/login/model/reload', json={'path': '/etc/passwd'}, headers=admin)
+    assert response.status_code == 400
+
+    response = client.post('/api/login/model/pin', json={'version': first}, headers=admin)
+    assert response.status_code == 200
+    assert response.get_json()['active']['version'] == first
+    assert response.get_json()['pinned_version'] == first
+    assert client.post('/api/login/model/reload', headers=admin).status_code == 409
+
+    assert client.post('/api/login/model/unpin', headers=admin).get_json()['pinned_version'] is None
+    response = client.post('/api/login/model/rollback', headers=admin)
+    assert response.get_json()['active']['version'] == second
+
+
+def test_watcher_keeps_rollback(tmp_path):
+    """The watcher picks up new bundles but does not undo a rollback"""
+    first = _save_bundle(tmp_path, seed=0)
+    manager = ModelManager(str(tmp_path), reload_interval=0.05)
+    try:
+        manager.load_initial()
+        second = _save_bundle(tmp_path, seed=1)
+        for _ in range(200):
+            if manager.current().version == second:
+                break
+            threading.Event().wait(0.05)
+        assert manager.current().version == second
+
+        assert manager.rollback().version == first
+        threading.Event().wait(0.5)
+        assert manager.current().version == first
+        assert manager.status()['reloading'] is False
+    finally:
+        manager.close()
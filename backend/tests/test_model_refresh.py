@@ -0,0 +1,115 @@
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+from app.ml.anomaly_detector import LoginAnomalyDetector
+from app.ml.data_generator import SyntheticLoginDataGenerator
+from app.ml.model_bundle import ModelBundle
+from app.ml.model_trainer import ModelTrainingPipeline
+from tests.test_streaming_training import _FakeCollection
+
+COLUMNS = [f'f{i}' for i in range(6)]
+
+
+@pytest.fixture
+def detector(tmp_path):
+    """Detector trained on standard normal rows"""
+    rng = np.random.default_rng(0)
+    detector = LoginAnomalyDetector(model_path=str(tmp_path), contamination=0.1, n_estimators=20)
+    detector.train_matrix(rng.normal(size=(2000, 6)), COLUMNS)
+    return detector
+
+
+def _recent(seed=1, n=1000):
+    """Drifted rows: shifted mean, wider spread"""
+    return np.random.default_rng(seed).normal(loc=0.5, scale=1.5, size=(n, 6))
+
+
+def test_refresh_retires_oldest_trees(detector):
+    """Each refresh replaces the oldest generation first"""
+    first = detector.refresh(_recent(1), n_trees=8)
+    assert first['generation'] == 1 and first['retired'] == [0] * 8
+    assert len(detector.model.estimators_) == 20
+
+    second = detector.refresh(_recent(2), n_trees=15)
+    assert second['retired'] == [0] * 12 + [1] * 3
+    assert sorted(detector.tree_generation.tolist()) == [1] * 5 + [2] * 15
+
+
+def test_kept_trees_split_same_raw_values(detector):
+    """Moving thresholds to the new scaling leaves kept trees' leaves unchanged"""
+    X = _recent(3)
+    old_scaler = detector.scaler
+    old_leaves = [est.apply(old_scaler.transform(X).astype(np.float32)) for est in detector.model.estimators_]
+
+    detector.refresh(_recent(1), n_trees=5)
+    assert not np.allclose(detector.scaler.mean_, old_scaler.mean_)
+
+    new_leaves = [est.apply(detector.scaler.transform(X).astype(np.float32))
+                  for est in detector.model.estimators_[:15]]
+    for old, new in zip(old_leaves[5:], new_leaves):
+        np.testing.assert_array_equal(old, new)
+
+
+def test_refresh_recomputes_offset_and_engine(detector):
+    """The offset flags `contamination` of the recent rows and the engine matches sklearn"""
+    X = _recent(1)
+    summary = detector.refresh(X, n_trees=5)
+
+    X_scaled = detector.scaler.transform(X)
+    scores = detector.model.score_samples(X_scaled)
+    assert summary['offset'] == pytest.approx(np.percentile(scores, 10.0))
+    assert np.mean(scores < detector.model.offset_) == pytest.approx(0.1, abs=0.01)
+
+    np.testing.assert_allclose(detector._score_samples(X[:200]), scores[:200], rtol=1e-12)
+    np.testing.assert_array_equal(detector.predict_batch(X)['is_anomaly'], detector.model.predict(X_scaled) == -1)
+
+
+def test_refresh_validates_input(detector):
+    """Too few rows or an invalid tree count leave the detector unchanged"""
+    model = detector.model
+    with pytest.raises(ValueError):
+        detector.refresh(_recent(n=100))
+    with pytest.raises(ValueError):
+        detector.refresh(_recent(), n_trees=21)
+    assert detector.model is model
+    assert (detector.tree_generation == 0).all()
+
+
+def test_tree_generations_survive_bundle(detector, tmp_path):
+    """Generations and refresh time are saved, and a refreshed save is a new version"""
+    path = detector.save_model('refresh')
+    version = ModelBundle(path).manifest['version']
+    detector.refresh(_recent(1))
+    detector.save_model('refresh')
+
+    loaded = LoginAnomalyDetector(model_path=str(tmp_path))
+    loaded.load_model('refresh')
+    np.testing.assert_array_equal(loaded.tree_generation, detector.tree_generation)
+    assert loaded.refreshed_at == detector.refreshed_at
+    assert loaded.model_version != version
+    assert ModelBundle(path).manifest['refresh']['generation'] == 1
+
+
+def test_pipeline_refresh_from_recent_events(tmp_path):
+    """run_refresh grows new trees on the last day of login_events and saves a new version"""
+    pipeline = ModelTrainingPipeline(data_path=str(tmp_path / 'data'), model_path=str(tmp_path / 'models'))
+    pipeline.run_full_pipeline(num_users=10, days=5)
+    version = pipeline.detector.model_version
+
+    # Generated events end now, so all of them are inside the refresh window
+    df = SyntheticLoginDataGenerator(num_users=60, days=1, seed=3).generate_dataset()
+    old = dict(df.to_dict('records')[0], timestamp=pd.Timestamp.utcnow().tz_localize(None) - timedelta(days=5))
+    documents = [dict(doc, timestamp=doc['timestamp'].to_pydatetime()) for doc in df.to_dict('records') + [old]]
+
+    refresher = ModelTrainingPipeline(data_path=str(tmp_path / 'data'), model_path=str(tmp_path / 'models'))
+    summary = refresher.run_refresh(collection=_FakeCollection(documents), days=2, n_trees=30)
+
+    assert summary['grown'] == 30 and summary['rows'] == len(df)
+    assert refresher.detector.model_version != version
+    assert set(refresher.metrics.to_dict()) == {'load', 'features', 'refresh', 'save'}
+
+    reloaded = LoginAnomalyDetector(model_path=str(tmp_path / 'models'))
+    reloaded.load_model()
+    assert (reloaded.tree_generation == 1).sum() == 30
+    assert reloaded.load_profiles() is not None
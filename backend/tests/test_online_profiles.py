@@ -0,0 +1,232 @@
+import pytest
+import random
+from datetime import datetime, timedelta
+from app.ml.feature_engineering import LoginFeatureEngineer
+from app.ml.online_profiles import StreamingMedian, OnlineProfile, OnlineProfileUpdater
+
+
+@pytest.fixture
+def base_profiles():
+    """One batch-built profile for a user in San Francisco"""
+    return {
+        'user_001': {
+            'user_id': 'user_001',
+            'typical_hours': [10],
+            'typical_location': {'latitude': 37.7749, 'longitude': -122.4194},
+            'devices': ['Chrome/Windows'],
+            'avg_logins_per_day': 2.0,
+            'typical_days': [1, 2]
+        }
+    }
+
+
+def _login(user_id='user_001', timestamp=None, lat=37.7749, lon=-122.4194,
+           browser='Chrome', os_name='Windows'):
+    return {
+        'user_id': user_id,
+        'timestamp': (timestamp or datetime(2024, 1, 15, 10, 0)).isoformat(),
+        'location': {'latitude': lat, 'longitude': lon},
+        'device_info': {'browser': browser, 'os': os_name, 'device_type': 'desktop'},
+        'success': True
+    }
+
+
+def test_streaming_median_converges():
+    """The estimate settles near the median of a stable distribution"""
+    rng = random.Random(0)
+    median = StreamingMedian()
+    for _ in range(2000):
+        median.update(rng.gauss(40.0, 0.1))
+
+    assert median.value == pytest.approx(40.0, abs=0.05)
+
+
+def test_streaming_median_tracks_relocation():
+    """A sustained move is tracked within a few dozen events"""
+    median = StreamingMedian(value=37.7)
+    for _ in range(30):
+        median.update(51.5)
+
+    assert median.value == pytest.approx(51.5, abs=0.01)
+
+
+def test_new_device_becomes_typical(base_profiles):
+    """A new laptop is atypical on first use and typical after that"""
+    engineer = LoginFeatureEngineer()
+    engineer.user_profiles = OnlineProfileUpdater(base=base_profiles)
+    event = _login(browser='Firefox', os_name='macOS')
+
+    assert engineer.engineer_features(event)['is_typical_device'] == 0
+
+    engineer.user_profiles.observe(event)
+
+    assert engineer.engineer_features(event)['is_typical_device'] == 1
+    assert 'Chrome/Windows' in engineer.user_profiles['user_001']['devices']
+
+
+def test_unused_device_is_forgotten():
+    """Decayed counters drop devices that stop being used"""
+    profile = OnlineProfile('user_001', half_life=5)
+    start = datetime(2024, 1, 15, 10, 0)
+    profile.update(start, 37.7, -122.4, 'Chrome/Windows')
+    for i in range(50):
+        profile.update(start + timedelta(hours=i), 37.7, -122.4, 'Firefox/macOS')
+
+    assert profile.to_profile()['devices'] == ['Firefox/macOS']
+
+
+def test_login_rate_ewma():
+    """Logins per active day is folded in as days roll over"""
+    profile = OnlineProfile('user_001')
+    start = datetime(2024, 1, 15, 10, 0)
+    for day in range(3):
+        for _ in range(4):
+            profile.update(start + timedelta(days=day), 37.7, -122.4, 'Chrome/Windows')
+
+    assert profile.to_profile()['avg_logins_per_day'] == pytest.approx(4.0)
+
+
+def test_state_round_trip():
+    """Serialized state restores to an identical profile"""
+    profile = OnlineProfile('user_001')
+    start = datetime(2024, 1, 15, 10, 0)
+    for day in range(3):
+        profile.update(start + timedelta(days=day), 37.7 + day, -122.4, 'Chrome/Windows')
+
+    restored = OnlineProfile.from_dict(profile.to_dict())
+
+    assert restored.to_profile() == profile.to_profile()
+
+
+def test_updater_flushes_in_batches(base_profiles):
+    """Dirty profiles are handed to persist in one batch and only once"""
+    persisted = []
+    updater = OnlineProfileUpdater(base=base_profiles, persist=persisted.append,
+                                   flush_interval=60, flush_batch_size=1000)
+    for user_id in ('user_001', 'user_002', 'user_001'):
+        updater.observe(_login(user_id=user_id))
+
+    assert updater.flush() == 2
+    assert updater.flush() == 0
+    updater.close()
+
+    assert len(persisted) == 1
+    assert {state['user_id'] for state in persisted[0]} == {'user_001', 'user_002'}
+
+
+def test_updater_keeps_dirty_on_persist_failure(base_profiles):
+    """Profiles are retried on the next flush if persisting fails"""
+    def failing_persist(batch):
+        raise ConnectionError('database unavailable')
+
+    updater = OnlineProfileUpdater(base=base_profiles, persist=failing_persist, flush_interval=60)
+    updater.observe(_login())
+
+    assert updater.flush() == 0
+    assert updater.dirty_count == 1
+
+
+def test_updater_resumes_persisted_state(base_profiles):
+    """A persisted state takes precedence over the batch-built profile"""
+    saved = OnlineProfile('user_001')
+    saved.update(datetime(2024, 1, 15, 10, 0), 51.5, -0.12, 'Safari/macOS')
+
+    updater = OnlineProfileUpdater(base=base_profiles)
+    assert updater.preload([saved.to_dict()]) == 1
+    updater.observe(_login(lat=51.5, lon=-0.12, browser='Safari', os_name='macOS'))
+
+    profile = updater['user_001']
+    assert profile['devices'] == ['Safari/macOS']
+    assert profile['typical_location']['latitude'] == pytest.approx(51.5)
+
+
+def test_updater_evicts_least_recent(base_profiles):
+    """Online state is capped; evicted users fall back to their base profile"""
+    updater = OnlineProfileUpdater(base=base_profiles, max_users=2)
+    updater.observe(_login(user_id='user_001', lat=51.5, lon=-0.12))
+    updater.observe(_login(user_id='user_002'))
+    updater.observe(_login(user_id='user_003'))
+
+    assert list(updater.states) == ['user_002', 'user_003']
+    assert updater['user_001'] == base_profiles['user_001']
+    assert updater.dirty_count == 0
+
+
+def test_evicted_dirty_state_is_persisted(base_profiles):
+    """A dirty user evicted before a flush is persisted and resumed from that state"""
+    persisted = []
+    updater = OnlineProfileUpdater(base=base_profiles, persist=persisted.extend,
+                                   flush_interval=60, max_users=1)
+    updater.observe(_login(user_id='user_001', browser='Safari', os_name='macOS'))
+    updater.observe(_login(user_id='user_002'))
+    assert updater.dirty_count == 2
+
+    # Seen again before the flush: resumes from its evicted state
+    updater.observe(_login(user_id='user_001', browser='Safari', os_name='macOS'))
+    assert 'Safari/macOS' in updater['user_001']['devices']
+
+    assert updater.flush() == 2
+    assert {state['user_id'] for state in persisted} == {'user_001', 'user_002'}
+    updater.close()
+
+
+def test_preload_keeps_live_state(base_profiles):
+    """Preloaded states never replace observed users or evict live ones"""
+    def saved(user_id, lat):
+        state = OnlineProfile(user_id)
+        state.update(datetime(2024, 1, 15, 10, 0), lat, 0.0, 'Safari/macOS')
+        return state.to_dict()
+
+    updater = OnlineProfileUpdater(base=base_profiles, max_users=2)
+    updater.observe(_login(user_id='user_001'))
+    assert updater.preload([saved('user_001', 51.5), saved('user_002', 48.8), saved('user_003', 40.4)]) == 1
+
+    assert updater['user_001']['typical_location']['latitude'] == pytest.approx(37.7749)
+    assert updater['user_002']['typical_location']['latitude'] == pytest.approx(48.8)
+    assert 'user_003' not in updater
+    assert list(updater.states) == ['user_002', 'user_001']
+
+
+def test_rebase_serves_retrained_profiles(base_profiles):
+    """After a model swap observed users get the retrained profile, not their old online state"""
+    persisted = []
+    updater = OnlineProfileUpdater(base=base_profiles, persist=persisted.extend,
+                                   flush_interval=60, base_version='v1')
+    updater.observe(_login(user_id='user_001', lat=51.5, lon=-0.12))
+    assert updater.flush() == 1
+    assert persisted[0]['base_version'] == 'v1'
+
+    retrained = {'user_001': dict(base_profiles['user_001'], devices=['Firefox/Linux'])}
+    updater.observe(_login(user_id='user_001', lat=51.5, lon=-0.12))
+    updater.rebase(retrained, 'v2')
+
+    assert updater['user_001'] == retrained['user_001']
+    assert updater.dirty_count == 0
+    updater.observe(_login(user_id='user_001'))
+    assert 'Firefox/Linux' in updater['user_001']['devices']
+    updater.close()
+
+
+def test_preload_skips_other_versions(base_profiles):
+    """States persisted on top of another model version are not restored"""
+    def saved(user_id, base_version):
+        state = OnlineProfile(user_id)
+        state.update(datetime(2024, 1, 15, 10, 0), 51.5, 0.0, 'Safari/macOS')
+        return dict(state.to_dict(), base_version=base_version)
+
+    updater = OnlineProfileUpdater(base=base_profiles, base_version='v2')
+    assert updater.preload([saved('user_001', 'v1'), saved('user_002', 'v2')]) == 1
+    assert list(updater.states) == ['user_002']
+    assert updater['user_001'] == base_profiles['user_001']
+
+
+def test_updater_mapping(base_profiles):
+    """Unobserved users are served from the base profiles"""
+    updater = OnlineProfileUpdater(base=base_profiles)
+    updater.observe(_login(user_id='user_002'))
+
+    assert 'user_001' in updater
+    assert 'user_002' in updater
+    assert len(updater) == 2
+    assert set(updater) == {'user_001', 'user_002'}
+    assert updater['user_001'] == base_profiles['user_001']
@@ -0,0 +1,108 @@
+import os
+import pytest
+import numpy as np
+import pandas as pd
+from app.ml.data_generator import SyntheticLoginDataGenerator
+from app.ml.model_bundle import ModelBundle
+from app.ml.model_trainer import ModelTrainingPipeline
+from app.ml.pipeline_cache import StageCache, frame_to_sections, sections_to_frame
+
+
+def _run(tmp_path, **kwargs):
+    pipeline = ModelTrainingPipeline(data_path=str(tmp_path / 'data'), model_path=str(tmp_path / 'models'),
+                                     force=kwargs.pop('force', False))
+    metrics = pipeline.run_full_pipeline(num_users=8, days=5, **kwargs)
+    cache = {name: stage.get('cache') for name, stage in pipeline.metrics.to_dict().items()}
+    return pipeline, metrics, cache
+
+
+def test_seeded_generator_is_reproducible():
+    """The same seed gives the same users and events"""
+    first = SyntheticLoginDataGenerator(num_users=5, days=3, seed=7).generate_dataset()
+    second = SyntheticLoginDataGenerator(num_users=5, days=3, seed=7).generate_dataset()
+
+    columns = ['user_id', 'ip_address', 'location', 'device_info', 'success', 'is_anomaly']
+    assert first[columns].equals(second[columns])
+
+
+def test_frame_roundtrip(tmp_path):
+    """Columns of dicts, strings and numbers survive the bundle"""
+    df = SyntheticLoginDataGenerator(num_users=5, days=3, seed=1).generate_dataset()
+    sections, layout = frame_to_sections(df)
+    assert all(array.dtype != object for array in sections.values())
+
+    cache = StageCache(str(tmp_path))
+    restored = sections_to_frame(cache.store('data', 'k', sections, {'layout': layout}), layout)
+
+    assert restored.columns.tolist() == df.columns.tolist()
+    for name in df.columns:
+        assert restored[name].tolist() == df[name].tolist(), name
+
+
+def test_key_depends_on_params_and_inputs():
+    """Keys ignore dict order but change with any parameter or input"""
+    key = StageCache.key('train', {'a': 1, 'b': 2}, ['x'])
+    assert key == StageCache.key('train', {'b': 2, 'a': 1}, ['x'])
+    assert key != StageCache.key('train', {'a': 1, 'b': 3}, ['x'])
+    assert key != StageCache.key('train', {'a': 1, 'b': 2}, ['y'])
+    assert key != StageCache.key('features', {'a': 1, 'b': 2}, ['x'])
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    """Over budget, the oldest artifacts not used by this run are removed"""
+    sections = {'values': np.zeros(100000)}
+    writer = StageCache(str(tmp_path))
+    for i, key in enumerate(['old', 'used', 'new']):
+        writer.store('data', key, sections, {})
+        os.utime(writer.path('data', key), (i, i))
+
+    size = os.path.getsize(writer.path('data', 'old'))
+    cache = StageCache(str(tmp_path), max_bytes=2 * size)
+    assert cache.load('data', 'used') is not None
+    assert cache.load('data', 'missing') is None
+    cache.evict()
+
+    remaining = sorted(name.split('-')[1].split('.')[0] for name in os.listdir(tmp_path))
+    assert remaining == ['new', 'used']
+    assert cache.size() <= cache.max_bytes
+
+
+def test_rerun_hits_every_stage(tmp_path):
+    """A second run loads data, features and model, with identical results"""
+    first, first_metrics, first_cache = _run(tmp_path)
+    second, second_metrics, second_cache = _run(tmp_path)
+
+    assert first_cache == {'data': 'miss', 'features': 'miss', 'train': 'miss', 'evaluate': None, 'save': None}
+    assert second_cache == {'data': 'hit', 'features': 'hit', 'train': 'hit', 'evaluate': None, 'save': None}
+    assert second_metrics['f1_score'] == first_metrics['f1_score']
+    assert second.detector.model_version == first.detector.model_version
+    assert len(second.engineer.user_profiles) == len(first.engineer.user_profiles)
+
+    # The restored bundle is the one the first run saved
+    bundle = ModelBundle(str(tmp_path / 'models' / 'login_anomaly_detector.bundle'))
+    assert bundle.manifest['checksum'] == first.cache.load('train', first._train_key).manifest['checksum']
+
+
+def test_changed_contamination_only_retrains(tmp_path):
+    """Upstream stages stay cached when only the training parameter changes"""
+    _run(tmp_path, contamination=0.10)
+    pipeline, _, cache = _run(tmp_path, contamination=0.05)
+
+    assert (cache['data'], cache['features'], cache['train']) == ('hit', 'hit', 'miss')
+    assert pipeline.detector.contamination == 0.05
+
+
+def test_changed_feature_options_recompute_from_features(tmp_path):
+    """Changing feature options keeps the data but invalidates features and model"""
+    _run(tmp_path)
+    _, _, cache = _run(tmp_path, use_failure_counters=True)
+
+    assert (cache['data'], cache['features'], cache['train']) == ('hit', 'miss', 'miss')
+
+
+def test_force_recomputes_everything(tmp_path):
+    """With force, no stage is loaded from the cache"""
+    _run(tmp_path)
+    _, _, cache = _run(tmp_path, force=True)
+
+    assert (cache['data'], cache['features'], cache['train']) == ('miss', 'miss', 'miss')
@@ -0,0 +1,110 @@
+import pytest
+import numpy as np
+from app.ml.data_generator import SyntheticLoginDataGenerator
+from app.ml.feature_engineering import LoginFeatureEngineer
+from app.ml.profile_store import ProfileStore
+
+
+@pytest.fixture
+def sample_data():
+    """Generate sample login data"""
+    generator = SyntheticLoginDataGenerator(num_users=20, days=7)
+    return generator.generate_dataset(anomaly_percentage=0.1)
+
+
+@pytest.fixture
+def profiles(sample_data):
+    """Profiles built from the sample data"""
+    engineer = LoginFeatureEngineer()
+    engineer.build_all_profiles(sample_data)
+    return engineer.user_profiles
+
+
+def test_store_round_trip(profiles):
+    """Every profile field survives conversion to the compact store"""
+    store = ProfileStore.from_profiles(profiles)
+
+    assert len(store) == len(profiles)
+    assert set(store) == set(profiles)
+
+    for user_id, profile in profiles.items():
+        stored = store[user_id]
+        assert stored['user_id'] == user_id
+        assert stored['typical_hours'] == sorted(profile['typical_hours'])
+        assert stored['typical_days'] == sorted(profile['typical_days'])
+        assert sorted(stored['devices']) == sorted(profile['devices'])
+        assert stored['typical_location']['latitude'] == pytest.approx(
+            profile['typical_location']['latitude'], abs=1e-4)
+        assert stored['typical_location']['longitude'] == pytest.approx(
+            profile['typical_location']['longitude'], abs=1e-4)
+        assert stored['avg_logins_per_day'] == pytest.approx(profile['avg_logins_per_day'], rel=1e-6)
+
+
+def test_store_lookup(profiles):
+    """Scalar and vectorized lookups agree and report unknown users"""
+    store = ProfileStore.from_profiles(profiles)
+    user_ids = list(profiles) + ['unknown_user']
+
+    positions = store.lookup(user_ids)
+
+    assert positions[-1] == -1
+    assert 'unknown_user' not in store
+    assert [store.index_of(user_id) for user_id in user_ids] == positions.tolist()
+    with pytest.raises(KeyError):
+        store['unknown_user']
+
+
+def test_store_save_and_mmap_load(profiles, tmp_path):
+    """Saved stores load memory-mapped with identical contents"""
+    path = str(tmp_path / 'profiles')
+    store = ProfileStore.from_profiles(profiles)
+    store.save(path)
+    store.save(path)  # overwriting an existing store is atomic
+
+    loaded = ProfileStore.load(path)
+
+    assert isinstance(loaded.latitude, np.memmap)
+    assert dict(loaded) == dict(store)
+
+
+def test_load_missing_store(tmp_path):
+    """Loading a missing store raises FileNotFoundError"""
+    with pytest.raises(FileNotFoundError):
+        ProfileStore.load(str(tmp_path / 'missing'))
+
+
+def test_engineer_with_store_matches_dict(profiles, sample_data):
+    """The engineer produces the same features from a store as from the dict"""
+    dict_engineer = LoginFeatureEngineer()
+    dict_engineer.user_profiles = profiles
+    store_engineer = LoginFeatureEngineer()
+    store_engineer.user_profiles = ProfileStore.from_profiles(profiles)
+
+    expected = dict_engineer.engineer_features_batch(sample_data)
+    actual = store_engineer.engineer_features_batch(sample_data)
+
+    np.testing.assert_array_equal(actual['is_typical_device'], expected['is_typical_device'])
+    np.testing.assert_allclose(actual['distance_from_typical'], expected['distance_from_typical'], atol=0.05)
+
+    event = sample_data.iloc[0].to_dict()
+    assert store_engineer.engineer_features(event)['is_typical_device'] == \
+        dict_engineer.engineer_features(event)['is_typical_device']
+
+
+def test_store_typical_location_not_cached_per_lookup(profiles, sample_data):
+    """Distances from a store read its radians array instead of caching per-user dicts"""
+    store = ProfileStore.from_profiles(profiles)
+    engineer = LoginFeatureEngineer()
+    engineer.user_profiles = store
+    dict_engineer = LoginFeatureEngineer()
+    dict_engineer.user_profiles = profiles
+
+    for event in sample_data.head(50).to_dict('records'):
+        actual = engineer.extract_location_features(event['location'], event['user_id'])
+        expected = dict_engineer.extract_location_features(event['location'], event['user_id'])
+        assert actual['distance_from_typical'] == pytest.approx(expected['distance_from_typical'], abs=0.05)
+
+    assert engineer._typical_location_rad == {}
+
+    no_location = ProfileStore.from_profiles({'u': {'user_id': 'u', 'typical_location': None}})
+    assert no_location.typical_location_rad(0) is None
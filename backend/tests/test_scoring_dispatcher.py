@@ -0,0 +1,89 @@
+import threading
+import pytest
+import numpy as np
+from app.ml.anomaly_detector import LoginAnomalyDetector
+from app.ml.scoring_dispatcher import MicroBatchScorer
+
+COLUMNS = [f'f{i}' for i in range(5)]
+
+
+@pytest.fixture(scope='module')
+def detector():
+    """Detector trained on standard normal rows"""
+    detector = LoginAnomalyDetector(contamination=0.1, n_estimators=20)
+    detector.train_matrix(np.random.default_rng(0).normal(size=(1000, 5)), COLUMNS)
+    return detector
+
+
+def _rows(n, seed=1):
+    return np.random.default_rng(seed).normal(scale=2.0, size=(n, 1, 5))
+
+
+def test_concurrent_rows_share_batches(detector):
+    """Rows from many threads are scored together with predict_row's results"""
+    scorer = MicroBatchScorer(max_batch=16, max_wait_ms=50)
+    rows = _rows(64)
+    results = [None] * len(rows)
+    barrier = threading.Barrier(len(rows))
+
+    def request(i):
+        barrier.wait()
+        results[i] = scorer.score(detector, rows[i], explain=True)
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(len(rows))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    scorer.close()
+
+    for row, result in zip(rows, results):
+        is_anomaly, risk_score, reasons = detector.predict_row(row, explain=True)
+        assert result[0] == is_anomaly and result[2] == reasons
+        assert result[1] == pytest.approx(risk_score, abs=1e-12)
+
+    metrics = scorer.metrics()
+    assert metrics['rows'] == 64
+    assert metrics['batches'] < 64 and metrics['full_batches'] >= 1
+
+
+def test_lone_row_waits_at_most_max_wait(detector):
+    """A single request is scored once max_wait passes, and its buffer can be reused at once"""
+    scorer = MicroBatchScorer(max_batch=64, max_wait_ms=5)
+    row = _rows(1)[0]
+    expected = detector.predict_row(row)
+    future = scorer.submit(detector, row)
+    row[:] = 0.0
+
+    assert future.result(timeout=1) == expected
+    assert scorer.metrics()['mean_batch'] == 1
+    scorer.close()
+
+
+def test_detectors_scored_separately(detector):
+    """Rows for different detectors in one batch go to their own detector"""
+    other = LoginAnomalyDetector(contamination=0.1, n_estimators=20)
+    other.train_matrix(np.random.default_rng(5).normal(loc=3.0, size=(1000, 5)), COLUMNS)
+    scorer = MicroBatchScorer(max_batch=4, max_wait_ms=200)
+    rows = _rows(4)
+
+    futures = [scorer.submit(detector if i % 2 else other, rows[i]) for i in range(4)]
+    for i, future in enumerate(futures):
+        expected = (detector if i % 2 else other).predict_row(rows[i])
+        assert future.result(timeout=1)[1] == pytest.approx(expected[1], abs=1e-12)
+    assert scorer.metrics()['batches'] == 1
+    scorer.close()
+
+
+def test_errors_reach_every_caller(detector):
+    """A failed batch raises in each waiting request; close() rejects new rows"""
+    scorer = MicroBatchScorer(max_batch=2, max_wait_ms=200)
+    untrained = LoginAnomalyDetector()
+    futures = [scorer.submit(untrained, row) for row in _rows(2)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=1)
+
+    scorer.close()
+    with pytest.raises(RuntimeError):
+        scorer.submit(detector, _rows(1)[0])
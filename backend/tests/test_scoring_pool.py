@@ -0,0 +1,146 @@
+import os
+import signal
+import threading
+import pytest
+import numpy as np
+from app.ml.anomaly_detector import LoginAnomalyDetector
+from app.ml.scoring_pool import ProcessScoringBackend, _decode_reasons, _encode_reasons, REASON_BYTES
+
+COLUMNS = [f'f{i}' for i in range(5)]
+
+
+def _train(model_path, seed=0, columns=COLUMNS):
+    """Saved detector, reloaded from its bundle as the API serves it"""
+    detector = LoginAnomalyDetector(model_path=str(model_path), contamination=0.1, n_estimators=20)
+    detector.train_matrix(np.random.default_rng(seed).normal(size=(1000, len(columns))), columns)
+    detector.save_model('pool')
+    served = LoginAnomalyDetector(model_path=str(model_path))
+    served.load_model('pool')
+    return served
+
+
+@pytest.fixture(scope='module')
+def model_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp('pool-model')
+
+
+@pytest.fixture(scope='module')
+def pool(model_dir):
+    """Two-process pool serving a trained bundle"""
+    detector = _train(model_dir)
+    pool = ProcessScoringBackend(processes=2, slots=8)
+    pool.start(detector)
+    yield pool, detector
+    pool.close()
+
+
+def _rows(n, seed=1):
+    return np.random.default_rng(seed).normal(scale=2.0, size=(n, 1, 5))
+
+
+def _assert_same(result, expected):
+    assert result[0] == expected[0] and result[2] == expected[2]
+    assert result[1] == pytest.approx(expected[1], abs=1e-12)
+
+
+def test_workers_match_predict_row(pool):
+    """Rows scored by the workers from many threads get predict_row's verdicts"""
+    pool, detector = pool
+    rows = _rows(40)
+    results = [None] * len(rows)
+
+    def request(i):
+        results[i] = pool.score(detector, rows[i], explain=bool(i % 2))
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(len(rows))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for i, (row, result) in enumerate(zip(rows, results)):
+        _assert_same(result, detector.predict_row(row, explain=bool(i % 2)))
+    metrics = pool.metrics()
+    assert metrics['alive'] == 2 and metrics['inflight'] == 0 and metrics['in_thread'] == 0
+
+
+def test_crashed_worker_is_restarted(pool):
+    """A killed worker is replaced and requests keep being answered"""
+    pool, detector = pool
+    restarts = pool.metrics()['restarts']
+    os.kill(pool._workers[0].process.pid, signal.SIGKILL)
+
+    for row in _rows(10, seed=2):
+        _assert_same(pool.score(detector, row), detector.predict_row(row))
+    assert pool.metrics()['restarts'] == restarts + 1
+    assert pool.metrics()['alive'] == 2
+
+
+def test_unavailable_versions_score_in_thread(pool, tmp_path):
+    """A detector the workers cannot load (not from a bundle) is scored in the calling thread"""
+    pool, _ = pool
+    detector = LoginAnomalyDetector(contamination=0.1, n_estimators=10)
+    detector.train_matrix(np.random.default_rng(3).normal(size=(500, 5)), COLUMNS)
+    detector.model_version = 'in-memory'
+
+    in_thread = pool.metrics()['in_thread']
+    row = _rows(1)[0]
+    _assert_same(pool.score(detector, row), detector.predict_row(row))
+    assert pool.metrics()['in_thread'] == in_thread + 1
+
+
+def test_new_version_loaded_into_workers(tmp_path):
+    """Loading a newly saved version switches every worker to it"""
+    first = _train(tmp_path, seed=0)
+    pool = ProcessScoringBackend(processes=1, slots=4)
+    try:
+        pool.start(first)
+        second = _train(tmp_path, seed=5)
+        assert pool.load(second) and pool.version == second.model_version != first.model_version
+
+        row = _rows(1)[0]
+        _assert_same(pool.score(second, row, explain=True), second.predict_row(row, explain=True))
+
+        # The first version's bundle was replaced on disk
+        assert not pool.load(first)
+        assert pool.metrics()['in_thread'] == 0
+        pool.score(first, row)
+        assert pool.metrics()['in_thread'] == 1
+    finally:
+        pool.close()
+
+
+def test_rows_queued_across_a_swap_keep_their_model(tmp_path):
+    """Rows tagged for the previous model are scored with it, not by the newly loaded one"""
+    first = _train(tmp_path, seed=0)
+    pool = ProcessScoringBackend(processes=1, slots=4)
+    try:
+        pool.start(first)
+        old_generation = pool._loaded[1]
+        wider = _train(tmp_path, seed=5, columns=COLUMNS + ['f5', 'f6'])
+        assert pool.load(wider)
+
+        # A request that read the pool state just before the swap
+        pool._loaded = (first.model_version, old_generation)
+        row = _rows(1)[0]
+        _assert_same(pool.score(first, row, explain=True), first.predict_row(row, explain=True))
+        assert pool.metrics()['stale'] == 1
+
+        # A stale detector is scored in-thread without reloading the workers
+        pool._loaded = (wider.model_version, old_generation + 1)
+        pool.score(first, row)
+        assert pool.metrics()['in_thread'] == 1
+        assert pool._loaded == (wider.model_version, old_generation + 1)
+    finally:
+        pool.close()
+
+
+def test_reasons_encoding_cut_at_boundary():
+    """Reasons survive the slot encoding; ones past its size are left out whole"""
+    reasons = ["Login from new or unusual device", "Unusual hour (3.1x its usual weight in the model)"]
+    assert _decode_reasons(_encode_reasons(reasons)) == reasons
+    assert _decode_reasons(_encode_reasons([])) == []
+
+    long = ['x' * 1500, 'y' * 1000]
+    assert _decode_reasons(_encode_reasons(long)) == ['x' * 1500]
+    assert len(_encode_reasons(long)) <= REASON_BYTES
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+import pytest
+from datetime import timedelta
+
+from app.ml.data_generator import SyntheticLoginDataGenerator
+from app.ml.feature_engineering import LoginFeatureEngineer, build_profiles
+from app.ml.failure_counters import FailureCounters
+from app.ml.model_trainer import ModelTrainingPipeline
+from app.ml.streaming_training import MongoTrainingSource, StreamingTrainer, TRAINING_PROJECTION, _IndexReservoir
+
+
+class _FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, key, direction):
+        self.documents = sorted(self.documents, key=lambda doc: doc[key], reverse=direction < 0)
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __iter__(self):
+        return iter(self.documents)
+
+
+class _FakeCollection:
+    """Just enough of a pymongo collection: timestamp range queries and projections"""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.projections = []
+
+    def _matches(self, doc, query):
+        window = query['timestamp']
+        return window['$gte'] <= doc['timestamp'] < window['$lt']
+
+    def count_documents(self, query):
+        return sum(self._matches(doc, query) for doc in self.documents)
+
+    def find(self, query, projection, allow_disk_use=False):
+        self.projections.append(projection)
+        fields = {key.split('.')[0] for key, value in projection.items() if value and key != '_id'}
+        return _FakeCursor([{key: doc[key] for key in fields} for doc in self.documents
+                            if self._matches(doc, query)])
+
+
+@pytest.fixture(scope='module')
+def events():
+    """Generated login events, shuffled as they would sit in a collection"""
+    df = SyntheticLoginDataGenerator(num_users=15, days=10).generate_dataset(anomaly_percentage=0.1)
+    df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+    # Unique timestamps, so the collection's sort order is the frame's order
+    df['timestamp'] += pd.to_timedelta(np.arange(len(df)), unit='us')
+    documents = [dict(doc, timestamp=doc['timestamp'].to_pydatetime(), extra='x' * 100)
+                 for doc in df.to_dict('records')]
+    rng = np.random.default_rng(0)
+    return df, [documents[i] for i in rng.permutation(len(documents))]
+
+
+def _source(documents, df, batch_size):
+    end = df['timestamp'].max().to_pydatetime() + timedelta(seconds=1)
+    return MongoTrainingSource(_FakeCollection(documents), days=30, end=end, batch_size=batch_size)
+
+
+def test_profiles_match_in_memory(events):
+    """Profiles from compact streamed columns equal build_profiles on the full frame"""
+    df, documents = events
+    trainer = StreamingTrainer(_source(documents, df, batch_size=97), track_memory=False)
+
+    profiles = trainer.build_profiles()
+
+    assert profiles == build_profiles(df)
+    assert list(profiles) == list(build_profiles(df))
+    assert all(projection == TRAINING_PROJECTION for projection in trainer.source.collection.projections)
+
+
+@pytest.mark.parametrize('use_failure_counters', [False, True])
+def test_features_match_in_memory(events, tmp_path, use_failure_counters):
+    """Chunked features written to the memmap equal one in-memory batch"""
+    df, documents = events
+    trainer = StreamingTrainer(_source(documents, df, batch_size=61), work_dir=str(tmp_path),
+                               use_failure_counters=use_failure_counters, track_memory=False)
+
+    features = trainer.engineer_features()
+
+    engineer = LoginFeatureEngineer(failure_counters=FailureCounters() if use_failure_counters else None)
+    engineer.build_all_profiles(df)
+    expected = engineer.engineer_features_batch(df)[trainer.feature_columns].to_numpy(dtype=np.float64)
+    np.testing.assert_array_equal(features, expected.astype(np.float32))
+    np.testing.assert_array_equal(np.load(tmp_path / 'features.npy', mmap_mode='r'), features)
+    np.testing.assert_allclose(trainer.scaler.mean_, expected.mean(axis=0))
+    np.testing.assert_allclose(trainer.scaler.var_, expected.var(axis=0), rtol=1e-9, atol=1e-12)
+
+
+def test_train_on_reservoir_sample(events):
+    """The forest is fitted on the sample; stages report time and memory"""
+    df, documents = events
+    trainer = StreamingTrainer(_source(documents, df, batch_size=200), sample_size=300)
+
+    detector = trainer.train(contamination=0.1)
+
+    assert len(trainer.sample_indices) == 300
+    assert len(np.unique(trainer.sample_indices)) == 300
+    assert detector.model.max_samples_ == 256
+    assert detector.scaler.n_samples_seen_ == len(df)
+    results = detector.predict_batch(np.asarray(trainer.features, dtype=np.float64))
+    assert results['is_anomaly'].any()
+    assert set(trainer.metrics.stages) == {'profiles', 'features', 'train'}
+    assert all(stage['seconds'] >= 0 and stage['peak_mb'] >= 0 for stage in trainer.metrics.stages.values())
+
+
+def test_streaming_pipeline_uses_work_dir(events, tmp_path):
+    """run_streaming_pipeline (model_trainer --stream) writes its features to work_dir and saves the model"""
+    _, documents = events
+    pipeline = ModelTrainingPipeline(data_path=str(tmp_path / 'data'), model_path=str(tmp_path / 'models'))
+
+    metrics = pipeline.run_streaming_pipeline(collection=_FakeCollection(documents), days=30, batch_size=200,
+                                              sample_size=300, work_dir=str(tmp_path / 'work'))
+
+    assert set(metrics) >= {'profiles', 'features', 'train', 'save'}
+    assert any((tmp_path / 'work').iterdir())
+    assert not (tmp_path / 'data' / 'training' / 'stream').exists()
+    assert (tmp_path / 'models' / 'login_anomaly_detector.bundle').exists()
+
+
+def test_reservoir_is_uniform():
+    """Every position of the stream is kept with probability size / n"""
+    hits = np.zeros(1000)
+    for seed in range(400):
+        reservoir = _IndexReservoir(100, np.random.default_rng(seed))
+        for count in (30, 170, 1, 799):
+            reservoir.offer(count)
+        hits[reservoir.indices] += 1
+
+    assert reservoir.seen == 1000
+    assert hits.sum() == 400 * 100
+    # Expected 40 hits per position; compare tenths of the stream
+    np.testing.assert_allclose(hits.reshape(10, 100).mean(axis=1), 40, rtol=0.1)
@@ -0,0 +1,73 @@
+import threading
+import pytest
+from app import create_app
+from app.config import TestingConfig
+import app.warmup as warmup_module
+
+
+def test_warmup_off_reports_ready():
+    """With warm-up disabled the app is ready immediately (lazy loading)"""
+    app = create_app('testing')
+    response = app.test_client().get('/api/ready')
+
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'disabled'
+
+
+def test_sync_warmup_loads_and_scores(monkeypatch):
+    """Sync warm-up loads the model and scores once before create_app returns"""
+    import app.api.login_analysis as login_analysis_module
+    monkeypatch.setattr(TestingConfig, 'WARMUP_MODE', 'sync')
+
+    app = create_app('testing')
+
+    assert login_analysis_module._model_manager is not None
+    assert login_analysis_module._engineer is not None
+    assert login_analysis_module._extractor is not None
+
+    response = app.test_client().get('/api/ready')
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['status'] == 'ready'
+    assert {'model', 'feature_engineer', 'first_score'} <= set(data['steps'])
+    assert data['startup_seconds'] >= data['warmup_seconds'] > 0
+
+
+def test_background_warmup_gates_readiness(monkeypatch):
+    """/api/ready answers 503 until the background warm-up finishes"""
+    gate = threading.Event()
+    real_run_warmup = warmup_module.run_warmup
+
+    def slow_warmup(app, state):
+        gate.wait(10)
+        real_run_warmup(app, state)
+
+    monkeypatch.setattr(TestingConfig, 'WARMUP_MODE', 'background')
+    monkeypatch.setattr(warmup_module, 'run_warmup', slow_warmup)
+
+    app = create_app('testing')
+    client = app.test_client()
+    assert client.get('/api/ready').status_code == 503
+    assert client.get('/api/health').status_code == 200
+
+    gate.set()
+    assert app.extensions['warmup'].finished.wait(30)
+    assert client.get('/api/ready').status_code == 200
+
+
+def test_missing_model_not_ready(monkeypatch, tmp_path):
+    """A worker without a model never reports ready"""
+    monkeypatch.setattr(TestingConfig, 'WARMUP_MODE', 'sync')
+    monkeypatch.setattr(TestingConfig, 'MODEL_PATH', str(tmp_path))
+
+    response = create_app('testing').test_client().get('/api/ready')
+
+    assert response.status_code == 503
+    assert response.get_json()['status'] == 'no_model'
+
+
+def test_unknown_mode(monkeypatch):
+    """Misconfigured warm-up modes fail at startup"""
+    monkeypatch.setattr(TestingConfig, 'WARMUP_MODE', 'eventually')
+    with pytest.raises(ValueError):
+        create_app('testing')
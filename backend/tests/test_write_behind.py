@@ -0,0 +1,180 @@
+import time
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError
+from app.write_behind import WriteBehindQueue
+
+
+class _FakeCollection:
+    """insert_many that records calls, can be taken down, and rejects duplicate ids"""
+
+    def __init__(self, db):
+        self.db = db
+        self.documents = {}
+        self.calls = []
+
+    def insert_many(self, documents, ordered=True):
+        assert ordered is False
+        if self.db.down:
+            raise AutoReconnect('connection refused')
+        self.calls.append(len(documents))
+        errors = []
+        for position, document in enumerate(documents):
+            if document['_id'] in self.documents:
+                errors.append({'index': position, 'code': 11000, 'errmsg': 'duplicate key'})
+            else:
+                self.documents[document['_id']] = document
+        if errors:
+            raise BulkWriteError({'writeErrors': errors})
+
+
+class _FakeDatabase:
+    def __init__(self):
+        self.down = False
+        self.collections = {}
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, _FakeCollection(self))
+
+
+def _doc(n):
+    return {'_id': ObjectId(), 'n': n}
+
+
+@pytest.fixture
+def db():
+    return _FakeDatabase()
+
+
+def test_flush_by_size_and_interval(db):
+    """Reaching flush_size wakes the flusher; a smaller batch waits for the interval"""
+    queue = WriteBehindQueue(db, flush_size=10, flush_interval=0.3)
+    for n in range(10):
+        queue.submit('login_events', _doc(n))
+    deadline = time.time() + 0.2
+    while len(db['login_events'].documents) < 10 and time.time() < deadline:
+        time.sleep(0.01)
+    assert db['login_events'].calls == [10]
+
+    queue.submit('login_events', _doc(10))
+    time.sleep(0.05)
+    assert len(db['login_events'].documents) == 10
+    time.sleep(0.4)
+    assert len(db['login_events'].documents) == 11
+
+    metrics = queue.metrics()
+    assert metrics['written'] == 11 and metrics['queue_depth'] == 0
+    assert metrics['flush_latency_ms']['p50'] is not None
+    queue.close()
+
+
+def test_collections_written_in_submission_order(db):
+    """An event is inserted before the alert that references it"""
+    order = []
+    for name in ('login_events', 'alerts'):
+        collection = db[name]
+        collection.insert_many = lambda documents, ordered=True, name=name: order.append(name)
+
+    queue = WriteBehindQueue(db, flush_interval=60)
+    queue.submit('login_events', _doc(0))
+    queue.submit('alerts', _doc(1))
+    queue.flush()
+    assert order == ['login_events', 'alerts']
+
+
+def test_spill_when_down_and_replay(db, tmp_path):
+    """Writes MongoDB refuses go to the spill file and are replayed, with types intact, once it is back"""
+    spill = tmp_path / 'spill.ndjson'
+    queue = WriteBehindQueue(db, flush_size=3, flush_interval=60, spill_path=str(spill))
+    documents = [_doc(n) for n in range(5)]
+
+    db.down = True
+    for document in documents:
+        queue.submit('login_events', document)
+    queue.submit('alerts', _doc(99))
+    assert queue.flush() == 0
+    assert queue.metrics()['spilled'] == 6 and queue.spill_pending()
+
+    # Still down: the replay stops and keeps the file
+    queue.flush()
+    assert queue.spill_pending()
+
+    # One event reached MongoDB before the connection dropped; its replay is a duplicate
+    db['login_events'].documents[documents[0]['_id']] = documents[0]
+
+    db.down = False
+    queue.submit('login_events', _doc(5))
+    assert queue.flush() == 7
+
+    stored = db['login_events'].documents
+    assert len(stored) == 6 and set(document['_id'] for document in documents) <= set(stored)
+    assert isinstance(next(iter(stored)), ObjectId)
+    assert len(db['alerts'].documents) == 1
+    metrics = queue.metrics()
+    assert metrics['replayed'] == 6 and metrics['dropped'] == 0 and metrics['write_errors'] == 0
+    assert not queue.spill_pending()
+
+
+def test_failed_replay_backs_off(db, tmp_path, monkeypatch):
+    """Idle flushes retry a failed replay after a doubling delay; a successful insert replays at once"""
+    now = [1000.0]
+    monkeypatch.setattr('app.write_behind.time.monotonic', lambda: now[0])
+    queue = WriteBehindQueue(db, flush_interval=60, spill_path=str(tmp_path / 'spill.ndjson'))
+
+    db.down = True
+    queue.submit('login_events', _doc(0))
+    queue.flush()
+    assert queue.spill_pending()
+
+    replays = []
+    replay_spill = queue._replay_spill
+    monkeypatch.setattr(queue, '_replay_spill', lambda: replays.append(now[0]) or replay_spill())
+
+    queue.flush()                       # fails, backs off 1s
+    now[0] += 0.5
+    queue.flush()                       # within the backoff: skipped
+    now[0] += 0.5
+    queue.flush()                       # fails again, backs off 2s
+    now[0] += 1.5
+    queue.flush()
+    assert replays == [1000.0, 1001.0]
+    assert queue.spill_pending()
+
+    db.down = False
+    queue.flush()                       # idle and still backing off
+    assert queue.spill_pending()
+    queue.submit('login_events', _doc(1))
+    assert queue.flush() == 2           # the insert succeeded, so replay right away
+    assert not queue.spill_pending()
+    queue.close()
+
+
+def test_full_queue_spills_or_drops(db, tmp_path):
+    """A full queue spills new documents, or drops and counts them without a spill file"""
+    dropping = WriteBehindQueue(db, max_size=2, flush_interval=60)
+    assert [dropping.submit('login_events', _doc(n)) for n in range(4)] == [True, True, False, False]
+    assert dropping.metrics()['dropped'] == 2 and dropping.depth == 2
+
+    spilling = WriteBehindQueue(db, max_size=2, flush_interval=60, spill_path=str(tmp_path / 'spill.ndjson'))
+    assert all(spilling.submit('login_events', _doc(n)) for n in range(4))
+    assert spilling.metrics()['spilled'] == 2
+    spilling.flush()
+    assert len(db['login_events'].documents) == 4
+    assert spilling.metrics()['dropped'] == 0
+
+
+def test_down_without_spill_drops(db):
+    """Without a spill file, a batch MongoDB refuses is counted as dropped"""
+    queue = WriteBehindQueue(db, flush_interval=60)
+    db.down = True
+    queue.submit('login_events', _doc(0))
+    queue.flush()
+    assert queue.metrics()['dropped'] == 1 and queue.depth == 0
+
+
+def test_close_flushes(db):
+    """close() writes whatever is still queued"""
+    queue = WriteBehindQueue(db, flush_interval=60)
+    queue.submit('login_events', _doc(0))
+    queue.close()
+    assert len(db['login_events'].documents) == 1